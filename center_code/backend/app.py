@@ -40,7 +40,7 @@ from blueprints.editor import editor_bp
 
 # 导入任务处理器
 from services.task_processor import get_task_processor
-from auto_transcode_worker import maybe_start_transcode_worker
+from auto_transcode_worker import maybe_start_edit_worker, maybe_start_transcode_worker
 
 app = Flask(__name__, static_folder='../frontend/dist', static_url_path='')
 
@@ -552,6 +552,16 @@ def print_startup_info():
                 print("  ⏭️  转码 Worker - 未拉起（无待处理任务或已在运行）")
         except Exception as e:
             print(f"  ❌ 转码 Worker - 自动拉起失败: {e}")
+
+        # 剪辑任务走 DB 队列时，自动拉起剪辑 worker（规则同上，开关 AUTO_START_EDIT_WORKER）
+        try:
+            started = maybe_start_edit_worker()
+            if started:
+                print("  ✅ 剪辑 Worker - 已自动拉起（worker_edit.py）")
+            else:
+                print("  ⏭️  剪辑 Worker - 未拉起（无待处理任务或已在运行）")
+        except Exception as e:
+            print(f"  ❌ 剪辑 Worker - 自动拉起失败: {e}")
     else:
         # 这是重载进程，不启动定时检查器（主进程的检查器会继续运行）
         print("  ⏸️  定时任务检查器 - 已跳过（重载模式）")
@@ -109,25 +109,41 @@ def _has_pending_work() -> bool:
         return False
 
 
-def maybe_start_transcode_worker() -> bool:
-    """
-    Auto-start transcode worker when enabled and there is pending/processing work.
+def _has_pending_edit_work() -> bool:
+    try:
+        from db import get_db
+        from models import VideoEditTask
+    except Exception:
+        return False
 
-    Enable rules:
-    - If AUTO_START_TRANSCODE_WORKER=true => enabled even in production.
-    - Else enabled only when not production.
-    """
-    enabled = _truthy(os.getenv("AUTO_START_TRANSCODE_WORKER", ""))
+    try:
+        with get_db() as db:
+            pending = (
+                db.query(VideoEditTask.id)
+                .filter(
+                    VideoEditTask.status.in_(["pending", "running"]),
+                    VideoEditTask.payload_json.isnot(None),
+                )
+                .limit(1)
+                .first()
+            )
+            return pending is not None
+    except Exception:
+        return False
+
+
+def _maybe_start_worker(name: str, enable_env: str, autostarted_env: str, has_work) -> bool:
+    enabled = _truthy(os.getenv(enable_env, ""))
     if not enabled and _is_production():
         return False
-    if not enabled and not _has_pending_work():
+    if not enabled and not has_work():
         return False
 
     base_dir = os.path.dirname(os.path.abspath(__file__))
     logs_dir = os.path.join(base_dir, "logs")
-    lock_path = os.path.join(logs_dir, "worker_transcode.lock")
-    pid_path = os.path.join(logs_dir, "worker_transcode.pid")
-    log_path = os.path.join(logs_dir, "worker_transcode.log")
+    lock_path = os.path.join(logs_dir, f"{name}.lock")
+    pid_path = os.path.join(logs_dir, f"{name}.pid")
+    log_path = os.path.join(logs_dir, f"{name}.log")
 
     try:
         with _FileLock(lock_path):
@@ -142,7 +158,7 @@ def maybe_start_transcode_worker() -> bool:
             except Exception:
                 pass
 
-            worker_py = os.path.join(base_dir, "worker_transcode.py")
+            worker_py = os.path.join(base_dir, f"{name}.py")
             if not os.path.exists(worker_py):
                 return False
 
@@ -152,7 +168,7 @@ def maybe_start_transcode_worker() -> bool:
             logf.flush()
 
             env = os.environ.copy()
-            env["TRANSCODE_WORKER_AUTOSTARTED"] = "1"
+            env[autostarted_env] = "1"
 
             creationflags = 0
             if os.name == "nt":
@@ -180,3 +196,26 @@ def maybe_start_transcode_worker() -> bool:
     except Exception:
         return False
 
+
+def maybe_start_transcode_worker() -> bool:
+    """
+    Auto-start transcode worker when enabled and there is pending/processing work.
+
+    Enable rules:
+    - If AUTO_START_TRANSCODE_WORKER=true => enabled even in production.
+    - Else enabled only when not production.
+    """
+    return _maybe_start_worker(
+        "worker_transcode", "AUTO_START_TRANSCODE_WORKER", "TRANSCODE_WORKER_AUTOSTARTED", _has_pending_work
+    )
+
+
+def maybe_start_edit_worker() -> bool:
+    """
+    Auto-start edit (render) worker when enabled and there are queued edit tasks.
+
+    Enable rules are the same as the transcode worker, using AUTO_START_EDIT_WORKER.
+    """
+    return _maybe_start_worker(
+        "worker_edit", "AUTO_START_EDIT_WORKER", "EDIT_WORKER_AUTOSTARTED", _has_pending_edit_work
+    )
@@ -0,0 +1,85 @@
+"""
+分段并行编码基准：同一条时间线分别走单进程编码与分段并行编码，对比耗时。
+
+用法：
+    python bench_chunked_encode.py a.mp4 b.mp4 [--speed 1.0] [--loop 1] [--chunk-seconds 60] [--keep]
+
+两种方式都输出与剪辑中间产物相同的无声视频（拼接 + 循环 + 调速），编码策略按当前负载选择。
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from encode_policy import choose_policy
+from media_utils import probe_summary, summary_duration
+from utils.video_editor import _render_intermediate, render_chunked
+
+
+def _write_concat_file(video_paths, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for vp in video_paths:
+            vp_escaped = os.path.abspath(vp).replace("'", "'\\''")
+            f.write(f"file '{vp_escaped}'\n")
+
+
+def _timed(label: str, fn) -> float:
+    print(f"[bench] {label} ...")
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    print(f"[bench] {label}: {elapsed:.2f}s")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark chunked parallel encoding vs single-process encoding")
+    parser.add_argument("videos", nargs="+", help="input video paths (concatenated in order)")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--loop", type=int, default=1, help="timeline loop count")
+    parser.add_argument("--chunk-seconds", type=float, default=None)
+    parser.add_argument("--keep", action="store_true", help="keep output files")
+    args = parser.parse_args()
+
+    video_paths = [os.path.abspath(p) for p in args.videos]
+    duration = sum(summary_duration(probe_summary(p)) for p in video_paths) * max(1, args.loop) / args.speed
+    policy = choose_policy("render")
+    print(f"[bench] clips={len(video_paths)} output={duration:.1f}s cpu={os.cpu_count()} policy={policy.to_json()}")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_chunked_")
+    try:
+        concat_file = os.path.join(work_dir, "concat.txt")
+        _write_concat_file(video_paths, concat_file)
+        single_out = os.path.join(work_dir, "single.mp4")
+        chunked_out = os.path.join(work_dir, "chunked.mp4")
+
+        single = _timed(
+            "single-process",
+            lambda: _render_intermediate(concat_file, args.loop, args.speed, duration, single_out, policy),
+        )
+        chunked = _timed(
+            "chunked",
+            lambda: render_chunked(
+                video_paths, args.loop, args.speed, duration, chunked_out, policy, chunk_seconds=args.chunk_seconds
+            ),
+        )
+
+        for label, path in (("single", single_out), ("chunked", chunked_out)):
+            out_duration = summary_duration(probe_summary(path))
+            print(f"[bench] {label}: {os.path.getsize(path)} bytes, {out_duration:.2f}s")
+        print(f"[bench] speedup: {single / chunked:.2f}x" if chunked > 0 else "[bench] speedup: n/a")
+        if args.keep:
+            print(f"[bench] outputs kept in {work_dir}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
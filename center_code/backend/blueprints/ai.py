@@ -12,6 +12,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import response_success, response_error, login_required
 from models import Material
 from db import get_db
+from media_utils import build_meta_json, file_sha256, probe_material, probe_summary, summary_duration
 
 # 导入工具函数
 from utils.ai import deepseek_generate_copies
@@ -285,15 +286,26 @@ def ai_tts_synthesize():
                 if not display_name.startswith('TTS_'):
                     display_name = f"配音_{display_name}"
                 
+                # 入库时顺带记录 probe 摘要，后续剪辑/字幕无需再 probe
+                duration = None
+                meta_json = None
+                try:
+                    summary = probe_summary(final_path)
+                    duration = summary_duration(summary) or None
+                    meta_json = build_meta_json(summary, final_path, content_sha256=file_sha256(final_path))
+                except Exception as probe_error:
+                    logger.warning(f"TTS 音频 probe 失败：{probe_error}")
+
                 with get_db() as db:
                     material = Material(
                         name=display_name,
                         path=rel_path,
                         type="audio",
-                        duration=None,
+                        duration=duration,
                         width=None,
                         height=None,
-                        size=size
+                        size=size,
+                        meta_json=meta_json,
                     )
                     db.add(material)
                     db.flush()
@@ -480,66 +492,14 @@ def ai_subtitle_srt():
             logger.error("文案为空且未启用自动识别")
             return response_error("text 不能为空，或者启用 auto_recognize 参数从音频自动识别", 400)
 
-        # 获取音频时长（需要 ffmpeg-python）
+        # 获取音频时长（ffprobe 由 media_utils 定位；素材 meta_json 指纹一致时不启动 ffprobe）
         try:
-            import ffmpeg
-            import shutil
-            
-            # 检查并配置 FFmpeg 路径
-            try:
-                from config import FFMPEG_PATH as config_ffmpeg_path
-                ffmpeg_path = os.environ.get('FFMPEG_PATH') or config_ffmpeg_path
-            except ImportError:
-                ffmpeg_path = os.environ.get('FFMPEG_PATH')
-            
-            if ffmpeg_path and os.path.exists(ffmpeg_path):
-                # 设置 ffmpeg-python 使用指定的路径
-                ffmpeg_path = os.path.abspath(ffmpeg_path)
-                ffmpeg_dir = os.path.dirname(ffmpeg_path)
-                if ffmpeg_dir not in os.environ.get('PATH', ''):
-                    os.environ['PATH'] = ffmpeg_dir + os.pathsep + os.environ.get('PATH', '')
-                logger.info(f"使用配置的 FFmpeg 路径：{ffmpeg_path}")
-            else:
-                # 尝试从系统 PATH 中查找
-                ffmpeg_path = shutil.which('ffmpeg')
-                if not ffmpeg_path:
-                    # 尝试常见路径
-                    common_paths = [
-                        r'D:\ffmpeg\bin\ffmpeg.exe',
-                        r'C:\ffmpeg\bin\ffmpeg.exe',
-                        r'C:\Program Files\ffmpeg\bin\ffmpeg.exe',
-                        r'C:\Program Files (x86)\ffmpeg\bin\ffmpeg.exe',
-                    ]
-                    for path in common_paths:
-                        if os.path.exists(path):
-                            ffmpeg_path = path
-                            ffmpeg_dir = os.path.dirname(ffmpeg_path)
-                            if ffmpeg_dir not in os.environ.get('PATH', ''):
-                                os.environ['PATH'] = ffmpeg_dir + os.pathsep + os.environ.get('PATH', '')
-                            logger.info(f"找到 FFmpeg：{ffmpeg_path}")
-                            break
-                
-                if not ffmpeg_path or not os.path.exists(ffmpeg_path):
-                    error_msg = (
-                        "未找到 FFmpeg 可执行文件，无法获取音频时长。\n"
-                        "解决方案：\n"
-                        "1. 将 FFmpeg 的 bin 目录添加到系统 PATH 环境变量\n"
-                        "2. 或设置环境变量 FFMPEG_PATH 指向 ffmpeg.exe 的完整路径\n"
-                        "   例如：set FFMPEG_PATH=D:\\软件\\ffmpeg\\bin\\ffmpeg.exe\n"
-                        "3. 或在 config.py 中设置 FFMPEG_PATH\n"
-                        "4. 重启后端服务后重试"
-                    )
-                    logger.error(error_msg)
-                    return response_error(error_msg, 500)
-            
             logger.info(f"开始获取音频时长: {abs_audio}")
-            probe = ffmpeg.probe(abs_audio)
-            fmt = probe.get("format") or {}
-            duration = float(fmt.get("duration") or 0.0)
+            with get_db() as db:
+                audio_mat = db.query(Material).filter(Material.id == audio_material_id).first()
+                summary = probe_material(audio_mat, abs_audio) if audio_mat else probe_summary(abs_audio)
+            duration = summary_duration(summary)
             logger.info(f"音频时长获取成功: {duration} 秒")
-        except ImportError:
-            logger.error("缺少 ffmpeg-python 库")
-            return response_error("缺少 ffmpeg-python，无法获取音频时长", 500)
         except Exception as e:
             logger.exception(f"获取音频时长失败: {e}")
             error_msg = f"获取音频时长失败：{str(e)}"
@@ -6,20 +6,48 @@ import sys
 import threading
 import time
 import datetime
+import hashlib
 import logging
 import json
 import shutil
 import uuid
-from typing import Optional
+from typing import Optional, Tuple
 
-from flask import Blueprint, request, send_from_directory
+from flask import Blueprint, Response, request, send_from_directory, stream_with_context
+from sqlalchemy.exc import IntegrityError
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import response_success, response_error, login_required, get_current_user_id
 from models import Material, VideoEditTask, VideoLibrary
 from db import get_db
-from utils.video_editor import video_editor, get_abs_path
+from utils.video_editor import (
+    video_editor,
+    get_abs_path,
+    normalize_vf,
+    aspect_variant_path,
+    ensure_thumbnails,
+    thumbnail_paths,
+    preview_dimensions,
+)
+from utils import segment_cache
 from utils.cos_service import list_objects_from_cos
+from media_utils import (
+    build_meta_json,
+    export_cached_summary,
+    import_cached_summary,
+    probe_duration_seconds,
+    probe_material,
+    probe_video_dimensions,
+    stored_content_hash,
+    summary_duration,
+)
+from auto_transcode_worker import maybe_start_edit_worker
+from encode_policy import choose_policy
+import job_control
+import render_planner
+import renditions
+import edit_scheduler
+import task_events
 
 # 检查COS是否可用
 try:
@@ -43,6 +71,11 @@ SUBTITLE_DIR = os.path.join(UPLOADS_DIR, 'subtitles')
 if not os.path.exists(OUTPUT_VIDEO_DIR):
     os.makedirs(OUTPUT_VIDEO_DIR)
 
+# 预览渲染输出目录（不上传 COS、不入视频库，按 TTL 清理）
+PREVIEW_DIR = os.path.join(OUTPUT_VIDEO_DIR, 'previews')
+os.makedirs(PREVIEW_DIR, exist_ok=True)
+PREVIEW_TTL_SECONDS = int(os.environ.get("PREVIEW_TTL_SECONDS", "86400"))
+
 # 片段缓存目录（用于图片转视频片段等）
 SEGMENTS_DIR = os.path.join(OUTPUT_VIDEO_DIR, 'segments')
 os.makedirs(SEGMENTS_DIR, exist_ok=True)
@@ -52,6 +85,20 @@ MAX_CLIPS = int(os.environ.get("MAX_EDIT_CLIPS", "100"))
 MAX_TOTAL_SECONDS = float(os.environ.get("MAX_EDIT_TOTAL_SECONDS", "1800"))
 MAX_CONCURRENT_EDIT_THREADS = int(os.environ.get("MAX_EDIT_THREADS", "2"))
 SEGMENT_DIR_TTL_SECONDS = int(os.environ.get("SEGMENT_DIR_TTL_SECONDS", "86400"))
+# 异步剪辑执行方式：thread（默认，进程内线程）/ db（写入 video_edit_tasks 由 worker_edit.py 认领；
+# 需单独运行 worker_edit.py 或设置 AUTO_START_EDIT_WORKER=1，否则任务一直停在排队）
+EDIT_TASK_QUEUE = (os.environ.get("EDIT_TASK_QUEUE", "thread") or "thread").strip().lower()
+# SSE 进度推送：心跳间隔 / 单连接最长时长（秒）；轮询间隔与每用户连接上限见 task_events.py
+TASK_EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("TASK_EVENTS_HEARTBEAT_SECONDS", "15"))
+TASK_EVENTS_MAX_SECONDS = float(os.environ.get("TASK_EVENTS_MAX_SECONDS", "1800"))
+# 相同剪辑请求去重：挂到已有任务/成片上，不重复渲染
+EDIT_DEDUPE = os.environ.get("EDIT_DEDUPE", "1") != "0"
+# 排队/运行中的任务超过该时间没有任何更新则视为失联，不再挂靠
+EDIT_DEDUPE_STALE_SECONDS = int(os.environ.get("EDIT_DEDUPE_STALE_SECONDS", "3600"))
+# 多画幅导出支持的比例（主输出之外的附加画幅）
+SUPPORTED_EXPORT_RATIOS = ("9:16", "1:1", "16:9")
+# 批量多版本剪辑：单次请求的版本数上限
+EDIT_BATCH_MAX_VARIANTS = int(os.environ.get("EDIT_BATCH_MAX_VARIANTS", "20"))
 
 
 def _ensure_within_dir(path: str, base_dir: str) -> str:
@@ -65,20 +112,37 @@ def _ensure_within_dir(path: str, base_dir: str) -> str:
     return path
 
 
-def _cleanup_old_segment_dirs():
+_SEGMENT_CACHE_EVICT_INTERVAL_SECONDS = int(os.environ.get("SEGMENT_CACHE_EVICT_INTERVAL_SECONDS", "300"))
+_segment_cache_last_evict = 0.0
+_segment_cache_evict_lock = threading.Lock()
+
+
+def _maintain_segment_cache():
+    """按 LRU 淘汰片段缓存（节流执行），并清理旧版本遗留的 task_* 临时目录"""
+    global _segment_cache_last_evict
+    now_ts = time.time()
+    with _segment_cache_evict_lock:
+        if now_ts - _segment_cache_last_evict < _SEGMENT_CACHE_EVICT_INTERVAL_SECONDS:
+            return
+        _segment_cache_last_evict = now_ts
+    try:
+        stats = segment_cache.evict()
+        if stats.get("removed_files"):
+            logger.info(f"片段缓存淘汰：{stats}")
+    except Exception:
+        logger.exception("片段缓存淘汰失败")
+    segment_cache.cleanup_legacy_task_dirs(SEGMENT_DIR_TTL_SECONDS)
+    _cleanup_old_previews()
+
+
+def _cleanup_old_previews() -> None:
     try:
         now_ts = time.time()
-        if not os.path.isdir(SEGMENTS_DIR):
-            return
-        for name in os.listdir(SEGMENTS_DIR):
-            if not name.startswith("task_"):
-                continue
-            p = os.path.join(SEGMENTS_DIR, name)
+        for name in os.listdir(PREVIEW_DIR):
+            p = os.path.join(PREVIEW_DIR, name)
             try:
-                if os.path.isdir(p):
-                    mtime = os.path.getmtime(p)
-                    if now_ts - mtime > SEGMENT_DIR_TTL_SECONDS:
-                        shutil.rmtree(p, ignore_errors=True)
+                if os.path.isfile(p) and now_ts - os.path.getmtime(p) > PREVIEW_TTL_SECONDS:
+                    os.remove(p)
             except Exception:
                 continue
     except Exception:
@@ -90,14 +154,21 @@ _TASK_LOCK = threading.Lock()
 
 
 def _probe_duration_seconds(path: str) -> float:
-    try:
-        import ffmpeg  # type: ignore
+    return probe_duration_seconds(path)
+
 
-        probe = ffmpeg.probe(path)
-        fmt = probe.get("format") or {}
-        return float(fmt.get("duration") or 0) or 0.0
+def _material_duration_seconds(mat: Material, abs_path: str) -> float:
+    """
+    素材时长：复用 meta_json 中的 ffprobe 摘要（文件未变化时不再 probe），
+    同时预热进程内缓存，后续渲染阶段对同一文件的 probe 直接命中。
+    """
+    try:
+        duration = summary_duration(probe_material(mat, abs_path))
     except Exception:
-        return 0.0
+        duration = 0.0
+    if duration <= 0 and mat.duration:
+        duration = float(mat.duration or 0.0)
+    return duration
 
 
 def _resolve_ffmpeg_exe() -> str:
@@ -165,6 +236,46 @@ def _calculate_output_dimensions(resolution: str, ratio: str) -> tuple[int, int]
     return (width, height)
 
 
+def _parse_export_ratios(value, resolution: str, primary_ratio: str) -> list:
+    """
+    解析多画幅导出参数，返回 [[比例, 宽, 高], ...]（不含与主输出相同的比例）。
+    不合法时抛 ValueError。
+    """
+    if not value:
+        return []
+    if not isinstance(value, list):
+        raise ValueError("export_ratios 必须是数组")
+    primary = primary_ratio if primary_ratio in SUPPORTED_EXPORT_RATIOS else "9:16"
+    extra = []
+    for r in value:
+        r = str(r or "").strip()
+        if r not in SUPPORTED_EXPORT_RATIOS:
+            raise ValueError(f"不支持的导出比例：{r}（支持 {', '.join(SUPPORTED_EXPORT_RATIOS)}）")
+        if r == primary or any(e[0] == r for e in extra):
+            continue
+        w, h = _calculate_output_dimensions(resolution, r)
+        extra.append([r, w, h])
+    return extra
+
+
+def _task_outputs(task: VideoEditTask) -> Optional[list]:
+    if not task.outputs_json:
+        return None
+    try:
+        return json.loads(task.outputs_json)
+    except Exception:
+        return None
+
+
+IMAGE_SEGMENT_VCODEC = "libx264"
+IMAGE_SEGMENT_PIX_FMT = "yuv420p"
+
+
+def _image_segment_vf(width: int, height: int, fps: int) -> str:
+    # 与视频片段预归一化使用同一滤镜，保证混剪片段规格一致、可流复制拼接
+    return normalize_vf(width, height, fps)
+
+
 def _make_image_segment(
     *,
     image_path: str,
@@ -181,7 +292,7 @@ def _make_image_segment(
     if d <= 0:
         raise RuntimeError("图片片段 duration 必须 > 0")
 
-    vf = f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,fps={fps},format=yuv420p,setsar=1"
+    vf = _image_segment_vf(width, height, fps)
     cmd = [
         ffmpeg_exe,
         "-y",
@@ -195,14 +306,51 @@ def _make_image_segment(
         vf,
         "-an",
         "-c:v",
-        "libx264",
+        IMAGE_SEGMENT_VCODEC,
         "-pix_fmt",
-        "yuv420p",
+        IMAGE_SEGMENT_PIX_FMT,
         out_path,
     ]
     subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
+def _cached_image_segment(
+    *,
+    image_path: str,
+    duration: float,
+    width: int = 1080,
+    height: int = 1920,
+    fps: int = 30,
+) -> str:
+    """
+    获取图片片段（内容寻址缓存）：相同图片内容 + 时长 + 尺寸 + 帧率 + 编码参数只编码一次。
+    返回的是缓存文件，调用方不得删除。
+    """
+    d = float(duration or 0)
+    params = {
+        "sha256": segment_cache.file_content_hash(image_path),
+        "duration": f"{d:.3f}",
+        "width": int(width),
+        "height": int(height),
+        "fps": int(fps),
+        "vf": _image_segment_vf(width, height, fps),
+        "vcodec": IMAGE_SEGMENT_VCODEC,
+        "pix_fmt": IMAGE_SEGMENT_PIX_FMT,
+    }
+    return segment_cache.get_or_render(
+        "image",
+        params,
+        lambda out_path: _make_image_segment(
+            image_path=image_path,
+            duration=d,
+            out_path=out_path,
+            width=width,
+            height=height,
+            fps=fps,
+        ),
+    )
+
+
 def _coerce_clip_type(v) -> str:
     t = str(v or "video").lower().strip()
     return t
@@ -226,7 +374,21 @@ def _validate_image_duration_seconds(duration: float) -> float:
     return float(duration)
 
 
-def _build_segments_from_request(data: dict, target_width: int = 1080, target_height: int = 1920) -> tuple[list, list, list, list, Optional[str]]:
+def _material_render_path(mat: Material, abs_path: str, preview: bool) -> str:
+    """预览模式优先读取入库时生成的低码率代理（见 renditions.py），没有代理时读原片"""
+    if not preview:
+        return abs_path
+    rel = renditions.rendition_path(getattr(mat, "meta_json", None), renditions.MATERIAL_PREVIEW_RENDITION)
+    if rel:
+        proxy_abs = get_abs_path(rel)
+        if os.path.isfile(proxy_abs):
+            return proxy_abs
+    return abs_path
+
+
+def _build_segments_from_request(
+    data: dict, target_width: int = 1080, target_height: int = 1920, preview: bool = False
+) -> tuple[list, list, list, list, Optional[str]]:
     """
     Returns: (segment_paths, legacy_video_ids, normalized_clips, temp_files, temp_dir)
     
@@ -234,6 +396,7 @@ def _build_segments_from_request(data: dict, target_width: int = 1080, target_he
         data: 请求数据字典
         target_width: 目标宽度（用于图片片段）
         target_height: 目标高度（用于图片片段）
+        preview: 预览模式，视频片段改用代理版本
     """
     clips = data.get("clips")
     video_ids = data.get("video_ids") if clips is None else None
@@ -300,13 +463,11 @@ def _build_segments_from_request(data: dict, target_width: int = 1080, target_he
                 abs_path = get_abs_path(mat.path)
                 if not os.path.exists(abs_path):
                     raise ValueError(f"视频文件不存在：{mat.path}")
-                duration = float(mat.duration or 0.0) if mat.duration is not None else 0.0
-                if duration <= 0:
-                    duration = _probe_duration_seconds(abs_path)
+                duration = _material_duration_seconds(mat, abs_path)
                 if duration <= 0:
                     raise ValueError(f"无法确定素材时长：{mat.path}")
                 total_seconds += duration
-                segment_paths.append(abs_path)
+                segment_paths.append(_material_render_path(mat, abs_path, preview))
                 legacy_video_ids.append(int(c["materialId"]))
             elif clip_type == "image":
                 if mat.type != "image":
@@ -314,20 +475,15 @@ def _build_segments_from_request(data: dict, target_width: int = 1080, target_he
                 abs_path = get_abs_path(mat.path)
                 if not os.path.exists(abs_path):
                     raise ValueError(f"图片文件不存在：{mat.path}")
-                if temp_dir is None:
-                    temp_dir = os.path.join(SEGMENTS_DIR, f"task_{uuid.uuid4().hex}")
-                    os.makedirs(temp_dir, exist_ok=True)
-                out_path = os.path.join(temp_dir, f"img_{uuid.uuid4().hex}.mp4")
                 total_seconds += float(c.get("duration") or 0.0)
-                _make_image_segment(
+                # 片段来自共享缓存，不计入 temp_files（任务结束后不删除）
+                out_path = _cached_image_segment(
                     image_path=abs_path,
                     duration=float(c["duration"]),
-                    out_path=out_path,
                     width=target_width,
                     height=target_height
                 )
                 segment_paths.append(out_path)
-                temp_files.append(out_path)
             else:
                 raise ValueError(f"不支持的 clip.type: {clip_type}")
 
@@ -398,7 +554,253 @@ def _repeat_last_image_segment_to_cover_voice(
     return out
 
 
-def _run_edit_task(
+RENDER_PROGRESS_START = 25
+RENDER_PROGRESS_END = 90
+
+
+def _set_task_progress(task_id: int, progress: int) -> None:
+    """只前进不后退地更新任务进度（调用方已做时间节流）"""
+    try:
+        with get_db() as db:
+            db.query(VideoEditTask).filter(
+                VideoEditTask.id == task_id,
+                VideoEditTask.status == "running",
+                VideoEditTask.progress < progress,
+            ).update(
+                {"progress": int(progress), "updated_at": datetime.datetime.now()},
+                synchronize_session=False,
+            )
+            db.commit()
+    except Exception:
+        logger.exception(f"Task {task_id}: 更新进度失败")
+    _TASK_EVENTS.notify(task_id)
+
+
+def _upload_thumbnail(task_id: int, path: str) -> str:
+    """封面/动图上传到COS（与成品同样的预签名策略），失败时退回本地URL"""
+    uploads_rel = os.path.relpath(path, UPLOADS_DIR).replace(os.sep, '/')
+    local_url = f"/uploads/{uploads_rel}"
+    try:
+        if COS_AVAILABLE:
+            cos_key = generate_cos_key('thumbnail', os.path.basename(path))
+            upload_result = upload_file_to_cos(path, cos_key)
+            if upload_result['success']:
+                from utils.cos_service import get_file_url
+                return get_file_url(cos_key, use_presigned=True, expires_in=86400 * 7)
+            logger.warning(f"Task {task_id}: 缩略图上传到COS失败: {upload_result['message']}")
+    except Exception as cos_error:
+        logger.exception(f"Task {task_id}: 缩略图COS上传异常: {cos_error}")
+    return local_url
+
+
+def _publish_output(db, task: VideoEditTask, task_id: int, output_path: str) -> dict:
+    """
+    成品（及其封面/动图）上传到COS并保存到VideoLibrary。
+
+    返回 {"cos_url", "preview_url"（本地URL）, "video_library_id", "thumbnail_url", "animated_preview_url"}
+    """
+    output_filename = os.path.basename(output_path)
+    uploads_rel = os.path.relpath(output_path, os.path.join(BASE_DIR, 'uploads')).replace(os.sep, '/')
+    preview_url = f"/uploads/{uploads_rel}"
+
+    # 封面/动图：重编码出片时已顺带生成，流复制等路径在这里快速补齐
+    thumbs = ensure_thumbnails(output_path)
+    thumbnail_url = _upload_thumbnail(task_id, thumbs["poster"]) if thumbs.get("poster") else None
+    animated_preview_url = _upload_thumbnail(task_id, thumbs["animated"]) if thumbs.get("animated") else None
+
+    # 上传到COS
+    cos_url = None
+    try:
+        if COS_AVAILABLE:
+            cos_key = generate_cos_key('video', output_filename)
+            upload_result = upload_file_to_cos(output_path, cos_key)
+            if upload_result['success']:
+                # 对于私有存储桶，生成预签名URL用于访问
+                from utils.cos_service import get_file_url
+                cos_url = get_file_url(cos_key, use_presigned=True, expires_in=86400 * 7)  # 7天有效期
+                logger.info(f"Task {task_id}: 视频已上传到COS: {upload_result['url']}")
+                logger.info(f"Task {task_id}: 预签名URL已生成（7天有效期）")
+            else:
+                logger.warning(f"Task {task_id}: 上传到COS失败: {upload_result['message']}")
+        else:
+            logger.warning(f"Task {task_id}: COS不可用，使用本地存储")
+    except Exception as cos_error:
+        logger.exception(f"Task {task_id}: COS上传异常: {cos_error}")
+    
+    # 保存到VideoLibrary表
+    video_library_id = None
+    try:
+        video_name = output_filename.replace('.mp4', '').replace('output_', 'AI剪辑_')
+        # 从任务中获取user_id，确保数据隔离
+        user_id = task.user_id if hasattr(task, 'user_id') and task.user_id else None
+        
+        # 如果任务没有user_id，尝试从当前会话获取（备用方案）
+        if not user_id:
+            try:
+                user_id = get_current_user_id()
+                if user_id:
+                    logger.info(f"Task {task_id}: 任务缺少user_id，从当前会话获取: {user_id}")
+                    # 更新任务的user_id（如果可能）
+                    try:
+                        task.user_id = user_id
+                        db.commit()
+                    except Exception:
+                        pass
+            except Exception:
+                pass
+        
+        if not user_id:
+            logger.error(f"Task {task_id}: 无法获取user_id，无法保存到视频库")
+        else:
+            video_library = VideoLibrary(
+                user_id=user_id,  # 关联任务所属用户
+                video_name=video_name,
+                video_url=cos_url or preview_url,  # 优先使用COS URL
+                thumbnail_url=thumbnail_url,
+                video_size=os.path.getsize(output_path),
+                platform='output',  # 标记为成品
+                description=f'AI剪辑生成，任务ID: {task_id}'
+            )
+            db.add(video_library)
+            db.flush()
+            video_library_id = video_library.id
+            logger.info(f"Task {task_id}: 已保存到视频库，ID: {video_library_id}, user_id: {user_id}")
+    except Exception as lib_error:
+        logger.exception(f"Task {task_id}: 保存到视频库失败: {lib_error}")
+
+    return {
+        "cos_url": cos_url,
+        "preview_url": preview_url,
+        "video_library_id": video_library_id,
+        "thumbnail_url": thumbnail_url,
+        "animated_preview_url": animated_preview_url,
+    }
+
+
+def _estimate_edit_cost(
+    video_paths: list,
+    speed: float,
+    width: int,
+    height: int,
+    voice_path: Optional[str] = None,
+    extra_outputs: Optional[list] = None,
+    preview: bool = False,
+    include_reencode: bool = True,
+):
+    """按缓存的 probe 估算渲染代价（预览按预览尺寸计）；估算失败不影响建任务"""
+    if preview:
+        width, height = preview_dimensions(width, height) or (width, height)
+    try:
+        return render_planner.estimate_cost(
+            [p for p in video_paths if p],
+            speed,
+            width,
+            height,
+            voice_path=voice_path,
+            extra_outputs=extra_outputs,
+            include_reencode=include_reencode,
+        )
+    except Exception:
+        logger.exception("估算渲染代价失败")
+        return render_planner.JobCost(0.0, 0.0, 0.0, 1.0, 1, 0.0)
+
+
+def _admission_rejected(plan):
+    """容量不足的拒绝响应：队列繁忙返回 429 + Retry-After；单任务过大返回 400"""
+    if plan.retry_after_seconds is None:
+        return response_error(plan.reason, 400, {"estimate": plan.to_dict()})
+    resp, code = response_error(plan.reason, 429, {"estimate": plan.to_dict()})
+    resp.headers["Retry-After"] = str(plan.retry_after_seconds)
+    return resp, code
+
+
+def _user_quota_rejected(db, user_id: int, plan, check_concurrency: bool = True):
+    """
+    每用户配额：每日渲染秒数（含排队任务的预计时长），以及进程内线程模式下的并发任务数
+    （DB 队列模式的并发上限由 worker 认领时执行，任务照常排队）。通过时返回 None。
+    """
+    if check_concurrency and EDIT_TASK_QUEUE == "thread" and edit_scheduler.EDIT_USER_MAX_CONCURRENT > 0:
+        active = (
+            db.query(VideoEditTask.id)
+            .filter(VideoEditTask.user_id == user_id, VideoEditTask.status.in_(["pending", "running"]))
+            .count()
+        )
+        if active >= edit_scheduler.EDIT_USER_MAX_CONCURRENT:
+            return response_error(
+                f"进行中的剪辑任务已达上限（{edit_scheduler.EDIT_USER_MAX_CONCURRENT}），请稍后再试", 429
+            )
+
+    quota = edit_scheduler.check_user_quota(db, user_id, plan.run_seconds, 1.0 / max(1e-3, plan.throughput))
+    if quota is None:
+        return None
+    reason, retry_after = quota
+    resp, code = response_error(reason, 429, {"estimate": plan.to_dict()})
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp, code
+
+
+def _remove_temp_files(temp_files: Optional[list], temp_dir: Optional[str]) -> None:
+    for p in (temp_files or []):
+        try:
+            if p and os.path.isfile(p):
+                os.remove(p)
+        except Exception:
+            pass
+    if temp_dir and os.path.isdir(temp_dir):
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _edit_task_cancelled(task_id: int) -> bool:
+    """任务已被取消或删除（供 job_control 轮询）"""
+    with get_db() as db:
+        row = db.query(VideoEditTask.status).filter(VideoEditTask.id == task_id).first()
+        return row is None or row[0] == "cancelled"
+
+
+def _discard_edit_outputs(paths: list) -> None:
+    """任务取消后删除已生成的成品及其封面/动图"""
+    for path in paths:
+        if not path:
+            continue
+        for p in [path] + list(thumbnail_paths(path).values()):
+            try:
+                if os.path.isfile(p):
+                    os.remove(p)
+            except Exception:
+                pass
+
+
+def cancel_edit_task(db, task: VideoEditTask) -> bool:
+    """
+    取消 pending/running 任务：置为 cancelled 并释放队列锁，终止本进程内正在运行的 ffmpeg。
+    任务在其它进程（worker）执行时，由该进程轮询到状态变化后自行终止。
+    """
+    if task.status not in ("pending", "running"):
+        return False
+    task.status = "cancelled"
+    task.error_message = "任务已取消"
+    task.locked_by = None
+    task.locked_at = None
+    task.finished_at = datetime.datetime.now()
+    task.updated_at = datetime.datetime.now()
+    db.commit()
+    _TASK_EVENTS.notify(task.id)
+    killed = job_control.cancel("edit", task.id)
+    logger.info(f"Task {task.id}: 已取消，终止进程 {killed} 个")
+    return True
+
+
+def _run_edit_task(task_id: int, *args, **kwargs):
+    """执行剪辑任务；期间启动的 ffmpeg 登记到本任务，任务被取消（或删除）后数秒内终止"""
+    try:
+        with job_control.job_scope("edit", task_id, poll=lambda: _edit_task_cancelled(task_id)):
+            _execute_edit_task(task_id, *args, **kwargs)
+    finally:
+        # 结束状态已写库，SSE 订阅者立即收到
+        _TASK_EVENTS.notify(task_id)
+
+
+def _execute_edit_task(
     task_id: int,
     video_paths: list,
     voice_path: Optional[str],
@@ -413,27 +815,43 @@ def _run_edit_task(
     is_mixed_clips: bool = False,
     target_width: int = 1080,
     target_height: int = 1920,
+    preview: bool = False,
+    extra_outputs: Optional[list] = None,
+    timeline_duration: Optional[float] = None,
 ):
-    """在后台线程中执行剪辑任务"""
+    """
+    在后台线程中执行剪辑任务（preview=True 时为低分辨率预览，不上传、不入库）。
+
+    extra_outputs: 附加画幅 [[比例, 宽, 高], ...]，与主输出同一次渲染（字幕叠加前 split），各自入库
+    timeline_duration: 批量剪辑组内最长的配音时长，组内各版本共享按该时长渲染的中间产物
+    """
     try:
         with get_db() as db:
             task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
-            if not task:
+            if not task or task.status == "cancelled":
                 return
             
             # 更新任务状态为运行中
             task.status = "running"
             task.progress = 10
             task.error_message = None
+            task.started_at = datetime.datetime.now()
             task.updated_at = datetime.datetime.now()
             db.commit()
+        _TASK_EVENTS.notify(task_id)
         
         time.sleep(0.05)
         
+        # 本任务已标记为 running，按当前负载选择线程数 / preset 并记录
+        encode_policy = choose_policy("render")
+        if preview:
+            encode_policy = encode_policy.for_preview()
+
         with get_db() as db:
             task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
             if task:
-                task.progress = 25
+                task.progress = RENDER_PROGRESS_START
+                task.encode_policy = encode_policy.to_json()
                 task.updated_at = datetime.datetime.now()
                 db.commit()
         
@@ -443,9 +861,21 @@ def _run_edit_task(
         
         output_path = None
         edit_error = None
-        try:
+
+        if preview:
+            extra_outputs = None
+        extra_targets = [(r.replace(":", "x"), int(w), int(h)) for r, w, h in (extra_outputs or [])]
+
+        def _on_render_progress(pct: int) -> None:
+            # ffmpeg 实际进度映射到 25~90 区间（前后为准备与上传/入库阶段）
+            _set_task_progress(task_id, RENDER_PROGRESS_START + int(pct * (RENDER_PROGRESS_END - RENDER_PROGRESS_START) / 100))
+
+        # 渲染情况（是否复用了中间产物），随编码策略记录，渲染规划学习吞吐时据此排除
+        render_info: dict = {}
+
+        def _render(targets):
             if is_mixed_clips:
-                output_path = video_editor.edit_mixed_concat_filter(
+                return video_editor.edit_mixed_concat_filter(
                     video_paths,
                     voice_path,
                     bgm_path,
@@ -456,29 +886,69 @@ def _run_edit_task(
                     output_name,
                     target_width=target_width,
                     target_height=target_height,
+                    progress_cb=_on_render_progress,
+                    encode_policy=encode_policy,
+                    preview=preview,
+                    extra_targets=targets,
                 )
-            else:
-                output_path = video_editor.edit(
-                    video_paths,
-                    voice_path,
-                    bgm_path,
-                    speed,
-                    subtitle_path,
-                    bgm_volume,
-                    voice_volume,
-                    output_name,
-                )
+            return video_editor.edit(
+                video_paths,
+                voice_path,
+                bgm_path,
+                speed,
+                subtitle_path,
+                bgm_volume,
+                voice_volume,
+                output_name,
+                progress_cb=_on_render_progress,
+                encode_policy=encode_policy,
+                preview=preview,
+                extra_targets=targets,
+                timeline_duration=timeline_duration,
+                render_info=render_info,
+            )
+
+        # 附加画幅与主输出同一次渲染；合并渲染失败时不带附加画幅重试一次，保证主输出
+        extra_error = None
+        try:
+            try:
+                output_path = _render(extra_targets)
+            except job_control.JobCancelled:
+                raise
+            except Exception as combined_ex:
+                if not extra_targets:
+                    raise
+                extra_error = str(combined_ex)
+                logger.exception(f"Task {task_id}: 多画幅合并渲染失败，仅重试主输出")
+                extra_targets = []
+                output_path = _render(extra_targets)
         except Exception as edit_ex:
             edit_error = str(edit_ex)
             logger.exception(f"Task {task_id}: Video edit failed with exception")
-        
+
+        extra_results = []
+        if extra_targets and not edit_error and output_path:
+            for (r, w, h), (label, _w, _h) in zip(extra_outputs, extra_targets):
+                path = aspect_variant_path(output_path, label)
+                if os.path.exists(path):
+                    extra_results.append((r, int(w), int(h), path))
+                else:
+                    extra_error = extra_error or f"未生成 {r} 画幅输出"
+
         with get_db() as db:
             task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
-            if not task:
+            if not task or task.status == "cancelled" or job_control.is_cancelled():
+                # 任务已取消/删除：丢弃已生成的成品，不上传、不入库
+                _discard_edit_outputs([output_path] + [r[3] for r in extra_results])
+                logger.info(f"Task {task_id}: 任务已取消，丢弃输出")
                 return
             
-            task.progress = 90
+            task.progress = RENDER_PROGRESS_END
             task.updated_at = datetime.datetime.now()
+            if render_info.get("reused_intermediate"):
+                task.encode_policy = json.dumps(
+                    {**json.loads(task.encode_policy or "{}"), "reused_intermediate": True}, ensure_ascii=False
+                )
             
             if edit_error:
                 # 剪辑过程中出现异常
@@ -486,72 +956,59 @@ def _run_edit_task(
                 task.progress = 100
                 task.error_message = f"剪辑失败：{edit_error}"
                 logger.error(f"Task {task_id}: Edit failed with error: {edit_error}")
+            elif preview and output_path and os.path.exists(output_path):
+                # 预览：移到预览目录，本地直接播放
+                preview_filename = "preview_" + os.path.basename(output_path)
+                preview_path = os.path.join(PREVIEW_DIR, preview_filename)
+                os.replace(output_path, preview_path)
+                uploads_rel = os.path.relpath(preview_path, UPLOADS_DIR).replace(os.sep, '/')
+
+                task.status = "success"
+                task.output_path = os.path.relpath(preview_path, BASE_DIR).replace(os.sep, "/")
+                task.output_filename = preview_filename
+                task.preview_url = f"/uploads/{uploads_rel}"
+                task.progress = 100
+                task.error_message = None
+                logger.info(f"Task {task_id}: Preview succeeded, output: {preview_path}")
             elif output_path and os.path.exists(output_path):
                 # 剪辑成功：上传到COS并保存到VideoLibrary
                 output_filename = os.path.basename(output_path)
                 relative_output_path = os.path.relpath(output_path, BASE_DIR).replace(os.sep, "/")
-                uploads_rel = os.path.relpath(output_path, os.path.join(BASE_DIR, 'uploads')).replace(os.sep, '/')
-                preview_url = f"/uploads/{uploads_rel}"
-                
-                # 上传到COS
-                cos_url = None
-                try:
-                    if COS_AVAILABLE:
-                        cos_key = generate_cos_key('video', output_filename)
-                        upload_result = upload_file_to_cos(output_path, cos_key)
-                        if upload_result['success']:
-                            # 对于私有存储桶，生成预签名URL用于访问
-                            from utils.cos_service import get_file_url
-                            cos_url = get_file_url(cos_key, use_presigned=True, expires_in=86400 * 7)  # 7天有效期
-                            logger.info(f"Task {task_id}: 视频已上传到COS: {upload_result['url']}")
-                            logger.info(f"Task {task_id}: 预签名URL已生成（7天有效期）")
-                        else:
-                            logger.warning(f"Task {task_id}: 上传到COS失败: {upload_result['message']}")
-                    else:
-                        logger.warning(f"Task {task_id}: COS不可用，使用本地存储")
-                except Exception as cos_error:
-                    logger.exception(f"Task {task_id}: COS上传异常: {cos_error}")
-                
-                # 保存到VideoLibrary表
-                video_library_id = None
-                try:
-                    video_name = output_filename.replace('.mp4', '').replace('output_', 'AI剪辑_')
-                    # 从任务中获取user_id，确保数据隔离
-                    user_id = task.user_id if hasattr(task, 'user_id') and task.user_id else None
-                    
-                    # 如果任务没有user_id，尝试从当前会话获取（备用方案）
-                    if not user_id:
-                        try:
-                            user_id = get_current_user_id()
-                            if user_id:
-                                logger.info(f"Task {task_id}: 任务缺少user_id，从当前会话获取: {user_id}")
-                                # 更新任务的user_id（如果可能）
-                                try:
-                                    task.user_id = user_id
-                                    db.commit()
-                                except Exception:
-                                    pass
-                        except Exception:
-                            pass
-                    
-                    if not user_id:
-                        logger.error(f"Task {task_id}: 无法获取user_id，无法保存到视频库")
-                    else:
-                        video_library = VideoLibrary(
-                            user_id=user_id,  # 关联任务所属用户
-                            video_name=video_name,
-                            video_url=cos_url or preview_url,  # 优先使用COS URL
-                            video_size=os.path.getsize(output_path),
-                            platform='output',  # 标记为成品
-                            description=f'AI剪辑生成，任务ID: {task_id}'
-                        )
-                        db.add(video_library)
-                        db.flush()
-                        video_library_id = video_library.id
-                        logger.info(f"Task {task_id}: 已保存到视频库，ID: {video_library_id}, user_id: {user_id}")
-                except Exception as lib_error:
-                    logger.exception(f"Task {task_id}: 保存到视频库失败: {lib_error}")
-                
+                published = _publish_output(db, task, task_id, output_path)
+                cos_url = published["cos_url"]
+                preview_url = published["preview_url"]
+                video_library_id = published["video_library_id"]
+                task.thumbnail_url = published["thumbnail_url"]
+                task.animated_preview_url = published["animated_preview_url"]
+
+                if extra_outputs:
+                    main_w, main_h = probe_video_dimensions(output_path)
+                    outputs = [{
+                        "ratio": "primary",
+                        "width": main_w,
+                        "height": main_h,
+                        "output_filename": output_filename,
+                        "output_path": relative_output_path,
+                        "preview_url": cos_url or preview_url,
+                        "video_library_id": video_library_id,
+                        "thumbnail_url": published["thumbnail_url"],
+                    }]
+                    for ratio, w, h, path in extra_results:
+                        extra = _publish_output(db, task, task_id, path)
+                        outputs.append({
+                            "ratio": ratio,
+                            "width": w,
+                            "height": h,
+                            "output_filename": os.path.basename(path),
+                            "output_path": os.path.relpath(path, BASE_DIR).replace(os.sep, "/"),
+                            "preview_url": extra["cos_url"] or extra["preview_url"],
+                            "video_library_id": extra["video_library_id"],
+                            "thumbnail_url": extra["thumbnail_url"],
+                        })
+                    if extra_error:
+                        outputs.append({"ratio": "extra", "error": f"多画幅导出失败：{extra_error}"})
+                    task.outputs_json = json.dumps(outputs, ensure_ascii=False)
+
                 # 更新任务状态
                 task.status = "success"
                 task.output_path = relative_output_path
@@ -578,6 +1035,7 @@ def _run_edit_task(
                 task.error_message = error_msg
                 logger.error(f"Task {task_id}: No output file generated. Expected: {output_path}")
             
+            task.finished_at = datetime.datetime.now()
             task.updated_at = datetime.datetime.now()
             db.commit()
     except Exception as e:
@@ -585,10 +1043,11 @@ def _run_edit_task(
         try:
             with get_db() as db:
                 task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
-                if task:
+                if task and task.status != "cancelled":
                     task.status = "fail"
                     task.progress = 100
                     task.error_message = str(e)
+                    task.finished_at = datetime.datetime.now()
                     task.updated_at = datetime.datetime.now()
                     db.commit()
         except Exception as db_error:
@@ -609,6 +1068,290 @@ def _run_edit_task(
             _TASK_THREADS.pop(task_id, None)
 
 
+def _to_payload_path(path: Optional[str]) -> Optional[str]:
+    """BASE_DIR 内的路径存相对路径，便于不同节点（挂载点一致）上的 worker 解析"""
+    if not path:
+        return None
+    abs_path = os.path.abspath(path)
+    try:
+        rel = os.path.relpath(abs_path, BASE_DIR)
+    except ValueError:
+        return abs_path
+    if rel.startswith(".."):
+        return abs_path
+    return rel.replace(os.sep, "/")
+
+
+def _from_payload_path(path: Optional[str]) -> Optional[str]:
+    if not path:
+        return None
+    if os.path.isabs(path):
+        return path
+    return os.path.join(BASE_DIR, path.replace("/", os.sep))
+
+
+def _encode_edit_payload(render_kwargs: dict) -> str:
+    payload = dict(render_kwargs)
+    payload["video_paths"] = [_to_payload_path(p) for p in (render_kwargs.get("video_paths") or [])]
+    for k in ("voice_path", "bgm_path", "subtitle_path", "temp_dir"):
+        payload[k] = _to_payload_path(render_kwargs.get(k))
+    payload["temp_files"] = [_to_payload_path(p) for p in (render_kwargs.get("temp_files") or [])]
+
+    # 随任务带上已缓存的 probe 摘要，worker 进程无需重新 probe
+    probes = {}
+    for p in list(render_kwargs.get("video_paths") or []) + [render_kwargs.get("voice_path")]:
+        if not p:
+            continue
+        key = _to_payload_path(p)
+        if key in probes:
+            continue
+        entry = export_cached_summary(p)
+        if entry:
+            probes[key] = entry
+    payload["probes"] = probes
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def _decode_edit_payload(payload_json: str) -> dict:
+    payload = json.loads(payload_json or "{}")
+    for key, entry in (payload.pop("probes", None) or {}).items():
+        import_cached_summary(_from_payload_path(key), entry)
+    payload["video_paths"] = [_from_payload_path(p) for p in (payload.get("video_paths") or [])]
+    for k in ("voice_path", "bgm_path", "subtitle_path", "temp_dir"):
+        payload[k] = _from_payload_path(payload.get(k))
+    payload["temp_files"] = [_from_payload_path(p) for p in (payload.get("temp_files") or [])]
+    return payload
+
+
+def _dispatch_edit_task(task_id: int, render_kwargs: dict) -> None:
+    """
+    派发异步剪辑任务：
+    - thread（默认）：进程内后台线程执行
+    - db：渲染参数写入 payload_json，由 worker_edit.py（可多节点部署）认领执行
+    """
+    if EDIT_TASK_QUEUE == "thread":
+        t = threading.Thread(target=_run_edit_task, args=(task_id,), kwargs=render_kwargs, daemon=True)
+        with _TASK_LOCK:
+            _TASK_THREADS[task_id] = t
+        t.start()
+        return
+
+    payload_json = _encode_edit_payload(render_kwargs)
+    with get_db() as db:
+        task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
+        if not task:
+            return
+        task.payload_json = payload_json
+        task.updated_at = datetime.datetime.now()
+        db.commit()
+
+    try:
+        maybe_start_edit_worker()
+    except Exception:
+        logger.exception("自动拉起剪辑 worker 失败")
+
+
+def _dispatch_edit_group(group_id: str, items: list) -> None:
+    """
+    派发一组剪辑任务 [(task_id, render_kwargs), ...]：
+    - db：逐个写入队列；组内第一个任务（组长）先被认领并生成共享的中间产物，
+      组长结束前其余版本不会被认领（见 edit_scheduler.claim_candidates），之后并行认领、直接复用
+    - thread：同一个后台线程内顺序执行，第一个版本生成中间产物，后续版本直接复用
+    """
+    if EDIT_TASK_QUEUE != "thread":
+        for task_id, render_kwargs in items:
+            _dispatch_edit_task(task_id, render_kwargs)
+        return
+
+    thread_key = f"group:{group_id}"
+
+    def _run_group():
+        try:
+            for task_id, render_kwargs in items:
+                _run_edit_task(task_id, **render_kwargs)
+        finally:
+            with _TASK_LOCK:
+                _TASK_THREADS.pop(thread_key, None)
+
+    t = threading.Thread(target=_run_group, daemon=True)
+    with _TASK_LOCK:
+        _TASK_THREADS[thread_key] = t
+    t.start()
+
+
+def run_edit_task_payload(task_id: int, payload_json: str) -> None:
+    """worker_edit.py 入口：按 payload_json 执行剪辑任务"""
+    _run_edit_task(task_id, **_decode_edit_payload(payload_json))
+
+
+def _content_hash(path: Optional[str], db=None) -> Optional[str]:
+    """
+    文件内容哈希：素材库文件优先用入库时记录在 meta_json 的 sha256（大小/mtime 一致时），
+    不在素材库或缺失时现算并回写，下次请求不再整文件读取。
+    :param db: 调用方的 session；给定时回写随调用方提交，避免另开连接与其争用写锁
+    """
+    if not path:
+        return None
+    if db is None:
+        with get_db() as own_db:
+            return _content_hash(path, own_db)
+    try:
+        rel_path = os.path.relpath(os.path.abspath(path), BASE_DIR).replace(os.sep, "/")
+        mat = db.query(Material).filter(Material.path == rel_path).first()
+        if mat is None:
+            return segment_cache.file_content_hash(path)
+        digest = stored_content_hash(mat.meta_json, path)
+        if digest:
+            return digest
+        digest = segment_cache.file_content_hash(path)
+        mat.meta_json = build_meta_json(probe_material(mat, path), path, mat.meta_json, content_sha256=digest)
+        return digest
+    except Exception:
+        logger.exception(f"读取素材内容哈希失败：{path}")
+        return segment_cache.file_content_hash(path)
+
+
+def _edit_job_hash(
+    *,
+    clips: list,
+    clip_paths: list,
+    voice_id,
+    voice_path: Optional[str],
+    bgm_id,
+    bgm_path: Optional[str],
+    speed: float,
+    subtitle_path: Optional[str],
+    bgm_volume: float,
+    voice_volume: float,
+    target_width: int,
+    target_height: int,
+    render_mode: str = "final",
+    extra_outputs: Optional[list] = None,
+    db=None,
+) -> str:
+    """
+    剪辑任务的规范哈希：素材 ID + 内容哈希、配音/BGM、速度、音量、字幕内容与输出尺寸。
+
+    素材文件被替换（内容变化）后哈希随之变化，不会误复用旧成片。
+    """
+    spec = {
+        "clips": [
+            {
+                "type": c.get("type") or "video",
+                "materialId": int(c["materialId"]),
+                "duration": c.get("duration"),
+                "sha256": _content_hash(p, db),
+            }
+            for c, p in zip(clips, clip_paths)
+        ],
+        "voice": {"id": int(voice_id), "sha256": _content_hash(voice_path, db)} if voice_path else None,
+        "bgm": {"id": int(bgm_id), "sha256": _content_hash(bgm_path, db)} if bgm_path else None,
+        "speed": round(float(speed), 4),
+        "subtitle": _content_hash(subtitle_path, db),
+        "bgm_volume": round(float(bgm_volume), 4),
+        "voice_volume": round(float(voice_volume), 4),
+        "size": [int(target_width), int(target_height)],
+        "render_mode": render_mode,
+    }
+    if extra_outputs:
+        spec["exports"] = [list(e) for e in extra_outputs]
+    payload = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _is_reusable_edit_task(task: VideoEditTask) -> bool:
+    """进行中（且未失联）的任务，或成片文件仍存在的成功任务"""
+    if task.status in ("pending", "running"):
+        stale_before = datetime.datetime.now() - datetime.timedelta(seconds=EDIT_DEDUPE_STALE_SECONDS)
+        seen = [d for d in (task.updated_at, task.locked_at, task.created_at) if d]
+        return bool(seen) and max(seen) >= stale_before
+    if task.status == "success":
+        return bool(task.output_path) and os.path.isfile(get_abs_path(task.output_path))
+    return False
+
+
+def _find_reusable_edit_task(
+    db, user_id: int, job_hash: str, finished_only: bool = False
+) -> Optional[VideoEditTask]:
+    """
+    查找可复用的同哈希任务：进行中（且未失联）的任务，或成片文件仍存在的成功任务。
+    只在同一用户内查找，保持数据隔离。
+
+    :param finished_only: 只复用成功任务（同步接口用：它不挂靠进行中的任务）
+    """
+    statuses = ["success"] if finished_only else ["pending", "running", "success"]
+    rows = (
+        db.query(VideoEditTask)
+        .filter(
+            VideoEditTask.user_id == user_id,
+            VideoEditTask.job_hash == job_hash,
+            VideoEditTask.status.in_(statuses),
+        )
+        .order_by(VideoEditTask.id.desc())
+        .limit(5)
+        .all()
+    )
+    for t in rows:
+        if _is_reusable_edit_task(t):
+            return t
+    return None
+
+
+def _add_edit_task(db, task: VideoEditTask) -> Tuple[VideoEditTask, bool]:
+    """
+    插入剪辑任务并 flush；返回 (任务, 是否复用了已有任务)。
+
+    去重由 (user_id, dedupe_key) 唯一索引保证：新任务占用 dedupe_key = job_hash，
+    多进程/多节点同时提交相同请求时只有一个插入成功，其余撞上唯一约束后复用它。
+    占着 dedupe_key 但已不可复用（失败/取消/失联/成片已删）的旧任务先让出 key。
+    """
+    if not task.job_hash:
+        db.add(task)
+        db.flush()
+        return task, False
+
+    for _attempt in range(3):
+        holder = (
+            db.query(VideoEditTask)
+            .filter(VideoEditTask.user_id == task.user_id, VideoEditTask.dedupe_key == task.job_hash)
+            .first()
+        )
+        if holder is not None:
+            if _is_reusable_edit_task(holder):
+                return holder, True
+            # 条件更新：并发请求同时让出同一个 key 也只会成功一次，不会误清别的任务
+            db.query(VideoEditTask).filter(
+                VideoEditTask.id == holder.id, VideoEditTask.dedupe_key == task.job_hash
+            ).update({VideoEditTask.dedupe_key: None}, synchronize_session=False)
+            db.expire(holder)
+
+        task.dedupe_key = task.job_hash
+        try:
+            with db.begin_nested():
+                db.add(task)
+                db.flush()
+            return task, False
+        except IntegrityError:
+            # 另一个请求刚插入了相同的任务：回滚到保存点后重新查找占用者
+            logger.info(f"剪辑任务去重键冲突（user_id={task.user_id}），复用已有任务")
+            continue
+    raise RuntimeError("相同剪辑请求并发冲突，请稍后重试")
+
+
+def _edit_success_payload(task: VideoEditTask) -> dict:
+    preview_url = task.preview_url or ""
+    return {
+        "task_id": task.id,
+        "output_filename": task.output_filename,
+        "preview_url": preview_url,
+        "cos_url": preview_url if preview_url.startswith("http") else None,
+        "video_library_id": None,
+        "thumbnail_url": task.thumbnail_url,
+        "animated_preview_url": task.animated_preview_url,
+        "deduplicated": True,
+    }
+
+
 @editor_bp.route('/editor/edit', methods=['POST'])
 @login_required
 def edit_video():
@@ -649,7 +1392,7 @@ def edit_video():
         speed = data.get("speed", 1.0)
         subtitle_path = (data.get("subtitle_path") or "").strip() or None
 
-        _cleanup_old_segment_dirs()
+        _maintain_segment_cache()
 
         # 参数校验：clips 优先
         if clips is None:
@@ -671,6 +1414,7 @@ def edit_video():
             return response_error(str(ex), 400)
 
         video_names = []
+        clip_paths = []
         voice_name = None
         bgm_name = None
         
@@ -679,7 +1423,9 @@ def edit_video():
                 mid = int(c["materialId"])
                 mat = db.query(Material).filter(Material.id == mid).first()
                 if not mat:
+                    clip_paths.append(None)
                     continue
+                clip_paths.append(get_abs_path(mat.path))
                 video_name = os.path.splitext(mat.name or os.path.basename(mat.path))[0]
                 video_names.append(video_name)
 
@@ -692,6 +1438,8 @@ def edit_video():
                 voice_path = get_abs_path(voice_mat.path)
                 if not os.path.exists(voice_path):
                     return response_error(f"配音文件不存在：{voice_mat.path}", 400)
+                # 预热 probe 缓存（配音时长在渲染阶段会再次用到）
+                _material_duration_seconds(voice_mat, voice_path)
                 voice_name = os.path.splitext(voice_mat.name or os.path.basename(voice_mat.path))[0]
                 if voice_name.startswith("配音_"):
                     voice_name = voice_name[2:]
@@ -765,7 +1513,33 @@ def edit_video():
             if not user_id:
                 return response_error('请先登录', 401)
             
-            # 创建任务记录
+            job_hash = None
+            if EDIT_DEDUPE:
+                job_hash = _edit_job_hash(
+                    clips=normalized_clips,
+                    clip_paths=clip_paths,
+                    voice_id=voice_id,
+                    voice_path=voice_path,
+                    bgm_id=bgm_id,
+                    bgm_path=bgm_path,
+                    speed=speed,
+                    subtitle_path=abs_sub_path,
+                    bgm_volume=0.25,
+                    voice_volume=1.0,
+                    target_width=1080,
+                    target_height=1920,
+                    db=db,
+                )
+
+            # 相同剪辑已完成：直接返回已有成片
+            existing = _find_reusable_edit_task(db, user_id, job_hash, finished_only=True) if job_hash else None
+            if existing is not None:
+                logger.info(f"剪辑请求与已完成任务 {existing.id} 相同，复用")
+                return response_success(_edit_success_payload(existing), "剪辑成功")
+
+            # 创建任务记录。同步任务在请求线程内执行、没有租约心跳，进程退出后会一直停在 running，
+            # 所以不占用去重键（dedupe_key），免得相同请求在 EDIT_DEDUPE_STALE_SECONDS 内都被挡住；
+            # 只记录 job_hash，成功后可被后续请求复用
             video_ids_str = json.dumps({"clips": normalized_clips}, ensure_ascii=False) if clips is not None else ",".join(map(str, video_ids))
             task = VideoEditTask(
                 user_id=user_id,  # 关联当前用户
@@ -774,6 +1548,9 @@ def edit_video():
                 bgm_id=bgm_id,
                 speed=speed,
                 subtitle_path=subtitle_path,
+                job_hash=job_hash,
+                cost_units=_estimate_edit_cost(segment_paths, speed, 1080, 1920, voice_path).units,
+                started_at=datetime.datetime.now(),
                 status="running",
                 progress=0
             )
@@ -791,7 +1568,9 @@ def edit_video():
                 voice_path=voice_path,
                 speed=speed,
             )
-            output_path = video_editor.edit(segment_paths, voice_path, bgm_path, speed, abs_sub_path, 0.25, 1.0, output_name)
+            with job_control.job_scope("edit", task_id, poll=lambda: _edit_task_cancelled(task_id)):
+                output_path = video_editor.edit(segment_paths, voice_path, bgm_path, speed, abs_sub_path, 0.25, 1.0, output_name)
+                job_control.check_cancelled()
 
             with get_db() as db:
                 task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
@@ -821,6 +1600,11 @@ def edit_video():
                         import traceback
                         traceback.print_exc()
                     
+                    # 封面/动图（出片时已顺带生成，缺失时快速补齐）
+                    thumbs = ensure_thumbnails(output_path)
+                    thumbnail_url = _upload_thumbnail(task_id, thumbs["poster"]) if thumbs.get("poster") else None
+                    animated_preview_url = _upload_thumbnail(task_id, thumbs["animated"]) if thumbs.get("animated") else None
+
                     # 保存到VideoLibrary表
                     video_library_id = None
                     try:
@@ -850,6 +1634,7 @@ def edit_video():
                                 user_id=user_id,  # 关联任务所属用户
                                 video_name=video_name,
                                 video_url=cos_url or preview_url,  # 优先使用COS URL
+                                thumbnail_url=thumbnail_url,
                                 video_size=os.path.getsize(output_path),
                                 platform='output',  # 标记为成品
                                 description=f'AI剪辑生成，任务ID: {task_id}'
@@ -868,8 +1653,11 @@ def edit_video():
                     task.output_path = relative_output_path
                     task.output_filename = output_filename
                     task.preview_url = cos_url or preview_url  # 优先使用COS URL
+                    task.thumbnail_url = thumbnail_url
+                    task.animated_preview_url = animated_preview_url
                     task.progress = 100
                     task.error_message = None
+                    task.finished_at = datetime.datetime.now()
                     task.updated_at = datetime.datetime.now()
                     db.commit()
                     
@@ -878,17 +1666,22 @@ def edit_video():
                         "output_filename": output_filename,
                         "preview_url": cos_url or preview_url,
                         "cos_url": cos_url,
-                        "video_library_id": video_library_id
+                        "video_library_id": video_library_id,
+                        "thumbnail_url": thumbnail_url,
+                        "animated_preview_url": animated_preview_url,
                     }, "剪辑成功")
                 else:
                     # 剪辑失败
                     task.status = "fail"
                     task.progress = 100
                     task.error_message = "未生成输出文件"
+                    task.finished_at = datetime.datetime.now()
                     task.updated_at = datetime.datetime.now()
                     db.commit()
                     return response_error("剪辑失败，未生成输出文件", 500)
 
+        except job_control.JobCancelled:
+            return response_error("任务已取消", 409, {"task_id": task_id})
         except Exception as e:
             with get_db() as db:
                 task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
@@ -896,6 +1689,7 @@ def edit_video():
                     task.status = "fail"
                     task.progress = 100
                     task.error_message = str(e)
+                    task.finished_at = datetime.datetime.now()
                     task.updated_at = datetime.datetime.now()
                     db.commit()
             return response_error(f"剪辑过程出错：{str(e)}", 500)
@@ -935,7 +1729,9 @@ def edit_video_async():
             "speed": float,           # 可选，播放速度（0.5-2.0），默认 1.0
             "subtitle_path": "string", # 可选，字幕文件路径（相对路径）
             "bgm_volume": float,      # 可选，BGM音量（0.0-1.0），默认 0.25
-            "voice_volume": float     # 可选，配音音量（0.0-1.0），默认 1.0
+            "voice_volume": float,    # 可选，配音音量（0.0-1.0），默认 1.0
+            "preview": bool,          # 可选，预览模式（短边 360、ultrafast，不上传不入库），默认 false
+            "export_ratios": [string] # 可选，附加导出画幅（9:16/1:1/16:9），一次解码多路编码，各自入库
         }
     
     返回数据:
@@ -944,9 +1740,21 @@ def edit_video_async():
             "code": 200,
             "message": "任务已创建",
             "data": {
-                "task_id": int
+                "task_id": int,
+                "deduplicated": bool,  # 可选，与已有任务完全相同时返回该任务ID，不重复渲染
+                "estimate": {          # 渲染规划（见 render_planner.py）
+                    "cost_units": float,
+                    "wait_seconds": float,
+                    "run_seconds": float,
+                    "estimated_start_at": "string",
+                    "estimated_finish_at": "string",
+                    ...
+                }
             }
         }
+
+        容量不足 (429): 预计排队超过 RENDER_MAX_QUEUE_WAIT_SECONDS，响应头带 Retry-After（秒），data.estimate 同上
+        任务过大 (400): 预计渲染超过 RENDER_MAX_JOB_SECONDS
     """
     try:
         data = request.get_json() or {}
@@ -971,7 +1779,17 @@ def edit_video_async():
         target_width, target_height = _calculate_output_dimensions(resolution, ratio)
         logger.info(f"视频输出尺寸: {target_width}x{target_height} (resolution={resolution}, ratio={ratio})")
 
-        _cleanup_old_segment_dirs()
+        # 预览模式：同样的时间线/字幕/音频，低分辨率 + 最快 preset
+        preview = bool(data.get("preview")) or (data.get("render_mode") == "preview")
+        render_mode = "preview" if preview else "final"
+
+        # 多画幅导出（预览模式忽略）
+        try:
+            extra_outputs = [] if preview else _parse_export_ratios(data.get("export_ratios"), resolution, ratio)
+        except ValueError as ve:
+            return response_error(str(ve), 400)
+
+        _maintain_segment_cache()
 
         with _TASK_LOCK:
             if len(_TASK_THREADS) >= MAX_CONCURRENT_EDIT_THREADS:
@@ -1000,12 +1818,13 @@ def edit_video_async():
         if clips is not None:
             try:
                 segment_paths, legacy_video_ids, normalized_clips, temp_files, temp_dir = _build_segments_from_request(
-                    data, target_width=target_width, target_height=target_height
+                    data, target_width=target_width, target_height=target_height, preview=preview
                 )
             except Exception as ex:
                 return response_error(str(ex), 400)
 
             video_names = []
+            clip_paths = []
             voice_name = None
             bgm_name = None
 
@@ -1014,7 +1833,9 @@ def edit_video_async():
                     mid = int(c["materialId"])
                     mat = db.query(Material).filter(Material.id == mid).first()
                     if not mat:
+                        clip_paths.append(None)
                         continue
+                    clip_paths.append(get_abs_path(mat.path))
                     clip_name = os.path.splitext(mat.name or os.path.basename(mat.path))[0]
                     video_names.append(clip_name)
 
@@ -1028,6 +1849,8 @@ def edit_video_async():
                     voice_path = get_abs_path(voice_mat.path)
                     if not os.path.exists(voice_path):
                         return response_error(f"配音文件不存在：{voice_mat.path}", 400)
+                    # 预热 probe 缓存（配音时长在渲染阶段会再次用到）
+                    _material_duration_seconds(voice_mat, voice_path)
                     voice_name = os.path.splitext(voice_mat.name or os.path.basename(voice_mat.path))[0]
 
                 if bgm_id is not None:
@@ -1088,6 +1911,45 @@ def edit_video_async():
                 if not user_id:
                     return response_error('请先登录', 401)
 
+                job_hash = None
+                if EDIT_DEDUPE:
+                    job_hash = _edit_job_hash(
+                        clips=normalized_clips,
+                        clip_paths=clip_paths,
+                        voice_id=voice_id,
+                        voice_path=voice_path,
+                        bgm_id=bgm_id,
+                        bgm_path=bgm_path,
+                        speed=speed,
+                        subtitle_path=abs_sub_path,
+                        bgm_volume=bgm_volume,
+                        voice_volume=voice_volume,
+                        target_width=target_width,
+                        target_height=target_height,
+                        render_mode=render_mode,
+                        extra_outputs=extra_outputs,
+                        db=db,
+                    )
+
+                # 按缓存的 probe 估算代价与排队时间，容量不足时拒绝
+                cost = _estimate_edit_cost(
+                    segment_paths, speed, target_width, target_height, voice_path, extra_outputs, preview
+                )
+                plan = render_planner.plan_job(cost.units)
+
+                existing = _find_reusable_edit_task(db, user_id, job_hash) if job_hash else None
+                if existing is not None:
+                    logger.info(f"剪辑请求与任务 {existing.id} 相同（{existing.status}），复用")
+                    return response_success({"task_id": existing.id, "deduplicated": True}, "任务已存在")
+
+                rejected = _user_quota_rejected(db, user_id, plan)
+                if rejected is None and not plan.admitted:
+                    logger.info(f"剪辑请求被拒绝：{plan.reason}（cost={cost.units}）")
+                    rejected = _admission_rejected(plan)
+                if rejected is not None:
+                    _remove_temp_files(temp_files, temp_dir)
+                    return rejected
+
                 video_ids_str = json.dumps({"clips": normalized_clips}, ensure_ascii=False)
                 task = VideoEditTask(
                     user_id=user_id,  # 关联当前用户
@@ -1096,12 +1958,18 @@ def edit_video_async():
                     bgm_id=bgm_id,
                     speed=speed,
                     subtitle_path=subtitle_path,
+                    render_mode=render_mode,
+                    job_hash=job_hash,
+                    cost_units=cost.units,
                     status="pending",
                     progress=0,
                     error_message=None,
                 )
-                db.add(task)
-                db.flush()
+                task, reused = _add_edit_task(db, task)
+                if reused:
+                    logger.info(f"剪辑请求与任务 {task.id} 相同（{task.status}），复用")
+                    _remove_temp_files(temp_files, temp_dir)
+                    return response_success({"task_id": task.id, "deduplicated": True}, "任务已存在")
                 task_id = task.id
                 db.commit()
 
@@ -1112,31 +1980,31 @@ def edit_video_async():
                 speed=speed,
             )
 
-            t = threading.Thread(
-                target=_run_edit_task,
-                args=(
-                    task_id,
-                    segment_paths,
-                    voice_path,
-                    bgm_path,
-                    speed,
-                    abs_sub_path,
-                    bgm_volume,
-                    voice_volume,
-                    output_name,
-                    temp_files,
-                    temp_dir,
-                    (any(c.get("type") == "image" for c in normalized_clips) and any(c.get("type") == "video" for c in normalized_clips)),
-                    target_width,
-                    target_height,
-                ),
-                daemon=True,
+            _dispatch_edit_task(
+                task_id,
+                {
+                    "video_paths": segment_paths,
+                    "voice_path": voice_path,
+                    "bgm_path": bgm_path,
+                    "speed": speed,
+                    "subtitle_path": abs_sub_path,
+                    "bgm_volume": bgm_volume,
+                    "voice_volume": voice_volume,
+                    "output_name": output_name,
+                    "temp_files": temp_files,
+                    "temp_dir": temp_dir,
+                    "is_mixed_clips": (
+                        any(c.get("type") == "image" for c in normalized_clips)
+                        and any(c.get("type") == "video" for c in normalized_clips)
+                    ),
+                    "target_width": target_width,
+                    "target_height": target_height,
+                    "preview": preview,
+                    "extra_outputs": extra_outputs,
+                },
             )
-            with _TASK_LOCK:
-                _TASK_THREADS[task_id] = t
-            t.start()
 
-            return response_success({"task_id": task_id}, "任务已创建")
+            return response_success({"task_id": task_id, "estimate": plan.to_dict()}, "任务已创建")
 
         video_paths = []
         video_names = []  # 用于生成文件名
@@ -1152,13 +2020,11 @@ def edit_video_async():
                 abs_path = get_abs_path(mat.path)
                 if not os.path.exists(abs_path):
                     return response_error(f"视频文件不存在：{mat.path}", 400)
-                duration = float(mat.duration or 0.0) if mat.duration is not None else 0.0
-                if duration <= 0:
-                    duration = _probe_duration_seconds(abs_path)
+                duration = _material_duration_seconds(mat, abs_path)
                 if duration <= 0:
                     return response_error(f"无法确定素材时长：{mat.path}", 400)
                 total_seconds += duration
-                video_paths.append(abs_path)
+                video_paths.append(_material_render_path(mat, abs_path, preview))
                 # 收集视频名称（去掉扩展名）
                 video_name = os.path.splitext(mat.name or os.path.basename(mat.path))[0]
                 video_names.append(video_name)
@@ -1180,6 +2046,8 @@ def edit_video_async():
                 if not os.path.exists(voice_path):
                     logger.error(f"配音文件不存在：{voice_path}")
                     return response_error(f"配音文件不存在：{voice_mat.path}", 400)
+                # 预热 probe 缓存（配音时长在渲染阶段会再次用到）
+                _material_duration_seconds(voice_mat, voice_path)
                 logger.info(f"配音文件验证成功：{voice_path}")
                 # 获取配音名称（去掉扩展名和前缀）
                 voice_name = voice_mat.name or os.path.basename(voice_mat.path)
@@ -1275,6 +2143,44 @@ def edit_video_async():
             if not user_id:
                 return response_error('请先登录', 401)
             
+            job_hash = None
+            if EDIT_DEDUPE:
+                job_hash = _edit_job_hash(
+                    clips=[{"type": "video", "materialId": vid} for vid in video_ids],
+                    clip_paths=video_paths,
+                    voice_id=voice_id,
+                    voice_path=voice_path,
+                    bgm_id=bgm_id,
+                    bgm_path=bgm_path,
+                    speed=speed,
+                    subtitle_path=abs_sub_path,
+                    bgm_volume=bgm_volume,
+                    voice_volume=voice_volume,
+                    target_width=target_width,
+                    target_height=target_height,
+                    render_mode=render_mode,
+                    extra_outputs=extra_outputs,
+                    db=db,
+                )
+
+            # 按缓存的 probe 估算代价与排队时间，容量不足时拒绝
+            cost = _estimate_edit_cost(
+                video_paths, speed, target_width, target_height, voice_path, extra_outputs, preview
+            )
+            plan = render_planner.plan_job(cost.units)
+
+            existing = _find_reusable_edit_task(db, user_id, job_hash) if job_hash else None
+            if existing is not None:
+                logger.info(f"剪辑请求与任务 {existing.id} 相同（{existing.status}），复用")
+                return response_success({"task_id": existing.id, "deduplicated": True}, "任务已存在")
+
+            rejected = _user_quota_rejected(db, user_id, plan)
+            if rejected is not None:
+                return rejected
+            if not plan.admitted:
+                logger.info(f"剪辑请求被拒绝：{plan.reason}（cost={cost.units}）")
+                return _admission_rejected(plan)
+
             # 创建任务记录
             video_ids_str = ",".join(map(str, video_ids))
             task = VideoEditTask(
@@ -1284,27 +2190,40 @@ def edit_video_async():
                 bgm_id=bgm_id,
                 speed=speed,
                 subtitle_path=subtitle_path,
+                render_mode=render_mode,
+                job_hash=job_hash,
+                cost_units=cost.units,
                 status="pending",
                 progress=0,
                 error_message=None
             )
-            db.add(task)
-            db.flush()
+            task, reused = _add_edit_task(db, task)
+            if reused:
+                logger.info(f"剪辑请求与任务 {task.id} 相同（{task.status}），复用")
+                return response_success({"task_id": task.id, "deduplicated": True}, "任务已存在")
             task_id = task.id
             db.commit()
 
-        # 启动后台任务
-        t = threading.Thread(
-            target=_run_edit_task,
-            args=(task_id, video_paths, voice_path, bgm_path, speed, abs_sub_path, bgm_volume, voice_volume, output_name, None, None),
-            daemon=True
+        # 派发后台任务（DB 队列或进程内线程）
+        _dispatch_edit_task(
+            task_id,
+            {
+                "video_paths": video_paths,
+                "voice_path": voice_path,
+                "bgm_path": bgm_path,
+                "speed": speed,
+                "subtitle_path": abs_sub_path,
+                "bgm_volume": bgm_volume,
+                "voice_volume": voice_volume,
+                "output_name": output_name,
+                "preview": preview,
+                "extra_outputs": extra_outputs,
+            },
         )
-        with _TASK_LOCK:
-            _TASK_THREADS[task_id] = t
-        t.start()
 
         return response_success({
-            "task_id": task_id
+            "task_id": task_id,
+            "estimate": plan.to_dict(),
         }, "任务已创建")
 
     except Exception as e:
@@ -1312,6 +2231,316 @@ def edit_video_async():
         return response_error(f"创建任务失败：{str(e)}", 500)
 
 
+def _sanitize_name_part(s: Optional[str], limit: int = 30) -> str:
+    """清理文件名片段，移除非法字符"""
+    import re
+
+    if not s:
+        return ""
+    s = re.sub(r'[<>:"/\\|?*]', '', str(s))
+    s = re.sub(r'\s+', '_', s)
+    s = s.strip('._')
+    return s[:limit]
+
+
+def _resolve_audio_material(db, material_id, label: str) -> tuple[Optional[str], Optional[str]]:
+    """校验音频素材并返回 (绝对路径, 名称)；material_id 为空时返回 (None, None)，不合法时抛 ValueError"""
+    if material_id is None:
+        return None, None
+    mat = db.query(Material).filter(Material.id == material_id).first()
+    if not mat or mat.type != "audio":
+        raise ValueError(f"{label}素材ID {material_id} 不存在或类型错误")
+    abs_path = get_abs_path(mat.path)
+    if not os.path.exists(abs_path):
+        raise ValueError(f"{label}文件不存在：{mat.path}")
+    # 预热 probe 缓存（时长在渲染阶段会再次用到）
+    _material_duration_seconds(mat, abs_path)
+    return abs_path, os.path.splitext(mat.name or os.path.basename(mat.path))[0]
+
+
+def _resolve_subtitle_path(subtitle_path: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+    """返回 (存库用的相对路径, 绝对路径)；路径非法或文件不存在时抛 ValueError"""
+    if not subtitle_path:
+        return None, None
+    subtitle_path = subtitle_path.lstrip('/')
+    abs_sub_path = get_abs_path(subtitle_path)
+    try:
+        abs_sub_path = _ensure_within_dir(abs_sub_path, SUBTITLE_DIR)
+    except Exception:
+        raise ValueError("字幕路径非法")
+    if not os.path.isfile(abs_sub_path):
+        raise ValueError(f"字幕文件不存在：{subtitle_path}")
+    return subtitle_path, abs_sub_path
+
+
+def _clamp_volume(value, default: float) -> float:
+    try:
+        v = float(value)
+    except Exception:
+        v = default
+    return max(0.0, min(1.0, v))
+
+
+@editor_bp.route('/editor/edit_batch', methods=['POST'])
+@login_required
+def edit_video_batch():
+    """
+    批量多版本剪辑接口：同一条时间线 + 多组配音/BGM/字幕覆盖，作为一个任务组调度。
+
+    共享的视频部分（拼接/调速/裁剪）只渲染一次（见 VideoEditor.edit 的中间产物缓存），
+    每个版本只做自己的混音与字幕叠加；每个版本各自生成 VideoEditTask / VideoLibrary 记录。
+    
+    请求方法: POST
+    路径: /api/editor/edit_batch
+    认证: 需要登录
+    
+    请求体 (JSON):
+        {
+            "clips": [...] 或 "video_ids": [int],  # 必填，共享时间线（同 edit_async）
+            "speed": float,                        # 可选，共享，默认 1.0
+            "resolution": "string",                # 可选，共享
+            "ratio": "string",                     # 可选，共享
+            "voice_id": int,                       # 可选，各版本默认值
+            "bgm_id": int,                         # 可选，各版本默认值
+            "subtitle_path": "string",             # 可选，各版本默认值
+            "bgm_volume": float,                   # 可选，各版本默认值
+            "voice_volume": float,                 # 可选，各版本默认值
+            "preview": bool,                       # 可选，整组按预览模式渲染
+            "variants": [                          # 必填，1 ~ EDIT_BATCH_MAX_VARIANTS 个
+                {
+                    "title": "string",             # 可选，成品文件名
+                    "voice_id": int,               # 可选，覆盖默认值（下同）
+                    "bgm_id": int,
+                    "subtitle_path": "string",
+                    "bgm_volume": float,
+                    "voice_volume": float
+                }
+            ]
+        }
+    
+    返回数据:
+        成功 (200):
+        {
+            "code": 200,
+            "message": "任务组已创建",
+            "data": {
+                "group_id": "string",
+                "task_ids": [int],        # 与 variants 一一对应
+                "deduplicated": [int],    # 复用已有任务的 task_id
+                "estimate": {...}         # 整组的渲染规划（同 edit_async）
+            }
+        }
+
+        容量不足 (429): 整组不入队，响应头带 Retry-After（秒）
+    """
+    try:
+        data = request.get_json() or {}
+        variants = data.get("variants")
+        if not isinstance(variants, list) or not variants:
+            return response_error("variants 不能为空", 400)
+        if len(variants) > EDIT_BATCH_MAX_VARIANTS:
+            return response_error(f"variants 数量超出限制（{EDIT_BATCH_MAX_VARIANTS}）", 400)
+        if any(not isinstance(v, dict) for v in variants):
+            return response_error("variants 的每一项必须是对象", 400)
+
+        try:
+            speed = float(data.get("speed", 1.0))
+        except Exception:
+            return response_error("播放速度必须是数字", 400)
+        if speed < 0.5 or speed > 2.0:
+            return response_error("播放速度超出范围（0.5~2.0）", 400)
+
+        target_width, target_height = _calculate_output_dimensions(
+            data.get("resolution", "auto"), data.get("ratio", "auto")
+        )
+        preview = bool(data.get("preview")) or (data.get("render_mode") == "preview")
+        render_mode = "preview" if preview else "final"
+
+        _maintain_segment_cache()
+
+        user_id = get_current_user_id()
+        if not user_id:
+            return response_error('请先登录', 401)
+
+        # 共享时间线只解析一次（图片片段进片段缓存）
+        try:
+            segment_paths, _legacy_video_ids, normalized_clips, _temp_files, _temp_dir = _build_segments_from_request(
+                data, target_width=target_width, target_height=target_height, preview=preview
+            )
+        except Exception as ex:
+            return response_error(str(ex), 400)
+        is_mixed_clips = (
+            any(c.get("type") == "image" for c in normalized_clips)
+            and any(c.get("type") == "video" for c in normalized_clips)
+        )
+
+        group_id = uuid.uuid4().hex
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        task_ids: list = []
+        deduplicated: list = []
+        to_dispatch: list = []
+
+        with get_db() as db:
+            clip_paths = []
+            clip_names = []
+            for c in normalized_clips:
+                mat = db.query(Material).filter(Material.id == int(c["materialId"])).first()
+                clip_paths.append(get_abs_path(mat.path) if mat else None)
+                if mat:
+                    clip_names.append(_sanitize_name_part(os.path.splitext(mat.name or os.path.basename(mat.path))[0]))
+            base_name = "_".join([n for n in clip_names[:3] if n]) or "batch"
+            if len(clip_names) > 3:
+                base_name += f"_等{len(clip_names)}个"
+
+            # 先校验全部版本，任何一个不合法都不创建任务
+            resolved = []
+            for i, variant in enumerate(variants):
+                spec = {**data, **variant}
+                try:
+                    voice_id = spec.get("voice_id")
+                    bgm_id = spec.get("bgm_id")
+                    voice_path, _voice_name = _resolve_audio_material(db, voice_id, "配音")
+                    bgm_path, _bgm_name = _resolve_audio_material(db, bgm_id, "BGM")
+                    subtitle_path, abs_sub_path = _resolve_subtitle_path(
+                        (spec.get("subtitle_path") or "").strip() or None
+                    )
+                except ValueError as ve:
+                    return response_error(f"variants[{i}]：{ve}", 400)
+                title = _sanitize_name_part(variant.get("title"), 60)
+                resolved.append({
+                    "voice_id": voice_id,
+                    "bgm_id": bgm_id,
+                    "voice_path": voice_path,
+                    "bgm_path": bgm_path,
+                    "subtitle_path": subtitle_path,
+                    "abs_sub_path": abs_sub_path,
+                    "bgm_volume": _clamp_volume(spec.get("bgm_volume", 0.25), 0.25),
+                    "voice_volume": _clamp_volume(spec.get("voice_volume", 1.0), 1.0),
+                    "output_name": f"{title or base_name}_{timestamp}_v{i + 1}.mp4",
+                })
+
+            # 共享的片段重编码只在第一个版本计入代价
+            for i, r in enumerate(resolved):
+                r["cost"] = _estimate_edit_cost(
+                    segment_paths, speed, target_width, target_height, r["voice_path"],
+                    preview=preview, include_reencode=(i == 0),
+                )
+
+            video_ids_str = json.dumps({"clips": normalized_clips}, ensure_ascii=False)
+            for r in resolved:
+                r["job_hash"] = None
+                r["existing_id"] = None
+                if EDIT_DEDUPE:
+                    r["job_hash"] = _edit_job_hash(
+                        clips=normalized_clips,
+                        clip_paths=clip_paths,
+                        voice_id=r["voice_id"],
+                        voice_path=r["voice_path"],
+                        bgm_id=r["bgm_id"],
+                        bgm_path=r["bgm_path"],
+                        speed=speed,
+                        subtitle_path=r["abs_sub_path"],
+                        bgm_volume=r["bgm_volume"],
+                        voice_volume=r["voice_volume"],
+                        target_width=target_width,
+                        target_height=target_height,
+                        render_mode=render_mode,
+                        db=db,
+                    )
+                    existing = _find_reusable_edit_task(db, user_id, r["job_hash"])
+                    if existing is not None:
+                        r["existing_id"] = int(existing.id)
+
+            # 整组按新建版本的代价之和做准入判断，要么全部入队要么全部拒绝
+            plan = render_planner.plan_job(
+                sum(r["cost"].units for r in resolved if r["existing_id"] is None)
+            )
+            if any(r["existing_id"] is None for r in resolved):
+                # 线程模式下整组在同一个线程里顺序执行（DB 队列由 worker 认领时限制并发），只检查每日配额
+                rejected = _user_quota_rejected(db, user_id, plan, check_concurrency=False)
+                if rejected is not None:
+                    return rejected
+                if not plan.admitted:
+                    logger.info(f"批量剪辑请求被拒绝：{plan.reason}")
+                    return _admission_rejected(plan)
+
+            for r in resolved:
+                if r["existing_id"] is not None:
+                    task_ids.append(r["existing_id"])
+                    deduplicated.append(r["existing_id"])
+                    continue
+
+                task = VideoEditTask(
+                    user_id=user_id,
+                    video_ids=video_ids_str,
+                    voice_id=r["voice_id"],
+                    bgm_id=r["bgm_id"],
+                    speed=speed,
+                    subtitle_path=r["subtitle_path"],
+                    render_mode=render_mode,
+                    job_hash=r["job_hash"],
+                    group_id=group_id,
+                    cost_units=r["cost"].units,
+                    status="pending",
+                    progress=0,
+                    error_message=None,
+                )
+                task, reused = _add_edit_task(db, task)
+                task_ids.append(int(task.id))
+                if reused:
+                    # 查重之后被并发的相同请求抢先创建
+                    deduplicated.append(int(task.id))
+                    continue
+                to_dispatch.append((int(task.id), r))
+            db.commit()
+
+        # 组内各版本共享一条按最长配音渲染的时间线（混剪路径不走中间产物）
+        timeline_duration = None
+        if not is_mixed_clips:
+            timeline_duration = max(
+                [_probe_duration_seconds(r["voice_path"]) for r in resolved if r["voice_path"]] or [0.0]
+            )
+
+        items = []
+        for task_id, r in to_dispatch:
+            items.append((
+                task_id,
+                {
+                    "video_paths": _repeat_last_image_segment_to_cover_voice(
+                        segment_paths=list(segment_paths),
+                        normalized_clips=normalized_clips,
+                        voice_path=r["voice_path"],
+                        speed=speed,
+                    ),
+                    "voice_path": r["voice_path"],
+                    "bgm_path": r["bgm_path"],
+                    "speed": speed,
+                    "subtitle_path": r["abs_sub_path"],
+                    "bgm_volume": r["bgm_volume"],
+                    "voice_volume": r["voice_volume"],
+                    "output_name": r["output_name"],
+                    "is_mixed_clips": is_mixed_clips,
+                    "target_width": target_width,
+                    "target_height": target_height,
+                    "preview": preview,
+                    "timeline_duration": timeline_duration,
+                },
+            ))
+        if items:
+            _dispatch_edit_group(group_id, items)
+
+        return response_success({
+            "group_id": group_id,
+            "task_ids": task_ids,
+            "deduplicated": deduplicated,
+            "estimate": plan.to_dict(),
+        }, "任务组已创建")
+
+    except Exception as e:
+        logger.exception("Create batch edit tasks failed")
+        return response_error(f"创建任务组失败：{str(e)}", 500)
+
+
 @editor_bp.route('/tasks', methods=['GET'])
 @login_required
 def list_tasks():
@@ -1323,7 +2552,8 @@ def list_tasks():
     认证: 需要登录
     
     查询参数:
-        status (string, 可选): 任务状态筛选（pending/running/success/fail）
+        status (string, 可选): 任务状态筛选（pending/running/success/fail/cancelled）
+        group_id (string, 可选): 批量剪辑任务组ID（见 /api/editor/edit_batch）
         limit (int, 可选): 每页数量，默认 50
         offset (int, 可选): 偏移量，默认 0
     
@@ -1340,6 +2570,7 @@ def list_tasks():
                     "bgm_id": int,
                     "speed": float,
                     "status": "string",
+                    "queue_position": int,      # pending 任务的排队位置（从 1 开始，按用户公平调度），其它状态为 null
                     "progress": int,
                     "output_filename": "string",
                     "preview_url": "string",
@@ -1352,6 +2583,7 @@ def list_tasks():
     """
     try:
         status = request.args.get("status")
+        group_id = (request.args.get("group_id") or "").strip() or None
         limit = int(request.args.get("limit", "50"))
         offset = int(request.args.get("offset", "0"))
         limit = max(1, min(limit, 200))
@@ -1362,9 +2594,14 @@ def list_tasks():
             
             if status:
                 query = query.filter(VideoEditTask.status == status)
+            if group_id:
+                query = query.filter(VideoEditTask.group_id == group_id)
             
             total = query.count()
             tasks = query.order_by(VideoEditTask.created_at.desc()).limit(limit).offset(offset).all()
+
+            # pending 任务按公平调度规则给出排队位置
+            positions = edit_scheduler.queue_positions(db) if any(t.status == "pending" for t in tasks) else {}
             
             tasks_list = []
             for task in tasks:
@@ -1375,7 +2612,13 @@ def list_tasks():
                     'bgm_id': task.bgm_id,
                     'speed': task.speed,
                     'subtitle_path': task.subtitle_path,
+                    'render_mode': task.render_mode or 'final',
+                    'group_id': task.group_id,
+                    'outputs': _task_outputs(task),
+                    'thumbnail_url': task.thumbnail_url,
+                    'animated_preview_url': task.animated_preview_url,
                     'status': task.status,
+                    'queue_position': positions.get(task.id),
                     'progress': task.progress,
                     'output_path': task.output_path,
                     'output_filename': task.output_filename,
@@ -1437,7 +2680,16 @@ def get_task(task_id: int):
                 'bgm_id': task.bgm_id,
                 'speed': task.speed,
                 'subtitle_path': task.subtitle_path,
+                'render_mode': task.render_mode or 'final',
+                'group_id': task.group_id,
+                'outputs': _task_outputs(task),
+                'thumbnail_url': task.thumbnail_url,
+                'animated_preview_url': task.animated_preview_url,
+                'cost_units': task.cost_units,
+                'started_at': task.started_at.isoformat() if task.started_at else None,
+                'finished_at': task.finished_at.isoformat() if task.finished_at else None,
                 'status': task.status,
+                'queue_position': edit_scheduler.queue_positions(db).get(task.id) if task.status == "pending" else None,
                 'progress': task.progress,
                 'output_path': task.output_path,
                 'output_filename': task.output_filename,
@@ -1452,6 +2704,130 @@ def get_task(task_id: int):
         return response_error(f"获取任务失败：{str(e)}", 500)
 
 
+def _task_progress_snapshots(task_ids) -> dict:
+    """一次查询多个任务的进度快照：{task_id: 快照}"""
+    with get_db() as db:
+        rows = (
+            db.query(
+                VideoEditTask.id,
+                VideoEditTask.status,
+                VideoEditTask.progress,
+                VideoEditTask.error_message,
+                VideoEditTask.output_filename,
+                VideoEditTask.preview_url,
+            )
+            .filter(VideoEditTask.id.in_(list(task_ids)))
+            .all()
+        )
+        return {
+            int(row[0]): {
+                "id": int(row[0]),
+                "status": row[1],
+                "progress": row[2],
+                "error_message": row[3],
+                "output_filename": row[4],
+                "preview_url": row[5],
+            }
+            for row in rows
+        }
+
+
+# 本进程所有 SSE 连接共用：一个轮询线程批量查库，本进程内的进度/状态变化即时通知
+_TASK_EVENTS = task_events.TaskEventHub(_task_progress_snapshots)
+
+
+@editor_bp.route('/tasks/<int:task_id>/events', methods=['GET'])
+@login_required
+def task_events_stream(task_id: int):
+    """
+    任务进度推送接口（Server-Sent Events）
+
+    请求方法: GET
+    路径: /api/tasks/{task_id}/events
+    认证: 需要登录
+
+    事件:
+        progress: {"id", "status", "progress", "error_message", "output_filename", "preview_url"}
+                  仅在状态/进度变化时推送；任务结束（success/fail/cancelled）后推送最后一次并关闭连接
+        error:    {"message"} 任务不存在
+    连接超过 TASK_EVENTS_MAX_SECONDS 由服务端关闭（客户端可重连）；
+    每用户同时打开的连接数超过 TASK_EVENTS_MAX_PER_USER 时返回 429。
+    """
+    if task_id not in _task_progress_snapshots([task_id]):
+        return response_error("任务不存在", 404)
+    try:
+        sub = _TASK_EVENTS.subscribe(get_current_user_id(), task_id)
+    except task_events.TooManySubscriptions as e:
+        resp, code = response_error(str(e), 429)
+        resp.headers["Retry-After"] = str(int(TASK_EVENTS_HEARTBEAT_SECONDS))
+        return resp, code
+
+    def _event(name: str, data: dict) -> str:
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def _stream():
+        deadline = time.monotonic() + TASK_EVENTS_MAX_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changed, snap = sub.wait(min(TASK_EVENTS_HEARTBEAT_SECONDS, remaining))
+            if not changed:
+                yield ": keep-alive\n\n"
+                continue
+            if snap is None:
+                yield _event("error", {"message": "任务不存在"})
+                return
+            yield _event("progress", snap)
+            if snap.get("status") in ("success", "fail", "cancelled"):
+                return
+
+    resp = Response(
+        stream_with_context(_stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # 正常结束、超时或客户端断开（包括生成器尚未开始）都会调用，释放连接名额
+    resp.call_on_close(sub.close)
+    return resp
+
+
+@editor_bp.route('/tasks/<int:task_id>/cancel', methods=['POST'])
+@login_required
+def cancel_task(task_id: int):
+    """
+    取消任务接口
+
+    请求方法: POST
+    路径: /api/tasks/{task_id}/cancel
+    认证: 需要登录
+
+    返回数据:
+        成功 (200):
+        {
+            "code": 200,
+            "message": "任务已取消",
+            "data": {"task_id": int, "status": "cancelled"}
+        }
+
+    说明:
+        - 只能取消 pending / running 的任务，其它状态返回 400
+        - 正在运行的 ffmpeg 会被终止（worker 进程内在 JOB_CANCEL_POLL_SECONDS 秒内生效），临时文件与未发布的成品会被清理
+    """
+    try:
+        with get_db() as db:
+            task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
+            if not task:
+                return response_error("任务不存在", 404)
+            if not cancel_edit_task(db, task):
+                return response_error(f"任务已结束（{task.status}），无法取消", 400)
+            return response_success({"task_id": task_id, "status": "cancelled"}, "任务已取消")
+
+    except Exception as e:
+        logger.exception("Cancel task failed")
+        return response_error(f"取消任务失败：{str(e)}", 500)
+
+
 @editor_bp.route('/tasks/<int:task_id>/delete', methods=['POST'])
 @login_required
 def delete_task(task_id: int):
@@ -1485,13 +2861,21 @@ def delete_task(task_id: int):
             if not task:
                 return response_error("任务不存在", 404)
 
+            # 进行中的任务先取消，停止正在运行的 ffmpeg
+            cancel_edit_task(db, task)
+
             if delete_output_file:
-                filename = task.output_filename
-                if filename:
+                # 主输出 + 多画幅导出的附加成品
+                filenames = [task.output_filename]
+                filenames += [o.get("output_filename") for o in (_task_outputs(task) or []) if o.get("ratio") != "primary"]
+                for filename in filenames:
+                    if not filename:
+                        continue
                     abs_path = os.path.normpath(os.path.join(OUTPUT_VIDEO_DIR, filename))
                     try:
-                        if os.path.isfile(abs_path):
-                            os.remove(abs_path)
+                        for p in [abs_path] + list(thumbnail_paths(abs_path).values()):
+                            if os.path.isfile(p):
+                                os.remove(p)
                     except Exception as e:
                         return response_error(f"删除成品文件失败：{e}", 500)
 
@@ -13,10 +13,21 @@ from datetime import datetime
 from werkzeug.utils import secure_filename
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import response_success, response_error, login_required
+from utils import response_success, response_error, login_required, get_current_user_id
 from models import Material, MaterialTranscodeTask
 from db import get_db
-from media_utils import ffprobe, summarize_probe, decide_transcode, get_duration_seconds
+from media_utils import (
+    build_meta_json,
+    file_sha256,
+    plan_transcode,
+    ffprobe,
+    get_duration_seconds,
+    remember_summary,
+    summarize_probe,
+)
+import chunked_upload
+import renditions
+import worker_notify
 
 material_bp = Blueprint('material', __name__, url_prefix='/api')
 
@@ -30,6 +41,7 @@ MATERIAL_ORIGINALS_DIR = os.path.join(UPLOAD_ROOT, 'materials', 'originals')
 MATERIAL_ORIGINAL_VIDEO_DIR = os.path.join(MATERIAL_ORIGINALS_DIR, 'videos')
 MATERIAL_ORIGINAL_AUDIO_DIR = os.path.join(MATERIAL_ORIGINALS_DIR, 'audios')
 MATERIAL_TMP_DIR = os.path.join(UPLOAD_ROOT, 'materials', '_tmp')
+MATERIAL_RENDITION_DIR = os.path.join(BASE_DIR, renditions.RENDITION_DIR_REL.replace('/', os.sep))
 
 # 允许的文件扩展名
 ALLOWED_VIDEO_EXT = ('.mp4', '.avi', '.mov')
@@ -98,14 +110,7 @@ def upload_material():
         if file.filename.strip() == '':
             return response_error('文件名不能为空', 400)
         
-        # 图片：仍用扩展名判定；视频/音频：用 ffprobe 判定（不要只靠扩展名）
         filename = file.filename
-        file_type = None
-        final_dir = None
-        originals_dir = None
-        probe_data = None
-        
-        # 提取文件扩展名用于调试
         ext = os.path.splitext(filename)[-1].lower()
 
         # Always save once, then route by detection.
@@ -113,6 +118,28 @@ def upload_material():
         tmp_name = unique_basename + (ext if ext else '')
         tmp_path = os.path.join(MATERIAL_TMP_DIR, tmp_name)
         file.save(tmp_path)
+        return _ingest_uploaded_file(tmp_path, filename)
+
+    except Exception as e:
+        return response_error(str(e), 500)
+
+
+def _ingest_uploaded_file(tmp_path: str, filename: str):
+    """
+    把已落盘到 MATERIAL_TMP_DIR 的上传文件入库（普通上传与分片上传 complete 共用）。
+    tmp_path 的文件名为 <唯一名><扩展名>，原片与转码产物沿用该唯一名；返回接口响应。
+    """
+    try:
+        # 图片：仍用扩展名判定；视频/音频：用 ffprobe 判定（不要只靠扩展名）
+        file_type = None
+        final_dir = None
+        originals_dir = None
+        probe_data = None
+        
+        # 提取文件扩展名用于调试
+        ext = os.path.splitext(filename)[-1].lower()
+        tmp_name = os.path.basename(tmp_path)
+        unique_basename = os.path.splitext(tmp_name)[0]
 
         if allowed_file(filename, 'image'):
             file_type = 'image'
@@ -242,8 +269,10 @@ def upload_material():
         width = (meta.get("video") or {}).get("width") if isinstance(meta.get("video"), dict) else None
         height = (meta.get("video") or {}).get("height") if isinstance(meta.get("video"), dict) else None
 
-        need_transcode, reason = decide_transcode(file_type, probe_data)
-        logger.info(f'转码判定: need={need_transcode}, reason={reason}')
+        # none 原样入库；remux/audio 只复制视频流（秒级），full 才完整重编码
+        transcode_plan, reason = plan_transcode(file_type, probe_data, input_save_path)
+        need_transcode = transcode_plan != 'none'
+        logger.info(f'转码判定: plan={transcode_plan}, reason={reason}')
 
         # 不需要转码：移动到最终目录，original_path=NULL，status=ready
         if not need_transcode:
@@ -274,11 +303,29 @@ def upload_material():
                     width=width,
                     height=height,
                     size=size,
-                    meta_json=json.dumps(meta, ensure_ascii=False),
+                    # 带文件指纹与内容哈希的 probe 摘要，剪辑/字幕等环节据此跳过重复 probe 与整文件读取
+                    meta_json=build_meta_json(meta, final_save_path, content_sha256=file_sha256(final_save_path)),
                 )
                 db.add(material)
                 db.flush()
+                # 原样入库的视频同样需要代理版本：素材立即可用，代理版本由转码 worker 后续补生成
+                needs_renditions = file_type == 'video' and bool(renditions.ladder())
+                if needs_renditions:
+                    db.add(MaterialTranscodeTask(
+                        material_id=material.id,
+                        input_path=relative_path,
+                        output_path=relative_path,
+                        kind=file_type,
+                        transcode_plan='renditions',
+                        status='pending',
+                        progress=0,
+                        attempts=0,
+                        max_attempts=3,
+                    ))
                 db.commit()
+                remember_summary(final_save_path, meta)
+                if needs_renditions:
+                    worker_notify.notify("transcode")
 
                 return response_success(
                     {
@@ -328,6 +375,7 @@ def upload_material():
                 input_path=input_rel,
                 output_path=output_rel,
                 kind=file_type,
+                transcode_plan=transcode_plan,
                 status='pending',
                 progress=0,
                 attempts=0,
@@ -337,6 +385,8 @@ def upload_material():
             )
             db.add(task)
             db.commit()
+            # 唤醒空闲的转码 worker 立即认领（best-effort，失败时 worker 靠兜底超时查库）
+            worker_notify.notify("transcode")
 
             # Compatibility: keep JSON {code:200} for existing frontend, but use HTTP 202.
             return (
@@ -350,6 +400,7 @@ def upload_material():
                             "path": output_rel,
                             "type": file_type,
                             "status": material.status,
+                            "transcode_plan": transcode_plan,
                         },
                     }
                 ),
@@ -360,6 +411,176 @@ def upload_material():
         return response_error(str(e), 500)
 
 
+@material_bp.route('/material/upload/init', methods=['POST'])
+@login_required
+def init_chunked_upload():
+    """
+    分片上传：创建会话
+
+    请求方法: POST
+    路径: /api/material/upload/init
+    认证: 需要登录
+
+    请求体 (JSON):
+        {
+            "filename": "string",    # 必填，原始文件名（决定扩展名）
+            "size": int,             # 必填，文件总字节数
+            "chunk_size": int,       # 可选，分片大小（1MB ~ 64MB），默认 CHUNKED_UPLOAD_CHUNK_SIZE
+            "purpose": "string"      # 可选，material（默认，入素材库）/ video_library（上传到视频库）
+        }
+
+    返回数据:
+        成功 (200):
+        {
+            "code": 200,
+            "message": "上传会话已创建",
+            "data": {"upload_id": "string", "size": int, "chunk_size": int, "total_chunks": int}
+        }
+
+    说明:
+        - 之后按 PUT /api/material/upload/<upload_id>/parts/<index> 逐片上传（index 从 0 开始，可乱序、可重试）
+        - 全部分片完成后调用 POST /api/material/upload/<upload_id>/complete 入库（与普通上传相同的判定与转码流程）
+        - 也可把 upload_id 交给 POST /api/video-library 上传到视频库（init 时传 purpose=video_library）
+        - 扩展名按 purpose 在此处校验，不支持的类型直接返回 400
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        purpose = (data.get('purpose') or 'material').strip().lower()
+        if purpose == 'video_library':
+            from blueprints.video_library import ALLOWED_VIDEO_EXTENSIONS
+            allowed_exts = ALLOWED_VIDEO_EXTENSIONS
+        elif purpose == 'material':
+            allowed_exts = ALLOWED_VIDEO_EXT + ALLOWED_AUDIO_EXT + ALLOWED_IMAGE_EXT
+        else:
+            return response_error('purpose 只能是 material 或 video_library', 400)
+        session = chunked_upload.init_upload(
+            MATERIAL_TMP_DIR,
+            get_current_user_id(),
+            data.get('filename'),
+            data.get('size'),
+            data.get('chunk_size'),
+            allowed_exts=allowed_exts,
+        )
+        return response_success(session, '上传会话已创建')
+    except chunked_upload.ChunkedUploadError as e:
+        return response_error(str(e), e.code)
+    except Exception as e:
+        return response_error(str(e), 500)
+
+
+@material_bp.route('/material/upload/<upload_id>/parts/<int:index>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id, index):
+    """
+    分片上传：上传单个分片
+
+    请求方法: PUT
+    路径: /api/material/upload/<upload_id>/parts/<index>
+    认证: 需要登录
+
+    请求体: 分片原始字节（application/octet-stream），长度须为 chunk_size（最后一片为余数）
+    请求头:
+        X-Chunk-Sha256: 可选，分片 SHA-256（十六进制），不一致时返回 422
+
+    说明:
+        - 请求体直接写入预分配文件的对应偏移，不经过 multipart 解析与临时文件
+        - 同一分片可重复上传（失败重试），以最后一次成功为准
+    """
+    try:
+        result = chunked_upload.write_part(
+            MATERIAL_TMP_DIR,
+            upload_id,
+            get_current_user_id(),
+            index,
+            request.stream,
+            sha256=request.headers.get('X-Chunk-Sha256'),
+        )
+        return response_success(result, '分片已接收')
+    except chunked_upload.ChunkedUploadError as e:
+        return response_error(str(e), e.code)
+    except Exception as e:
+        return response_error(str(e), 500)
+
+
+@material_bp.route('/material/upload/<upload_id>', methods=['GET'])
+@login_required
+def chunked_upload_status(upload_id):
+    """
+    分片上传：查询进度（断线续传时据 missing 补传）
+
+    请求方法: GET
+    路径: /api/material/upload/<upload_id>
+    认证: 需要登录
+
+    返回数据:
+        {"upload_id", "filename", "size", "chunk_size", "total_chunks", "received": [int], "missing": [int]}
+    """
+    try:
+        return response_success(
+            chunked_upload.upload_status(MATERIAL_TMP_DIR, upload_id, get_current_user_id()), '获取上传进度成功'
+        )
+    except chunked_upload.ChunkedUploadError as e:
+        return response_error(str(e), e.code)
+    except Exception as e:
+        return response_error(str(e), 500)
+
+
+class _IngestFailed(Exception):
+    """分片上传 complete 入库失败：携带原响应，触发 completing() 恢复上传会话"""
+
+    def __init__(self, response):
+        super().__init__("ingest failed")
+        self.response = response
+
+
+@material_bp.route('/material/upload/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(upload_id):
+    """
+    分片上传：完成并入库
+
+    请求方法: POST
+    路径: /api/material/upload/<upload_id>/complete
+    认证: 需要登录
+
+    返回数据: 与 POST /api/material/upload 相同（需要转码时返回 HTTP 202）；
+        仍有分片未上传时返回 409
+    """
+    try:
+        with chunked_upload.completing(MATERIAL_TMP_DIR, upload_id, get_current_user_id()) as (tmp_path, filename):
+            # 拼好的文件已在 MATERIAL_TMP_DIR，直接走普通上传的判定/转码流程
+            resp = _ingest_uploaded_file(tmp_path, filename)
+            if resp[1] >= 500 and os.path.exists(tmp_path):
+                # 数据文件还没被取走就失败了：恢复会话，客户端可用同一个 upload_id 重试 complete，无需重传分片
+                raise _IngestFailed(resp)
+            return resp
+    except _IngestFailed as e:
+        return e.response
+    except chunked_upload.ChunkedUploadError as e:
+        return response_error(str(e), e.code)
+    except Exception as e:
+        return response_error(str(e), 500)
+
+
+@material_bp.route('/material/upload/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_chunked_upload(upload_id):
+    """
+    分片上传：放弃会话并删除已上传的数据
+
+    请求方法: DELETE
+    路径: /api/material/upload/<upload_id>
+    认证: 需要登录
+    """
+    try:
+        chunked_upload.abort_upload(MATERIAL_TMP_DIR, upload_id, get_current_user_id())
+        return response_success({'upload_id': upload_id}, '上传已取消')
+    except chunked_upload.ChunkedUploadError as e:
+        return response_error(str(e), e.code)
+    except Exception as e:
+        return response_error(str(e), 500)
+
+
 @material_bp.route('/materials', methods=['GET'])
 @login_required
 def get_materials():
@@ -384,6 +605,7 @@ def get_materials():
                     "name": "string",
                     "path": "string",
                     "type": "string",
+                    "renditions": {"proxy": "string", "scrub": "string"},
                     "duration": int,
                     "width": int,
                     "height": int,
@@ -416,6 +638,11 @@ def get_materials():
                     'status': getattr(mat, 'status', None) or 'ready',
                     'original_path': getattr(mat, 'original_path', None),
                     'meta_json': getattr(mat, 'meta_json', None),
+                    # 代理版本相对路径（预览/时间线拖动用），如 {"proxy": "...", "scrub": "..."}
+                    'renditions': {
+                        name: info.get('path')
+                        for name, info in renditions.material_renditions(getattr(mat, 'meta_json', None)).items()
+                    },
                     'duration': mat.duration,
                     'width': mat.width,
                     'height': mat.height,
@@ -481,7 +708,7 @@ def clear_materials():
         delete_errors = []
         
         # 删除文件（含 originals）
-        for dir_path in [MATERIAL_VIDEO_DIR, MATERIAL_AUDIO_DIR, MATERIAL_IMAGE_DIR, MATERIAL_ORIGINALS_DIR]:
+        for dir_path in [MATERIAL_VIDEO_DIR, MATERIAL_AUDIO_DIR, MATERIAL_IMAGE_DIR, MATERIAL_ORIGINALS_DIR, MATERIAL_RENDITION_DIR]:
             try:
                 if not os.path.isdir(dir_path):
                     continue
@@ -532,6 +759,72 @@ def clear_materials():
         return response_error(str(e), 500)
 
 
+@material_bp.route('/material/cancel-transcode', methods=['POST'])
+@login_required
+def cancel_transcode():
+    """
+    取消素材转码接口
+
+    请求方法: POST
+    路径: /api/material/cancel-transcode
+    认证: 需要登录
+
+    请求体 (JSON):
+        {
+            "material_id": int      # 必填，素材ID
+        }
+
+    返回数据:
+        成功 (200):
+        {
+            "code": 200,
+            "message": "已取消转码",
+            "data": {"material_id": int, "task_id": int, "status": "cancelled"}
+        }
+
+    说明:
+        - 只能取消 pending / running 的转码任务；素材状态置为 failed（代理版本任务除外，素材保持 ready）
+        - 转码 worker 在 JOB_CANCEL_POLL_SECONDS 秒内发现取消，终止 ffmpeg 并删除未完成的产物
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            material_id = int(data.get('material_id'))
+        except Exception:
+            return response_error('material_id 必须是整数', 400)
+
+        with get_db() as db:
+            task = (
+                db.query(MaterialTranscodeTask)
+                .filter(
+                    MaterialTranscodeTask.material_id == material_id,
+                    MaterialTranscodeTask.status.in_(['pending', 'running']),
+                )
+                .order_by(MaterialTranscodeTask.id.desc())
+                .first()
+            )
+            if not task:
+                return response_error('没有进行中的转码任务', 404)
+
+            task.status = 'cancelled'
+            task.error_message = '转码已取消'
+            task.locked_by = None
+            task.locked_at = None
+            # 代理版本任务（素材已就绪）取消后素材照常可用
+            material = db.query(Material).filter(Material.id == material_id).first()
+            if material and task.transcode_plan != 'renditions':
+                material.status = 'failed'
+            db.commit()
+
+            return response_success(
+                {'material_id': material_id, 'task_id': task.id, 'status': 'cancelled'},
+                '已取消转码',
+            )
+
+    except Exception as e:
+        return response_error(str(e), 500)
+
+
 @material_bp.route('/delete-material', methods=['POST'])
 @login_required
 def delete_material():
@@ -647,8 +940,12 @@ def delete_material():
             except Exception:
                 pass
 
-            # 删除文件（产物 + originals）
-            for rel in [getattr(material, 'path', None), getattr(material, 'original_path', None)]:
+            # 删除文件（产物 + originals + 代理版本）
+            rendition_paths = [
+                info.get('path')
+                for info in renditions.material_renditions(getattr(material, 'meta_json', None)).values()
+            ]
+            for rel in [getattr(material, 'path', None), getattr(material, 'original_path', None)] + rendition_paths:
                 if not rel:
                     continue
                 abs_path = os.path.join(BASE_DIR, rel)
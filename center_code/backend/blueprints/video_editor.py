@@ -547,17 +547,25 @@ def cancel_task(task_id):
         }
     
     说明:
-        - 只能取消 pending 或 processing 状态的任务
+        - 只能取消 pending 或 running 状态的任务
         - 已完成或已失败的任务不能取消
         - 如果任务不存在，返回 404 错误
+        - 项目任务模型尚未实现，这里取消的是剪辑任务表 video_edit_tasks 中的任务（同 /api/tasks/{task_id}/cancel）
     """
-    # TODO: 实现取消任务功能
-    # 1. 根据 task_id 查询任务
-    # 2. 检查任务状态，确保可以取消
-    # 3. 更新任务状态为 cancelled
-    # 4. 停止后台处理任务（如果正在处理）
-    # 5. 返回取消结果
-    return response_error('功能待实现', 501)
+    from models import VideoEditTask
+    from db import get_db
+    from blueprints.editor import cancel_edit_task
+
+    try:
+        with get_db() as db:
+            task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
+            if not task:
+                return response_error('任务不存在', 404)
+            if not cancel_edit_task(db, task):
+                return response_error(f'任务已结束（{task.status}），无法取消', 400)
+            return response_success({'task_id': task_id, 'status': 'cancelled'}, 'Task cancelled')
+    except Exception as e:
+        return response_error(str(e), 500)
 
 
 @video_editor_bp.route('/projects/<int:project_id>/videos/<int:video_id>', methods=['DELETE'])
@@ -25,6 +25,8 @@ except ImportError:
 
 video_library_bp = Blueprint('video_library', __name__, url_prefix='/api/video-library')
 
+ALLOWED_VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.flv', '.wmv', '.webm', '.mkv'}
+
 
 def _extract_cos_key_from_url(url: str) -> str:
     """
@@ -217,6 +219,62 @@ def get_videos():
         return response_error(str(e), 500)
 
 
+def _upload_chunked_video(user_id: int, data: dict):
+    """
+    分片上传完成的文件（已在素材临时目录中拼好）直接上传到 COS 并入库，之后删除本地文件。
+    上传 COS 或入库失败时保留上传会话，客户端可用同一个 upload_id 重试，无需重传分片。
+    """
+    import chunked_upload
+    from blueprints.material import MATERIAL_TMP_DIR
+
+    if not COS_AVAILABLE:
+        return response_error('腾讯云COS不可用，无法上传视频文件', 500)
+
+    try:
+        with chunked_upload.completing(MATERIAL_TMP_DIR, data.get('upload_id'), user_id) as (temp_file_path, original_name):
+            filename = secure_filename(original_name) or os.path.basename(temp_file_path)
+            file_ext = os.path.splitext(filename)[1].lower()
+            if file_ext not in ALLOWED_VIDEO_EXTENSIONS:
+                # 不可能再成功的会话直接结束
+                os.remove(temp_file_path)
+                return response_error(f'File type not allowed. Allowed types: {", ".join(ALLOWED_VIDEO_EXTENSIONS)}', 400)
+
+            upload_result = upload_file_to_cos(temp_file_path, generate_cos_key('video', filename))
+            if not upload_result['success']:
+                raise RuntimeError(f'上传到COS失败: {upload_result["message"]}')
+
+            with get_db() as db:
+                video = VideoLibrary(
+                    user_id=user_id,
+                    video_name=data.get('video_name') or filename,
+                    video_url=upload_result['url'],
+                    thumbnail_url=data.get('thumbnail_url'),
+                    video_size=os.path.getsize(temp_file_path),
+                    platform=data.get('platform'),
+                    tags=data.get('tags'),
+                    description=data.get('description')
+                )
+                db.add(video)
+                db.flush()
+                db.commit()
+                result = {
+                    'id': video.id,
+                    'video_name': video.video_name,
+                    'video_url': video.video_url,
+                    'thumbnail_url': video.thumbnail_url
+                }
+    except chunked_upload.ChunkedUploadError as e:
+        return response_error(str(e), e.code)
+    except Exception as e:
+        return response_error(f'{e}（上传会话已保留，可重试）', 500)
+
+    try:
+        os.remove(temp_file_path)
+    except OSError:
+        pass
+    return response_success(result, 'Video uploaded to COS', 201)
+
+
 @video_library_bp.route('', methods=['POST'])
 @login_required
 def upload_video():
@@ -228,6 +286,9 @@ def upload_video():
     认证: 需要登录
     
     请求体 (multipart/form-data 或 JSON):
+        - 大文件：先用 /api/material/upload/init（purpose=video_library）与分片接口上传，再以 JSON 提交
+            {"upload_id": "string", "video_name", "platform", "tags", "description"}（均可选，除 upload_id）
+        
         - 如果上传文件：使用 multipart/form-data
             file: 视频文件（必填）
             thumbnail: 缩略图文件（可选）
@@ -287,12 +348,11 @@ def upload_video():
                 return response_error('No file selected', 400)
             
             # 检查文件类型
-            allowed_extensions = {'.mp4', '.mov', '.avi', '.flv', '.wmv', '.webm', '.mkv'}
             filename = secure_filename(file.filename)
             file_ext = os.path.splitext(filename)[1].lower()
             
-            if file_ext not in allowed_extensions:
-                return response_error(f'File type not allowed. Allowed types: {", ".join(allowed_extensions)}', 400)
+            if file_ext not in ALLOWED_VIDEO_EXTENSIONS:
+                return response_error(f'File type not allowed. Allowed types: {", ".join(ALLOWED_VIDEO_EXTENSIONS)}', 400)
             
             # 获取其他参数
             video_name = request.form.get('video_name') or filename
@@ -374,6 +434,9 @@ def upload_video():
             data = request.json
             if not data:
                 return response_error('No file or data provided', 400)
+
+            if data.get('upload_id'):
+                return _upload_chunked_video(user_id, data)
             
             video_name = data.get('video_name')
             video_url = data.get('video_url')
@@ -0,0 +1,299 @@
+"""
+分片可续传上传：init -> 逐片 PUT（可乱序、可重试）-> complete。
+
+- init 时在临时目录预分配目标文件 <upload_id><扩展名>，每个分片按 index * chunk_size 直接写到对应偏移，
+  complete 时无需再拼接或拷贝，文件原地交给后续入库流程
+- 会话状态放在 <临时目录>/_chunks/<upload_id>/：session.json + 每个已完成分片一个标记文件，
+  多进程 / 多节点（共享 uploads 目录）都能接着写；客户端断线后查询状态，只补传缺失的分片
+- 超过 CHUNKED_UPLOAD_TTL_SECONDS 未完成的会话在下次 init 时清理
+- 扩展名在 init 时校验，不合法的文件不会等到整个文件传完才被拒绝
+- complete 的后续处理（入库 / 上传 COS）失败时可用 completing() 保留会话，客户端直接重试 complete
+
+所有参数都可用环境变量覆盖。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 默认分片大小（字节），客户端可在 init 时指定（限制在 1MB ~ 64MB）
+CHUNKED_UPLOAD_CHUNK_SIZE = int(os.environ.get("CHUNKED_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# 单个文件上限（字节）
+CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get("CHUNKED_UPLOAD_MAX_SIZE", str(20 * 1024 * 1024 * 1024)))
+# 未完成会话的保留时长（秒）
+CHUNKED_UPLOAD_TTL_SECONDS = int(os.environ.get("CHUNKED_UPLOAD_TTL_SECONDS", "86400"))
+
+_MIN_CHUNK_SIZE = 1024 * 1024
+_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+_COPY_BUFSIZE = 1024 * 1024
+
+
+class ChunkedUploadError(Exception):
+    """上传协议错误；code 为对应的 HTTP 状态码"""
+
+    def __init__(self, message: str, code: int = 400):
+        super().__init__(message)
+        self.code = code
+
+
+def _sessions_dir(tmp_dir: str) -> str:
+    return os.path.join(tmp_dir, "_chunks")
+
+
+def _session_dir(tmp_dir: str, upload_id: str) -> str:
+    try:
+        upload_id = str(uuid.UUID(str(upload_id)))
+    except ValueError:
+        raise ChunkedUploadError("upload_id 无效", 404)
+    return os.path.join(_sessions_dir(tmp_dir), upload_id)
+
+
+def _load_session(tmp_dir: str, upload_id: str, user_id: Optional[int]) -> Tuple[str, Dict[str, Any]]:
+    session_dir = _session_dir(tmp_dir, upload_id)
+    try:
+        with open(os.path.join(session_dir, "session.json"), "r", encoding="utf-8") as f:
+            session = json.load(f)
+    except (OSError, ValueError):
+        raise ChunkedUploadError("上传会话不存在或已结束", 404)
+    if session.get("user_id") != user_id:
+        raise ChunkedUploadError("上传会话不存在或已结束", 404)
+    return session_dir, session
+
+
+def _data_path(tmp_dir: str, session: Dict[str, Any]) -> str:
+    return os.path.join(tmp_dir, session["upload_id"] + session.get("ext", ""))
+
+
+def _expected_length(session: Dict[str, Any], index: int) -> int:
+    chunk_size = int(session["chunk_size"])
+    return min(chunk_size, int(session["size"]) - index * chunk_size)
+
+
+def _received(session_dir: str) -> List[int]:
+    out = []
+    for name in os.listdir(session_dir):
+        if name.endswith(".part"):
+            try:
+                out.append(int(name[:-5]))
+            except ValueError:
+                continue
+    return sorted(out)
+
+
+def cleanup_stale(tmp_dir: str) -> int:
+    """删除过期的未完成会话及其数据文件"""
+    root = _sessions_dir(tmp_dir)
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    now = time.time()
+    for name in os.listdir(root):
+        session_dir = os.path.join(root, name)
+        try:
+            if now - os.path.getmtime(session_dir) < CHUNKED_UPLOAD_TTL_SECONDS:
+                continue
+            try:
+                with open(os.path.join(session_dir, "session.json"), "r", encoding="utf-8") as f:
+                    data_path = _data_path(tmp_dir, json.load(f))
+                if os.path.isfile(data_path):
+                    os.remove(data_path)
+            except (OSError, ValueError, KeyError):
+                pass
+            shutil.rmtree(session_dir, ignore_errors=True)
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def init_upload(
+    tmp_dir: str,
+    user_id: Optional[int],
+    filename: str,
+    size: int,
+    chunk_size: Optional[int] = None,
+    allowed_exts: Optional[Iterable[str]] = None,
+) -> Dict[str, Any]:
+    """
+    创建上传会话并预分配目标文件，返回会话信息（含 upload_id / chunk_size / total_chunks）
+    :param allowed_exts: 允许的扩展名（小写，含点）；为 None 时不限制
+    """
+    filename = (filename or "").strip()
+    if not filename:
+        raise ChunkedUploadError("文件名不能为空")
+    ext = os.path.splitext(filename)[-1].lower()
+    if allowed_exts is not None:
+        allowed = sorted({e.lower() for e in allowed_exts})
+        if ext not in allowed:
+            raise ChunkedUploadError(f"不支持的文件类型，允许：{', '.join(allowed)}")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise ChunkedUploadError("size 必须是整数")
+    if size <= 0:
+        raise ChunkedUploadError("size 必须 > 0")
+    if size > CHUNKED_UPLOAD_MAX_SIZE:
+        raise ChunkedUploadError(f"文件超出大小上限（{CHUNKED_UPLOAD_MAX_SIZE} 字节）", 413)
+    try:
+        chunk_size = int(chunk_size or CHUNKED_UPLOAD_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        raise ChunkedUploadError("chunk_size 必须是整数")
+    chunk_size = max(_MIN_CHUNK_SIZE, min(_MAX_CHUNK_SIZE, chunk_size))
+
+    cleanup_stale(tmp_dir)
+
+    upload_id = str(uuid.uuid4())
+    session = {
+        "upload_id": upload_id,
+        "user_id": user_id,
+        "filename": filename,
+        "ext": ext,
+        "size": size,
+        "chunk_size": chunk_size,
+        "total_chunks": (size + chunk_size - 1) // chunk_size,
+        "created_at": time.time(),
+    }
+    session_dir = _session_dir(tmp_dir, upload_id)
+    os.makedirs(session_dir, exist_ok=True)
+    # 稀疏预分配：各分片直接写入最终偏移
+    with open(_data_path(tmp_dir, session), "wb") as f:
+        f.truncate(size)
+    tmp = os.path.join(session_dir, "session.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(session, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(session_dir, "session.json"))
+
+    return {k: session[k] for k in ("upload_id", "size", "chunk_size", "total_chunks")}
+
+
+def write_part(
+    tmp_dir: str,
+    upload_id: str,
+    user_id: Optional[int],
+    index: int,
+    stream: BinaryIO,
+    sha256: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    把请求体流式写到分片对应的偏移（不经内存 / 临时文件缓冲）。同一分片可重复上传，后写覆盖先写。
+    :param sha256: 客户端给出的分片 SHA-256（十六进制），不一致时该分片视为未收到
+    """
+    session_dir, session = _load_session(tmp_dir, upload_id, user_id)
+    try:
+        index = int(index)
+    except (TypeError, ValueError):
+        raise ChunkedUploadError("分片序号必须是整数")
+    if index < 0 or index >= int(session["total_chunks"]):
+        raise ChunkedUploadError(f"分片序号超出范围（0 ~ {int(session['total_chunks']) - 1}）")
+
+    expected = _expected_length(session, index)
+    marker = os.path.join(session_dir, f"{index}.part")
+    # 重传时先撤销标记，写入中途失败不会被当作已收到
+    try:
+        os.remove(marker)
+    except OSError:
+        pass
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(_data_path(tmp_dir, session), "r+b") as f:
+        f.seek(index * int(session["chunk_size"]))
+        while written < expected:
+            buf = stream.read(min(_COPY_BUFSIZE, expected - written))
+            if not buf:
+                break
+            f.write(buf)
+            digest.update(buf)
+            written += len(buf)
+        # 多出的数据说明客户端分片大小与会话不一致
+        extra = stream.read(1)
+
+    if written != expected or extra:
+        raise ChunkedUploadError(f"分片 {index} 长度不符：期望 {expected} 字节")
+    if sha256 and digest.hexdigest() != sha256.strip().lower():
+        raise ChunkedUploadError(f"分片 {index} 校验失败", 422)
+
+    with open(marker, "w", encoding="utf-8") as f:
+        f.write(digest.hexdigest())
+    # 刷新会话目录 mtime，活跃会话不会被当作过期清理
+    os.utime(session_dir, None)
+    return {"index": index, "size": written, "sha256": digest.hexdigest()}
+
+
+def upload_status(tmp_dir: str, upload_id: str, user_id: Optional[int]) -> Dict[str, Any]:
+    """会话进度：已收到 / 缺失的分片序号，供断线后续传"""
+    session_dir, session = _load_session(tmp_dir, upload_id, user_id)
+    received = _received(session_dir)
+    got = set(received)
+    missing = [i for i in range(int(session["total_chunks"])) if i not in got]
+    return {
+        "upload_id": session["upload_id"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "total_chunks": session["total_chunks"],
+        "received": received,
+        "missing": missing,
+    }
+
+
+def _claim_completed(tmp_dir: str, upload_id: str, user_id: Optional[int]) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    校验分片已到齐，并把会话目录原子改名为 .finishing（同一会话并发 complete 时只有一方成功）。
+    :return: (原会话目录, .finishing 目录, 会话信息)
+    """
+    session_dir, session = _load_session(tmp_dir, upload_id, user_id)
+    received = set(_received(session_dir))
+    missing = [i for i in range(int(session["total_chunks"])) if i not in received]
+    if missing:
+        preview = ", ".join(str(i) for i in missing[:20])
+        raise ChunkedUploadError(f"还有 {len(missing)} 个分片未上传：{preview}", 409)
+
+    finishing = session_dir + ".finishing"
+    try:
+        os.rename(session_dir, finishing)
+    except OSError:
+        raise ChunkedUploadError("上传会话不存在或已结束", 409)
+    return session_dir, finishing, session
+
+
+def finish_upload(tmp_dir: str, upload_id: str, user_id: Optional[int]) -> Tuple[str, str]:
+    """
+    所有分片到齐后结束会话，返回 (数据文件绝对路径, 原始文件名)；数据文件交由调用方处理。
+    """
+    _, finishing, session = _claim_completed(tmp_dir, upload_id, user_id)
+    shutil.rmtree(finishing, ignore_errors=True)
+    return _data_path(tmp_dir, session), session["filename"]
+
+
+@contextmanager
+def completing(tmp_dir: str, upload_id: str, user_id: Optional[int]) -> Iterator[Tuple[str, str]]:
+    """
+    与 finish_upload 相同，但会话在 with 块成功结束后才删除：
+    块内抛异常（如上传 COS 失败）时会话与数据文件原样恢复，客户端可再次 complete 重试。
+    块内成功处理后数据文件由调用方删除。
+    """
+    session_dir, finishing, session = _claim_completed(tmp_dir, upload_id, user_id)
+    try:
+        yield _data_path(tmp_dir, session), session["filename"]
+    except BaseException:
+        try:
+            os.rename(finishing, session_dir)
+        except OSError:
+            pass
+        raise
+    shutil.rmtree(finishing, ignore_errors=True)
+
+
+def abort_upload(tmp_dir: str, upload_id: str, user_id: Optional[int]) -> None:
+    session_dir, session = _load_session(tmp_dir, upload_id, user_id)
+    try:
+        os.remove(_data_path(tmp_dir, session))
+    except OSError:
+        pass
+    shutil.rmtree(session_dir, ignore_errors=True)
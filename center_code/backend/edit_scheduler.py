@@ -0,0 +1,186 @@
+"""
+剪辑队列的按用户公平调度与配额。
+
+- 调度：按用户做加权公平（虚拟时间 = 已占用/分配槽位数 ÷ 用户权重），每次从负载最低的用户里取其最早的任务；
+  同负载时先到先得。这样一个用户一次提交 50 个任务也只会和其他用户轮流占用渲染槽位
+- 配额：每用户同时运行的任务数（worker 认领时跳过已到上限的用户）、每日渲染秒数（提交时检查）
+- 排队位置：按同样的规则模拟出队顺序，供任务列表接口展示
+- 批量任务组：组长（组内 ID 最小的任务）待处理/运行中时不认领其余版本，
+  组长先生成共享的中间产物，其余版本随后并行认领、直接复用，不会占着槽位等片段缓存的锁
+
+所有参数都可用环境变量覆盖。
+"""
+
+import datetime
+import heapq
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 每用户同时运行的剪辑任务上限；0 表示不限制
+EDIT_USER_MAX_CONCURRENT = int(os.environ.get("EDIT_USER_MAX_CONCURRENT", "0") or "0")
+# 每用户每日渲染秒数上限（按任务实际运行时长 + 排队任务的预计时长）；0 表示不限制
+EDIT_USER_DAILY_RENDER_SECONDS = float(os.environ.get("EDIT_USER_DAILY_RENDER_SECONDS", "0") or "0")
+# 用户权重，形如 "12:2,34:0.5"；未列出的用户权重为 1
+EDIT_USER_WEIGHTS = os.environ.get("EDIT_USER_WEIGHTS", "")
+
+# 组长还没结束的批量版本不可认领
+_GROUP_LEADER_IDLE = (
+    "NOT EXISTS (SELECT 1 FROM video_edit_tasks leader"
+    " WHERE video_edit_tasks.group_id IS NOT NULL"
+    " AND leader.id = (SELECT MIN(g.id) FROM video_edit_tasks g WHERE g.group_id = video_edit_tasks.group_id)"
+    " AND leader.id <> video_edit_tasks.id"
+    " AND leader.status IN ('pending', 'running'))"
+)
+
+
+def _parse_weights(raw: str) -> Dict[int, float]:
+    weights: Dict[int, float] = {}
+    for part in (raw or "").split(","):
+        if ":" not in part:
+            continue
+        uid, w = part.split(":", 1)
+        try:
+            weights[int(uid.strip())] = max(0.01, float(w.strip()))
+        except ValueError:
+            continue
+    return weights
+
+
+_WEIGHTS = _parse_weights(EDIT_USER_WEIGHTS)
+
+
+def user_weight(user_id: Optional[int]) -> float:
+    return _WEIGHTS.get(int(user_id or 0), 1.0)
+
+
+def fair_order(pending: Iterable[Tuple[int, int]], running: Dict[int, int]) -> List[int]:
+    """
+    按公平规则排出 pending 任务的出队顺序。
+
+    :param pending: [(task_id, user_id), ...]，每个用户内部已按提交顺序排列
+    :param running: {user_id: 正在运行的任务数}
+    :return: task_id 列表
+    """
+    queues: Dict[int, List[int]] = {}
+    for task_id, user_id in pending:
+        queues.setdefault(int(user_id or 0), []).append(int(task_id))
+
+    # (虚拟时间, 队首任务ID, user_id)：队首任务ID 越小越早提交，作为同负载时的先后
+    heap = []
+    for user_id, ids in queues.items():
+        heapq.heappush(heap, (running.get(user_id, 0) / user_weight(user_id), ids[0], user_id))
+
+    order: List[int] = []
+    pos = {user_id: 0 for user_id in queues}
+    while heap:
+        vtime, task_id, user_id = heapq.heappop(heap)
+        order.append(task_id)
+        pos[user_id] += 1
+        ids = queues[user_id]
+        if pos[user_id] < len(ids):
+            heapq.heappush(heap, (vtime + 1.0 / user_weight(user_id), ids[pos[user_id]], user_id))
+    return order
+
+
+def running_by_user(db) -> Dict[int, int]:
+    from sqlalchemy import func
+
+    from models import VideoEditTask
+
+    rows = (
+        db.query(VideoEditTask.user_id, func.count(VideoEditTask.id))
+        .filter(VideoEditTask.status == "running")
+        .group_by(VideoEditTask.user_id)
+        .all()
+    )
+    return {int(user_id or 0): int(cnt or 0) for user_id, cnt in rows}
+
+
+def claim_candidates(db, stale_before: datetime.datetime, limit: int = 5) -> List[int]:
+    """
+    worker 认领顺序：每个有待处理任务的用户取最早的一个，按公平规则排序，跳过已到并发上限的用户。
+    只需每个用户的队首，避免把整个 pending 队列读出来。组长未结束的批量版本不参与。
+    """
+    from sqlalchemy import func, text
+
+    from models import VideoEditTask
+
+    heads = (
+        db.query(VideoEditTask.user_id, func.min(VideoEditTask.id))
+        .filter(
+            VideoEditTask.payload_json.isnot(None),
+            VideoEditTask.attempts < VideoEditTask.max_attempts,
+            VideoEditTask.status == "pending",
+            (VideoEditTask.locked_at.is_(None)) | (VideoEditTask.locked_at < stale_before),
+            text(_GROUP_LEADER_IDLE),
+        )
+        .group_by(VideoEditTask.user_id)
+        .all()
+    )
+    if not heads:
+        return []
+    running = running_by_user(db)
+    if EDIT_USER_MAX_CONCURRENT > 0:
+        heads = [h for h in heads if running.get(int(h[0] or 0), 0) < EDIT_USER_MAX_CONCURRENT]
+    return fair_order([(task_id, user_id) for user_id, task_id in heads], running)[:limit]
+
+
+def queue_positions(db) -> Dict[int, int]:
+    """全部 pending 任务的排队位置（从 1 开始）"""
+    from models import VideoEditTask
+
+    rows = (
+        db.query(VideoEditTask.id, VideoEditTask.user_id)
+        .filter(VideoEditTask.status == "pending")
+        .order_by(VideoEditTask.id.asc())
+        .all()
+    )
+    order = fair_order(rows, running_by_user(db))
+    return {task_id: i + 1 for i, task_id in enumerate(order)}
+
+
+def daily_render_seconds(db, user_id: int, pending_seconds_per_unit: Optional[float] = None) -> float:
+    """
+    用户今日已用渲染秒数：已结束任务的实际运行时长 + 运行中任务已运行时长；
+    给定 pending_seconds_per_unit（秒/代价单位）时，排队任务按 cost_units 计入预计时长。
+    """
+    from models import VideoEditTask
+
+    now = datetime.datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = (
+        db.query(VideoEditTask.status, VideoEditTask.started_at, VideoEditTask.finished_at, VideoEditTask.cost_units)
+        .filter(
+            VideoEditTask.user_id == user_id,
+            (VideoEditTask.started_at >= midnight)
+            | ((VideoEditTask.status == "pending") & (VideoEditTask.created_at >= midnight)),
+        )
+        .all()
+    )
+    total = 0.0
+    for status, started_at, finished_at, cost_units in rows:
+        if status == "pending":
+            if pending_seconds_per_unit and cost_units:
+                total += float(cost_units) * pending_seconds_per_unit
+            continue
+        if started_at:
+            total += max(0.0, ((finished_at or now) - started_at).total_seconds())
+    return total
+
+
+def check_user_quota(db, user_id: int, run_seconds: float, seconds_per_unit: Optional[float] = None) -> Optional[Tuple[str, int]]:
+    """
+    提交前检查每日渲染配额。
+    :return: None 表示通过；否则 (原因, Retry-After 秒数：到次日零点)
+    """
+    if EDIT_USER_DAILY_RENDER_SECONDS <= 0:
+        return None
+    used = daily_render_seconds(db, user_id, seconds_per_unit)
+    if used + max(0.0, run_seconds) <= EDIT_USER_DAILY_RENDER_SECONDS:
+        return None
+    now = datetime.datetime.now()
+    tomorrow = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (
+        f"今日渲染额度不足（已用 {int(used)} 秒，本任务预计 {int(run_seconds)} 秒，上限 {int(EDIT_USER_DAILY_RENDER_SECONDS)} 秒）",
+        max(1, int((tomorrow - now).total_seconds())),
+    )
@@ -0,0 +1,124 @@
+"""
+编码策略：为每个 ffmpeg 任务分配 x264 线程数与 preset。
+
+- 线程数：按本机 CPU 核数在本机正在运行的编码任务（剪辑 + 转码）之间均分，避免多任务同时跑时超订；
+  其它节点上运行的任务不占本机的核
+- preset：队列积压时换更快的 preset（牺牲一些压缩率换吞吐），空闲时用更慢的 preset 提升画质
+
+所有阈值都可用环境变量覆盖；每个任务把实际使用的策略记录到各自任务表的 encode_policy 字段。
+"""
+
+import json
+import os
+import socket
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Dict, List, Tuple
+
+ENCODE_CRF = int(os.environ.get("ENCODE_CRF", "23"))
+ENCODE_PRESET_IDLE = os.environ.get("ENCODE_PRESET_IDLE", "medium")
+ENCODE_PRESET_NORMAL = os.environ.get("ENCODE_PRESET_NORMAL", "veryfast")
+ENCODE_PRESET_BUSY = os.environ.get("ENCODE_PRESET_BUSY", "superfast")
+# 排队任务数 >= 该值视为积压；0 表示按 CPU 核数 / 4 自动计算
+ENCODE_BUSY_QUEUE_DEPTH = int(os.environ.get("ENCODE_BUSY_QUEUE_DEPTH", "0") or "0")
+# 单个 x264 实例的线程上限（线程再多收益很小）
+ENCODE_MAX_THREADS = int(os.environ.get("ENCODE_MAX_THREADS", "16") or "16")
+# 预览渲染：低分辨率 + 最快 preset，只求尽快出片
+ENCODE_PREVIEW_PRESET = os.environ.get("ENCODE_PREVIEW_PRESET", "ultrafast")
+ENCODE_PREVIEW_CRF = int(os.environ.get("ENCODE_PREVIEW_CRF", "30"))
+
+
+@dataclass(frozen=True)
+class EncodePolicy:
+    kind: str
+    preset: str
+    crf: int
+    threads: int
+    running: int
+    pending: int
+
+    def x264_args(self) -> List[str]:
+        """subprocess 命令行参数"""
+        return ["-preset", self.preset, "-crf", str(self.crf), "-threads", str(self.threads)]
+
+    def x264_kwargs(self) -> Dict[str, Any]:
+        """ffmpeg-python output() 关键字参数"""
+        return {"preset": self.preset, "crf": self.crf, "threads": self.threads}
+
+    def for_preview(self) -> "EncodePolicy":
+        """同样的线程预算，换成预览用的 preset / crf"""
+        return replace(self, kind="preview", preset=ENCODE_PREVIEW_PRESET, crf=ENCODE_PREVIEW_CRF)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+
+def _cpu_count() -> int:
+    return max(1, os.cpu_count() or 1)
+
+
+def queue_load() -> Tuple[int, int]:
+    """
+    当前编码负载：(本机运行中任务数, 排队任务数)，剪辑与转码两个队列合计。
+
+    运行中只统计占用本机 CPU 的任务：worker 认领的任务按 locked_by 的主机名前缀（worker_id 为 "主机名:pid..."）判断，
+    Web 进程内线程执行的任务（locked_by 为空）按本进程登记的 job_control 任务判断。排队任务数是全局的。
+    查询失败时视为空闲。
+    """
+    try:
+        from sqlalchemy import and_, func, or_
+
+        import job_control
+        from db import get_db
+        from models import MaterialTranscodeTask, VideoEditTask
+    except Exception:
+        return 0, 0
+
+    host_prefix = f"{socket.gethostname()}:%"
+    local_jobs = job_control.active_jobs()
+    running = 0
+    pending = 0
+    try:
+        with get_db() as db:
+            for model, kind in ((VideoEditTask, "edit"), (MaterialTranscodeTask, "transcode")):
+                in_process = [task_id for k, task_id in local_jobs if k == kind]
+                local = model.locked_by.like(host_prefix)
+                if in_process:
+                    local = or_(local, and_(model.locked_by.is_(None), model.id.in_(in_process)))
+                running += int(
+                    db.query(func.count(model.id)).filter(model.status == "running", local).scalar() or 0
+                )
+                pending += int(db.query(func.count(model.id)).filter(model.status == "pending").scalar() or 0)
+    except Exception:
+        return 0, 0
+    return running, pending
+
+
+def choose_policy(kind: str) -> EncodePolicy:
+    """
+    为即将开始的编码任务选择策略。
+
+    :param kind: render（剪辑成片）/ transcode（素材转码）
+    """
+    cores = _cpu_count()
+    running, pending = queue_load()
+    # 调用方通常已把自己标记为 running；未标记时也至少按 1 个任务计算
+    active = max(1, running)
+
+    threads = max(1, min(ENCODE_MAX_THREADS, cores // active))
+
+    busy_depth = ENCODE_BUSY_QUEUE_DEPTH if ENCODE_BUSY_QUEUE_DEPTH > 0 else max(2, cores // 4)
+    if pending >= busy_depth:
+        preset = ENCODE_PRESET_BUSY
+    elif pending > 0 or active > 1:
+        preset = ENCODE_PRESET_NORMAL
+    else:
+        preset = ENCODE_PRESET_IDLE
+
+    return EncodePolicy(
+        kind=kind,
+        preset=preset,
+        crf=ENCODE_CRF,
+        threads=threads,
+        running=running,
+        pending=pending,
+    )
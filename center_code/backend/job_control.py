@@ -0,0 +1,200 @@
+"""
+任务取消：按任务登记正在运行的 ffmpeg 进程，取消时终止整个进程树。
+
+- 执行任务的线程用 job_scope(kind, task_id) 声明当前任务，其间经 popen()/run() 启动的进程都登记到该任务
+- cancel(kind, task_id) 标记取消并终止已登记的进程组（先 SIGTERM，超时后 SIGKILL）；之后再启动进程直接抛 JobCancelled
+- worker 与 Web 进程不在同一进程时，job_scope 的 poll 回调定期查库（任务被置为 cancelled 或已删除），发现后在本进程内取消
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Set, Tuple
+
+# worker 查库检查任务是否已取消的间隔（秒）
+JOB_CANCEL_POLL_SECONDS = float(os.environ.get("JOB_CANCEL_POLL_SECONDS", "2.0") or "2.0")
+# SIGTERM 后等待进程退出的时间，超时改用 SIGKILL
+JOB_KILL_GRACE_SECONDS = float(os.environ.get("JOB_KILL_GRACE_SECONDS", "3.0") or "3.0")
+
+_IS_WINDOWS = sys.platform.startswith("win")
+
+JobKey = Tuple[str, int]
+
+_local = threading.local()
+_LOCK = threading.Lock()
+_PROCS: Dict[JobKey, Set[subprocess.Popen]] = {}
+_ACTIVE: Set[JobKey] = set()
+_CANCELLED: Set[JobKey] = set()
+
+
+class JobCancelled(Exception):
+    """任务已被取消（不继承 RuntimeError，避免被 ffmpeg 失败的包装逻辑吞掉）"""
+
+
+def current_job() -> Optional[JobKey]:
+    return getattr(_local, "job", None)
+
+
+def is_cancelled(key: Optional[JobKey] = None) -> bool:
+    key = key or current_job()
+    if key is None:
+        return False
+    with _LOCK:
+        return key in _CANCELLED
+
+
+def check_cancelled() -> None:
+    """在流水线各阶段之间调用：当前任务已取消时抛 JobCancelled"""
+    key = current_job()
+    if key is not None and is_cancelled(key):
+        raise JobCancelled(f"{key[0]} task {key[1]} cancelled")
+
+
+def _watch(key: JobKey, poll: Callable[[], bool], stop: threading.Event) -> None:
+    while not stop.wait(JOB_CANCEL_POLL_SECONDS):
+        try:
+            if poll():
+                cancel(*key)
+                return
+        except Exception as e:
+            print(f"[job_control] {key[0]} task {key[1]}: 检查取消状态失败：{e}")
+
+
+@contextmanager
+def job_scope(kind: str, task_id: int, poll: Optional[Callable[[], bool]] = None):
+    """
+    声明当前线程正在执行的任务。
+
+    :param poll: 可选，返回 True 表示任务已在别处被取消（通常是查库），由后台线程按 JOB_CANCEL_POLL_SECONDS 轮询
+    """
+    key = (kind, int(task_id))
+    prev = current_job()
+    _local.job = key
+    with _LOCK:
+        _ACTIVE.add(key)
+    stop = threading.Event()
+    if poll is not None:
+        threading.Thread(target=_watch, args=(key, poll, stop), name=f"cancel-watch-{kind}-{task_id}", daemon=True).start()
+    try:
+        yield key
+    finally:
+        stop.set()
+        _local.job = prev
+        with _LOCK:
+            _ACTIVE.discard(key)
+            _CANCELLED.discard(key)
+            _PROCS.pop(key, None)
+
+
+def active_jobs() -> Set[JobKey]:
+    """本进程内正在执行的任务"""
+    with _LOCK:
+        return set(_ACTIVE)
+
+
+def bind(fn: Callable) -> Callable:
+    """把当前任务带进线程池里的工作线程（线程池不继承 thread-local）"""
+    key = current_job()
+
+    def _wrapped(*args, **kwargs):
+        prev = current_job()
+        _local.job = key
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.job = prev
+
+    return _wrapped
+
+
+def _kill_tree(p: subprocess.Popen) -> None:
+    if p.poll() is not None:
+        return
+    try:
+        if _IS_WINDOWS:
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(p.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            return
+        os.killpg(p.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError, OSError):
+        return
+
+    def _escalate() -> None:
+        deadline = time.monotonic() + JOB_KILL_GRACE_SECONDS
+        while time.monotonic() < deadline:
+            if p.poll() is not None:
+                return
+            time.sleep(0.1)
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError, OSError):
+            pass
+
+    threading.Thread(target=_escalate, daemon=True).start()
+
+
+def cancel(kind: str, task_id: int) -> int:
+    """
+    取消任务：标记取消并终止本进程内该任务登记的全部进程树。
+    返回被终止的进程数；任务不在本进程执行时什么也不做，返回 0（由执行方的 poll 发现）。
+    """
+    key = (kind, int(task_id))
+    with _LOCK:
+        if key not in _ACTIVE:
+            return 0
+        _CANCELLED.add(key)
+        procs = list(_PROCS.get(key) or ())
+    for p in procs:
+        _kill_tree(p)
+    return len(procs)
+
+
+def popen(cmd, **kwargs) -> subprocess.Popen:
+    """
+    启动子进程并登记到当前任务（放入独立进程组，取消时可整组终止）。
+    当前任务已取消时不再启动，直接抛 JobCancelled；用完需调用 release()。
+    """
+    check_cancelled()
+    if _IS_WINDOWS:
+        kwargs["creationflags"] = kwargs.get("creationflags", 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs.setdefault("start_new_session", True)
+    p = subprocess.Popen(cmd, **kwargs)
+
+    key = current_job()
+    if key is not None:
+        with _LOCK:
+            _PROCS.setdefault(key, set()).add(p)
+            cancelled = key in _CANCELLED
+        # 登记前恰好被取消：cancel() 没看到这个进程，这里补杀
+        if cancelled:
+            _kill_tree(p)
+    return p
+
+
+def release(p: subprocess.Popen) -> None:
+    key = current_job()
+    if key is None:
+        return
+    with _LOCK:
+        procs = _PROCS.get(key)
+        if procs is not None:
+            procs.discard(p)
+
+
+def run(cmd, **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run 的可取消版本（支持 stdout/stderr/text/encoding 等 Popen 参数）"""
+    p = popen(cmd, **kwargs)
+    try:
+        stdout, stderr = p.communicate()
+    finally:
+        release(p)
+    check_cancelled()
+    return subprocess.CompletedProcess(cmd, p.returncode, stdout, stderr)
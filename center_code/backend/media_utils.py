@@ -1,8 +1,22 @@
+import hashlib
 import json
 import os
 import shutil
 import subprocess
-from typing import Any, Dict, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import job_control
+
+# 进程内 ffprobe 摘要缓存（LRU），键为 (绝对路径, 大小, mtime)
+PROBE_CACHE_SIZE = int(os.environ.get("PROBE_CACHE_SIZE", "512"))
+# 摘要结构版本：summarize_probe 字段变化时递增，使 meta_json 中的旧摘要失效
+PROBE_SUMMARY_VERSION = 3
+
+_PROBE_CACHE: "OrderedDict[Tuple[str, int, int], Dict[str, Any]]" = OrderedDict()
+_PROBE_LOCK = threading.Lock()
 
 
 def resolve_ffmpeg_exe() -> str:
@@ -120,8 +134,10 @@ def summarize_probe(probe_data: Dict[str, Any]) -> Dict[str, Any]:
             "codec_name": _s(v, "codec_name"),
             "pix_fmt": _s(v, "pix_fmt"),
             "profile": _s(v, "profile"),
+            "level": _s(v, "level"),
             "width": _s(v, "width"),
             "height": _s(v, "height"),
+            "sample_aspect_ratio": _s(v, "sample_aspect_ratio"),
             "r_frame_rate": _s(v, "r_frame_rate"),
             "avg_frame_rate": _s(v, "avg_frame_rate"),
             "bits_per_raw_sample": _s(v, "bits_per_raw_sample"),
@@ -157,7 +173,51 @@ def _coerce_float(v) -> Optional[float]:
         return None
 
 
-def decide_transcode(kind: str, probe_data: Dict[str, Any]) -> Tuple[bool, str]:
+# 入库转码方案：none 原样入库 / remux 仅换封装（-c copy +faststart）/ audio 视频流复制、只重编码音频 / full 完整重编码
+TRANSCODE_PLANS = ("none", "remux", "audio", "full")
+
+# 可直接入库的封装扩展名（ffprobe 的 format_name 无法区分 mov 与 mp4，按扩展名判断）
+_MP4_EXTS = (".mp4", ".m4v")
+
+
+def mp4_faststart(path: str) -> Optional[bool]:
+    """
+    按顶层 box 顺序判断 moov 是否在 mdat 之前（只读各 box 头，不读媒体数据）。
+    :return: True/False；无法判断（非 MP4 结构、读取失败）时返回 None
+    """
+    try:
+        with open(path, "rb") as f:
+            for _ in range(64):
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                size = int.from_bytes(header[:4], "big")
+                box = header[4:8]
+                if box == b"moov":
+                    return True
+                if box == b"mdat":
+                    return False
+                if size == 1:
+                    large = f.read(8)
+                    if len(large) < 8:
+                        return None
+                    size = int.from_bytes(large, "big") - 16
+                elif size >= 8:
+                    size -= 8
+                else:
+                    return None
+                f.seek(size, os.SEEK_CUR)
+    except OSError:
+        return None
+    return None
+
+
+def plan_transcode(kind: str, probe_data: Dict[str, Any], path: Optional[str] = None) -> Tuple[str, str]:
+    """
+    选择入库转码方案（见 TRANSCODE_PLANS），返回 (方案, 原因)。
+    视频只有编码/像素格式/位深不符时才完整重编码；音轨不是 AAC 时复制视频流、只转音频；
+    仅封装不是 MP4 或 moov 在文件尾（给定 path 时检查）时只做 remux。
+    """
     kind = (kind or "").lower().strip()
     if kind == "video":
         v = _first_stream(probe_data, "video") or {}
@@ -168,19 +228,35 @@ def decide_transcode(kind: str, probe_data: Dict[str, Any]) -> Tuple[bool, str]:
         safe_codec = codec == "h264"
         safe_pix = pix_fmt == "yuv420p" if pix_fmt else False
         safe_bits = (bits_raw is None) or (bits_raw <= 8)
-
-        if safe_codec and safe_pix and safe_bits:
-            return (False, "h264+yuv420p+8bit")
-        return (True, f"codec={codec or 'unknown'},pix_fmt={pix_fmt or 'unknown'},bits={bits_raw or 'unknown'}")
+        if not (safe_codec and safe_pix and safe_bits):
+            return ("full", f"codec={codec or 'unknown'},pix_fmt={pix_fmt or 'unknown'},bits={bits_raw or 'unknown'}")
+
+        a = _first_stream(probe_data, "audio")
+        audio_codec = ((a or {}).get("codec_name") or "").lower()
+        if a and audio_codec != "aac":
+            return ("audio", f"h264+yuv420p, audio={audio_codec or 'unknown'}")
+
+        if path:
+            ext = os.path.splitext(path)[1].lower()
+            if ext not in _MP4_EXTS:
+                return ("remux", f"h264+yuv420p, container={ext or 'unknown'}")
+            if mp4_faststart(path) is False:
+                return ("remux", "h264+yuv420p, moov after mdat")
+        return ("none", "h264+yuv420p+8bit")
 
     if kind == "audio":
         a = _first_stream(probe_data, "audio") or {}
         codec = (a.get("codec_name") or "").lower()
         if codec == "mp3":
-            return (False, "mp3")
-        return (True, f"codec={codec or 'unknown'}")
+            return ("none", "mp3")
+        return ("full", f"codec={codec or 'unknown'}")
+
+    return ("none", "n/a")
 
-    return (False, "n/a")
+
+def decide_transcode(kind: str, probe_data: Dict[str, Any], path: Optional[str] = None) -> Tuple[bool, str]:
+    plan, reason = plan_transcode(kind, probe_data, path)
+    return (plan != "none", reason)
 
 
 def get_duration_seconds(probe_data: Dict[str, Any]) -> float:
@@ -188,3 +264,321 @@ def get_duration_seconds(probe_data: Dict[str, Any]) -> float:
     d = _coerce_float(fmt.get("duration"))
     return float(d or 0.0)
 
+
+# =========================
+# ffprobe 元数据缓存
+# =========================
+# 同一文件在上传、剪辑、TTS、字幕等环节会被反复 probe。这里统一按 (path, size, mtime)
+# 缓存 summarize_probe 摘要：素材库文件持久化到 Material.meta_json，临时文件走进程内 LRU。
+
+
+def file_stamp(path: str) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns), "v": PROBE_SUMMARY_VERSION}
+
+
+def _cache_key(path: str, stamp: Dict[str, Any]) -> Tuple[str, int, int]:
+    return (os.path.normcase(os.path.abspath(path)), int(stamp["size"]), int(stamp["mtime_ns"]))
+
+
+def _cache_get(key: Tuple[str, int, int]) -> Optional[Dict[str, Any]]:
+    with _PROBE_LOCK:
+        summary = _PROBE_CACHE.get(key)
+        if summary is not None:
+            _PROBE_CACHE.move_to_end(key)
+        return summary
+
+
+def _cache_put(key: Tuple[str, int, int], summary: Dict[str, Any]) -> None:
+    with _PROBE_LOCK:
+        _PROBE_CACHE[key] = summary
+        _PROBE_CACHE.move_to_end(key)
+        while len(_PROBE_CACHE) > max(1, PROBE_CACHE_SIZE):
+            _PROBE_CACHE.popitem(last=False)
+
+
+def remember_probe(path: str, probe_data: Dict[str, Any]) -> Dict[str, Any]:
+    """把已有的完整 ffprobe 结果写入缓存（如上传时已 probe 过），返回摘要"""
+    summary = summarize_probe(probe_data)
+    remember_summary(path, summary)
+    return summary
+
+
+def remember_summary(path: str, summary: Dict[str, Any]) -> None:
+    try:
+        _cache_put(_cache_key(path, file_stamp(path)), summary)
+    except Exception:
+        pass
+
+
+def export_cached_summary(path: str) -> Optional[Dict[str, Any]]:
+    """
+    导出进程内已缓存的摘要（带文件指纹），不会触发 probe；
+    用于把 API 进程里已 probe 的结果随任务一起交给 worker 进程。
+    """
+    try:
+        stamp = file_stamp(path)
+    except Exception:
+        return None
+    summary = _cache_get(_cache_key(path, stamp))
+    if summary is None:
+        return None
+    return {"file": stamp, "summary": summary}
+
+
+def import_cached_summary(path: str, entry: Optional[Dict[str, Any]]) -> bool:
+    """导入 export_cached_summary 的结果；文件指纹不一致（文件已变化）时忽略"""
+    if not isinstance(entry, dict) or not isinstance(entry.get("summary"), dict):
+        return False
+    try:
+        stamp = file_stamp(path)
+    except Exception:
+        return False
+    if not _stamp_matches({"file": entry.get("file")}, stamp):
+        return False
+    _cache_put(_cache_key(path, stamp), entry["summary"])
+    return True
+
+
+def probe_summary(path: str) -> Dict[str, Any]:
+    """获取文件的 ffprobe 摘要（命中缓存时不启动子进程）；失败抛 RuntimeError"""
+    key = _cache_key(path, file_stamp(path))
+    summary = _cache_get(key)
+    if summary is not None:
+        return summary
+    summary = summarize_probe(ffprobe(path))
+    _cache_put(key, summary)
+    return summary
+
+
+def _stamp_matches(meta: Dict[str, Any], stamp: Dict[str, Any]) -> bool:
+    f = meta.get("file") if isinstance(meta, dict) else None
+    if not isinstance(f, dict):
+        return False
+    return (
+        _coerce_int(f.get("size")) == stamp["size"]
+        and _coerce_int(f.get("mtime_ns")) == stamp["mtime_ns"]
+        and _coerce_int(f.get("v")) == stamp["v"]
+    )
+
+
+def _same_file(meta: Dict[str, Any], stamp: Dict[str, Any]) -> bool:
+    """只比较 size/mtime：内容哈希与摘要版本无关"""
+    f = meta.get("file") if isinstance(meta, dict) else None
+    if not isinstance(f, dict):
+        return False
+    return _coerce_int(f.get("size")) == stamp["size"] and _coerce_int(f.get("mtime_ns")) == stamp["mtime_ns"]
+
+
+def _load_meta(meta_json: Optional[str]) -> Dict[str, Any]:
+    if not meta_json:
+        return {}
+    try:
+        meta = json.loads(meta_json)
+        return meta if isinstance(meta, dict) else {}
+    except Exception:
+        return {}
+
+
+def build_meta_json(
+    summary: Dict[str, Any],
+    path: str,
+    previous_meta_json: Optional[str] = None,
+    content_sha256: Optional[str] = None,
+) -> str:
+    """
+    生成 Material.meta_json：摘要 + 文件指纹（size/mtime），保留旧 meta 中的其它字段。
+    旧 meta 若是另一个文件（如转码前原片）的摘要，则挪到 source 下以便排查。
+    :param content_sha256: 文件内容哈希，记在 file.sha256；不传时沿用旧 meta 中指纹一致的哈希
+    """
+    old = _load_meta(previous_meta_json)
+    meta = {k: v for k, v in old.items() if k not in ("format", "video", "audio", "file")}
+    if old.get("format") is not None and "file" not in old and "source" not in old:
+        meta["source"] = {k: old.get(k) for k in ("format", "video", "audio")}
+    meta.update(summary)
+    stamp = file_stamp(path)
+    if not content_sha256 and _same_file(old, stamp):
+        content_sha256 = old["file"].get("sha256")
+    meta["file"] = dict(stamp, sha256=content_sha256) if content_sha256 else stamp
+    return json.dumps(meta, ensure_ascii=False)
+
+
+def file_sha256(path: str) -> str:
+    """计算文件内容的 sha256（入库时写入 meta_json，剪辑去重据此免读整个文件）"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stored_content_hash(meta_json: Optional[str], path: str) -> Optional[str]:
+    """meta_json 中记录的内容哈希；文件已变化（指纹不一致）或没有记录时返回 None"""
+    meta = _load_meta(meta_json)
+    try:
+        if not _same_file(meta, file_stamp(path)):
+            return None
+    except OSError:
+        return None
+    digest = meta["file"].get("sha256")
+    return str(digest) if digest else None
+
+
+def probe_material(material: Any, abs_path: str) -> Dict[str, Any]:
+    """
+    获取素材库文件的 ffprobe 摘要：meta_json 中的指纹与文件一致时直接复用，
+    否则重新 probe 并回写 material.meta_json（由调用方的 session 提交）。
+    """
+    stamp = file_stamp(abs_path)
+    key = _cache_key(abs_path, stamp)
+    summary = _cache_get(key)
+    meta_json = getattr(material, "meta_json", None)
+
+    if summary is None:
+        meta = _load_meta(meta_json)
+        if _stamp_matches(meta, stamp):
+            summary = {k: meta.get(k) for k in ("format", "video", "audio")}
+            _cache_put(key, summary)
+            return summary
+        summary = summarize_probe(ffprobe(abs_path))
+        _cache_put(key, summary)
+    elif _stamp_matches(_load_meta(meta_json), stamp):
+        return summary
+
+    try:
+        material.meta_json = build_meta_json(summary, abs_path, meta_json)
+        if getattr(material, "duration", None) in (None, 0):
+            d = summary_duration(summary)
+            if d > 0:
+                material.duration = d
+    except Exception:
+        pass
+    return summary
+
+
+def parse_frame_rate(rate: Any) -> Optional[float]:
+    """解析 ffprobe 的帧率字符串（如 30000/1001）"""
+    if rate is None:
+        return None
+    try:
+        txt = str(rate).strip()
+        if "/" in txt:
+            num, den = txt.split("/", 1)
+            den_f = float(den)
+            if den_f == 0:
+                return None
+            return float(num) / den_f
+        return float(txt)
+    except Exception:
+        return None
+
+
+def summary_duration(summary: Optional[Dict[str, Any]]) -> float:
+    fmt = (summary or {}).get("format") or {}
+    return float(_coerce_float(fmt.get("duration")) or 0.0)
+
+
+def summary_video_dimensions(summary: Optional[Dict[str, Any]]) -> Tuple[Optional[int], Optional[int]]:
+    v = (summary or {}).get("video") or {}
+    return (_coerce_int(v.get("width")), _coerce_int(v.get("height")))
+
+
+def probe_duration_seconds(path: str) -> float:
+    """时长（秒）；probe 失败返回 0.0"""
+    try:
+        return summary_duration(probe_summary(path))
+    except Exception:
+        return 0.0
+
+
+def probe_video_dimensions(path: str) -> Tuple[Optional[int], Optional[int]]:
+    """视频宽高；probe 失败返回 (None, None)"""
+    try:
+        return summary_video_dimensions(probe_summary(path))
+    except Exception:
+        return (None, None)
+
+
+# =========================
+# ffmpeg 进度
+# =========================
+
+
+def run_ffmpeg_with_progress(
+    args: List[str],
+    duration_seconds: float,
+    on_progress: Optional[Callable[[int], None]] = None,
+    min_interval_seconds: float = 0.0,
+) -> None:
+    """
+    运行 ffmpeg 并解析 `-progress pipe:1` 输出，按输出时长换算百分比回调 on_progress(0-99)。
+
+    :param args: 完整命令（args[0] 为 ffmpeg 可执行文件），自动插入 -progress pipe:1 -nostats
+    :param duration_seconds: 预期输出时长（秒），<=0 时只在结束时回调
+    :param min_interval_seconds: 两次回调的最小间隔（节流，避免频繁写库）
+    失败时抛 RuntimeError（附 stderr 末尾内容）；所属任务被取消时抛 job_control.JobCancelled
+    """
+    cmd = [args[0], "-progress", "pipe:1", "-nostats"] + list(args[1:])
+    # 登记到当前任务，取消任务时可整组终止
+    p = job_control.popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+
+    # stderr 单独线程读取，避免管道写满导致 ffmpeg 阻塞
+    err_tail: "deque[str]" = deque(maxlen=200)
+
+    def _drain_stderr() -> None:
+        try:
+            for line in p.stderr or []:
+                err_tail.append(line.rstrip())
+        except Exception:
+            pass
+
+    err_thread = threading.Thread(target=_drain_stderr, daemon=True)
+    err_thread.start()
+
+    last_pct = -1
+    last_emit = 0.0
+
+    def _emit(pct: int, force: bool = False) -> None:
+        nonlocal last_pct, last_emit
+        if on_progress is None or pct <= last_pct:
+            return
+        now_ts = time.monotonic()
+        if not force and now_ts - last_emit < min_interval_seconds:
+            return
+        last_pct = pct
+        last_emit = now_ts
+        try:
+            on_progress(pct)
+        except Exception:
+            pass
+
+    try:
+        for line in p.stdout or []:
+            line = (line or "").strip()
+            if "=" not in line:
+                continue
+            k, v = line.split("=", 1)
+            if k == "out_time_ms" and duration_seconds and duration_seconds > 0:
+                try:
+                    out_us = int(v)
+                except Exception:
+                    continue
+                _emit(int(min(99, max(0, (out_us / (duration_seconds * 1000000.0)) * 100.0))))
+            elif k == "progress" and v.strip() == "end":
+                _emit(99, force=True)
+    finally:
+        p.wait()
+        err_thread.join(timeout=5)
+        job_control.release(p)
+
+    job_control.check_cancelled()
+    if p.returncode != 0:
+        err = "\n".join(err_tail).strip()
+        raise RuntimeError(err[-8000:] or f"ffmpeg failed, exit={p.returncode}")
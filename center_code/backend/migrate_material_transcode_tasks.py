@@ -2,6 +2,7 @@
 数据库迁移脚本：
 1) materials 表新增：status / original_path / meta_json
 2) 新增 material_transcode_tasks 表（DB 作为队列）
+3) material_transcode_tasks 表新增：encode_policy / lease_expires_at（运行租约，worker 续期，过期由 reaper 回收）/ transcode_plan
 
 支持 MySQL / SQLite（由 DB_TYPE 决定）。
 """
@@ -43,6 +44,14 @@ def _has_table(table: str) -> bool:
         return False
 
 
+def _has_index(table: str, name: str) -> bool:
+    insp = inspect(engine)
+    try:
+        return any((i.get("name") or "") == name for i in insp.get_indexes(table))
+    except Exception:
+        return False
+
+
 def _create_material_transcode_tasks_table() -> None:
     dialect = _dialect_name()
     if dialect == "sqlite":
@@ -53,6 +62,7 @@ def _create_material_transcode_tasks_table() -> None:
             input_path VARCHAR(500) NOT NULL,
             output_path VARCHAR(500) NOT NULL,
             kind VARCHAR(50) NOT NULL,
+            transcode_plan VARCHAR(20),
             status VARCHAR(50) NOT NULL DEFAULT 'pending',
             progress INTEGER NOT NULL DEFAULT 0,
             error_message TEXT,
@@ -60,6 +70,8 @@ def _create_material_transcode_tasks_table() -> None:
             max_attempts INTEGER NOT NULL DEFAULT 3,
             locked_by VARCHAR(100),
             locked_at DATETIME,
+            encode_policy TEXT,
+            lease_expires_at DATETIME,
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
         );
@@ -68,6 +80,7 @@ def _create_material_transcode_tasks_table() -> None:
             "CREATE INDEX IF NOT EXISTS idx_material_transcode_tasks_material_id ON material_transcode_tasks(material_id);",
             "CREATE INDEX IF NOT EXISTS idx_material_transcode_tasks_status_time ON material_transcode_tasks(status, created_at);",
             "CREATE INDEX IF NOT EXISTS idx_material_transcode_tasks_lock ON material_transcode_tasks(status, locked_at);",
+            "CREATE INDEX IF NOT EXISTS idx_material_transcode_tasks_lease ON material_transcode_tasks(status, lease_expires_at);",
         ]
     else:
         ddl = """
@@ -77,6 +90,7 @@ def _create_material_transcode_tasks_table() -> None:
             input_path VARCHAR(500) NOT NULL,
             output_path VARCHAR(500) NOT NULL,
             kind VARCHAR(50) NOT NULL,
+            transcode_plan VARCHAR(20) NULL,
             status VARCHAR(50) NOT NULL DEFAULT 'pending',
             progress INT NOT NULL DEFAULT 0,
             error_message TEXT NULL,
@@ -84,11 +98,14 @@ def _create_material_transcode_tasks_table() -> None:
             max_attempts INT NOT NULL DEFAULT 3,
             locked_by VARCHAR(100) NULL,
             locked_at DATETIME NULL,
+            encode_policy TEXT NULL,
+            lease_expires_at DATETIME NULL,
             created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
             updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
             INDEX idx_material_transcode_tasks_material_id (material_id),
             INDEX idx_material_transcode_tasks_status_time (status, created_at),
-            INDEX idx_material_transcode_tasks_lock (status, locked_at)
+            INDEX idx_material_transcode_tasks_lock (status, locked_at),
+            INDEX idx_material_transcode_tasks_lease (status, lease_expires_at)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """
         idx = []
@@ -144,6 +161,47 @@ def _add_materials_columns() -> None:
     print(f"✓ 已成功添加 {len(added_columns)} 个字段")
 
 
+def _add_material_transcode_tasks_columns() -> None:
+    columns = [
+        ("encode_policy", "TEXT NULL"),
+        ("lease_expires_at", "DATETIME NULL"),
+        ("transcode_plan", "VARCHAR(20) NULL"),
+    ]
+    indexes = [
+        ("idx_material_transcode_tasks_lease", "status, lease_expires_at"),
+    ]
+
+    statements = []
+    added_columns = []
+    for name, ddl in columns:
+        if _has_column("material_transcode_tasks", name):
+            print(f"✓ {name} 字段已存在")
+            continue
+        statements.append(f"ALTER TABLE material_transcode_tasks ADD COLUMN {name} {ddl};")
+        added_columns.append(name)
+
+    for index_name, index_cols in indexes:
+        if _has_index("material_transcode_tasks", index_name):
+            continue
+        if _dialect_name() == "sqlite":
+            statements.append(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON material_transcode_tasks({index_cols});"
+            )
+        else:
+            statements.append(f"CREATE INDEX {index_name} ON material_transcode_tasks({index_cols});")
+
+    if not statements:
+        return
+
+    if added_columns:
+        print(f"\n正在添加缺失的字段: {', '.join(added_columns)}")
+    with get_db() as db:
+        for stmt in statements:
+            db.execute(text(stmt))
+        db.commit()
+    print(f"✓ 已成功添加 {len(added_columns)} 个字段")
+
+
 def migrate() -> None:
     print("=" * 60)
     print("数据库迁移：materials + material_transcode_tasks")
@@ -158,6 +216,8 @@ def migrate() -> None:
 
     if not _has_table("material_transcode_tasks"):
         _create_material_transcode_tasks_table()
+    else:
+        _add_material_transcode_tasks_columns()
 
     print()
     print("=" * 60)
@@ -0,0 +1,146 @@
+"""
+数据库迁移脚本：
+video_edit_tasks 表新增 DB 队列字段（payload_json / attempts / max_attempts / locked_by / locked_at），
+供 worker_edit.py 认领剪辑任务；encode_policy（记录渲染使用的编码策略）；render_mode（final/preview）；
+cost_units / started_at / finished_at（渲染规划学习吞吐用）；
+dedupe_key + (user_id, dedupe_key) 唯一索引（相同剪辑请求跨进程去重）。
+
+支持 MySQL / SQLite（由 DB_TYPE 决定）。
+"""
+
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from sqlalchemy import inspect, text
+
+from db import engine, get_db
+
+
+def _dialect_name() -> str:
+    try:
+        return (engine.dialect.name or "").lower()
+    except Exception:
+        return ""
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = inspect(engine)
+    try:
+        cols = insp.get_columns(table)
+    except Exception:
+        return False
+    return any((c.get("name") or "").lower() == column.lower() for c in cols)
+
+
+def _has_table(table: str) -> bool:
+    insp = inspect(engine)
+    try:
+        return table in insp.get_table_names()
+    except Exception:
+        return False
+
+
+def _has_index(table: str, name: str) -> bool:
+    insp = inspect(engine)
+    try:
+        return any((i.get("name") or "") == name for i in insp.get_indexes(table))
+    except Exception:
+        return False
+
+
+def _add_video_edit_tasks_columns() -> None:
+    columns = [
+        ("payload_json", "TEXT NULL"),
+        ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+        ("max_attempts", "INTEGER NOT NULL DEFAULT 3"),
+        ("locked_by", "VARCHAR(100) NULL"),
+        ("locked_at", "DATETIME NULL"),
+        ("encode_policy", "TEXT NULL"),
+        ("render_mode", "VARCHAR(20) NOT NULL DEFAULT 'final'"),
+        ("job_hash", "VARCHAR(64) NULL"),
+        ("group_id", "VARCHAR(64) NULL"),
+        ("outputs_json", "TEXT NULL"),
+        ("thumbnail_url", "VARCHAR(1000) NULL"),
+        ("animated_preview_url", "VARCHAR(1000) NULL"),
+        ("cost_units", "FLOAT NULL"),
+        ("started_at", "DATETIME NULL"),
+        ("finished_at", "DATETIME NULL"),
+        ("dedupe_key", "VARCHAR(64) NULL"),
+    ]
+    indexes = [
+        ("idx_video_edit_tasks_lock", "status, locked_at"),
+        ("idx_video_edit_tasks_job_hash", "user_id, job_hash"),
+        ("ix_video_edit_tasks_group_id", "group_id"),
+        ("idx_video_edit_tasks_status_user", "status, user_id"),
+    ]
+    # 唯一索引：NULL 不参与唯一性（MySQL / SQLite 均如此），只约束占用中的去重键
+    unique_indexes = [
+        ("uq_video_edit_tasks_dedupe", "user_id, dedupe_key"),
+    ]
+
+    statements = []
+    added_columns = []
+    for name, ddl in columns:
+        if _has_column("video_edit_tasks", name):
+            print(f"✓ {name} 字段已存在")
+            continue
+        statements.append(f"ALTER TABLE video_edit_tasks ADD COLUMN {name} {ddl};")
+        added_columns.append(name)
+
+    for index_name, index_cols in indexes:
+        if _has_index("video_edit_tasks", index_name):
+            continue
+        if _dialect_name() == "sqlite":
+            statements.append(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON video_edit_tasks({index_cols});"
+            )
+        else:
+            statements.append(f"CREATE INDEX {index_name} ON video_edit_tasks({index_cols});")
+
+    for index_name, index_cols in unique_indexes:
+        if _has_index("video_edit_tasks", index_name):
+            continue
+        if _dialect_name() == "sqlite":
+            statements.append(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON video_edit_tasks({index_cols});"
+            )
+        else:
+            statements.append(f"CREATE UNIQUE INDEX {index_name} ON video_edit_tasks({index_cols});")
+
+    if not statements:
+        print("所有字段都已存在，无需迁移")
+        return
+
+    if added_columns:
+        print(f"\n正在添加缺失的字段: {', '.join(added_columns)}")
+    with get_db() as db:
+        for stmt in statements:
+            db.execute(text(stmt))
+        db.commit()
+    print(f"✓ 已成功添加 {len(added_columns)} 个字段")
+
+
+def migrate() -> None:
+    print("=" * 60)
+    print("数据库迁移：video_edit_tasks（剪辑任务 DB 队列）")
+    print("=" * 60)
+    print(f"dialect={_dialect_name()}")
+    print()
+
+    if not _has_table("video_edit_tasks"):
+        raise RuntimeError("未找到 video_edit_tasks 表，请先初始化数据库")
+
+    _add_video_edit_tasks_columns()
+
+    print()
+    print("=" * 60)
+    print("完成")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    migrate()
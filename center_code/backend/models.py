@@ -261,9 +261,28 @@ class VideoEditTask(Base):
     output_path = Column(String(1000), nullable=True)  # 输出文件路径（相对路径）
     output_filename = Column(String(255), nullable=True)  # 输出文件名
     preview_url = Column(String(1000), nullable=True)  # 预览URL
-    status = Column(String(50), default='pending')  # pending/running/success/fail
+    status = Column(String(50), default='pending')  # pending/running/success/fail/cancelled
     progress = Column(Integer, default=0)  # 进度（0-100）
     error_message = Column(Text, nullable=True)  # 错误信息
+
+    # DB 队列（worker_edit.py 认领执行）
+    payload_json = Column(Text, nullable=True)  # 渲染参数（路径相对 BASE_DIR）
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    locked_by = Column(String(100), nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    encode_policy = Column(Text, nullable=True)  # 实际使用的编码策略（JSON，见 encode_policy.py）
+    render_mode = Column(String(20), default='final')  # final=成片 / preview=低分辨率预览
+    job_hash = Column(String(64), nullable=True)  # 剪辑参数 + 素材内容的规范哈希，用于去重
+    dedupe_key = Column(String(64), nullable=True)  # 可复用任务占用的去重键（= job_hash），(user_id, dedupe_key) 唯一；不可复用后置空
+    group_id = Column(String(64), nullable=True, index=True)  # 批量多版本剪辑的任务组ID
+    outputs_json = Column(Text, nullable=True)  # 多画幅导出的全部成品（JSON 列表，含主输出）
+    thumbnail_url = Column(String(1000), nullable=True)  # 成品封面（出片时同一次 ffmpeg 调用生成）
+    animated_preview_url = Column(String(1000), nullable=True)  # 成品短动图（WebP）
+    cost_units = Column(Float, nullable=True)  # 入队时估算的渲染代价（见 render_planner.py）
+    started_at = Column(DateTime, nullable=True)  # 开始渲染时间
+    finished_at = Column(DateTime, nullable=True)  # 结束时间（成功/失败/取消）
+
     created_at = Column(DateTime, default=lambda: __import__('datetime').datetime.now())
     updated_at = Column(DateTime, default=lambda: __import__('datetime').datetime.now(),
                        onupdate=lambda: __import__('datetime').datetime.now())
@@ -279,8 +298,9 @@ class MaterialTranscodeTask(Base):
     input_path = Column(String(500), nullable=False)  # 原始文件相对路径
     output_path = Column(String(500), nullable=False)  # 转码产物相对路径
     kind = Column(String(50), nullable=False)  # video/audio
+    transcode_plan = Column(String(20), nullable=True)  # none/remux/audio/full（见 media_utils.plan_transcode）/ renditions（入库后补生成代理版本）；旧任务为空按 full 处理
 
-    status = Column(String(50), default='pending')  # pending/running/success/fail
+    status = Column(String(50), default='pending')  # pending/running/success/fail/cancelled
     progress = Column(Integer, default=0)  # 0-100
     error_message = Column(Text, nullable=True)
 
@@ -289,6 +309,9 @@ class MaterialTranscodeTask(Base):
 
     locked_by = Column(String(100), nullable=True)
     locked_at = Column(DateTime, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)  # running 任务的租约，worker 定期续期；过期视为 worker 已丢失
+
+    encode_policy = Column(Text, nullable=True)  # 实际使用的编码策略（JSON，见 encode_policy.py）
 
     created_at = Column(DateTime, default=lambda: __import__('datetime').datetime.now())
     updated_at = Column(
@@ -311,7 +334,12 @@ Index('idx_materials_status_time', Material.status, Material.updated_at)
 # 如果需要数据库层面的唯一性，可以考虑使用哈希字段或缩短路径长度
 Index('idx_video_edit_tasks_status_time', VideoEditTask.status, VideoEditTask.created_at)
 Index('idx_video_edit_tasks_update_time', VideoEditTask.updated_at)
+Index('idx_video_edit_tasks_lock', VideoEditTask.status, VideoEditTask.locked_at)
+Index('idx_video_edit_tasks_job_hash', VideoEditTask.user_id, VideoEditTask.job_hash)
+Index('uq_video_edit_tasks_dedupe', VideoEditTask.user_id, VideoEditTask.dedupe_key, unique=True)
+Index('idx_video_edit_tasks_status_user', VideoEditTask.status, VideoEditTask.user_id)
 
 Index('idx_material_transcode_tasks_status_time', MaterialTranscodeTask.status, MaterialTranscodeTask.created_at)
 Index('idx_material_transcode_tasks_lock', MaterialTranscodeTask.status, MaterialTranscodeTask.locked_at)
+Index('idx_material_transcode_tasks_lease', MaterialTranscodeTask.status, MaterialTranscodeTask.lease_expires_at)
 
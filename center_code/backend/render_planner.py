@@ -0,0 +1,279 @@
+"""
+渲染规划：估算剪辑任务的代价，按历史吞吐给出预计开始/完成时间，并在容量不足时拒绝入队。
+
+- 代价单位：1 单位 ≈ 编码 1 秒 1080x1920 成片；源片段需要重编码（尺寸/编码不符）时按源时长额外计入
+- 吞吐：从最近完成的 VideoEditTask（cost_units / 实际运行时长）学习，单位/秒/渲染槽位；无历史时用默认值
+- 排队：pending 任务的代价 + running 任务的剩余代价，按槽位数均摊得到预计等待时长
+
+所有阈值都可用环境变量覆盖；任务入队时把代价记录到 video_edit_tasks.cost_units。
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from media_utils import probe_summary, summary_duration
+
+# 没有历史数据时的吞吐（单位/秒/槽位），1.0 即 1080x1920 实时编码
+RENDER_PLANNER_DEFAULT_THROUGHPUT = float(os.environ.get("RENDER_PLANNER_DEFAULT_THROUGHPUT", "1.0") or "1.0")
+# 学习吞吐使用的最近完成任务数
+RENDER_PLANNER_HISTORY = int(os.environ.get("RENDER_PLANNER_HISTORY", "50") or "50")
+# 吞吐模型在进程内的缓存时间（秒）
+RENDER_PLANNER_MODEL_TTL_SECONDS = float(os.environ.get("RENDER_PLANNER_MODEL_TTL_SECONDS", "60") or "60")
+# 源片段重编码 1 秒相对成片编码 1 秒的代价
+RENDER_PLANNER_REENCODE_WEIGHT = float(os.environ.get("RENDER_PLANNER_REENCODE_WEIGHT", "0.5") or "0.5")
+# 每个任务的固定开销（秒，含 probe、上传、入库）
+RENDER_PLANNER_OVERHEAD_SECONDS = float(os.environ.get("RENDER_PLANNER_OVERHEAD_SECONDS", "5") or "5")
+# 渲染槽位数；0 表示按队列模式自动取 EDIT_WORKER_CONCURRENCY / MAX_EDIT_THREADS
+RENDER_SLOTS = int(os.environ.get("RENDER_SLOTS", "0") or "0")
+# 预计排队超过该时长（秒）时拒绝入队（429 + Retry-After）；0 表示不限制
+RENDER_MAX_QUEUE_WAIT_SECONDS = float(os.environ.get("RENDER_MAX_QUEUE_WAIT_SECONDS", "1800") or "0")
+# 单个任务预计渲染超过该时长（秒）时直接拒绝；0 表示不限制
+RENDER_MAX_JOB_SECONDS = float(os.environ.get("RENDER_MAX_JOB_SECONDS", "0") or "0")
+
+_REFERENCE_PIXELS = 1080 * 1920
+
+
+@dataclass(frozen=True)
+class JobCost:
+    source_seconds: float
+    output_seconds: float
+    reencode_seconds: float
+    pixel_factor: float
+    outputs: int
+    units: float
+
+
+@dataclass(frozen=True)
+class RenderPlan:
+    cost_units: float
+    throughput: float
+    slots: int
+    queue_units: float
+    wait_seconds: float
+    run_seconds: float
+    estimated_start_at: str
+    estimated_finish_at: str
+    admitted: bool
+    reason: Optional[str] = None
+    retry_after_seconds: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _clip_duration(path: Optional[str]) -> float:
+    if not path:
+        return 0.0
+    try:
+        return summary_duration(probe_summary(path))
+    except Exception:
+        return 0.0
+
+
+def _needs_reencode(path: str, width: int, height: int) -> bool:
+    """片段与成片规格不一致（编码/像素格式/尺寸）时，渲染前需要单独重编码"""
+    try:
+        v = probe_summary(path).get("video") or {}
+    except Exception:
+        return True
+    if (v.get("codec_name") or "").lower() != "h264" or (v.get("pix_fmt") or "").lower() != "yuv420p":
+        return True
+    return (v.get("width"), v.get("height")) != (width, height)
+
+
+def estimate_cost(
+    video_paths: List[str],
+    speed: float,
+    width: int,
+    height: int,
+    voice_path: Optional[str] = None,
+    extra_outputs: Optional[list] = None,
+    include_reencode: bool = True,
+) -> JobCost:
+    """
+    估算单个剪辑任务的代价（probe 走共享缓存，通常不启动子进程）。
+
+    :param extra_outputs: 附加画幅 [[比例, 宽, 高], ...]，各自按成片时长与像素数计入
+    :param include_reencode: 批量任务共享中间产物时，只有第一个版本计入片段重编码
+    """
+    speed = float(speed or 1.0)
+    durations = [_clip_duration(p) for p in video_paths]
+    source_seconds = sum(durations)
+    # 有配音时成片按配音时长（视频循环补齐）
+    output_seconds = max(source_seconds / speed, _clip_duration(voice_path))
+
+    reencode_seconds = 0.0
+    if include_reencode:
+        reencode_seconds = sum(d for p, d in zip(video_paths, durations) if p and _needs_reencode(p, width, height))
+
+    pixel_factor = max(0.05, (int(width) * int(height)) / float(_REFERENCE_PIXELS))
+    units = output_seconds * pixel_factor + reencode_seconds * pixel_factor * RENDER_PLANNER_REENCODE_WEIGHT
+    for _ratio, w, h in (extra_outputs or []):
+        units += output_seconds * max(0.05, (int(w) * int(h)) / float(_REFERENCE_PIXELS))
+
+    return JobCost(
+        source_seconds=round(source_seconds, 3),
+        output_seconds=round(output_seconds, 3),
+        reencode_seconds=round(reencode_seconds, 3),
+        pixel_factor=round(pixel_factor, 4),
+        outputs=1 + len(extra_outputs or []),
+        units=round(units, 3),
+    )
+
+
+def render_slots() -> int:
+    if RENDER_SLOTS > 0:
+        return RENDER_SLOTS
+    if (os.environ.get("EDIT_TASK_QUEUE", "thread") or "thread").strip().lower() == "thread":
+        return max(1, int(os.environ.get("MAX_EDIT_THREADS", "2") or "2"))
+    return max(1, int(os.environ.get("EDIT_WORKER_CONCURRENCY", "1") or "1"))
+
+
+_MODEL_LOCK = threading.Lock()
+_MODEL: Dict[str, Any] = {"at": 0.0, "throughput": None, "avg_units": None}
+
+
+def _reused_intermediate(policy_json: Optional[str]) -> bool:
+    try:
+        return bool(json.loads(policy_json or "{}").get("reused_intermediate"))
+    except (ValueError, AttributeError):
+        return False
+
+
+def _learn_model() -> Tuple[float, Optional[float]]:
+    """
+    (吞吐 单位/秒/槽位, 平均任务代价)：取最近完成任务的 Σ代价 / Σ运行时长。
+    复用了中间产物的任务（encode_policy 里记有 reused_intermediate）实际只做了一部分渲染，不计入。
+    """
+    try:
+        from db import get_db
+        from models import VideoEditTask
+    except Exception:
+        return RENDER_PLANNER_DEFAULT_THROUGHPUT, None
+
+    try:
+        with get_db() as db:
+            rows = (
+                db.query(
+                    VideoEditTask.cost_units,
+                    VideoEditTask.started_at,
+                    VideoEditTask.finished_at,
+                    VideoEditTask.encode_policy,
+                )
+                .filter(
+                    VideoEditTask.status == "success",
+                    VideoEditTask.cost_units.isnot(None),
+                    VideoEditTask.started_at.isnot(None),
+                    VideoEditTask.finished_at.isnot(None),
+                )
+                .order_by(VideoEditTask.finished_at.desc())
+                .limit(RENDER_PLANNER_HISTORY)
+                .all()
+            )
+    except Exception:
+        return RENDER_PLANNER_DEFAULT_THROUGHPUT, None
+
+    total_units = 0.0
+    total_seconds = 0.0
+    used = 0
+    for units, started_at, finished_at, policy_json in rows:
+        seconds = (finished_at - started_at).total_seconds() - RENDER_PLANNER_OVERHEAD_SECONDS
+        if not units or units <= 0 or seconds <= 0 or _reused_intermediate(policy_json):
+            continue
+        total_units += float(units)
+        total_seconds += seconds
+        used += 1
+    if total_seconds <= 0:
+        return RENDER_PLANNER_DEFAULT_THROUGHPUT, None
+    return total_units / total_seconds, total_units / used
+
+
+def throughput_model() -> Tuple[float, Optional[float]]:
+    now = time.monotonic()
+    with _MODEL_LOCK:
+        if _MODEL["throughput"] is not None and now - _MODEL["at"] < RENDER_PLANNER_MODEL_TTL_SECONDS:
+            return _MODEL["throughput"], _MODEL["avg_units"]
+    throughput, avg_units = _learn_model()
+    with _MODEL_LOCK:
+        _MODEL.update({"at": now, "throughput": throughput, "avg_units": avg_units})
+    return throughput, avg_units
+
+
+def queue_backlog(default_units: float) -> Tuple[float, int, int]:
+    """(排队中的剩余代价, running 数, pending 数)；缺少 cost_units 的旧任务按 default_units 计"""
+    try:
+        from db import get_db
+        from models import VideoEditTask
+    except Exception:
+        return 0.0, 0, 0
+
+    units = 0.0
+    running = 0
+    pending = 0
+    try:
+        with get_db() as db:
+            rows = (
+                db.query(VideoEditTask.status, VideoEditTask.cost_units, VideoEditTask.progress)
+                .filter(VideoEditTask.status.in_(["pending", "running"]))
+                .all()
+            )
+    except Exception:
+        return 0.0, 0, 0
+    for status, cost, progress in rows:
+        cost = float(cost) if cost else default_units
+        if status == "running":
+            running += 1
+            units += cost * max(0.0, 1.0 - float(progress or 0) / 100.0)
+        else:
+            pending += 1
+            units += cost
+    return units, running, pending
+
+
+def plan_job(cost_units: float) -> RenderPlan:
+    """按当前队列与吞吐模型给出预计开始/完成时间，并判断是否接纳"""
+    throughput, avg_units = throughput_model()
+    throughput = max(1e-3, throughput)
+    slots = render_slots()
+    queue_units, running, pending = queue_backlog(avg_units or cost_units)
+
+    # 有空闲槽位且无人排队时立即开始，否则按槽位均摊排队中的剩余代价
+    if pending == 0 and running < slots:
+        wait_seconds = 0.0
+    else:
+        wait_seconds = queue_units / (throughput * slots)
+    run_seconds = cost_units / throughput + RENDER_PLANNER_OVERHEAD_SECONDS
+
+    admitted = True
+    reason = None
+    retry_after = None
+    if RENDER_MAX_JOB_SECONDS > 0 and run_seconds > RENDER_MAX_JOB_SECONDS:
+        admitted = False
+        reason = f"任务预计渲染 {int(run_seconds)} 秒，超出单任务上限（{int(RENDER_MAX_JOB_SECONDS)} 秒）"
+    elif RENDER_MAX_QUEUE_WAIT_SECONDS > 0 and wait_seconds > RENDER_MAX_QUEUE_WAIT_SECONDS:
+        admitted = False
+        reason = f"渲染队列繁忙，预计需等待 {int(wait_seconds)} 秒"
+        # 等队列消化到上限以内再来
+        retry_after = max(1, int(wait_seconds - RENDER_MAX_QUEUE_WAIT_SECONDS) + 1)
+
+    now = datetime.datetime.now()
+    start_at = now + datetime.timedelta(seconds=wait_seconds)
+    finish_at = start_at + datetime.timedelta(seconds=run_seconds)
+    return RenderPlan(
+        cost_units=round(cost_units, 3),
+        throughput=round(throughput, 4),
+        slots=slots,
+        queue_units=round(queue_units, 3),
+        wait_seconds=round(wait_seconds, 1),
+        run_seconds=round(run_seconds, 1),
+        estimated_start_at=start_at.isoformat(timespec="seconds"),
+        estimated_finish_at=finish_at.isoformat(timespec="seconds"),
+        admitted=admitted,
+        reason=reason,
+        retry_after_seconds=retry_after,
+    )
@@ -0,0 +1,127 @@
+"""
+素材代理版本（rendition ladder）：入库转码时在同一次 ffmpeg 调用里（只解码一次）额外输出低码率版本。
+
+- proxy：480p 低码率，剪辑预览模式读取它而不是全分辨率原片
+- scrub：GOP=1（每帧都是关键帧）的小尺寸中间件，时间线拖动时任意位置都能立即解码
+
+阶梯由 MATERIAL_RENDITIONS 配置，格式 "名称:短边:码率:GOP,..."；设为空或 off 时不生成。
+生成结果记录在 Material.meta_json["renditions"]：{名称: {path, short_side, bitrate, gop}}。
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+MATERIAL_RENDITIONS = os.environ.get("MATERIAL_RENDITIONS", "proxy:480:800k:48,scrub:360:1200k:1")
+# 预览渲染使用的版本名
+MATERIAL_PREVIEW_RENDITION = os.environ.get("MATERIAL_PREVIEW_RENDITION", "proxy")
+# 代理版本的 x264 preset（只求快）
+MATERIAL_RENDITION_PRESET = os.environ.get("MATERIAL_RENDITION_PRESET", "veryfast")
+
+# 相对 BASE_DIR（center_code）的存放目录，与 Material.path 同一套相对路径
+RENDITION_DIR_REL = "uploads/materials/renditions"
+
+
+@dataclass(frozen=True)
+class Rendition:
+    name: str
+    short_side: int
+    bitrate: str
+    gop: int
+
+    def scale_filter(self) -> str:
+        """等比缩放到短边 short_side（不放大，宽高取偶数）"""
+        s = int(self.short_side)
+        return (
+            f"scale=w='if(lt(iw,ih),trunc(min({s},iw)/2)*2,-2)'"
+            f":h='if(lt(iw,ih),-2,trunc(min({s},ih)/2)*2)'"
+        )
+
+    def ffmpeg_args(self, output_abs: str, threads: Optional[int] = None) -> List[str]:
+        """追加在主输出之后的一组输出参数（同一输入，多路输出）"""
+        rate = _bitrate_kbps(self.bitrate)
+        args = [
+            "-map",
+            "0:v:0",
+            "-map",
+            "0:a:0?",
+            "-vf",
+            self.scale_filter(),
+            "-c:v",
+            "libx264",
+            "-preset",
+            MATERIAL_RENDITION_PRESET,
+            "-pix_fmt",
+            "yuv420p",
+            "-b:v",
+            f"{rate}k",
+            "-maxrate",
+            f"{rate}k",
+            "-bufsize",
+            f"{rate * 2}k",
+            "-g",
+            str(max(1, int(self.gop))),
+        ]
+        if threads:
+            args += ["-threads", str(int(threads))]
+        args += ["-c:a", "aac", "-b:a", "64k", "-movflags", "+faststart", output_abs]
+        return args
+
+    def to_meta(self, rel_path: str) -> Dict[str, Any]:
+        return {"path": rel_path, "short_side": self.short_side, "bitrate": self.bitrate, "gop": self.gop}
+
+
+def _bitrate_kbps(value: str) -> int:
+    raw = (value or "").strip().lower()
+    try:
+        if raw.endswith("m"):
+            return max(1, int(float(raw[:-1]) * 1000))
+        if raw.endswith("k"):
+            return max(1, int(float(raw[:-1])))
+        return max(1, int(float(raw) / 1000))
+    except ValueError:
+        return 800
+
+
+def _parse_ladder(raw: str) -> List[Rendition]:
+    if (raw or "").strip().lower() in ("", "off", "none", "0", "false"):
+        return []
+    ladder: List[Rendition] = []
+    for part in raw.split(","):
+        fields = [f.strip() for f in part.split(":")]
+        if len(fields) != 4 or not fields[0]:
+            continue
+        try:
+            ladder.append(Rendition(name=fields[0], short_side=int(fields[1]), bitrate=fields[2], gop=int(fields[3])))
+        except ValueError:
+            continue
+    return ladder
+
+
+_LADDER = _parse_ladder(MATERIAL_RENDITIONS)
+
+
+def ladder() -> List[Rendition]:
+    return list(_LADDER)
+
+
+def rendition_rel_path(output_rel: str, name: str) -> str:
+    """主产物 uploads/materials/videos/<id>.mp4 -> uploads/materials/renditions/<id>.<name>.mp4"""
+    stem = os.path.splitext(os.path.basename(output_rel.replace("\\", "/")))[0]
+    return f"{RENDITION_DIR_REL}/{stem}.{name}.mp4"
+
+
+def material_renditions(meta_json: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    try:
+        meta = json.loads(meta_json) if meta_json else {}
+    except (TypeError, ValueError):
+        return {}
+    renditions = meta.get("renditions") if isinstance(meta, dict) else None
+    return renditions if isinstance(renditions, dict) else {}
+
+
+def rendition_path(meta_json: Optional[str], name: str) -> Optional[str]:
+    """素材某个版本的相对路径；未生成时返回 None"""
+    info = material_renditions(meta_json).get(name) or {}
+    return info.get("path") or None
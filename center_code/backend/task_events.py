@@ -0,0 +1,149 @@
+"""
+剪辑任务进度推送（SSE 接口的进程内订阅中心）。
+
+- 同一进程内的所有 SSE 连接共用一个后台轮询线程：每个间隔对全部被订阅的任务只查一次库，
+  连接数增加不会成倍增加数据库查询
+- 本进程内执行的任务（线程模式 / 同步接口）更新进度或状态后调用 notify()，轮询线程立即刷新，
+  订阅者不必等下一个间隔；worker 进程执行的任务由定时轮询兜底
+- 每用户同时打开的连接数有上限（超出时 subscribe 抛 TooManySubscriptions，由接口返回 429）
+
+所有参数都可用环境变量覆盖。
+"""
+
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# 兜底轮询间隔（秒）：worker 进程执行的任务靠它发现进度变化
+TASK_EVENTS_POLL_SECONDS = float(os.environ.get("TASK_EVENTS_POLL_SECONDS", "2.0") or "2.0")
+# 每用户同时打开的进度推送连接上限；0 表示不限制
+TASK_EVENTS_MAX_PER_USER = int(os.environ.get("TASK_EVENTS_MAX_PER_USER", "4") or "4")
+
+logger = logging.getLogger(__name__)
+
+# fetch(task_ids) -> {task_id: 快照}；不在结果中的任务视为已删除
+Fetch = Callable[[Iterable[int]], Dict[int, dict]]
+
+
+class TooManySubscriptions(Exception):
+    """该用户打开的进度推送连接已达上限"""
+
+
+class Subscription:
+    """一个 SSE 连接对某个任务的订阅；close() 可重复调用"""
+
+    def __init__(self, hub: "TaskEventHub", user_id: int, task_id: int):
+        self._hub = hub
+        self.user_id = user_id
+        self.task_id = task_id
+        self._version = 0
+        self._closed = False
+
+    def wait(self, timeout: float) -> Tuple[bool, Optional[dict]]:
+        """
+        等待任务快照变化，最多 timeout 秒。
+        :return: (是否有新快照, 快照)；快照为 None 表示任务已不存在
+        """
+        changed, self._version, snap = self._hub._wait(self.task_id, self._version, timeout)
+        return changed, snap
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._hub._release(self)
+
+
+class TaskEventHub:
+    def __init__(
+        self,
+        fetch: Fetch,
+        poll_seconds: float = TASK_EVENTS_POLL_SECONDS,
+        max_per_user: int = TASK_EVENTS_MAX_PER_USER,
+    ):
+        self._fetch = fetch
+        self._poll_seconds = max(0.1, float(poll_seconds))
+        self._max_per_user = int(max_per_user)
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._watchers: Dict[int, int] = {}  # task_id -> 订阅数
+        self._per_user: Dict[int, int] = {}  # user_id -> 连接数
+        self._snaps: Dict[int, Optional[dict]] = {}
+        self._versions: Dict[int, int] = {}  # 快照每变化一次加 1；0 表示尚未取到
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, user_id: int, task_id: int) -> Subscription:
+        user_id, task_id = int(user_id or 0), int(task_id)
+        with self._cond:
+            if self._max_per_user > 0 and self._per_user.get(user_id, 0) >= self._max_per_user:
+                raise TooManySubscriptions(f"进度推送连接过多（上限 {self._max_per_user}），请关闭其它页面后重试")
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            self._watchers[task_id] = self._watchers.get(task_id, 0) + 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="task-events", daemon=True)
+                self._thread.start()
+        # 新订阅立即取一次快照
+        self._wake.set()
+        return Subscription(self, user_id, task_id)
+
+    def notify(self, task_id: int) -> None:
+        """本进程内任务进度/状态已写库：有人订阅时立即刷新"""
+        with self._cond:
+            watched = int(task_id) in self._watchers
+        if watched:
+            self._wake.set()
+
+    def connections(self, user_id: int) -> int:
+        with self._cond:
+            return self._per_user.get(int(user_id or 0), 0)
+
+    def _release(self, sub: Subscription) -> None:
+        with self._cond:
+            left = self._per_user.get(sub.user_id, 0) - 1
+            if left > 0:
+                self._per_user[sub.user_id] = left
+            else:
+                self._per_user.pop(sub.user_id, None)
+            left = self._watchers.get(sub.task_id, 0) - 1
+            if left > 0:
+                self._watchers[sub.task_id] = left
+            else:
+                self._watchers.pop(sub.task_id, None)
+                self._snaps.pop(sub.task_id, None)
+                self._versions.pop(sub.task_id, None)
+
+    def _wait(self, task_id: int, seen: int, timeout: float) -> Tuple[bool, int, Optional[dict]]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._versions.get(task_id, 0) != seen, max(0.0, timeout))
+            version = self._versions.get(task_id, 0)
+            return version != seen, version, self._snaps.get(task_id)
+
+    def refresh(self) -> None:
+        """对全部被订阅的任务查一次库，快照有变化时唤醒对应订阅者"""
+        with self._cond:
+            task_ids = list(self._watchers)
+        if not task_ids:
+            return
+        snaps = self._fetch(task_ids)
+        with self._cond:
+            changed = False
+            for task_id in task_ids:
+                if task_id not in self._watchers:
+                    continue
+                snap = snaps.get(task_id)
+                if self._versions.get(task_id, 0) and self._snaps.get(task_id) == snap:
+                    continue
+                self._snaps[task_id] = snap
+                self._versions[task_id] = self._versions.get(task_id, 0) + 1
+                changed = True
+            if changed:
+                self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self._poll_seconds)
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"读取任务进度失败：{e}")
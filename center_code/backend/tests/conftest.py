@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 测试直接 import 后端根目录下的模块（与各 worker 脚本的做法一致）
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# db.py 在 import 时建引擎：必须在任何测试模块 import db 之前切到临时 SQLite 库
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["SQLITE_DB"] = os.path.join(tempfile.mkdtemp(prefix="autovideo-test-"), "test.db")
+
+
+@pytest.fixture
+def db_session():
+    """每个测试一套空表；返回一个会话，用例结束时关闭并清表"""
+    from db import SessionLocal, engine
+    from models import Base
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        SessionLocal.remove()
+        Base.metadata.drop_all(engine)
@@ -0,0 +1,150 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+import chunked_upload
+from chunked_upload import ChunkedUploadError
+
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def session(tmp_path):
+    # 2.5 个分片：最后一片为余数
+    return chunked_upload.init_upload(str(tmp_path), 1, "clip.mp4", 2 * MB + 100, chunk_size=MB)
+
+
+def test_init_rejects_disallowed_extension(tmp_path):
+    with pytest.raises(ChunkedUploadError) as exc:
+        chunked_upload.init_upload(str(tmp_path), 1, "run.exe", 10, allowed_exts=(".mp4", ".mov"))
+    assert exc.value.code == 400
+
+
+def test_init_extension_check_is_case_insensitive(tmp_path):
+    s = chunked_upload.init_upload(str(tmp_path), 1, "CLIP.MP4", 10, allowed_exts=(".mp4",))
+    assert s["total_chunks"] == 1
+
+
+def test_short_chunk_is_rejected(tmp_path, session):
+    with pytest.raises(ChunkedUploadError) as exc:
+        chunked_upload.write_part(str(tmp_path), session["upload_id"], 1, 0, io.BytesIO(b"x" * (MB - 1)))
+    assert exc.value.code == 400
+    assert 0 in chunked_upload.upload_status(str(tmp_path), session["upload_id"], 1)["missing"]
+
+
+def test_oversized_chunk_is_rejected(tmp_path, session):
+    with pytest.raises(ChunkedUploadError) as exc:
+        chunked_upload.write_part(str(tmp_path), session["upload_id"], 1, 2, io.BytesIO(b"x" * 101))
+    assert exc.value.code == 400
+
+
+def test_sha_mismatch_leaves_chunk_missing(tmp_path, session):
+    with pytest.raises(ChunkedUploadError) as exc:
+        chunked_upload.write_part(
+            str(tmp_path), session["upload_id"], 1, 2, io.BytesIO(b"x" * 100), sha256="0" * 64
+        )
+    assert exc.value.code == 422
+    assert chunked_upload.upload_status(str(tmp_path), session["upload_id"], 1)["missing"] == [0, 1, 2]
+
+
+def test_sha_match_and_reassembly(tmp_path, session):
+    parts = [b"a" * MB, b"b" * MB, b"c" * 100]
+    # 乱序上传
+    for index in (2, 0, 1):
+        data = parts[index]
+        chunked_upload.write_part(
+            str(tmp_path), session["upload_id"], 1, index, io.BytesIO(data),
+            sha256=hashlib.sha256(data).hexdigest().upper(),
+        )
+    path, filename = chunked_upload.finish_upload(str(tmp_path), session["upload_id"], 1)
+    assert filename == "clip.mp4"
+    with open(path, "rb") as f:
+        assert f.read() == b"".join(parts)
+
+
+def test_finish_with_missing_chunks(tmp_path, session):
+    chunked_upload.write_part(str(tmp_path), session["upload_id"], 1, 0, io.BytesIO(b"a" * MB))
+    with pytest.raises(ChunkedUploadError) as exc:
+        chunked_upload.finish_upload(str(tmp_path), session["upload_id"], 1)
+    assert exc.value.code == 409
+
+
+def test_other_user_cannot_see_session(tmp_path, session):
+    with pytest.raises(ChunkedUploadError) as exc:
+        chunked_upload.upload_status(str(tmp_path), session["upload_id"], 2)
+    assert exc.value.code == 404
+
+
+def test_completing_restores_session_on_failure(tmp_path):
+    s = chunked_upload.init_upload(str(tmp_path), 1, "clip.mp4", 10)
+    chunked_upload.write_part(str(tmp_path), s["upload_id"], 1, 0, io.BytesIO(b"0123456789"))
+    with pytest.raises(RuntimeError):
+        with chunked_upload.completing(str(tmp_path), s["upload_id"], 1):
+            raise RuntimeError("COS unavailable")
+    assert chunked_upload.upload_status(str(tmp_path), s["upload_id"], 1)["missing"] == []
+
+    with chunked_upload.completing(str(tmp_path), s["upload_id"], 1) as (path, _filename):
+        with open(path, "rb") as f:
+            assert f.read() == b"0123456789"
+    with pytest.raises(ChunkedUploadError):
+        chunked_upload.upload_status(str(tmp_path), s["upload_id"], 1)
+
+
+@pytest.fixture
+def complete(tmp_path, monkeypatch):
+    """直接调用 complete 接口（跳过登录校验），入库流程由用例替换"""
+    from flask import Flask
+
+    from blueprints import material
+
+    monkeypatch.setattr(material, "MATERIAL_TMP_DIR", str(tmp_path))
+    monkeypatch.setattr(material, "get_current_user_id", lambda: 1)
+    app = Flask(__name__)
+
+    def _call(upload_id, ingest):
+        monkeypatch.setattr(material, "_ingest_uploaded_file", ingest)
+        with app.app_context():
+            view = material.complete_chunked_upload
+            return getattr(view, "__wrapped__", view)(upload_id)
+
+    return _call
+
+
+def _uploaded(tmp_path):
+    s = chunked_upload.init_upload(str(tmp_path), 1, "clip.mp4", 10)
+    chunked_upload.write_part(str(tmp_path), s["upload_id"], 1, 0, io.BytesIO(b"0123456789"))
+    return s["upload_id"]
+
+
+def test_complete_keeps_session_when_ingest_fails(tmp_path, complete):
+    from utils import response_error, response_success
+
+    upload_id = _uploaded(tmp_path)
+    assert complete(upload_id, lambda path, name: response_error("数据库不可用", 500))[1] == 500
+    # 数据文件还在：会话恢复，同一个 upload_id 可直接重试
+    assert chunked_upload.upload_status(str(tmp_path), upload_id, 1)["missing"] == []
+
+    def _ingest(path, name):
+        os.remove(path)
+        return response_success({"name": name}, "上传成功")
+
+    assert complete(upload_id, _ingest)[1] == 200
+    with pytest.raises(ChunkedUploadError):
+        chunked_upload.upload_status(str(tmp_path), upload_id, 1)
+
+
+def test_complete_ends_session_once_file_is_consumed(tmp_path, complete):
+    from utils import response_error
+
+    upload_id = _uploaded(tmp_path)
+
+    def _ingest(path, name):
+        # 不可重试的失败（如文件不是音视频）：入库流程已删掉数据文件
+        os.remove(path)
+        return response_error("不支持的文件类型", 400)
+
+    assert complete(upload_id, _ingest)[1] == 400
+    assert complete(upload_id, _ingest)[1] == 404
@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+from blueprints import editor
+from models import VideoEditTask
+
+
+@pytest.fixture
+def outputs(tmp_path, monkeypatch):
+    """成片路径相对 tmp_path 解析"""
+    monkeypatch.setattr(editor, "get_abs_path", lambda rel: str(tmp_path / rel))
+    return tmp_path
+
+
+def _task(**fields):
+    fields.setdefault("status", "pending")
+    return VideoEditTask(user_id=fields.pop("user_id", 1), video_ids="1", job_hash="h" * 64, **fields)
+
+
+def test_new_task_takes_dedupe_key_and_duplicates_reuse_it(db_session):
+    first, reused = editor._add_edit_task(db_session, _task())
+    assert not reused and first.dedupe_key == first.job_hash
+    db_session.commit()
+
+    again, reused = editor._add_edit_task(db_session, _task())
+    assert reused and again.id == first.id
+    # 其他用户的相同请求互不影响
+    other, reused = editor._add_edit_task(db_session, _task(user_id=2))
+    assert not reused and other.id != first.id
+
+
+def test_unreusable_holder_gives_up_key(db_session):
+    old = datetime.datetime.now() - datetime.timedelta(seconds=editor.EDIT_DEDUPE_STALE_SECONDS + 60)
+    stale, _ = editor._add_edit_task(db_session, _task(status="running", created_at=old, updated_at=old))
+    db_session.commit()
+    stale_id = stale.id
+
+    fresh, reused = editor._add_edit_task(db_session, _task())
+    db_session.commit()
+    assert not reused and fresh.id != stale_id
+    assert db_session.get(VideoEditTask, stale_id).dedupe_key is None
+
+
+def test_success_reusable_only_while_output_exists(db_session, outputs):
+    task = _task(status="success", output_path="out.mp4")
+    assert not editor._is_reusable_edit_task(task)
+    (outputs / "out.mp4").write_bytes(b"x")
+    assert editor._is_reusable_edit_task(task)
+    assert not editor._is_reusable_edit_task(_task(status="fail"))
+
+
+def test_finished_only_ignores_tasks_in_flight(db_session, outputs):
+    (outputs / "out.mp4").write_bytes(b"x")
+    running = _task(status="running")
+    db_session.add(running)
+    db_session.commit()
+    assert editor._find_reusable_edit_task(db_session, 1, "h" * 64).id == running.id
+    # 同步接口不挂靠进行中的任务，只复用已完成的成片
+    assert editor._find_reusable_edit_task(db_session, 1, "h" * 64, finished_only=True) is None
+
+    done = _task(status="success", output_path="out.mp4")
+    db_session.add(done)
+    db_session.commit()
+    assert editor._find_reusable_edit_task(db_session, 1, "h" * 64, finished_only=True).id == done.id
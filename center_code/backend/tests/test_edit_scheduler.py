@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+import edit_scheduler
+from edit_scheduler import fair_order
+from models import VideoEditTask
+
+
+def test_empty_queue():
+    assert fair_order([], {}) == []
+
+
+def test_users_alternate_when_idle():
+    pending = [(1, 7), (2, 7), (3, 7), (4, 8), (5, 8)]
+    assert fair_order(pending, {}) == [1, 4, 2, 5, 3]
+
+
+def test_equal_load_tie_broken_by_earliest_head():
+    # 两个用户虚拟时间相同时，队首任务提交更早的先出队
+    assert fair_order([(10, 1), (3, 2)], {}) == [3, 10]
+    assert fair_order([(3, 2), (10, 1)], {}) == [3, 10]
+
+
+def test_running_tasks_delay_busy_user():
+    pending = [(1, 7), (2, 7), (3, 7), (4, 8), (5, 8)]
+    assert fair_order(pending, {7: 2}) == [4, 5, 1, 2, 3]
+
+
+def test_weight_gives_more_turns(monkeypatch):
+    monkeypatch.setattr(edit_scheduler, "_WEIGHTS", {7: 2.0})
+    pending = [(1, 7), (2, 7), (3, 7), (4, 7), (5, 8), (6, 8)]
+    assert fair_order(pending, {}) == [1, 5, 2, 3, 6, 4]
+
+
+def test_missing_user_id_is_grouped_as_zero():
+    assert fair_order([(1, None), (2, 0), (3, 5)], {}) == [1, 3, 2]
+
+
+def _add(db, task_id, user_id, status="pending", **fields):
+    db.add(VideoEditTask(id=task_id, user_id=user_id, video_ids="1", status=status, payload_json="{}", **fields))
+
+
+def test_claim_candidates_takes_one_head_per_user(db_session):
+    for task_id, user_id in [(1, 7), (2, 7), (3, 7), (4, 8)]:
+        _add(db_session, task_id, user_id)
+    _add(db_session, 5, 7, status="running")
+    db_session.commit()
+    stale_before = datetime.datetime.now() - datetime.timedelta(minutes=10)
+    # 用户 7 已有一个在跑：用户 8 的任务先出队
+    assert edit_scheduler.claim_candidates(db_session, stale_before) == [4, 1]
+    assert edit_scheduler.queue_positions(db_session) == {4: 1, 1: 2, 2: 3, 3: 4}
+
+
+def test_claim_candidates_skips_users_at_limit(db_session, monkeypatch):
+    monkeypatch.setattr(edit_scheduler, "EDIT_USER_MAX_CONCURRENT", 1)
+    _add(db_session, 1, 7)
+    _add(db_session, 2, 8)
+    _add(db_session, 3, 7, status="running")
+    db_session.commit()
+    stale_before = datetime.datetime.now() - datetime.timedelta(minutes=10)
+    assert edit_scheduler.claim_candidates(db_session, stale_before) == [2]
+
+
+def test_daily_quota(db_session, monkeypatch):
+    monkeypatch.setattr(edit_scheduler, "EDIT_USER_DAILY_RENDER_SECONDS", 100.0)
+    now = datetime.datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    started = max(midnight, now - datetime.timedelta(seconds=60))
+    _add(db_session, 1, 7, status="success", started_at=started, finished_at=started + datetime.timedelta(seconds=60))
+    _add(db_session, 2, 7, cost_units=10)
+    _add(db_session, 3, 8, status="success", started_at=started, finished_at=started + datetime.timedelta(seconds=60))
+    db_session.commit()
+
+    assert edit_scheduler.daily_render_seconds(db_session, 7) == pytest.approx(60)
+    assert edit_scheduler.daily_render_seconds(db_session, 7, pending_seconds_per_unit=2.0) == pytest.approx(80)
+    assert edit_scheduler.check_user_quota(db_session, 7, 30) is None
+    blocked = edit_scheduler.check_user_quota(db_session, 7, 30, seconds_per_unit=2.0)
+    assert blocked and blocked[1] > 0
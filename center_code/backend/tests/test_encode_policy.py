@@ -0,0 +1,64 @@
+import socket
+
+import pytest
+
+import encode_policy
+import job_control
+from models import MaterialTranscodeTask, VideoEditTask
+
+
+def _transcode(**fields):
+    return MaterialTranscodeTask(material_id=1, input_path="in.mp4", output_path="out.mp4", kind="video", **fields)
+
+
+@pytest.fixture
+def load(monkeypatch):
+    """固定 8 核，负载由用例直接给出"""
+    state = {"running": 0, "pending": 0}
+    monkeypatch.setattr(encode_policy, "_cpu_count", lambda: 8)
+    monkeypatch.setattr(encode_policy, "queue_load", lambda: (state["running"], state["pending"]))
+    monkeypatch.setattr(encode_policy, "ENCODE_BUSY_QUEUE_DEPTH", 3)
+    return state
+
+
+def test_idle_uses_all_cores_and_slow_preset(load):
+    policy = encode_policy.choose_policy("render")
+    assert policy.threads == 8
+    assert policy.preset == encode_policy.ENCODE_PRESET_IDLE
+
+
+def test_cores_split_between_local_jobs(load):
+    load["running"] = 3
+    policy = encode_policy.choose_policy("transcode")
+    assert policy.threads == 2
+    assert policy.preset == encode_policy.ENCODE_PRESET_NORMAL
+    assert policy.x264_args() == ["-preset", policy.preset, "-crf", str(policy.crf), "-threads", "2"]
+
+
+def test_backlog_switches_to_fast_preset(load):
+    load["pending"] = 3
+    assert encode_policy.choose_policy("render").preset == encode_policy.ENCODE_PRESET_BUSY
+
+
+def test_queue_load_counts_only_this_host(db_session):
+    host = socket.gethostname()
+    db_session.add_all(
+        [
+            VideoEditTask(user_id=1, video_ids="1", status="running", locked_by=f"{host}:10:0"),
+            VideoEditTask(user_id=1, video_ids="1", status="running", locked_by="other-node:10:0"),
+            VideoEditTask(user_id=1, video_ids="1", status="pending"),
+            _transcode(status="running", locked_by=f"{host}:11:ab"),
+            _transcode(status="running", locked_by="other-node:11:ab"),
+            _transcode(status="pending"),
+        ]
+    )
+    thread_task = VideoEditTask(user_id=1, video_ids="1", status="running")
+    foreign_thread_task = VideoEditTask(user_id=1, video_ids="1", status="running")
+    db_session.add_all([thread_task, foreign_thread_task])
+    db_session.commit()
+    thread_task_id = thread_task.id
+
+    assert encode_policy.queue_load() == (2, 2)
+    # 本进程内线程执行的任务（locked_by 为空）也占本机的核；别的 Web 节点上的不算
+    with job_control.job_scope("edit", thread_task_id):
+        assert encode_policy.queue_load() == (3, 2)
@@ -0,0 +1,86 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import job_control
+
+pytestmark = pytest.mark.skipif(sys.platform.startswith("win"), reason="按进程组终止只在 POSIX 上测试")
+
+
+def _run_in_job(task_id, fn, **scope_kwargs):
+    """在后台线程的 job_scope 内执行 fn，返回 (线程, 结果列表)"""
+    result = []
+
+    def _target():
+        with job_control.job_scope("edit", task_id, **scope_kwargs):
+            try:
+                result.append(fn())
+            except Exception as e:
+                result.append(e)
+
+    t = threading.Thread(target=_target)
+    t.start()
+    return t, result
+
+
+def _wait_for(pred, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pred():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_cancel_kills_running_process_tree():
+    # sh 再起一个 sleep：取消时整个进程组都要被终止，run() 不会等满 30 秒
+    t, result = _run_in_job(801, lambda: job_control.run(["sh", "-c", "sleep 30 & wait"]))
+    assert _wait_for(lambda: job_control._PROCS.get(("edit", 801)))
+    started = time.monotonic()
+    assert job_control.cancel("edit", 801) == 1
+    t.join(10)
+    assert not t.is_alive() and time.monotonic() - started < 5
+    assert isinstance(result[0], job_control.JobCancelled)
+    assert ("edit", 801) not in job_control.active_jobs()
+
+
+def test_cancelled_job_cannot_start_processes():
+    gate = threading.Event()
+
+    def _later():
+        gate.wait(5)
+        return job_control.popen(["true"])
+
+    t, result = _run_in_job(802, _later)
+    assert _wait_for(lambda: ("edit", 802) in job_control.active_jobs())
+    job_control.cancel("edit", 802)
+    gate.set()
+    t.join(5)
+    assert isinstance(result[0], job_control.JobCancelled)
+
+
+def test_cancel_outside_this_process_is_noop():
+    assert job_control.cancel("edit", 803) == 0
+    assert not job_control.is_cancelled(("edit", 803))
+    job_control.check_cancelled()
+
+
+def test_poll_cancels_from_another_process(monkeypatch):
+    monkeypatch.setattr(job_control, "JOB_CANCEL_POLL_SECONDS", 0.02)
+    t, result = _run_in_job(
+        804, lambda: job_control.run(["sleep", "30"]), poll=lambda: True
+    )
+    t.join(10)
+    assert not t.is_alive()
+    assert isinstance(result[0], job_control.JobCancelled)
+
+
+def test_bind_carries_job_into_pool_threads():
+    with job_control.job_scope("transcode", 805) as key:
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            assert pool.submit(job_control.current_job).result() is None
+            assert pool.submit(job_control.bind(job_control.current_job)).result() == key
+    assert job_control.current_job() is None
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import struct
+
+import pytest
+
+from media_utils import build_meta_json, file_sha256, mp4_faststart, plan_transcode, stored_content_hash
+
+
+def _box(kind: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+def _large_box(kind: bytes, payload: bytes = b"") -> bytes:
+    # size == 1：真实大小在紧随其后的 64 位 largesize 中
+    return struct.pack(">I", 1) + kind + struct.pack(">Q", 16 + len(payload)) + payload
+
+
+def _write(tmp_path, data: bytes, name: str = "a.mp4") -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_faststart_moov_before_mdat(tmp_path):
+    path = _write(tmp_path, _box(b"ftyp", b"isom") + _box(b"moov", b"x" * 16) + _box(b"mdat", b"y" * 32))
+    assert mp4_faststart(path) is True
+
+
+def test_faststart_moov_after_mdat(tmp_path):
+    path = _write(tmp_path, _box(b"ftyp", b"isom") + _box(b"mdat", b"y" * 32) + _box(b"moov", b"x" * 16))
+    assert mp4_faststart(path) is False
+
+
+def test_faststart_skips_64bit_box(tmp_path):
+    path = _write(tmp_path, _box(b"ftyp", b"isom") + _large_box(b"free", b"z" * 40) + _box(b"moov"))
+    assert mp4_faststart(path) is True
+
+
+def test_faststart_truncated_largesize(tmp_path):
+    path = _write(tmp_path, _box(b"ftyp", b"isom") + struct.pack(">I", 1) + b"free" + b"\x00\x00")
+    assert mp4_faststart(path) is None
+
+
+def test_faststart_invalid_box_size(tmp_path):
+    path = _write(tmp_path, struct.pack(">I", 4) + b"ftyp")
+    assert mp4_faststart(path) is None
+
+
+def test_faststart_missing_file(tmp_path):
+    assert mp4_faststart(str(tmp_path / "missing.mp4")) is None
+
+
+def _probe(vcodec="h264", pix_fmt="yuv420p", bits=None, acodec="aac"):
+    streams = [{"codec_type": "video", "codec_name": vcodec, "pix_fmt": pix_fmt, "bits_per_raw_sample": bits}]
+    if acodec:
+        streams.append({"codec_type": "audio", "codec_name": acodec})
+    return {"streams": streams, "format": {}}
+
+
+@pytest.mark.parametrize(
+    "probe, expected",
+    [
+        (_probe(vcodec="hevc"), "full"),
+        (_probe(pix_fmt="yuv422p"), "full"),
+        (_probe(bits="10"), "full"),
+        (_probe(vcodec="hevc", acodec="opus"), "full"),
+        (_probe(acodec="opus"), "audio"),
+        (_probe(acodec=None), "none"),
+        (_probe(), "none"),
+    ],
+)
+def test_plan_transcode_video_matrix(probe, expected):
+    assert plan_transcode("video", probe)[0] == expected
+
+
+def test_plan_transcode_remux_for_container(tmp_path):
+    path = _write(tmp_path, b"", name="a.mov")
+    assert plan_transcode("video", _probe(), path)[0] == "remux"
+
+
+def test_plan_transcode_remux_for_moov_at_end(tmp_path):
+    path = _write(tmp_path, _box(b"ftyp") + _box(b"mdat", b"y" * 8) + _box(b"moov"))
+    assert plan_transcode("video", _probe(), path)[0] == "remux"
+
+
+def test_plan_transcode_faststart_mp4_is_kept(tmp_path):
+    path = _write(tmp_path, _box(b"ftyp") + _box(b"moov") + _box(b"mdat", b"y" * 8))
+    assert plan_transcode("video", _probe(), path)[0] == "none"
+
+
+def test_plan_transcode_audio_check_precedes_container(tmp_path):
+    path = _write(tmp_path, b"", name="a.mkv")
+    assert plan_transcode("video", _probe(acodec="opus"), path)[0] == "audio"
+
+
+@pytest.mark.parametrize("codec, expected", [("mp3", "none"), ("aac", "full"), ("flac", "full")])
+def test_plan_transcode_audio(codec, expected):
+    probe = {"streams": [{"codec_type": "audio", "codec_name": codec}], "format": {}}
+    assert plan_transcode("audio", probe)[0] == expected
+
+
+def test_content_hash_recorded_and_carried_over(tmp_path):
+    path = _write(tmp_path, b"abc")
+    digest = file_sha256(path)
+    assert digest == hashlib.sha256(b"abc").hexdigest()
+    meta_json = build_meta_json({}, path, content_sha256=digest)
+    assert stored_content_hash(meta_json, path) == digest
+    # 文件未变时重新生成摘要沿用已记录的哈希
+    assert stored_content_hash(build_meta_json({}, path, meta_json), path) == digest
+
+
+def test_content_hash_stale_after_change(tmp_path):
+    path = _write(tmp_path, b"abc")
+    meta_json = build_meta_json({}, path, content_sha256=file_sha256(path))
+    with open(path, "wb") as f:
+        f.write(b"abcd")
+    assert stored_content_hash(meta_json, path) is None
+    assert stored_content_hash(build_meta_json({}, path, meta_json), path) is None
+    assert stored_content_hash(meta_json, os.path.join(str(tmp_path), "missing.mp4")) is None
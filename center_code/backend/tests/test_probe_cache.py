@@ -0,0 +1,110 @@
+import json
+import os
+from collections import OrderedDict
+
+import pytest
+
+import media_utils
+
+_PROBE = {
+    "format": {"format_name": "mov,mp4", "duration": "12.5", "size": "3", "bit_rate": "1000"},
+    "streams": [
+        {"codec_type": "video", "codec_name": "h264", "width": 1080, "height": 1920},
+        {"codec_type": "audio", "codec_name": "aac"},
+    ],
+}
+
+
+class _Material:
+    def __init__(self, meta_json=None, duration=None):
+        self.meta_json = meta_json
+        self.duration = duration
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """替换 ffprobe 并清空进程内缓存，返回被 probe 的路径列表"""
+    calls = []
+
+    def _fake(path):
+        calls.append(path)
+        return _PROBE
+
+    monkeypatch.setattr(media_utils, "ffprobe", _fake)
+    monkeypatch.setattr(media_utils, "_PROBE_CACHE", OrderedDict())
+    return calls
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = tmp_path / "a.mp4"
+    path.write_bytes(b"abc")
+    return str(path)
+
+
+def _rewrite(path, data):
+    st = os.stat(path)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_probe_summary_cached_until_file_changes(probes, clip):
+    summary = media_utils.probe_summary(clip)
+    assert media_utils.summary_duration(summary) == 12.5
+    assert media_utils.summary_video_dimensions(summary) == (1080, 1920)
+    media_utils.probe_summary(clip)
+    assert len(probes) == 1
+    _rewrite(clip, b"abcd")
+    media_utils.probe_summary(clip)
+    assert len(probes) == 2
+
+
+def test_cache_is_bounded(probes, clip, monkeypatch):
+    monkeypatch.setattr(media_utils, "PROBE_CACHE_SIZE", 1)
+    media_utils.probe_summary(clip)
+    other = os.path.join(os.path.dirname(clip), "b.mp4")
+    with open(other, "wb") as f:
+        f.write(b"b")
+    media_utils.probe_summary(other)
+    media_utils.probe_summary(clip)
+    assert len(probes) == 3
+
+
+def test_probe_material_writes_and_reuses_meta(probes, clip):
+    mat = _Material()
+    media_utils.probe_material(mat, clip)
+    assert len(probes) == 1
+    assert mat.duration == 12.5
+    assert json.loads(mat.meta_json)["file"]["size"] == 3
+
+    # 另一个进程（缓存为空）凭 meta_json 指纹直接复用，不再 probe
+    media_utils._PROBE_CACHE.clear()
+    again = _Material(mat.meta_json)
+    assert media_utils.summary_duration(media_utils.probe_material(again, clip)) == 12.5
+    assert len(probes) == 1
+
+
+def test_probe_material_ignores_stale_meta(probes, clip):
+    mat = _Material()
+    media_utils.probe_material(mat, clip)
+    _rewrite(clip, b"abcdef")
+    media_utils._PROBE_CACHE.clear()
+    media_utils.probe_material(mat, clip)
+    assert len(probes) == 2
+    assert json.loads(mat.meta_json)["file"]["size"] == 6
+
+
+def test_export_import_roundtrip(probes, clip):
+    assert media_utils.export_cached_summary(clip) is None
+    media_utils.probe_summary(clip)
+    entry = media_utils.export_cached_summary(clip)
+    media_utils._PROBE_CACHE.clear()
+    assert media_utils.import_cached_summary(clip, entry) is True
+    media_utils.probe_summary(clip)
+    assert len(probes) == 1
+
+    # 文件变化后导入的旧摘要被忽略
+    _rewrite(clip, b"zzzz")
+    assert media_utils.import_cached_summary(clip, entry) is False
+    assert media_utils.import_cached_summary(clip, {"file": entry["file"]}) is False
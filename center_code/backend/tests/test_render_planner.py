@@ -0,0 +1,95 @@
+import datetime
+import json
+
+import pytest
+
+import render_planner
+from models import VideoEditTask
+
+
+@pytest.fixture
+def planner(monkeypatch):
+    """吞吐 1 单位/秒/槽位、2 个槽位，队列由用例直接给出"""
+    state = {"backlog": (0.0, 0, 0)}
+    monkeypatch.setattr(render_planner, "throughput_model", lambda: (1.0, None))
+    monkeypatch.setattr(render_planner, "render_slots", lambda: 2)
+    monkeypatch.setattr(render_planner, "queue_backlog", lambda default_units: state["backlog"])
+    monkeypatch.setattr(render_planner, "RENDER_PLANNER_OVERHEAD_SECONDS", 5.0)
+    monkeypatch.setattr(render_planner, "RENDER_MAX_QUEUE_WAIT_SECONDS", 600.0)
+    monkeypatch.setattr(render_planner, "RENDER_MAX_JOB_SECONDS", 0.0)
+    return state
+
+
+def test_free_slot_starts_immediately(planner):
+    planner["backlog"] = (300.0, 1, 0)
+    plan = render_planner.plan_job(60)
+    assert plan.admitted and plan.wait_seconds == 0 and plan.run_seconds == 65
+
+
+def test_backlog_is_spread_over_slots(planner):
+    planner["backlog"] = (1000.0, 2, 3)
+    plan = render_planner.plan_job(60)
+    assert plan.admitted and plan.wait_seconds == 500
+
+
+def test_full_queue_is_rejected_with_retry_after(planner):
+    planner["backlog"] = (1400.0, 2, 5)
+    plan = render_planner.plan_job(60)
+    assert not plan.admitted and plan.reason
+    assert plan.retry_after_seconds == 101
+
+
+def test_oversized_job_is_rejected(planner, monkeypatch):
+    monkeypatch.setattr(render_planner, "RENDER_MAX_JOB_SECONDS", 60.0)
+    plan = render_planner.plan_job(120)
+    assert not plan.admitted and plan.retry_after_seconds is None
+
+
+def test_learned_throughput_skips_reused_intermediates(db_session):
+    now = datetime.datetime.now()
+
+    def _done(units, seconds, **policy):
+        db_session.add(
+            VideoEditTask(
+                user_id=1,
+                video_ids="1",
+                status="success",
+                cost_units=units,
+                started_at=now - datetime.timedelta(seconds=seconds),
+                finished_at=now,
+                encode_policy=json.dumps(policy),
+            )
+        )
+
+    _done(100, 55)  # 扣掉 5 秒固定开销后 50 秒
+    _done(60, 35)
+    # 复用了中间产物的任务只做了一部分渲染，学进去会高估吞吐
+    _done(200, 10, reused_intermediate=True)
+    db_session.commit()
+
+    throughput, avg_units = render_planner._learn_model()
+    assert throughput == pytest.approx(160 / 80)
+    assert avg_units == pytest.approx(80)
+
+
+def test_queue_backlog_counts_remaining_work(db_session):
+    db_session.add_all(
+        [
+            VideoEditTask(user_id=1, video_ids="1", status="running", cost_units=100, progress=40),
+            VideoEditTask(user_id=1, video_ids="1", status="pending", cost_units=30),
+            VideoEditTask(user_id=1, video_ids="1", status="pending"),
+            VideoEditTask(user_id=1, video_ids="1", status="success", cost_units=500),
+        ]
+    )
+    db_session.commit()
+    assert render_planner.queue_backlog(20.0) == (pytest.approx(110.0), 1, 2)
+
+
+def test_render_slots_follow_queue_mode(monkeypatch):
+    monkeypatch.setattr(render_planner, "RENDER_SLOTS", 0)
+    monkeypatch.delenv("EDIT_TASK_QUEUE", raising=False)
+    monkeypatch.setenv("MAX_EDIT_THREADS", "3")
+    monkeypatch.setenv("EDIT_WORKER_CONCURRENCY", "5")
+    assert render_planner.render_slots() == 3
+    monkeypatch.setenv("EDIT_TASK_QUEUE", "db")
+    assert render_planner.render_slots() == 5
@@ -0,0 +1,31 @@
+import renditions
+from renditions import Rendition, _parse_ladder
+
+
+def test_parse_ladder():
+    assert _parse_ladder("proxy:480:800k:48,scrub:360:1200k:1") == [
+        Rendition(name="proxy", short_side=480, bitrate="800k", gop=48),
+        Rendition(name="scrub", short_side=360, bitrate="1200k", gop=1),
+    ]
+    for off in ("", "off", "none", "0", "False"):
+        assert _parse_ladder(off) == []
+    # 格式不对的项跳过，其余照常
+    assert [r.name for r in _parse_ladder("bad,:1:1k:1,x:abc:1k:1, small : 240 : 300k : 24 ")] == ["small"]
+
+
+def test_ffmpeg_args_cap_bitrate_and_threads():
+    args = Rendition(name="proxy", short_side=480, bitrate="1.5m", gop=48).ffmpeg_args("/out/p.mp4", 3)
+    assert args[args.index("-b:v") + 1] == "1500k"
+    assert args[args.index("-bufsize") + 1] == "3000k"
+    assert args[args.index("-threads") + 1] == "3"
+    assert args[-1] == "/out/p.mp4"
+
+
+def test_rendition_paths():
+    assert renditions.rendition_rel_path("uploads/materials/videos/12.mp4", "proxy") == (
+        "uploads/materials/renditions/12.proxy.mp4"
+    )
+    meta = '{"renditions": {"proxy": {"path": "uploads/materials/renditions/12.proxy.mp4"}}}'
+    assert renditions.rendition_path(meta, "proxy").endswith("12.proxy.mp4")
+    assert renditions.rendition_path(meta, "scrub") is None
+    assert renditions.rendition_path("not json", "proxy") is None
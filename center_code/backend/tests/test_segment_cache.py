@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+
+import pytest
+
+import job_control
+from utils import segment_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    d = tmp_path / "cache"
+    monkeypatch.setattr(segment_cache, "SEGMENT_CACHE_DIR", str(d))
+    monkeypatch.setattr(segment_cache, "SEGMENT_CACHE_LOCK_POLL_SECONDS", 0.01)
+    return d
+
+
+def _writer(data: bytes, calls: list):
+    def _render(out_path):
+        calls.append(out_path)
+        with open(out_path, "wb") as f:
+            f.write(data)
+    return _render
+
+
+def _age(path, seconds):
+    ts = time.time() - seconds
+    os.utime(path, (ts, ts))
+
+
+def test_cache_key_ignores_param_order():
+    a = segment_cache.cache_key("image", {"sha256": "x", "duration": 3})
+    b = segment_cache.cache_key("image", {"duration": 3, "sha256": "x"})
+    assert a == b
+    assert a != segment_cache.cache_key("image", {"duration": 4, "sha256": "x"})
+    assert a != segment_cache.cache_key("video", {"duration": 3, "sha256": "x"})
+
+
+def test_get_or_render_renders_once():
+    calls = []
+    params = {"sha256": "x"}
+    assert segment_cache.lookup("image", params) is None
+    path = segment_cache.get_or_render("image", params, _writer(b"data", calls))
+    assert segment_cache.get_or_render("image", params, _writer(b"other", calls)) == path
+    assert len(calls) == 1
+    # 临时文件保留扩展名，落盘后不留残余
+    assert calls[0].endswith(".mp4") and not os.path.exists(calls[0])
+    with open(path, "rb") as f:
+        assert f.read() == b"data"
+    assert segment_cache.lookup("image", params) == path
+
+
+def test_failed_render_leaves_nothing(cache_dir):
+    def _boom(out_path):
+        with open(out_path, "wb") as f:
+            f.write(b"partial")
+        raise RuntimeError("ffmpeg failed")
+
+    with pytest.raises(RuntimeError):
+        segment_cache.get_or_render("image", {"sha256": "x"}, _boom)
+    with pytest.raises(RuntimeError):
+        segment_cache.get_or_render("image", {"sha256": "y"}, lambda out_path: None)
+    leftovers = [n for _r, _d, files in os.walk(cache_dir) for n in files]
+    assert leftovers == []
+
+
+def test_stale_lock_is_taken_over(monkeypatch):
+    monkeypatch.setattr(segment_cache, "SEGMENT_CACHE_LOCK_STALE_SECONDS", 60)
+    params = {"sha256": "x"}
+    key = segment_cache.cache_key("image", params)
+    lock_path = os.path.join(os.path.dirname(segment_cache.cache_path(key)), f".tmp_{key}.lock")
+    os.makedirs(os.path.dirname(lock_path))
+    open(lock_path, "w").close()
+    _age(lock_path, 120)
+
+    calls = []
+    segment_cache.get_or_render("image", params, _writer(b"data", calls))
+    assert len(calls) == 1
+    assert not os.path.exists(lock_path)
+
+
+def test_lock_refreshed_while_rendering(monkeypatch):
+    monkeypatch.setattr(segment_cache, "SEGMENT_CACHE_LOCK_HEARTBEAT_SECONDS", 0.02)
+    seen = []
+
+    def _slow(out_path):
+        lock_path = [
+            os.path.join(os.path.dirname(out_path), n)
+            for n in os.listdir(os.path.dirname(out_path))
+            if n.endswith(".lock")
+        ][0]
+        _age(lock_path, 1000)
+        time.sleep(0.2)
+        seen.append(time.time() - os.path.getmtime(lock_path))
+        with open(out_path, "wb") as f:
+            f.write(b"data")
+
+    segment_cache.get_or_render("image", {"sha256": "x"}, _slow)
+    assert seen and seen[0] < 100
+
+
+def test_cancelled_job_stops_waiting_for_lock():
+    params = {"sha256": "x"}
+    key = segment_cache.cache_key("image", params)
+    lock_path = os.path.join(os.path.dirname(segment_cache.cache_path(key)), f".tmp_{key}.lock")
+    os.makedirs(os.path.dirname(lock_path))
+    open(lock_path, "w").close()
+
+    errors = []
+
+    def _wait():
+        with job_control.job_scope("edit", 901):
+            try:
+                segment_cache.get_or_render("image", params, _writer(b"data", []))
+            except job_control.JobCancelled as e:
+                errors.append(e)
+
+    t = threading.Thread(target=_wait)
+    t.start()
+    time.sleep(0.05)
+    job_control.cancel("edit", 901)
+    t.join(5)
+    assert not t.is_alive()
+    assert len(errors) == 1
+
+
+def test_evict_lru_keeps_recent(cache_dir):
+    paths = []
+    for i in range(4):
+        p = segment_cache.get_or_render("image", {"i": i}, _writer(b"x" * 100, []))
+        _age(p, 10000 - i * 1000)  # i=0 最久未使用
+        paths.append(p)
+    # 最近使用过的条目不参与淘汰
+    os.utime(paths[0], None)
+
+    stats = segment_cache.evict(max_bytes=250, max_age_seconds=10 ** 6, min_idle_seconds=3600)
+    assert [os.path.exists(p) for p in paths] == [True, False, False, True]
+    assert stats["removed_files"] == 2 and stats["files"] == 2 and stats["bytes"] == 200
+
+
+def test_evict_by_age_and_tmp_leftovers(cache_dir):
+    old = segment_cache.get_or_render("image", {"i": 1}, _writer(b"x", []))
+    fresh = segment_cache.get_or_render("image", {"i": 2}, _writer(b"x", []))
+    leftover = os.path.join(os.path.dirname(old), ".tmp_dead.mp4")
+    open(leftover, "wb").close()
+    _age(old, 5000)
+    _age(leftover, 5000)
+
+    segment_cache.evict(max_bytes=10 ** 9, max_age_seconds=4000, min_idle_seconds=60)
+    assert not os.path.exists(old)
+    assert not os.path.exists(leftover)
+    assert os.path.exists(fresh)
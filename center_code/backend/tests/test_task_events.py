@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from task_events import TaskEventHub, TooManySubscriptions
+
+
+class _Store:
+    """假数据库：记录每次批量查询的任务ID"""
+
+    def __init__(self):
+        self.rows = {}
+        self.queries = []
+
+    def fetch(self, task_ids):
+        ids = sorted(task_ids)
+        self.queries.append(ids)
+        return {i: dict(self.rows[i]) for i in ids if i in self.rows}
+
+
+def _hub(store, **kwargs):
+    # 轮询间隔取很长，测试里只靠 notify / 手动 refresh 推进
+    kwargs.setdefault("poll_seconds", 3600)
+    return TaskEventHub(store.fetch, **kwargs)
+
+
+def test_one_query_for_all_subscribers():
+    store = _Store()
+    store.rows = {1: {"progress": 10}, 2: {"progress": 20}}
+    hub = _hub(store, max_per_user=0)
+    subs = [hub.subscribe(7, 1) for _ in range(5)] + [hub.subscribe(8, 2)]
+    for s in subs:
+        assert s.wait(5)[0]
+    store.queries.clear()
+    hub.refresh()
+    # 后台线程可能也刷新过一次，但每次都是一条覆盖全部任务的查询
+    assert store.queries and all(q == [1, 2] for q in store.queries)
+
+
+def test_unchanged_snapshot_times_out():
+    store = _Store()
+    store.rows = {1: {"progress": 10}}
+    hub = _hub(store)
+    sub = hub.subscribe(7, 1)
+    assert sub.wait(5) == (True, {"progress": 10})
+    hub.refresh()
+    assert sub.wait(0.05) == (False, {"progress": 10})
+
+
+def test_notify_wakes_subscriber():
+    store = _Store()
+    store.rows = {1: {"progress": 10}}
+    hub = _hub(store)
+    sub = hub.subscribe(7, 1)
+    assert sub.wait(5)[0]
+
+    got = []
+    t = threading.Thread(target=lambda: got.append(sub.wait(5)))
+    t.start()
+    store.rows[1] = {"progress": 50}
+    hub.notify(1)
+    t.join(5)
+    assert got == [(True, {"progress": 50})]
+
+
+def test_deleted_task_yields_none():
+    store = _Store()
+    store.rows = {1: {"progress": 10}}
+    hub = _hub(store)
+    sub = hub.subscribe(7, 1)
+    assert sub.wait(5)[0]
+    del store.rows[1]
+    hub.refresh()
+    assert sub.wait(1) == (True, None)
+
+
+def test_per_user_cap_and_release():
+    store = _Store()
+    hub = _hub(store, max_per_user=2)
+    a = hub.subscribe(7, 1)
+    hub.subscribe(7, 2)
+    with pytest.raises(TooManySubscriptions):
+        hub.subscribe(7, 3)
+    # 其他用户不受影响
+    hub.subscribe(8, 3)
+    a.close()
+    a.close()
+    assert hub.connections(7) == 1
+    hub.subscribe(7, 3)
+    assert hub.connections(7) == 2
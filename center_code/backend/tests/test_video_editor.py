@@ -0,0 +1,377 @@
+import os
+
+import pytest
+
+from utils import segment_cache, video_editor
+from utils.video_editor import VideoEditor, plan_stream_copy
+from encode_policy import EncodePolicy
+
+POLICY = EncodePolicy(kind="render", preset="veryfast", crf=23, threads=4, running=1, pending=0)
+
+
+def _video(**overrides):
+    v = {
+        "codec_name": "h264",
+        "pix_fmt": "yuv420p",
+        "profile": "High",
+        "level": 40,
+        "width": 1080,
+        "height": 1920,
+        "sample_aspect_ratio": "1:1",
+        "r_frame_rate": "30/1",
+    }
+    v.update(overrides)
+    return v
+
+
+class _Harness:
+    """假 probe + 截获 ffmpeg 调用：记录每次的命令行参数，并给输出文件写入内容"""
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.summaries = {}
+        self.calls = []
+
+    def clip(self, name, duration, video=None, audio=None):
+        path = os.path.join(self.root, name)
+        with open(path, "wb") as f:
+            f.write(name.encode("utf-8"))
+        self.summaries[path] = {
+            "format": {"duration": str(duration)},
+            "video": video if video is not None else _video(),
+            "audio": audio or {},
+        }
+        return path
+
+    def probe(self, path):
+        if path not in self.summaries:
+            raise RuntimeError(f"unexpected probe: {path}")
+        return self.summaries[path]
+
+    def dims(self, path):
+        v = self.probe(path).get("video") or {}
+        return v.get("width"), v.get("height")
+
+    def run(self, stream, expected_duration, progress_cb=None):
+        args = stream.get_args()
+        self.calls.append(args)
+        for i, a in enumerate(args):
+            if a.startswith(self.root) and (i == 0 or args[i - 1] != "-i") and not os.path.exists(a):
+                with open(a, "wb") as f:
+                    f.write(b"out")
+
+    def last(self):
+        return self.calls[-1]
+
+
+@pytest.fixture
+def harness(tmp_path, monkeypatch):
+    ff = tmp_path / "ffmpeg"
+    ff.write_bytes(b"")
+    monkeypatch.setenv("FFMPEG_PATH", str(ff))
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    monkeypatch.setattr(video_editor, "OUTPUT_VIDEO_DIR", str(out_dir))
+    monkeypatch.setattr(segment_cache, "SEGMENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(video_editor, "_ENCODERS", set())
+    h = _Harness(tmp_path)
+    monkeypatch.setattr(video_editor, "probe_summary", h.probe)
+    monkeypatch.setattr(video_editor, "probe_video_dimensions", h.dims)
+    monkeypatch.setattr(video_editor, "_run_ffmpeg_stream", h.run)
+    return h
+
+
+def _opt(args, flag):
+    """第一个 flag 之后的值"""
+    return args[args.index(flag) + 1]
+
+
+def test_stream_copy_requires_matching_clips(harness):
+    a = harness.clip("a.mp4", 5)
+    b = harness.clip("b.mp4", 5)
+    assert plan_stream_copy([a, b])[0] is True
+    assert plan_stream_copy([a, b], 1080, 1920, 30)[0] is True
+    assert plan_stream_copy([a, b], 720, 1280)[0] is False
+    assert plan_stream_copy([a, b], target_fps=25)[0] is False
+    assert plan_stream_copy([])[0] is False
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [
+        {"codec_name": "hevc"},
+        {"pix_fmt": "yuv420p10le"},
+        {"width": 720},
+        {"r_frame_rate": "25/1"},
+        {"profile": "Main"},
+        {"sample_aspect_ratio": "4:3"},
+        {"bits_per_raw_sample": "10"},
+    ],
+)
+def test_stream_copy_rejects_mismatch(harness, overrides):
+    a = harness.clip("a.mp4", 5)
+    b = harness.clip("b.mp4", 5, video=_video(**overrides))
+    ok, reason = plan_stream_copy([a, b])
+    assert ok is False and reason
+
+
+def test_edit_copies_video_when_clips_match(harness):
+    clips = [harness.clip("a.mp4", 5), harness.clip("b.mp4", 5)]
+    voice = harness.clip("voice.mp3", 8, video={})
+    out = VideoEditor.edit(clips, voice, None, encode_policy=POLICY)
+    assert out and os.path.exists(out)
+    args = harness.last()
+    assert _opt(args, "-vcodec") == "copy"
+    assert _opt(args, "-acodec") == "aac"
+    # 流复制不能 trim，靠输出时长截到配音长度
+    assert float(_opt(args, "-t")) == 8
+    assert "-filter_complex" not in args or "trim" not in _opt(args, "-filter_complex")
+
+
+def test_edit_reencodes_when_speed_changes(harness):
+    clips = [harness.clip("a.mp4", 5), harness.clip("b.mp4", 5)]
+    VideoEditor.edit(clips, None, None, speed=1.25, encode_policy=POLICY)
+    args = harness.last()
+    assert _opt(args, "-vcodec") == "libx264"
+    assert "setpts" in _opt(args, "-vf")
+
+
+def test_short_footage_loops_concat_input(harness, tmp_path):
+    clips = [harness.clip("a.mp4", 4, video=_video(codec_name="hevc")), harness.clip("b.mp4", 6)]
+    voice = harness.clip("voice.mp3", 23, video={})
+    VideoEditor.edit(clips, voice, None, encode_policy=POLICY)
+    args = harness.last()
+    # 10 秒素材循环 3 次覆盖 23 秒配音：输入只打开一次，不展开 N 份 concat 列表
+    assert args.count("-i") == 2
+    assert _opt(args, "-stream_loop") == "2"
+    assert "trim=end=23" in _opt(args, "-filter_complex")
+    # concat 列表用完即删，不留 loop_concat_*.txt
+    assert [n for n in os.listdir(tmp_path / "out") if n.endswith(".txt")] == []
+
+
+def test_long_footage_is_not_looped(harness):
+    clips = [harness.clip("a.mp4", 20, video=_video(codec_name="hevc"))]
+    voice = harness.clip("voice.mp3", 8, video={})
+    VideoEditor.edit(clips, voice, None, encode_policy=POLICY)
+    args = harness.last()
+    assert "-stream_loop" not in args[: args.index("-i") + 2]
+    assert "trim=end=8" in _opt(args, "-filter_complex")
+
+
+def test_normalize_pool_splits_thread_budget(monkeypatch):
+    monkeypatch.setattr(video_editor.os, "cpu_count", lambda: 16)
+    monkeypatch.setenv("MAX_EDIT_THREADS", "2")
+    monkeypatch.setattr(video_editor, "EDIT_NORMALIZE_WORKERS", 0)
+    # 每个剪辑任务 8 核预算：片段多时 8 进程各 1 线程，片段少时进程数封顶、线程更多
+    assert video_editor._normalize_pool_size(20) == (8, 1)
+    assert video_editor._normalize_pool_size(3) == (3, 2)
+    monkeypatch.setattr(video_editor, "EDIT_NORMALIZE_WORKERS", 2)
+    assert video_editor._normalize_pool_size(20) == (2, 4)
+
+
+def test_normalize_clips_parallel_keeps_order_and_caches(harness, monkeypatch):
+    rendered = []
+
+    def _fake_render(src, out, width, height, fps, threads):
+        rendered.append(os.path.basename(src))
+        with open(out, "wb") as f:
+            f.write(b"norm")
+
+    monkeypatch.setattr(video_editor, "_render_normalized_clip", _fake_render)
+    ok = harness.clip("ok.mp4", 3)
+    odd = harness.clip("odd.mp4", 3, video=_video(width=720, height=1280))
+    hevc = harness.clip("hevc.mp4", 3, video=_video(codec_name="hevc"))
+
+    out = video_editor.normalize_clips_parallel([ok, odd, hevc, odd], 1080, 1920, 30)
+    # 已符合规格的片段原样返回；相同片段只归一化一次（片段缓存）
+    assert out[0] == ok
+    assert out[1] == out[3] and out[1] != out[2]
+    assert sorted(rendered) == ["hevc.mp4", "odd.mp4"]
+    again = video_editor.normalize_clips_parallel([odd], 1080, 1920, 30)
+    assert again == [out[1]] and len(rendered) == 2
+
+
+def test_preview_dimensions_keep_aspect_and_even_sides():
+    assert video_editor.preview_dimensions(1080, 1920) == (360, 640)
+    assert video_editor.preview_dimensions(1920, 1080) == (640, 360)
+    assert video_editor.preview_dimensions(1001, 1333) == (360, 480)
+    # 本身已小于预览尺寸的不放大
+    assert video_editor.preview_dimensions(240, 320) == (240, 320)
+    assert video_editor.preview_dimensions(None, 1920) is None
+
+
+def test_preview_skips_stream_copy_and_scales_down(harness):
+    clips = [harness.clip("a.mp4", 5), harness.clip("b.mp4", 5)]
+    VideoEditor.edit(clips, None, None, encode_policy=POLICY.for_preview(), preview=True)
+    args = harness.last()
+    assert _opt(args, "-vcodec") == "libx264"
+    assert _opt(args, "-preset") == "ultrafast"
+    assert "scale=360:640" in _opt(args, "-vf")
+
+
+def _intermediates(args):
+    return [a for a in args if os.sep + "cache" + os.sep in a]
+
+
+def test_audio_change_reuses_cached_intermediate(harness, monkeypatch):
+    monkeypatch.setattr(video_editor, "EDIT_INTERMEDIATE_CACHE", True)
+    clips = [harness.clip("a.mp4", 5, video=_video(codec_name="hevc")), harness.clip("b.mp4", 5)]
+    first, second = {}, {}
+    VideoEditor.edit(clips, harness.clip("v1.mp3", 8, video={}), None, encode_policy=POLICY, render_info=first)
+    assert len(harness.calls) == 2 and not first
+    # 无字幕时中间产物直接按成片 CRF 编码，出片只重封装视频
+    assert _opt(harness.calls[0], "-crf") == str(POLICY.crf)
+    assert _opt(harness.last(), "-vcodec") == "copy"
+
+    VideoEditor.edit(clips, harness.clip("v2.mp3", 8, video={}), None, encode_policy=POLICY, render_info=second)
+    assert len(harness.calls) == 3 and second == {"reused_intermediate": True}
+    assert _intermediates(harness.last()) == _intermediates(harness.calls[1])
+    assert _opt(harness.last(), "-vcodec") == "copy"
+
+
+def test_subtitles_burned_over_high_quality_intermediate(harness, monkeypatch, tmp_path):
+    monkeypatch.setattr(video_editor, "EDIT_INTERMEDIATE_CACHE", True)
+    clips = [harness.clip("a.mp4", 5, video=_video(codec_name="hevc"))]
+    voice = harness.clip("v.mp3", 4, video={})
+    sub = tmp_path / "sub.srt"
+    sub.write_text("1\n00:00:00,000 --> 00:00:01,000\nhi\n", encoding="utf-8")
+    out = VideoEditor.edit(clips, voice, None, subtitle_path=str(sub), encode_policy=POLICY)
+    # 首次出片与中间产物同一次解码写出，不编码两遍；中间产物用高质量 CRF，成片烧字幕
+    assert len(harness.calls) == 1
+    args = harness.last()
+    inter = _intermediates(args)[0]
+    assert _opt(args[args.index(out):], "-crf") == str(video_editor.EDIT_INTERMEDIATE_CRF)
+    assert args.index(out) < args.index(inter)
+    assert _opt(args, "-crf") == str(POLICY.crf)
+    assert "subtitles" in _opt(args, "-filter_complex")
+
+
+def test_intermediate_cache_is_opt_in(harness, monkeypatch):
+    monkeypatch.setattr(video_editor, "EDIT_INTERMEDIATE_CACHE", False)
+    clips = [harness.clip("a.mp4", 5, video=_video(codec_name="hevc"))]
+    VideoEditor.edit(clips, harness.clip("v.mp3", 4, video={}), None, encode_policy=POLICY)
+    assert len(harness.calls) == 1 and not _intermediates(harness.last())
+
+
+def test_batch_variants_share_one_timeline(harness):
+    clips = [harness.clip("a.mp4", 5, video=_video(codec_name="hevc")), harness.clip("b.mp4", 5)]
+    short = harness.clip("short.mp3", 8, video={})
+    long = harness.clip("long.mp3", 14, video={})
+    first, second = {}, {}
+    # 组内最长配音 14 秒：按它展开循环渲染一次，较短的版本截取前缀
+    VideoEditor.edit(clips, short, None, encode_policy=POLICY, timeline_duration=14, render_info=first)
+    assert float(_opt(harness.calls[0], "-t")) == 14
+    assert _opt(harness.calls[0], "-stream_loop") == "1"
+
+    VideoEditor.edit(clips, long, None, encode_policy=POLICY, timeline_duration=14, render_info=second)
+    assert not first and second == {"reused_intermediate": True}
+    assert float(_opt(harness.last(), "-t")) == 14
+    assert _intermediates(harness.last()) == _intermediates(harness.calls[1])
+
+
+def test_aspect_variants_branch_from_one_render(harness):
+    clips = [harness.clip("a.mp4", 5, video=_video(codec_name="hevc"))]
+    voice = harness.clip("v.mp3", 4, video={})
+    out = VideoEditor.edit(clips, voice, None, encode_policy=POLICY, extra_targets=[("1x1", 1080, 1080)])
+    # 成片与附加画幅同一次解码输出，不先出成片再解码一遍
+    assert len(harness.calls) == 1
+    args = harness.last()
+    variant = video_editor.aspect_variant_path(out, "1x1")
+    assert out in args and variant in args and os.path.exists(variant)
+    graph = _opt(args, "-filter_complex")
+    assert "split" in graph and "scale=1080:1080" in graph and "pad=1080:1080" in graph
+
+
+def test_parse_export_ratios():
+    from blueprints import editor
+
+    assert editor._parse_export_ratios(None, "1080p", "9:16") == []
+    # 与主输出相同、重复的比例忽略
+    assert editor._parse_export_ratios(["9:16", "1:1", "16:9", "1:1"], "720p", "9:16") == [
+        ["1:1", 720, 720],
+        ["16:9", 1280, 720],
+    ]
+    with pytest.raises(ValueError):
+        editor._parse_export_ratios(["4:3"], "1080p", "9:16")
+    with pytest.raises(ValueError):
+        editor._parse_export_ratios("1:1", "1080p", "9:16")
+
+
+def test_timeline_pieces_follow_loop_copies():
+    # 两个片段 4 + 6 秒，循环两遍；区间 [8, 15) 跨过第一遍末尾
+    assert video_editor.timeline_pieces([4.0, 6.0], 2, 8.0, 15.0) == [(1, 4.0, 2.0), (0, 0.0, 4.0), (1, 0.0, 1.0)]
+    assert video_editor.timeline_pieces([4.0, 6.0], 1, 0.0, 3.0) == [(0, 0.0, 3.0)]
+
+
+def test_chunk_pool_stays_within_thread_budget(monkeypatch):
+    monkeypatch.setattr(video_editor, "EDIT_CHUNK_WORKERS", 0)
+    assert video_editor._chunk_pool_size(10, 16) == (4, 4)
+    assert video_editor._chunk_pool_size(2, 16) == (2, 8)
+    assert video_editor._chunk_pool_size(10, 1) == (1, 1)
+    monkeypatch.setattr(video_editor, "EDIT_CHUNK_WORKERS", 3)
+    assert video_editor._chunk_pool_size(10, 12) == (3, 4)
+
+
+def test_render_chunked_splits_on_frame_boundaries(harness, monkeypatch, tmp_path):
+    chunks = []
+
+    def _fake_chunk(video_paths, pieces, speed, width, height, out_fps, frames, out_path, preset, threads, crf):
+        chunks.append((pieces, frames, (width, height), crf))
+
+    joined = []
+    monkeypatch.setattr(video_editor, "_render_chunk", _fake_chunk)
+    monkeypatch.setattr(video_editor, "_concat_copy", lambda paths, out: joined.append(len(paths)))
+    clips = [
+        harness.clip("a.mp4", 50, video=_video(avg_frame_rate="30/1")),
+        harness.clip("b.mp4", 50, video=_video(avg_frame_rate="30/1")),
+    ]
+    video_editor.render_chunked(clips, 2, 1.0, 150.0, str(tmp_path / "inter.mp4"), POLICY, chunk_seconds=60)
+
+    # 各段在线程池里并行完成，顺序不定
+    assert sorted(c[1] for c in chunks) == [900, 1800, 1800]
+    assert joined == [3]
+    assert all(c[2] == (1080, 1920) and c[3] == video_editor.EDIT_INTERMEDIATE_CRF for c in chunks)
+    # 第二段 [60, 120) 跨过片段 b 的末尾回到循环第二遍的 a
+    assert [(1, 10.0, 40.0), (0, 0.0, 20.0)] in [c[0] for c in chunks]
+    assert not os.path.exists(str(tmp_path / "inter.mp4.chunks"))
+
+
+def test_reencode_writes_thumbnails_in_same_call(harness, monkeypatch):
+    monkeypatch.setattr(video_editor, "_ENCODERS", {"libwebp"})
+    clips = [harness.clip("a.mp4", 5, video=_video(codec_name="hevc"))]
+    out = VideoEditor.edit(clips, harness.clip("v.mp3", 4, video={}), None, encode_policy=POLICY)
+    thumbs = video_editor.thumbnail_paths(out)
+    assert len(harness.calls) == 1
+    args = harness.last()
+    assert thumbs["poster"] in args and thumbs["animated"] in args
+    assert "libwebp" in args and "mjpeg" in args
+    # 海报从 1 秒处取（短视频取中点）
+    assert float(_opt(args[args.index(out):], "-ss")) == 1.0
+
+
+def test_thumbnails_can_be_disabled(harness, monkeypatch):
+    monkeypatch.setattr(video_editor, "EDIT_THUMBNAILS", False)
+    clips = [harness.clip("a.mp4", 5, video=_video(codec_name="hevc"))]
+    out = VideoEditor.edit(clips, harness.clip("v.mp3", 4, video={}), None, encode_policy=POLICY)
+    assert video_editor.thumbnail_paths(out)["poster"] not in harness.last()
+    assert video_editor.ensure_thumbnails(out) == {}
+
+
+def test_ensure_thumbnails_fills_only_missing(harness, monkeypatch, tmp_path):
+    cmds = []
+
+    def _fake_run(cmd, **kwargs):
+        cmds.append(cmd)
+        with open(cmd[-1], "wb") as f:
+            f.write(b"img")
+        return video_editor.subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(video_editor.job_control, "run", _fake_run)
+    out = harness.clip("out.mp4", 10)
+    thumbs = video_editor.thumbnail_paths(out)
+
+    assert video_editor.ensure_thumbnails(out) == {"poster": thumbs["poster"]}
+    assert len(cmds) == 1 and _opt(cmds[0], "-ss") == "1.000"
+    monkeypatch.setattr(video_editor, "_ENCODERS", {"libwebp"})
+    assert video_editor.ensure_thumbnails(out) == thumbs
+    assert len(cmds) == 2 and cmds[1][-1] == thumbs["animated"]
@@ -0,0 +1,98 @@
+import datetime
+
+import worker_edit
+from models import VideoEditTask
+
+
+def _task(db, user_id=1, **fields):
+    fields.setdefault("payload_json", "{}")
+    t = VideoEditTask(user_id=user_id, video_ids="1", status=fields.pop("status", "pending"), **fields)
+    db.add(t)
+    db.commit()
+    return t.id
+
+
+def _get(db, task_id):
+    db.expire_all()
+    return db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
+
+
+def test_claim_takes_pending_task_once(db_session):
+    task_id = _task(db_session)
+    claimed = worker_edit.claim_one("host:1:0", 600)
+    assert claimed and claimed.id == task_id
+    task = _get(db_session, task_id)
+    assert (task.status, task.locked_by, task.attempts) == ("running", "host:1:0", 1)
+    # 已被认领、锁未过期的任务不会再被领走
+    assert worker_edit.claim_one("host:2:0", 600) is None
+
+
+def test_thread_mode_tasks_are_ignored(db_session):
+    # 没有 payload_json 的任务由 web 进程内线程执行，worker 不认领
+    _task(db_session, payload_json=None)
+    assert worker_edit.claim_one("host:1:0", 600) is None
+
+
+def test_stale_running_task_is_reclaimed_first(db_session):
+    old = datetime.datetime.now() - datetime.timedelta(hours=1)
+    _task(db_session)
+    stale_id = _task(db_session, status="running", locked_by="dead:1:0", locked_at=old, attempts=1)
+    claimed = worker_edit.claim_one("host:1:0", 600)
+    assert claimed.id == stale_id
+    assert _get(db_session, stale_id).attempts == 2
+
+
+def test_fail_exhausted_only_touches_stale_tasks(db_session):
+    now = datetime.datetime.now()
+    old = now - datetime.timedelta(hours=1)
+    dead = _task(db_session, status="running", locked_by="dead:1:0", locked_at=old, attempts=3, max_attempts=3)
+    retry = _task(db_session, status="running", locked_by="dead:1:0", locked_at=old, attempts=1, max_attempts=3)
+    alive = _task(db_session, status="running", locked_by="host:1:0", locked_at=now, attempts=3, max_attempts=3)
+
+    worker_edit.fail_exhausted(now - datetime.timedelta(minutes=10))
+    assert _get(db_session, dead).status == "fail"
+    assert _get(db_session, dead).locked_by is None
+    assert _get(db_session, retry).status == "running"
+    assert _get(db_session, alive).status == "running"
+
+
+def test_heartbeat_refreshes_own_tasks(db_session, monkeypatch):
+    old = datetime.datetime.now() - datetime.timedelta(hours=1)
+    mine = _task(db_session, status="running", locked_by="host:1:0", locked_at=old)
+    other = _task(db_session, status="running", locked_by="host:2:0", locked_at=old)
+    monkeypatch.setattr(worker_edit, "_ACTIVE", {mine, other})
+
+    worker_edit.heartbeat("host:1")
+    assert _get(db_session, mine).locked_at > old
+    assert _get(db_session, other).locked_at == old
+
+
+def test_payload_roundtrip_uses_relative_paths(monkeypatch, tmp_path):
+    import json
+
+    from blueprints import editor
+
+    monkeypatch.setattr(editor, "BASE_DIR", str(tmp_path))
+    clip = str(tmp_path / "uploads" / "a.mp4")
+    outside = "/elsewhere/voice.mp3"
+    payload = editor._encode_edit_payload({"video_paths": [clip], "voice_path": outside, "speed": 1.5})
+    raw = json.loads(payload)
+    assert raw["video_paths"] == ["uploads/a.mp4"]
+    assert raw["voice_path"] == outside
+
+    kwargs = editor._decode_edit_payload(payload)
+    assert kwargs["video_paths"] == [clip]
+    assert kwargs["voice_path"] == outside
+    assert kwargs["speed"] == 1.5 and kwargs["bgm_path"] is None
+
+
+def test_group_followers_wait_for_leader(db_session):
+    leader = _task(db_session, group_id="g1")
+    follower = _task(db_session, group_id="g1")
+    assert worker_edit.claim_one("host:1:0", 600).id == leader
+    # 组长渲染共享中间产物期间不认领其余版本
+    assert worker_edit.claim_one("host:1:1", 600) is None
+
+    db_session.query(VideoEditTask).filter(VideoEditTask.id == leader).update({"status": "success"})
+    db_session.commit()
+    assert worker_edit.claim_one("host:1:1", 600).id == follower
@@ -0,0 +1,54 @@
+import os
+import time
+
+import pytest
+
+import worker_notify
+
+
+@pytest.fixture(autouse=True)
+def notify_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker_notify, "WORKER_NOTIFY_DIR", str(tmp_path / "notify"))
+    return tmp_path / "notify"
+
+
+def test_notify_wakes_registered_listener():
+    listener = worker_notify.Listener("transcode")
+    try:
+        assert listener.wait(0.05) is False
+        assert worker_notify.notify("transcode") == 1
+        assert worker_notify.notify("transcode") == 1
+        # 积压的多条通知一次取空
+        assert listener.wait(2) is True
+        assert listener.wait(0.05) is False
+        # 其它通道的通知不会唤醒它
+        assert worker_notify.notify("edit") == 0
+        assert listener.wait(0.05) is False
+    finally:
+        listener.close()
+    assert not os.path.exists(listener.path)
+    assert worker_notify.notify("transcode") == 0
+
+
+def test_poke_wakes_self():
+    listener = worker_notify.Listener("edit")
+    try:
+        listener.poke()
+        assert listener.wait(2) is True
+    finally:
+        listener.close()
+
+
+def test_stale_registrations_are_pruned(monkeypatch):
+    listener = worker_notify.Listener("transcode")
+    try:
+        old = time.time() - worker_notify.WORKER_NOTIFY_STALE_SECONDS - 10
+        os.utime(listener.path, (old, old))
+        assert worker_notify.notify("transcode") == 0
+        assert not os.path.exists(listener.path)
+        # 兜底：worker 定期重新登记
+        monkeypatch.setattr(listener, "_registered_at", 0.0)
+        listener.wait(0)
+        assert worker_notify.notify("transcode") == 1
+    finally:
+        listener.close()
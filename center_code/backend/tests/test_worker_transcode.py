@@ -0,0 +1,170 @@
+import datetime
+
+import worker_transcode
+from encode_policy import EncodePolicy
+from models import Material, MaterialTranscodeTask
+from renditions import Rendition
+
+
+def _material(db, duration):
+    m = Material(name="m", type="video", status="processing", duration=duration)
+    db.add(m)
+    db.flush()
+    return m.id
+
+
+def _task(db, duration=None, plan="full", **fields):
+    t = MaterialTranscodeTask(
+        material_id=_material(db, duration),
+        input_path="in.mp4",
+        output_path="out.mp4",
+        kind="video",
+        transcode_plan=plan,
+        **fields,
+    )
+    db.add(t)
+    db.commit()
+    return t.id
+
+
+def _get(db, task_id):
+    db.expire_all()
+    return db.get(MaterialTranscodeTask, task_id)
+
+
+def test_claim_batch_prefers_short_materials(db_session):
+    long_id = _task(db_session, 600)
+    short_id = _task(db_session, 10)
+    unknown_id = _task(db_session, None)
+    rendition_id = _task(db_session, 1, plan="renditions")
+
+    first = worker_transcode.claim_batch("host:1", 2, 600)
+    assert sorted(t.id for t in first) == sorted([short_id, long_id])
+    assert len({t.lock_token for t in first}) == 1
+    task = _get(db_session, short_id)
+    assert (task.status, task.attempts) == ("running", 1) and task.lease_expires_at is not None
+
+    # 已认领的任务不会被另一个 worker 再领走；代理版本任务排在入库转码之后
+    second = worker_transcode.claim_batch("host:2", 5, 600)
+    assert [t.id for t in second] == [unknown_id, rendition_id]
+    assert second[1].plan == "renditions"
+    assert worker_transcode.claim_batch("host:3", 5, 600) == []
+
+
+def test_aged_task_is_not_starved(db_session):
+    old = datetime.datetime.now() - datetime.timedelta(seconds=worker_transcode.TRANSCODE_SJF_MAX_WAIT_SECONDS + 60)
+    long_id = _task(db_session, 600, created_at=old)
+    _task(db_session, 10)
+    assert [t.id for t in worker_transcode.claim_batch("host:1", 1, 600)] == [long_id]
+
+
+def test_exhausted_tasks_are_not_claimed(db_session):
+    _task(db_session, 10, attempts=3, max_attempts=3)
+    assert worker_transcode.claim_batch("host:1", 5, 600) == []
+    assert worker_transcode.claim_batch("host:1", 0, 600) == []
+
+
+def test_progress_buffer_merges_into_one_update(db_session):
+    a = _task(db_session, 10, status="running", progress=5)
+    b = _task(db_session, 10, status="running", progress=50)
+    done = _task(db_session, 10, status="success", progress=100)
+    buf = worker_transcode.ProgressBuffer(3600)
+    buf.set(a, 20)
+    buf.set(a, 15)  # 内存里也不回退
+    buf.set(b, 40)  # 库里已更高：不回退
+    buf.set(done, 60)  # 已结束的任务不再被进度覆盖
+    buf.flush()
+
+    assert _get(db_session, a).progress == 20
+    assert _get(db_session, b).progress == 50
+    assert (_get(db_session, done).status, _get(db_session, done).progress) == ("success", 100)
+    # 已写库的进度从缓冲中移除
+    assert buf._pending == {}
+
+
+def test_progress_buffer_discard(db_session):
+    a = _task(db_session, 10, status="running", progress=0)
+    buf = worker_transcode.ProgressBuffer(3600)
+    buf.set(a, 30)
+    buf.discard(a)
+    buf.flush()
+    assert _get(db_session, a).progress == 0
+
+
+def test_reaper_requeues_or_fails_expired_leases(db_session):
+    now = worker_transcode.utcnow()
+    past = now - datetime.timedelta(seconds=30)
+    retry = _task(db_session, 10, status="running", locked_by="dead:1:a", attempts=1, lease_expires_at=past)
+    dead = _task(db_session, 10, status="running", locked_by="dead:1:a", attempts=3, lease_expires_at=past)
+    dead_rendition = _task(
+        db_session, 10, plan="renditions", status="running", locked_by="dead:1:a", attempts=3, lease_expires_at=past
+    )
+    alive = _task(db_session, 10, status="running", locked_by="host:1:a", attempts=1,
+                  lease_expires_at=now + datetime.timedelta(seconds=60))
+    # 升级前认领、没有租约的任务按 locked_at 判断
+    legacy = _task(db_session, 10, status="running", locked_by="old:1", attempts=1,
+                   locked_at=now - datetime.timedelta(hours=1))
+
+    assert worker_transcode.reap_expired_leases(600) == 4
+    assert (_get(db_session, retry).status, _get(db_session, retry).locked_by) == ("pending", None)
+    assert _get(db_session, legacy).status == "pending"
+    assert _get(db_session, dead).status == "fail"
+    assert db_session.get(Material, _get(db_session, dead).material_id).status == "failed"
+    # 代理版本任务失败不影响已就绪的素材
+    assert _get(db_session, dead_rendition).status == "fail"
+    assert db_session.get(Material, _get(db_session, dead_rendition).material_id).status == "processing"
+    assert _get(db_session, alive).status == "running"
+    assert worker_transcode.reap_expired_leases(600) == 0
+
+
+def test_renew_leases_extends_own_tasks(db_session, monkeypatch):
+    soon = worker_transcode.utcnow() + datetime.timedelta(seconds=5)
+    mine = _task(db_session, 10, status="running", locked_by="host:1:a", lease_expires_at=soon)
+    other = _task(db_session, 10, status="running", locked_by="host:2:b", lease_expires_at=soon)
+    monkeypatch.setattr(worker_transcode, "_LEASED", {mine, other})
+
+    worker_transcode.renew_leases("host:1")
+    assert _get(db_session, mine).lease_expires_at > soon
+    assert _get(db_session, other).lease_expires_at == soon
+
+
+class _FakeProc:
+    stdout = []
+    returncode = 0
+
+    def communicate(self, timeout=None):
+        return "", ""
+
+
+def _transcode_cmd(monkeypatch, tmp_path, plan, rendition_count):
+    cmds = []
+
+    def _popen(cmd, **kwargs):
+        cmds.append(cmd)
+        return _FakeProc()
+
+    monkeypatch.setattr(worker_transcode, "resolve_ffmpeg_exe", lambda: "ffmpeg")
+    monkeypatch.setattr(worker_transcode.job_control, "popen", _popen)
+    outputs = [
+        (Rendition(name=f"r{i}", short_side=360, bitrate="800k", gop=1), str(tmp_path / f"r{i}.mp4"))
+        for i in range(rendition_count)
+    ]
+    worker_transcode.run_ffmpeg_transcode(
+        input_abs=str(tmp_path / "in.mp4"),
+        output_abs=str(tmp_path / "out" / "main.mp4"),
+        kind="video",
+        duration_seconds=10,
+        task_id=1,
+        plan=plan,
+        policy=EncodePolicy(kind="transcode", preset="veryfast", crf=23, threads=8, running=1, pending=0),
+        rendition_outputs=outputs,
+    )
+    cmd = cmds[0]
+    return [cmd[i + 1] for i, a in enumerate(cmd) if a == "-threads"]
+
+
+def test_transcode_threads_shared_by_all_encoders(monkeypatch, tmp_path):
+    # 主输出 + 3 个代理版本：每个编码器 2 线程，合计不超过策略的 8 线程
+    assert _transcode_cmd(monkeypatch, tmp_path, "full", 3) == ["2", "2", "2", "2"]
+    assert _transcode_cmd(monkeypatch, tmp_path, "full", 0) == ["8"]
+    assert _transcode_cmd(monkeypatch, tmp_path, "renditions", 2) == ["4", "4"]
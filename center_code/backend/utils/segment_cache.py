@@ -0,0 +1,296 @@
+"""
+剪辑片段缓存（内容寻址）
+
+图片转视频片段等中间产物按「素材内容哈希 + 全部编码参数」生成缓存键，
+跨任务复用同一份编码结果；按最近使用时间与总大小做 LRU 淘汰。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import job_control
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SEGMENTS_DIR = os.path.join(BASE_DIR, "uploads", "videos", "segments")
+SEGMENT_CACHE_DIR = os.path.join(SEGMENTS_DIR, "cache")
+
+# 缓存容量与淘汰策略（可用环境变量覆盖）
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get("SEGMENT_CACHE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+SEGMENT_CACHE_MAX_AGE_SECONDS = int(os.environ.get("SEGMENT_CACHE_MAX_AGE_SECONDS", str(7 * 86400)))
+# 最近被使用过的条目不参与淘汰，避免删掉正在渲染的任务引用的片段
+SEGMENT_CACHE_MIN_IDLE_SECONDS = int(os.environ.get("SEGMENT_CACHE_MIN_IDLE_SECONDS", "3600"))
+
+# 跨进程渲染锁：多个 worker 进程同时需要同一片段时只渲染一次；
+# 持有者渲染期间定期刷新锁文件 mtime，超过该时间未刷新视为持有者已崩溃
+SEGMENT_CACHE_LOCK_STALE_SECONDS = int(os.environ.get("SEGMENT_CACHE_LOCK_STALE_SECONDS", "120"))
+SEGMENT_CACHE_LOCK_POLL_SECONDS = 0.5
+# 锁文件刷新间隔：远小于过期时间，慢速磁盘上偶尔延迟也不会被误判
+SEGMENT_CACHE_LOCK_HEARTBEAT_SECONDS = max(0.1, min(30.0, SEGMENT_CACHE_LOCK_STALE_SECONDS / 4.0))
+
+# 缓存格式版本：编码逻辑变化时递增，旧条目自然失效并被淘汰
+CACHE_VERSION = 1
+
+_TMP_PREFIX = ".tmp_"
+
+_HASH_MEMO: Dict[Tuple[str, int, int], str] = {}
+_HASH_LOCK = threading.Lock()
+
+_KEY_LOCKS: Dict[str, threading.Lock] = {}
+_KEY_LOCKS_GUARD = threading.Lock()
+
+
+def file_content_hash(path: str) -> str:
+    """
+    计算文件内容的 sha256。
+
+    同一进程内按 (绝对路径, 大小, mtime) 记忆结果，文件未变化时不重复读盘。
+    """
+    abs_path = os.path.abspath(path)
+    st = os.stat(abs_path)
+    memo_key = (abs_path, int(st.st_size), int(st.st_mtime_ns))
+    with _HASH_LOCK:
+        cached = _HASH_MEMO.get(memo_key)
+    if cached:
+        return cached
+
+    h = hashlib.sha256()
+    with open(abs_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _HASH_LOCK:
+        if len(_HASH_MEMO) > 4096:
+            _HASH_MEMO.clear()
+        _HASH_MEMO[memo_key] = digest
+    return digest
+
+
+def cache_key(kind: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        {"kind": kind, "version": CACHE_VERSION, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_path(key: str, ext: str = ".mp4") -> str:
+    return os.path.join(SEGMENT_CACHE_DIR, key[:2], key + ext)
+
+
+def _touch_if_exists(path: str) -> bool:
+    try:
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            # mtime 作为「最近使用时间」，供 LRU 淘汰使用
+            os.utime(path, None)
+            return True
+    except Exception:
+        pass
+    return False
+
+
+def lookup(kind: str, params: Dict[str, Any], ext: str = ".mp4") -> Optional[str]:
+    """只查不渲染：命中返回缓存文件路径（并刷新使用时间），否则返回 None"""
+    path = cache_path(cache_key(kind, params), ext)
+    return path if _touch_if_exists(path) else None
+
+
+def _key_lock(key: str) -> threading.Lock:
+    with _KEY_LOCKS_GUARD:
+        lock = _KEY_LOCKS.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _KEY_LOCKS[key] = lock
+        return lock
+
+
+@contextmanager
+def _acquire(lock: threading.Lock) -> Iterator[None]:
+    """获取进程内锁；等待期间任务被取消时抛 JobCancelled"""
+    while not lock.acquire(timeout=SEGMENT_CACHE_LOCK_POLL_SECONDS):
+        job_control.check_cancelled()
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def _heartbeat(lock_path: str, stop: threading.Event) -> None:
+    while not stop.wait(SEGMENT_CACHE_LOCK_HEARTBEAT_SECONDS):
+        try:
+            os.utime(lock_path, None)
+        except Exception:
+            pass
+
+
+@contextmanager
+def _file_lock(lock_path: str) -> Iterator[None]:
+    """
+    基于 O_EXCL 锁文件的跨进程互斥（Windows/Linux 通用）。
+    持有期间后台线程定期刷新锁文件 mtime；等待期间任务被取消时抛 JobCancelled。
+    """
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > SEGMENT_CACHE_LOCK_STALE_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            except Exception:
+                pass
+            job_control.check_cancelled()
+            time.sleep(SEGMENT_CACHE_LOCK_POLL_SECONDS)
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(lock_path, stop), daemon=True)
+    try:
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        os.close(fd)
+        beat.start()
+        yield
+    finally:
+        stop.set()
+        if beat.is_alive():
+            beat.join()
+        try:
+            os.remove(lock_path)
+        except Exception:
+            pass
+
+
+def get_or_render(
+    kind: str,
+    params: Dict[str, Any],
+    render: Callable[[str], None],
+    ext: str = ".mp4",
+) -> str:
+    """
+    命中缓存直接返回缓存文件路径；否则调用 render(out_path) 生成并原子落盘。
+
+    :param kind: 片段类型（如 image），参与缓存键
+    :param params: 决定产物内容的全部参数（内容哈希、时长、尺寸、编码参数等）
+    :param render: 渲染函数，把结果写到传入的临时路径
+    :return: 缓存文件绝对路径（调用方不得删除）
+    """
+    key = cache_key(kind, params)
+    path = cache_path(key, ext)
+    if _touch_if_exists(path):
+        return path
+
+    out_dir = os.path.dirname(path)
+    # 先拿进程内锁再拿文件锁：同进程的并发请求不必轮询锁文件
+    with _acquire(_key_lock(key)), _file_lock(os.path.join(out_dir, f"{_TMP_PREFIX}{key}.lock")):
+        if _touch_if_exists(path):
+            return path
+
+        # 临时文件保留扩展名，FFmpeg 依赖扩展名推断封装格式
+        tmp_path = os.path.join(out_dir, f"{_TMP_PREFIX}{uuid.uuid4().hex}{ext}")
+        try:
+            render(tmp_path)
+            if not os.path.isfile(tmp_path) or os.path.getsize(tmp_path) <= 0:
+                raise RuntimeError(f"片段渲染未生成输出：{kind}")
+            os.replace(tmp_path, path)
+        finally:
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except Exception:
+                pass
+    return path
+
+
+def evict(
+    max_bytes: Optional[int] = None,
+    max_age_seconds: Optional[int] = None,
+    min_idle_seconds: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    按最近使用时间淘汰缓存：
+    1) 超过 max_age_seconds 未使用的条目直接删除
+    2) 总大小仍超过 max_bytes 时，从最久未使用的条目开始删除
+    最近 min_idle_seconds 内使用过的条目始终保留。
+    """
+    max_bytes = SEGMENT_CACHE_MAX_BYTES if max_bytes is None else int(max_bytes)
+    max_age_seconds = SEGMENT_CACHE_MAX_AGE_SECONDS if max_age_seconds is None else int(max_age_seconds)
+    min_idle_seconds = SEGMENT_CACHE_MIN_IDLE_SECONDS if min_idle_seconds is None else int(min_idle_seconds)
+
+    stats = {"files": 0, "bytes": 0, "removed_files": 0, "removed_bytes": 0}
+    if not os.path.isdir(SEGMENT_CACHE_DIR):
+        return stats
+
+    now_ts = time.time()
+    entries = []
+    for root, _dirs, files in os.walk(SEGMENT_CACHE_DIR):
+        for name in files:
+            p = os.path.join(root, name)
+            try:
+                st = os.stat(p)
+            except Exception:
+                continue
+            idle = now_ts - st.st_mtime
+            if name.startswith(_TMP_PREFIX):
+                # 中断的渲染残留
+                if idle > min_idle_seconds:
+                    _remove(p, st.st_size, stats)
+                continue
+            if idle > max_age_seconds and idle > min_idle_seconds:
+                _remove(p, st.st_size, stats)
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+    total = sum(size for _mtime, size, _p in entries)
+    remaining = len(entries)
+    if total > max_bytes:
+        entries.sort()
+        for mtime, size, p in entries:
+            if total <= max_bytes:
+                break
+            if now_ts - mtime <= min_idle_seconds:
+                continue
+            if _remove(p, size, stats):
+                total -= size
+                remaining -= 1
+
+    stats["files"] = remaining
+    stats["bytes"] = total
+    return stats
+
+
+def _remove(path: str, size: int, stats: Dict[str, int]) -> bool:
+    try:
+        os.remove(path)
+        stats["removed_files"] += 1
+        stats["removed_bytes"] += int(size or 0)
+        return True
+    except Exception:
+        return False
+
+
+def cleanup_legacy_task_dirs(ttl_seconds: int) -> None:
+    """清理旧版本按任务创建的 SEGMENTS_DIR/task_* 临时目录"""
+    try:
+        if not os.path.isdir(SEGMENTS_DIR):
+            return
+        now_ts = time.time()
+        for name in os.listdir(SEGMENTS_DIR):
+            if not name.startswith("task_"):
+                continue
+            p = os.path.join(SEGMENTS_DIR, name)
+            try:
+                if os.path.isdir(p) and now_ts - os.path.getmtime(p) > ttl_seconds:
+                    shutil.rmtree(p, ignore_errors=True)
+            except Exception:
+                continue
+    except Exception:
+        pass
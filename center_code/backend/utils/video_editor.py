@@ -3,15 +3,65 @@
 使用 FFmpeg 进行视频拼接、添加音频、调速、字幕烧录等
 """
 import os
+import shutil
+import subprocess
 import sys
-from typing import Optional, List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from typing import Any, Dict, List, Optional, Tuple
 
 # 导入配置
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from media_utils import (
+    parse_frame_rate,
+    probe_summary,
+    probe_video_dimensions,
+    resolve_ffmpeg_exe,
+    run_ffmpeg_with_progress,
+    summary_duration,
+)
+from utils import segment_cache
+from encode_policy import choose_policy
+import job_control
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 OUTPUT_VIDEO_DIR = os.path.join(BASE_DIR, "uploads", "videos")
 os.makedirs(OUTPUT_VIDEO_DIR, exist_ok=True)
 
+# 混剪并行预归一化（可选）：每个片段在独立 ffmpeg 进程里缩放/补边/统一帧率并缓存，
+# 然后流复制拼接；默认关闭，沿用单进程 concat filter
+EDIT_PARALLEL_NORMALIZE = os.environ.get("EDIT_PARALLEL_NORMALIZE", "").strip().lower() in ("1", "true", "yes", "y", "on")
+# 并发 ffmpeg 进程数；0 表示按 CPU 核数 / MAX_EDIT_THREADS 自动计算
+EDIT_NORMALIZE_WORKERS = int(os.environ.get("EDIT_NORMALIZE_WORKERS", "0") or "0")
+NORMALIZE_VCODEC = "libx264"
+# 预览渲染的短边像素
+PREVIEW_SHORT_SIDE = int(os.environ.get("PREVIEW_SHORT_SIDE", "360") or "360")
+# 渲染进度回调的最小间隔（秒）
+EDIT_PROGRESS_INTERVAL_SECONDS = float(os.environ.get("EDIT_PROGRESS_INTERVAL_SECONDS", "2.0") or "2.0")
+NORMALIZE_PIX_FMT = "yuv420p"
+# 成片中间产物缓存（可选）：拼接 + 循环 + 调速 + 裁剪后的无声视频按输入缓存，
+# 只改配音/BGM/字幕的再次剪辑直接复用，只做音频重封装或字幕叠加。
+# 未命中时带字幕的成片要多编码一路中间产物，适合同一素材反复改字幕/配音的场景，默认关闭
+EDIT_INTERMEDIATE_CACHE = os.environ.get("EDIT_INTERMEDIATE_CACHE", "").strip().lower() in ("1", "true", "yes", "y", "on")
+# 还要再编码一次（烧字幕）的中间产物用较低 CRF 减少二次编码损失；
+# 无字幕时中间产物按成片 CRF 编码，出片直接流复制
+EDIT_INTERMEDIATE_CRF = int(os.environ.get("EDIT_INTERMEDIATE_CRF", "18") or "18")
+# 成品缩略图：重编码出片时在同一次 ffmpeg 调用里顺带输出封面 JPEG 与短动图 WebP
+EDIT_THUMBNAILS = os.environ.get("EDIT_THUMBNAILS", "1").strip().lower() not in ("0", "false", "no", "n", "off")
+POSTER_AT_SECONDS = float(os.environ.get("POSTER_AT_SECONDS", "1.0") or "1.0")
+POSTER_WIDTH = int(os.environ.get("POSTER_WIDTH", "720") or "720")
+ANIMATED_PREVIEW_SECONDS = float(os.environ.get("ANIMATED_PREVIEW_SECONDS", "3") or "3")
+ANIMATED_PREVIEW_WIDTH = int(os.environ.get("ANIMATED_PREVIEW_WIDTH", "320") or "320")
+ANIMATED_PREVIEW_FPS = int(os.environ.get("ANIMATED_PREVIEW_FPS", "10") or "10")
+# 分段并行编码（可选）：长成片按固定间隔切成独立 GOP 的分段，在进程池中并行编码，
+# 再流复制拼接；短于 EDIT_CHUNK_MIN_SECONDS 的仍走单进程
+EDIT_CHUNKED_ENCODE = os.environ.get("EDIT_CHUNKED_ENCODE", "").strip().lower() in ("1", "true", "yes", "y", "on")
+EDIT_CHUNK_SECONDS = float(os.environ.get("EDIT_CHUNK_SECONDS", "60") or "60")
+EDIT_CHUNK_MIN_SECONDS = float(os.environ.get("EDIT_CHUNK_MIN_SECONDS", "180") or "180")
+# 并发分段数；0 表示按编码策略的线程预算自动计算（每段约 4 线程）
+EDIT_CHUNK_WORKERS = int(os.environ.get("EDIT_CHUNK_WORKERS", "0") or "0")
+
 
 def safe_remove(file_path):
     """安全删除文件"""
@@ -27,6 +77,697 @@ def get_abs_path(rel_path):
     return os.path.join(BASE_DIR, rel_path)
 
 
+def plan_stream_copy(
+    video_paths,
+    target_width: Optional[int] = None,
+    target_height: Optional[int] = None,
+    target_fps: Optional[float] = None,
+) -> Tuple[bool, str]:
+    """
+    判断片段能否直接 concat 并 `-c:v copy`（不解码重编码）。
+
+    要求所有片段均为 h264/yuv420p/8bit，且尺寸、帧率、profile/level、SAR 一致；
+    给定目标尺寸/帧率时还需与目标一致。probe 走共享缓存，通常不启动子进程。
+    :return: (是否可流复制, 原因)
+    """
+    if not video_paths:
+        return False, "no clips"
+
+    ref = None
+    for p in video_paths:
+        try:
+            v = (probe_summary(p).get("video") or {})
+        except Exception as e:
+            return False, f"probe failed: {os.path.basename(p)} {e}"
+        if not v:
+            return False, f"no video stream: {os.path.basename(p)}"
+
+        codec = (v.get("codec_name") or "").lower()
+        pix_fmt = (v.get("pix_fmt") or "").lower()
+        if codec != "h264":
+            return False, f"codec={codec or 'unknown'}"
+        if pix_fmt != "yuv420p":
+            return False, f"pix_fmt={pix_fmt or 'unknown'}"
+        bits = v.get("bits_per_raw_sample")
+        if bits not in (None, "", "N/A") and str(bits) != "8":
+            return False, f"bits_per_raw_sample={bits}"
+        sar = v.get("sample_aspect_ratio")
+        if sar not in (None, "", "N/A", "0:1", "1:1"):
+            return False, f"sar={sar}"
+
+        fps = parse_frame_rate(v.get("r_frame_rate"))
+        sig = (
+            v.get("width"),
+            v.get("height"),
+            round(fps, 3) if fps else None,
+            (v.get("profile") or "").lower(),
+            v.get("level"),
+        )
+        if ref is None:
+            ref = sig
+        elif sig != ref:
+            return False, f"clip mismatch: {os.path.basename(p)} {sig} != {ref}"
+
+    width, height, fps, _profile, _level = ref
+    if target_width and target_height:
+        try:
+            if (int(width), int(height)) != (int(target_width), int(target_height)):
+                return False, f"size {width}x{height} != target {target_width}x{target_height}"
+        except Exception:
+            return False, "size unknown"
+    if target_fps:
+        if not fps or abs(float(fps) - float(target_fps)) > 0.01:
+            return False, f"fps {fps} != target {target_fps}"
+    return True, "clips compatible"
+
+
+def _needs_video_filters(speed, subtitle_path: Optional[str]) -> bool:
+    try:
+        speed_f = float(speed)
+    except Exception:
+        speed_f = 1.0
+    if speed_f and abs(speed_f - 1.0) > 1e-6:
+        return True
+    return bool(subtitle_path and os.path.exists(subtitle_path))
+
+
+def preview_dimensions(width: Optional[int], height: Optional[int]) -> Optional[Tuple[int, int]]:
+    """预览尺寸：等比缩放到短边 PREVIEW_SHORT_SIDE（宽高取偶数）；未知尺寸返回 None"""
+    try:
+        w, h = int(width or 0), int(height or 0)
+    except Exception:
+        return None
+    if w <= 0 or h <= 0:
+        return None
+    short = min(w, h)
+    ratio = min(1.0, PREVIEW_SHORT_SIDE / float(short))
+    return (max(2, int(round(w * ratio / 2)) * 2), max(2, int(round(h * ratio / 2)) * 2))
+
+
+def _preview_scale_args(width: Optional[int], height: Optional[int]) -> Tuple[str, str]:
+    dims = preview_dimensions(width, height)
+    if dims:
+        return str(dims[0]), str(dims[1])
+    # 尺寸未知时按高度缩放（竖屏会略大于目标，但仍远小于成片）
+    return "-2", str(PREVIEW_SHORT_SIDE)
+
+
+def normalize_vf(width: int, height: int, fps: int) -> str:
+    return f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,fps={fps},format=yuv420p,setsar=1"
+
+
+def _normalize_pool_size(clip_count: int) -> Tuple[int, int]:
+    """
+    并行预归一化的进程数与每个 ffmpeg 的线程数。
+    每个剪辑任务分得 CPU 核数 / MAX_EDIT_THREADS 的预算，再均分给各归一化进程，避免超订。
+    """
+    cpu = os.cpu_count() or 1
+    edit_threads = max(1, int(os.environ.get("MAX_EDIT_THREADS", "2") or "2"))
+    budget = max(1, cpu // edit_threads)
+    workers = EDIT_NORMALIZE_WORKERS if EDIT_NORMALIZE_WORKERS > 0 else budget
+    workers = max(1, min(workers, clip_count))
+    threads_per_job = max(1, budget // workers)
+    return workers, threads_per_job
+
+
+def _render_normalized_clip(src_path: str, out_path: str, width: int, height: int, fps: int, threads: int) -> None:
+    cmd = [
+        resolve_ffmpeg_exe(),
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        src_path,
+        "-vf",
+        normalize_vf(width, height, fps),
+        "-an",
+        "-c:v",
+        NORMALIZE_VCODEC,
+        "-pix_fmt",
+        NORMALIZE_PIX_FMT,
+        "-threads",
+        str(int(threads)),
+        out_path,
+    ]
+    p = job_control.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8", errors="replace")
+    if p.returncode != 0:
+        err = (p.stderr or p.stdout or "").strip()
+        raise RuntimeError(f"片段归一化失败：{os.path.basename(src_path)} {err[-2000:]}")
+
+
+def normalize_clip(src_path: str, width: int, height: int, fps: int, threads: int = 1) -> str:
+    """
+    把片段归一化到目标尺寸/帧率/像素格式（结果进片段缓存，调用方不得删除）。
+    已经符合目标规格的片段原样返回。
+    """
+    ok, _reason = plan_stream_copy([src_path], width, height, fps)
+    if ok:
+        return src_path
+    st = os.stat(src_path)
+    params = {
+        "path": os.path.abspath(src_path),
+        "size": int(st.st_size),
+        "mtime_ns": int(st.st_mtime_ns),
+        "width": int(width),
+        "height": int(height),
+        "fps": int(fps),
+        "vf": normalize_vf(width, height, fps),
+        "vcodec": NORMALIZE_VCODEC,
+        "pix_fmt": NORMALIZE_PIX_FMT,
+    }
+    return segment_cache.get_or_render(
+        "normalize",
+        params,
+        lambda out_path: _render_normalized_clip(src_path, out_path, width, height, fps, threads),
+    )
+
+
+def normalize_clips_parallel(video_paths, width: int, height: int, fps: int) -> List[str]:
+    """在有界进程池中并行归一化全部片段，返回与输入一一对应的路径列表"""
+    workers, threads_per_job = _normalize_pool_size(len(video_paths))
+    print(f"[VideoEditor] 并行预归一化：{len(video_paths)} 个片段，{workers} 个进程，每进程 {threads_per_job} 线程")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="normalize") as pool:
+        futures = [pool.submit(job_control.bind(normalize_clip), p, width, height, fps, threads_per_job) for p in video_paths]
+        return [f.result() for f in futures]
+
+
+def _run_ffmpeg_stream(stream, expected_duration: Optional[float], progress_cb=None) -> None:
+    """执行 ffmpeg-python 构建的命令，解析 -progress 输出并回调 progress_cb(0-99)"""
+    import ffmpeg
+
+    args = ffmpeg.compile(stream, cmd=resolve_ffmpeg_exe(), overwrite_output=True)
+    try:
+        run_ffmpeg_with_progress(
+            args,
+            float(expected_duration or 0.0),
+            progress_cb,
+            EDIT_PROGRESS_INTERVAL_SECONDS,
+        )
+    except RuntimeError as e:
+        raise RuntimeError(f"FFmpeg 执行失败：{e}") from e
+
+
+def _total_duration(video_paths) -> float:
+    return sum(summary_duration(probe_summary(p)) for p in video_paths)
+
+
+def _progress_slice(progress_cb, lo: int, hi: int):
+    """把子步骤的 0-99 进度映射到总进度的 [lo, hi] 区间"""
+    if progress_cb is None:
+        return None
+    return lambda p: progress_cb(int(lo + (hi - lo) * max(0, min(99, int(p))) / 99))
+
+
+def _subtitles_vf(subtitle_path: str, sub_style: str) -> str:
+    # Windows 盘符 ':' 需要写成 '\:'（在 Python 字符串里是 '\\:'）
+    sub_file = subtitle_path.replace("\\", "/").replace(":", "\\:")
+    # filename/force_style 用单引号包裹更稳
+    return (
+        "subtitles="
+        + f"filename='{sub_file}'"
+        + ":charenc=UTF-8"
+        + f":force_style='{sub_style}'"
+    )
+
+
+def aspect_variant_path(output_path: str, label: str) -> str:
+    """附加画幅成品路径：与主输出同目录，文件名追加画幅标签（如 _1x1）"""
+    base, ext = os.path.splitext(output_path)
+    return f"{base}_{label}{ext or '.mp4'}"
+
+
+def _split_streams(stream, count: int, split_filter: str = "split") -> list:
+    """同一路流要喂给多个输出时 split 成多路（滤镜输出不能直接复用）"""
+    if stream is None:
+        return [None] * count
+    if count == 1:
+        return [stream]
+    node = stream.filter_multi_output(split_filter, count)
+    return [node.stream(i) for i in range(count)]
+
+
+def _branch_x264_kwargs(encode_policy, encoders: int) -> Dict[str, Any]:
+    """多路编码器并行跑在同一进程里，线程预算按路数均分"""
+    policy = encode_policy or choose_policy("render")
+    return {**policy.x264_kwargs(), "threads": max(1, int(policy.threads) // max(1, encoders))}
+
+
+def _aspect_target_outputs(
+    sources: list,
+    audio_streams: list,
+    output_path: str,
+    extra_targets: List[Tuple[str, int, int, str]],
+    subtitle_path: Optional[str],
+    duration: Optional[float],
+    x264_kwargs: Dict[str, Any],
+) -> list:
+    """
+    附加画幅输出：每路从字幕叠加之前的画面出发，等比缩放补边到目标画幅，
+    按该画幅的短边重新计算字号后烧字幕，各自编码。
+
+    :param extra_targets: [(标签, 宽, 高, 字幕样式)]
+    """
+    import ffmpeg
+
+    outputs = []
+    for source, audio, (label, width, height, style) in zip(sources, audio_streams, extra_targets):
+        v = source.filter("scale", width, height, force_original_aspect_ratio="decrease")
+        v = v.filter("pad", width, height, "(ow-iw)/2", "(oh-ih)/2").filter("setsar", 1)
+        if subtitle_path and os.path.exists(subtitle_path):
+            v = v.filter(
+                "subtitles",
+                filename=os.path.abspath(subtitle_path).replace("\\", "/"),
+                charenc="UTF-8",
+                force_style=style,
+            )
+        output_kwargs = {"vcodec": "libx264", "pix_fmt": NORMALIZE_PIX_FMT, **x264_kwargs}
+        if duration and duration > 0:
+            output_kwargs["t"] = duration
+        out_path = aspect_variant_path(output_path, label)
+        if audio is not None:
+            outputs.append(ffmpeg.output(v, audio, out_path, acodec="aac", **output_kwargs))
+        else:
+            outputs.append(ffmpeg.output(v, out_path, **output_kwargs))
+    return outputs
+
+
+def _intermediate_params(
+    video_paths, loop_times: int, speed: float, duration: float, crf: int, scale: Optional[Tuple[str, str]] = None
+) -> Dict[str, Any]:
+    """中间产物缓存键参数：片段（路径 + 大小 + mtime）、循环次数、调速、裁剪时长、编码 CRF 与缩放尺寸（预览）"""
+    clips = []
+    for p in video_paths:
+        st = os.stat(p)
+        clips.append({"path": os.path.abspath(p), "size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)})
+    return {
+        "clips": clips,
+        "loop": int(loop_times),
+        "speed": round(float(speed), 4),
+        "duration": round(float(duration or 0.0), 3),
+        "vcodec": NORMALIZE_VCODEC,
+        "pix_fmt": NORMALIZE_PIX_FMT,
+        "crf": int(crf),
+        "scale": f"{scale[0]}:{scale[1]}" if scale else None,
+    }
+
+
+def thumbnail_paths(output_path: str) -> Dict[str, str]:
+    """成品对应的封面/动图路径（与成品同目录）"""
+    base, _ext = os.path.splitext(output_path)
+    return {"poster": f"{base}_poster.jpg", "animated": f"{base}_preview.webp"}
+
+
+_ENCODERS: Optional[set] = None
+
+
+def _has_encoder(name: str) -> bool:
+    """ffmpeg 是否编译了指定编码器（结果进程内缓存）"""
+    global _ENCODERS
+    if _ENCODERS is None:
+        found = set()
+        try:
+            p = subprocess.run(
+                [resolve_ffmpeg_exe(), "-hide_banner", "-encoders"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+            )
+            for line in (p.stdout or "").splitlines():
+                parts = line.split()
+                if len(parts) >= 2 and len(parts[0]) == 6:
+                    found.add(parts[1])
+        except Exception:
+            pass
+        _ENCODERS = found
+    return name in _ENCODERS
+
+
+def _poster_time(duration: Optional[float]) -> float:
+    d = float(duration or 0.0)
+    return max(0.0, min(POSTER_AT_SECONDS, d / 2)) if d > 0 else 0.0
+
+
+def _poster_vf() -> str:
+    return f"scale={POSTER_WIDTH}:-2"
+
+
+def _animated_vf() -> str:
+    return f"fps={ANIMATED_PREVIEW_FPS},scale={ANIMATED_PREVIEW_WIDTH}:-2:flags=lanczos"
+
+
+def _with_thumbnail_outputs(v_stream, output_path: str, duration: Optional[float], filtered: bool, vf: Optional[str] = None):
+    """
+    给出片的 ffmpeg 调用追加封面/动图输出，复用同一份解码（和滤镜）结果。
+
+    :param filtered: v_stream 是滤镜图输出（需要 split）；否则是输入流，各输出用自己的 -vf（前缀为主输出的 vf）
+    :return: (主输出使用的视频流, 附加输出列表)
+    """
+    import ffmpeg
+
+    if not EDIT_THUMBNAILS:
+        return v_stream, []
+    paths = thumbnail_paths(output_path)
+    animated = _has_encoder("libwebp")
+
+    if filtered:
+        split = v_stream.filter_multi_output("split", 3 if animated else 2)
+        main = split.stream(0)
+        poster_src = split.stream(1).filter("scale", POSTER_WIDTH, -2)
+        anim_src = split.stream(2).filter("fps", fps=ANIMATED_PREVIEW_FPS).filter(
+            "scale", ANIMATED_PREVIEW_WIDTH, -2, flags="lanczos"
+        ) if animated else None
+        poster_kwargs: Dict[str, Any] = {}
+        anim_kwargs: Dict[str, Any] = {}
+    else:
+        main = poster_src = anim_src = v_stream
+        poster_kwargs = {"vf": ",".join(p for p in (vf, _poster_vf()) if p)}
+        anim_kwargs = {"vf": ",".join(p for p in (vf, _animated_vf()) if p)}
+
+    outputs = [
+        ffmpeg.output(
+            poster_src,
+            paths["poster"],
+            ss=_poster_time(duration),
+            vframes=1,
+            vcodec="mjpeg",
+            update=1,
+            **{"q:v": 3},
+            **poster_kwargs,
+        )
+    ]
+    if animated:
+        outputs.append(
+            ffmpeg.output(
+                anim_src,
+                paths["animated"],
+                t=ANIMATED_PREVIEW_SECONDS,
+                vcodec="libwebp",
+                loop=0,
+                an=None,
+                **{"q:v": 60},
+                **anim_kwargs,
+            )
+        )
+    return main, outputs
+
+
+def ensure_thumbnails(output_path: str) -> Dict[str, str]:
+    """
+    返回成品已有的封面/动图 {"poster": 路径, "animated": 路径}。
+    出片时没有顺带生成的（流复制路径、多画幅导出等），用 seek 快速抽帧补齐，不解码整条视频。
+    """
+    if not EDIT_THUMBNAILS or not output_path or not os.path.isfile(output_path):
+        return {}
+    paths = thumbnail_paths(output_path)
+    exe = resolve_ffmpeg_exe()
+
+    def _ok(p: str) -> bool:
+        return os.path.isfile(p) and os.path.getsize(p) > 0
+
+    jobs = []
+    if not _ok(paths["poster"]):
+        try:
+            duration = summary_duration(probe_summary(output_path))
+        except Exception:
+            duration = 0.0
+        jobs.append([
+            exe, "-y", "-hide_banner", "-loglevel", "error",
+            "-ss", f"{_poster_time(duration):.3f}", "-i", output_path,
+            "-frames:v", "1", "-vf", _poster_vf(), "-q:v", "3", "-update", "1", paths["poster"],
+        ])
+    if not _ok(paths["animated"]) and _has_encoder("libwebp"):
+        jobs.append([
+            exe, "-y", "-hide_banner", "-loglevel", "error",
+            "-t", f"{ANIMATED_PREVIEW_SECONDS:.3f}", "-i", output_path,
+            "-vf", _animated_vf(), "-an", "-c:v", "libwebp", "-loop", "0", "-q:v", "60", paths["animated"],
+        ])
+    for cmd in jobs:
+        try:
+            p = job_control.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8", errors="replace")
+            if p.returncode != 0:
+                print(f"[VideoEditor] 生成缩略图失败：{(p.stderr or '').strip()[-500:]}")
+        except job_control.JobCancelled:
+            raise
+        except Exception as e:
+            print(f"[VideoEditor] 生成缩略图失败：{e}")
+    return {k: p for k, p in paths.items() if _ok(p)}
+
+
+def timeline_pieces(durations: List[float], loop_times: int, start: float, end: float) -> List[Tuple[int, float, float]]:
+    """
+    把（循环展开后的）源时间线区间 [start, end) 映射成片段列表 [(片段下标, 片内起点, 时长)]。
+    """
+    pieces: List[Tuple[int, float, float]] = []
+    offset = 0.0
+    for _loop in range(max(1, int(loop_times))):
+        for idx, dur in enumerate(durations):
+            seg_start, seg_end = offset, offset + dur
+            offset = seg_end
+            lo, hi = max(start, seg_start), min(end, seg_end)
+            if hi - lo > 1e-3:
+                pieces.append((idx, lo - seg_start, hi - lo))
+            if offset >= end:
+                return pieces
+    return pieces
+
+
+def _chunk_pool_size(chunk_count: int, threads_budget: int) -> Tuple[int, int]:
+    """分段编码的并发数与每个 ffmpeg 的线程数（总量不超过本任务的线程预算）"""
+    budget = max(1, int(threads_budget or 1))
+    workers = EDIT_CHUNK_WORKERS if EDIT_CHUNK_WORKERS > 0 else max(1, budget // 4)
+    workers = max(1, min(workers, chunk_count))
+    return workers, max(1, budget // workers)
+
+
+def _render_chunk(
+    video_paths,
+    pieces: List[Tuple[int, float, float]],
+    speed: float,
+    width: int,
+    height: int,
+    out_fps: Fraction,
+    frames: int,
+    out_path: str,
+    preset: str,
+    threads: int,
+    crf: int,
+) -> None:
+    """
+    按片内起点/时长精确切入各片段，等比缩放补边到统一尺寸后 concat + 调速，
+    固定输出帧率并按帧数截断，独立编码成一个闭合 GOP 分段（各段帧数之和即成片帧数）
+    """
+    cmd = [resolve_ffmpeg_exe(), "-y", "-hide_banner", "-loglevel", "error"]
+    for idx, start, dur in pieces:
+        cmd += ["-ss", f"{start:.6f}", "-t", f"{dur:.6f}", "-i", video_paths[idx]]
+    chains = [
+        f"[{i}:v:0]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,format={NORMALIZE_PIX_FMT}[v{i}]"
+        for i in range(len(pieces))
+    ]
+    concat_in = "".join(f"[v{i}]" for i in range(len(pieces)))
+    tail = f"{concat_in}concat=n={len(pieces)}:v=1:a=0"
+    if speed and abs(speed - 1.0) > 1e-6:
+        tail += f",setpts={1/speed}*PTS"
+    tail += f",fps={out_fps.numerator}/{out_fps.denominator}"
+    graph = ";".join(chains + [tail + "[out]"])
+    cmd += [
+        "-filter_complex",
+        graph,
+        "-map",
+        "[out]",
+        "-frames:v",
+        str(int(frames)),
+        "-an",
+        "-c:v",
+        NORMALIZE_VCODEC,
+        "-pix_fmt",
+        NORMALIZE_PIX_FMT,
+        "-preset",
+        preset,
+        "-crf",
+        str(int(crf)),
+        "-threads",
+        str(int(threads)),
+        # 每段以 IDR 开头且不引用段外帧，拼接时可直接流复制
+        "-x264-params",
+        "open-gop=0",
+        out_path,
+    ]
+    p = job_control.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8", errors="replace")
+    if p.returncode != 0:
+        err = (p.stderr or p.stdout or "").strip()
+        raise RuntimeError(f"分段编码失败：{os.path.basename(out_path)} {err[-2000:]}")
+
+
+def _concat_copy(chunk_paths: List[str], out_path: str) -> None:
+    list_file = out_path + ".concat.txt"
+    with open(list_file, "w", encoding="utf-8") as f:
+        for cp in chunk_paths:
+            f.write("file '" + cp.replace("'", "'\\''") + "'\n")
+    try:
+        cmd = [
+            resolve_ffmpeg_exe(), "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_file,
+            "-c", "copy", out_path,
+        ]
+        p = job_control.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8", errors="replace")
+        if p.returncode != 0:
+            err = (p.stderr or p.stdout or "").strip()
+            raise RuntimeError(f"分段拼接失败：{err[-2000:]}")
+    finally:
+        safe_remove(list_file)
+
+
+def render_chunked(
+    video_paths,
+    loop_times: int,
+    speed: float,
+    duration: float,
+    out_path: str,
+    encode_policy=None,
+    progress_cb=None,
+    chunk_seconds: Optional[float] = None,
+    crf: Optional[int] = None,
+) -> None:
+    """
+    分段并行编码输出无声视频（与 _render_intermediate 产物等价）：
+    按成片时间每 chunk_seconds 切一段，分段在线程池里各起一个 ffmpeg 并行编码，最后流复制拼接。
+    :param crf: 为 None 时用 EDIT_INTERMEDIATE_CRF
+    """
+    durations = [summary_duration(probe_summary(p)) for p in video_paths]
+    if not durations or any(d <= 0 for d in durations):
+        raise RuntimeError("分段编码需要已知的片段时长")
+    geometry = _uniform_geometry(video_paths)
+    if not geometry:
+        raise RuntimeError("分段编码需要各片段尺寸与帧率一致")
+    first_w, first_h, src_fps = geometry
+    width, height = int(first_w) // 2 * 2, int(first_h) // 2 * 2
+
+    speed = float(speed or 1.0)
+    chunk_seconds = float(chunk_seconds or EDIT_CHUNK_SECONDS)
+    out_fps = src_fps * Fraction(speed).limit_denominator(1000)
+    # 分段边界对齐到输出帧：每段帧数固定，拼接处不丢帧/重帧
+    total_frames = max(1, int(round(duration * out_fps)))
+    chunk_frames = max(1, int(round(chunk_seconds * out_fps)))
+
+    bounds = []
+    first_frame = 0
+    while first_frame < total_frames:
+        n = min(chunk_frames, total_frames - first_frame)
+        bounds.append((float(first_frame / out_fps), float((first_frame + n) / out_fps), n))
+        first_frame += n
+    chunk_seconds = float(chunk_frames / out_fps)
+
+    policy = encode_policy or choose_policy("render")
+    workers, threads = _chunk_pool_size(len(bounds), policy.threads)
+    chunk_dir = out_path + ".chunks"
+    os.makedirs(chunk_dir, exist_ok=True)
+    chunk_paths = [os.path.join(chunk_dir, f"chunk_{i:04d}.mp4") for i in range(len(bounds))]
+    print(f"[VideoEditor] 分段并行编码：{len(bounds)} 段 × {chunk_seconds:.2f}秒，{workers} 个进程，每进程 {threads} 线程")
+
+    done = [0]
+    done_lock = threading.Lock()
+
+    def _one(i: int) -> None:
+        a, b, frames = bounds[i]
+        pieces = timeline_pieces(durations, loop_times, a * speed, b * speed)
+        _render_chunk(
+            video_paths, pieces, speed, width, height, out_fps, frames, chunk_paths[i], policy.preset, threads,
+            EDIT_INTERMEDIATE_CRF if crf is None else crf,
+        )
+        with done_lock:
+            done[0] += 1
+            if progress_cb:
+                progress_cb(int(done[0] * 95 / len(bounds)))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk") as pool:
+            for f in [pool.submit(job_control.bind(_one), i) for i in range(len(bounds))]:
+                f.result()
+        _concat_copy(chunk_paths, out_path)
+        if progress_cb:
+            progress_cb(99)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+def _uniform_geometry(video_paths) -> Optional[Tuple[int, int, Fraction]]:
+    """
+    各片段宽高与帧率都一致时返回 (宽, 高, 帧率)，否则返回 None。
+    单进程 concat 路径对混合规格的片段不做统一，分段结果会与之不等价，这类输入不走分段编码。
+    """
+    geometry = None
+    for p in video_paths:
+        try:
+            v = probe_summary(p).get("video") or {}
+        except Exception:
+            return None
+        rate = str(v.get("avg_frame_rate") or "").strip()
+        try:
+            fps = Fraction(rate)
+        except (ValueError, ZeroDivisionError):
+            return None
+        if fps <= 0 or not v.get("width") or not v.get("height"):
+            return None
+        current = (int(v["width"]), int(v["height"]), fps)
+        if geometry is None:
+            geometry = current
+        elif current != geometry:
+            return None
+    return geometry
+
+
+def _use_chunked_encode(duration: float, video_paths) -> bool:
+    if not (EDIT_CHUNKED_ENCODE and duration >= EDIT_CHUNK_MIN_SECONDS and (os.cpu_count() or 1) >= 4):
+        return False
+    if _uniform_geometry(video_paths) is None:
+        print("[VideoEditor] 片段尺寸或帧率不一致，不走分段并行编码")
+        return False
+    return True
+
+
+def _render_intermediate(
+    concat_file: str,
+    loop_times: int,
+    speed: float,
+    duration: float,
+    out_path: str,
+    encode_policy=None,
+    progress_cb=None,
+    crf: Optional[int] = None,
+    scale: Optional[Tuple[str, str]] = None,
+) -> None:
+    """
+    拼接 + 循环 + 调速 + 裁剪，输出无声视频（不含字幕）
+    :param crf: 为 None 时用 EDIT_INTERMEDIATE_CRF
+    :param scale: 预览用的缩放尺寸 (宽, 高)；为 None 时保持原尺寸
+    """
+    import ffmpeg
+
+    if loop_times > 1:
+        v_in = ffmpeg.input(concat_file, format="concat", safe=0, stream_loop=loop_times - 1)
+    else:
+        v_in = ffmpeg.input(concat_file, format="concat", safe=0)
+    v_stream = v_in.video
+    if speed and abs(speed - 1.0) > 1e-6:
+        v_stream = v_stream.filter("setpts", f"{1/speed}*PTS")
+    if scale:
+        v_stream = v_stream.filter("scale", scale[0], scale[1])
+
+    output_kwargs = {
+        "vcodec": NORMALIZE_VCODEC,
+        "pix_fmt": NORMALIZE_PIX_FMT,
+        **(encode_policy or choose_policy("render")).x264_kwargs(),
+        "crf": EDIT_INTERMEDIATE_CRF if crf is None else crf,
+    }
+    if duration and duration > 0:
+        output_kwargs["t"] = duration
+    _run_ffmpeg_stream(ffmpeg.output(v_stream, out_path, **output_kwargs), duration, progress_cb)
+
+
 class VideoEditor:
     @staticmethod
     def edit_mixed_concat_filter(
@@ -41,10 +782,17 @@ class VideoEditor:
         target_width: int = 1080,
         target_height: int = 1920,
         target_fps: int = 30,
+        progress_cb=None,
+        encode_policy=None,
+        preview: bool = False,
+        extra_targets: Optional[List[Tuple[str, int, int]]] = None,
     ):
         """
         Mixed clips path (image+video): use concat *filter* instead of concat demuxer to avoid
         timestamp/duration issues that can freeze video while audio continues.
+
+        extra_targets: 附加画幅 [(标签, 宽, 高)]，各画幅从原始片段单独缩放补边（共用同一次解码），
+        输出到 aspect_variant_path(成品, 标签)；预览忽略
         """
         try:
             import ffmpeg
@@ -52,17 +800,8 @@ class VideoEditor:
             raise RuntimeError("未安装 ffmpeg-python，请先 pip install ffmpeg-python")
 
         def _probe_video_dimensions(path: str):
-            try:
-                info = ffmpeg.probe(path)
-                streams = info.get("streams") or []
-                for s in streams:
-                    if (s.get("codec_type") or "").lower() == "video":
-                        w = s.get("width")
-                        h = s.get("height")
-                        return (int(w) if w else None, int(h) if h else None)
-            except Exception:
-                pass
-            return (None, None)
+            # 走共享 probe 缓存，避免对已 probe 过的片段重复启动 ffprobe
+            return probe_video_dimensions(path)
 
         def _subtitle_style_for_min_dim(min_dim):
             try:
@@ -142,12 +881,22 @@ class VideoEditor:
 
         output_path = os.path.join(OUTPUT_VIDEO_DIR, output_name)
 
+        extra_targets = [] if preview else list(extra_targets or [])
+        # 附加画幅从原始片段出发，不经过按主画幅补边的归一化结果
+        source_paths = list(video_paths)
+
+        # 可选：多进程并行归一化，之后片段规格一致，通常可直接流复制拼接
+        if EDIT_PARALLEL_NORMALIZE and len(video_paths) > 1:
+            try:
+                video_paths = normalize_clips_parallel(video_paths, target_width, target_height, target_fps)
+            except Exception as norm_error:
+                print(f"[VideoEditor] 警告：并行预归一化失败，回退到单进程滤镜图：{norm_error}")
+
         # Probe voice duration (for optional trimming)
         voice_duration = None
         if voice_path and os.path.exists(voice_path):
             try:
-                voice_probe = ffmpeg.probe(voice_path)
-                voice_duration = float(voice_probe.get("format", {}).get("duration", 0.0)) or None
+                voice_duration = summary_duration(probe_summary(voice_path)) or None
                 if voice_duration:
                     print(f"[VideoEditor] 配音时长: {voice_duration:.2f}秒")
             except Exception as dur_error:
@@ -169,59 +918,98 @@ class VideoEditor:
             min_dim = first_h
         sub_style = _subtitle_style_for_min_dim(min_dim)
 
-        try:
-            # Build per-clip normalized video streams
-            v_streams = []
-            for idx, p in enumerate(video_paths):
-                inp = ffmpeg.input(p)
-                v = inp.video
-                # Use per-input no-op expressions to prevent ffmpeg-python from de-duplicating identical
-                # filter nodes across multiple inputs (which can trigger "multiple outgoing edges" errors).
-                w_expr = f"{int(target_width)}+0*{idx}"
-                h_expr = f"{int(target_height)}+0*{idx}"
-                x_expr = f"(ow-iw)/2+0*{idx}"
-                y_expr = f"(oh-ih)/2+0*{idx}"
-                v = v.filter("scale", w_expr, h_expr, force_original_aspect_ratio="decrease")
-                v = v.filter("pad", target_width, target_height, x_expr, y_expr)
-                v_streams.append(v)
-
-            if not v_streams:
-                raise RuntimeError("无可用视频片段")
-
-            if len(v_streams) == 1:
-                v_stream = v_streams[0]
-            else:
-                concat_node = ffmpeg.concat(*v_streams, v=1, a=0).node
-                v_stream = concat_node[0]
-
-            # Normalize frame rate / sample aspect ratio / pixel format once after concat
-            v_stream = v_stream.filter("fps", fps=target_fps)
-            v_stream = v_stream.filter("setsar", "1")
-            v_stream = v_stream.filter("format", "yuv420p")
+        # 片段已是目标规格且无需调速/字幕/附加画幅时，直接流复制拼接，只编码音频
+        if not preview and not extra_targets and not _needs_video_filters(speed, subtitle_path):
+            copy_ok, copy_reason = plan_stream_copy(video_paths, target_width, target_height, target_fps)
+            print(f"[VideoEditor] 流复制判定：{copy_ok}（{copy_reason}）")
+            if copy_ok:
+                return VideoEditor._concat_stream_copy(
+                    video_paths,
+                    voice_path,
+                    bgm_path,
+                    bgm_volume=bgm_volume,
+                    voice_volume=voice_volume,
+                    output_path=output_path,
+                    max_duration=voice_duration,
+                    progress_cb=progress_cb,
+                )
 
-            # Apply speed via setpts
+        try:
             try:
                 speed_f = float(speed)
             except Exception:
                 speed_f = 1.0
+
+            def _timeline(paths, width: int, height: int, branch: int, style: str, scale_to=None):
+                # Build per-clip normalized video streams
+                v_streams = []
+                for idx, p in enumerate(paths):
+                    inp = ffmpeg.input(p)
+                    v = inp.video
+                    # Use per-input (and per-branch) no-op expressions to prevent ffmpeg-python from
+                    # de-duplicating identical filter nodes (which can trigger "multiple outgoing edges" errors).
+                    uid = branch * len(paths) + idx
+                    w_expr = f"{int(width)}+0*{uid}"
+                    h_expr = f"{int(height)}+0*{uid}"
+                    x_expr = f"(ow-iw)/2+0*{uid}"
+                    y_expr = f"(oh-ih)/2+0*{uid}"
+                    v = v.filter("scale", w_expr, h_expr, force_original_aspect_ratio="decrease")
+                    v = v.filter("pad", width, height, x_expr, y_expr)
+                    v_streams.append(v)
+
+                if not v_streams:
+                    raise RuntimeError("无可用视频片段")
+
+                if len(v_streams) == 1:
+                    v_stream = v_streams[0]
+                else:
+                    concat_node = ffmpeg.concat(*v_streams, v=1, a=0).node
+                    v_stream = concat_node[0]
+
+                # Normalize frame rate / sample aspect ratio / pixel format once after concat
+                v_stream = v_stream.filter("fps", fps=target_fps)
+                v_stream = v_stream.filter("setsar", "1")
+                v_stream = v_stream.filter("format", "yuv420p")
+
+                # Apply speed via setpts
+                if speed_f and abs(speed_f - 1.0) > 1e-6:
+                    v_stream = v_stream.filter("setpts", f"{1/speed_f}*PTS")
+
+                # If voice exists, trim video to voice duration (avoid trailing black/freeze)
+                if voice_duration and voice_duration > 0:
+                    v_stream = v_stream.trim(end=voice_duration).setpts("PTS-STARTPTS")
+
+                if scale_to:
+                    v_stream = v_stream.filter("scale", scale_to[0], scale_to[1])
+
+                # Subtitles (must be in filtergraph in this mode)
+                if subtitle_path and os.path.exists(subtitle_path):
+                    abs_subtitle_path = os.path.abspath(subtitle_path)
+                    sub_file_raw = abs_subtitle_path.replace("\\", "/")
+                    v_stream = v_stream.filter(
+                        "subtitles",
+                        filename=sub_file_raw,
+                        charenc="UTF-8",
+                        force_style=style,
+                    )
+                return v_stream
+
             if speed_f and abs(speed_f - 1.0) > 1e-6:
-                v_stream = v_stream.filter("setpts", f"{1/speed_f}*PTS")
                 print(f"[VideoEditor] 混剪（concat filter）应用调速：{speed_f}x")
 
-            # If voice exists, trim video to voice duration (avoid trailing black/freeze)
-            if voice_duration and voice_duration > 0:
-                v_stream = v_stream.trim(end=voice_duration).setpts("PTS-STARTPTS")
-
-            # Subtitles (must be in filtergraph in this mode)
-            if subtitle_path and os.path.exists(subtitle_path):
-                abs_subtitle_path = os.path.abspath(subtitle_path)
-                sub_file_raw = abs_subtitle_path.replace("\\", "/")
-                v_stream = v_stream.filter(
-                    "subtitles",
-                    filename=sub_file_raw,
-                    charenc="UTF-8",
-                    force_style=sub_style,
-                )
+            # 预览：片段仍按成片尺寸归一化（缓存与成片共用），只在出片前缩小
+            v_stream = _timeline(
+                video_paths,
+                target_width,
+                target_height,
+                0,
+                sub_style,
+                _preview_scale_args(target_width, target_height) if preview else None,
+            )
+            extra_streams = [
+                _timeline(source_paths, w, h, i + 1, _subtitle_style_for_min_dim(min(int(w), int(h))))
+                for i, (_label, w, h) in enumerate(extra_targets)
+            ]
 
             # Audio mixing: voice + bgm
             audio_stream = None
@@ -252,23 +1040,41 @@ class VideoEditor:
                 else:
                     print(f"[VideoEditor] 警告：BGM文件不存在：{bgm_path}")
 
+            expected_duration = voice_duration
+            if not expected_duration:
+                try:
+                    expected_duration = _total_duration(video_paths) / (speed_f or 1.0)
+                except Exception:
+                    expected_duration = None
+
+            # 封面/动图与成片同一次调用输出（预览不需要）
+            thumb_outputs = []
+            if not preview:
+                v_stream, thumb_outputs = _with_thumbnail_outputs(v_stream, output_path, expected_duration, filtered=True)
+
             output_kwargs = {"vcodec": "libx264", "pix_fmt": "yuv420p"}
-            if audio_stream is not None:
+            # 线程数 / preset 由编码策略按当前负载决定；附加画幅各占一路编码器，线程预算均分
+            x264_kwargs = _branch_x264_kwargs(encode_policy, 1 + len(extra_targets))
+            output_kwargs.update(x264_kwargs)
+            audio_streams = _split_streams(audio_stream, 1 + len(extra_targets), "asplit")
+            if audio_streams[0] is not None:
                 output_kwargs["acodec"] = "aac"
-                stream = ffmpeg.output(v_stream, audio_stream, output_path, **output_kwargs)
+                stream = ffmpeg.output(v_stream, audio_streams[0], output_path, **output_kwargs)
             else:
                 stream = ffmpeg.output(v_stream, output_path, **output_kwargs)
+            # 附加画幅的字幕已在各自的时间线上叠加
+            extra_outputs = []
+            for v_extra, a_extra, (label, _w, _h) in zip(extra_streams, audio_streams[1:], extra_targets):
+                out_path = aspect_variant_path(output_path, label)
+                if a_extra is not None:
+                    extra_outputs.append(ffmpeg.output(v_extra, a_extra, out_path, **output_kwargs))
+                else:
+                    extra_outputs.append(ffmpeg.output(v_extra, out_path, **output_kwargs))
+            if thumb_outputs or extra_outputs:
+                stream = ffmpeg.merge_outputs(stream, *thumb_outputs, *extra_outputs)
 
             print(f"[VideoEditor] 混剪（concat filter）开始执行 FFmpeg，输出：{output_path}")
-            try:
-                ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
-            except ffmpeg.Error as fe:  # type: ignore[attr-defined]
-                err = getattr(fe, "stderr", None)
-                try:
-                    err_text = err.decode("utf-8", errors="replace") if isinstance(err, (bytes, bytearray)) else str(err)
-                except Exception:
-                    err_text = str(err)
-                raise RuntimeError(f"FFmpeg 执行失败：{err_text}") from fe
+            _run_ffmpeg_stream(stream, expected_duration, progress_cb)
 
             if os.path.exists(output_path):
                 file_size = os.path.getsize(output_path)
@@ -280,9 +1086,254 @@ class VideoEditor:
             import traceback
 
             traceback.print_exc()
+            if os.path.exists(output_path):
+                safe_remove(output_path)
+            for label, _w, _h in extra_targets:
+                safe_remove(aspect_variant_path(output_path, label))
+            raise
+
+    @staticmethod
+    def _concat_stream_copy(
+        video_paths,
+        voice_path: Optional[str],
+        bgm_path: Optional[str],
+        bgm_volume: float,
+        voice_volume: float,
+        output_path: str,
+        max_duration: Optional[float] = None,
+        progress_cb=None,
+    ):
+        """concat demuxer + `-c:v copy`：视频不重编码，只混音并编码音频"""
+        import ffmpeg
+        import secrets
+
+        concat_file = os.path.join(OUTPUT_VIDEO_DIR, f"concat_{secrets.token_hex(4)}.txt")
+        try:
+            with open(concat_file, "w", encoding="utf-8") as f:
+                for vp in video_paths:
+                    vp_escaped = vp.replace("'", "'\\''")
+                    f.write(f"file '{vp_escaped}'\n")
+
+            v_stream = ffmpeg.input(concat_file, format="concat", safe=0).video
+            audio_stream = VideoEditor._mix_voice_and_bgm(voice_path, bgm_path, voice_volume, bgm_volume)
+
+            output_kwargs = {"vcodec": "copy"}
+            if max_duration and max_duration > 0:
+                output_kwargs["t"] = max_duration
+            if audio_stream is not None:
+                output_kwargs["acodec"] = "aac"
+                stream = ffmpeg.output(v_stream, audio_stream, output_path, **output_kwargs)
+            else:
+                stream = ffmpeg.output(v_stream, output_path, **output_kwargs)
+
+            expected_duration = max_duration
+            if not expected_duration:
+                try:
+                    expected_duration = _total_duration(video_paths)
+                except Exception:
+                    expected_duration = None
+
+            print(f"[VideoEditor] 流复制拼接开始执行 FFmpeg，输出：{output_path}")
+            _run_ffmpeg_stream(stream, expected_duration, progress_cb)
+
+            if os.path.exists(output_path):
+                print(f"[VideoEditor] 流复制拼接成功：{output_path}，大小：{os.path.getsize(output_path)} 字节")
+                return output_path
+            raise RuntimeError("流复制拼接失败：未生成输出文件")
+        except Exception:
             if os.path.exists(output_path):
                 safe_remove(output_path)
             raise
+        finally:
+            safe_remove(concat_file)
+
+    @staticmethod
+    def _mix_voice_and_bgm(voice_path: Optional[str], bgm_path: Optional[str], voice_volume: float, bgm_volume: float):
+        """配音 + 循环 BGM 混音，返回音频流（都没有时返回 None）"""
+        import ffmpeg
+
+        audio_stream = None
+        if voice_path:
+            voice_path = os.path.normpath(voice_path)
+            if os.path.exists(voice_path):
+                audio_stream = ffmpeg.input(voice_path).audio.filter("volume", voice_volume)
+            else:
+                print(f"[VideoEditor] 警告：配音文件不存在：{voice_path}")
+
+        if bgm_path:
+            bgm_path = os.path.normpath(bgm_path)
+            if os.path.exists(bgm_path):
+                a_bgm = ffmpeg.input(bgm_path, stream_loop=-1).audio.filter("volume", bgm_volume)
+                if audio_stream is None:
+                    audio_stream = a_bgm
+                else:
+                    audio_stream = ffmpeg.filter(
+                        [audio_stream, a_bgm],
+                        "amix",
+                        inputs=2,
+                        duration="shortest",
+                        dropout_transition=0,
+                    )
+            else:
+                print(f"[VideoEditor] 警告：BGM文件不存在：{bgm_path}")
+        return audio_stream
+
+    @staticmethod
+    def _finish_from_intermediate(
+        intermediate_path: str,
+        duration: float,
+        voice_path: Optional[str],
+        bgm_path: Optional[str],
+        voice_volume: float,
+        bgm_volume: float,
+        subtitle_path: Optional[str],
+        sub_style: str,
+        preview_size: Optional[Tuple[str, str]],
+        output_path: str,
+        encode_policy=None,
+        progress_cb=None,
+        intermediate_crf: Optional[int] = None,
+        extra_targets: Optional[List[Tuple[str, int, int, str]]] = None,
+    ) -> None:
+        """
+        基于中间产物出片：无字幕/非预览且中间产物按成片 CRF 编码时视频流复制、只编码音频；
+        否则只做缩放 + 字幕叠加这一遍编码（不再拼接/调速）。
+        extra_targets 的各画幅同样从中间产物（字幕叠加之前）出发，同一次调用输出。
+        """
+        import ffmpeg
+
+        extra_targets = list(extra_targets or [])
+        policy = encode_policy or choose_policy("render")
+        source = ffmpeg.input(intermediate_path).video
+        v_stream = source
+        vf_parts: List[str] = []
+        if preview_size:
+            vf_parts.append(f"scale={preview_size[0]}:{preview_size[1]}")
+        if subtitle_path and os.path.exists(subtitle_path):
+            vf_parts.append(_subtitles_vf(subtitle_path, sub_style))
+
+        thumb_outputs = []
+        # 低 CRF 的中间产物直接流复制会绕过成片的码率控制，这种情况重编码一次
+        copy_video = not vf_parts and intermediate_crf == policy.crf
+        encoders = (0 if copy_video else 1) + len(extra_targets)
+        x264_kwargs = _branch_x264_kwargs(policy, encoders) if extra_targets else policy.x264_kwargs()
+        if copy_video:
+            output_kwargs = {"vcodec": "copy"}
+        else:
+            output_kwargs = {"vcodec": "libx264", **x264_kwargs}
+            if vf_parts:
+                output_kwargs["vf"] = ",".join(vf_parts)
+            if not preview_size:
+                v_stream, thumb_outputs = _with_thumbnail_outputs(
+                    v_stream, output_path, duration, filtered=False, vf=output_kwargs.get("vf")
+                )
+        # BGM 是无限循环输入，必须限定输出时长
+        if duration and duration > 0:
+            output_kwargs["t"] = duration
+
+        audio_streams = _split_streams(
+            VideoEditor._mix_voice_and_bgm(voice_path, bgm_path, voice_volume, bgm_volume),
+            1 + len(extra_targets),
+            "asplit",
+        )
+        if audio_streams[0] is not None:
+            output_kwargs["acodec"] = "aac"
+            stream = ffmpeg.output(v_stream, audio_streams[0], output_path, **output_kwargs)
+        else:
+            stream = ffmpeg.output(v_stream, output_path, **output_kwargs)
+        # 主输出直接用输入流（可带 -vf 或流复制），附加画幅从同一输入流 split
+        extra_outputs = _aspect_target_outputs(
+            _split_streams(source, len(extra_targets)) if extra_targets else [],
+            audio_streams[1:],
+            output_path,
+            extra_targets,
+            subtitle_path,
+            duration,
+            x264_kwargs,
+        )
+        if thumb_outputs or extra_outputs:
+            stream = ffmpeg.merge_outputs(stream, *thumb_outputs, *extra_outputs)
+        mode = "仅音频重封装" if copy_video else ("字幕/缩放叠加" if vf_parts else "重编码")
+        print(f"[VideoEditor] 基于中间产物出片（{mode}）：{output_path}")
+        _run_ffmpeg_stream(stream, duration, progress_cb)
+
+    @staticmethod
+    def _render_timeline(
+        concat_file: str,
+        loop_times: int,
+        speed: float,
+        duration: float,
+        voice_path: Optional[str],
+        bgm_path: Optional[str],
+        voice_volume: float,
+        bgm_volume: float,
+        subtitle_path: Optional[str],
+        sub_style: str,
+        output_path: str,
+        encode_policy=None,
+        progress_cb=None,
+        intermediate_path: Optional[str] = None,
+        intermediate_crf: int = EDIT_INTERMEDIATE_CRF,
+        extra_targets: Optional[List[Tuple[str, int, int, str]]] = None,
+        intermediate_duration: Optional[float] = None,
+    ) -> None:
+        """
+        拼接/循环/调速的时间线在同一个滤镜图里 split 成多路，源片段只解码一次：
+        叠加字幕的成片、可选的中间产物（写入缓存，不含字幕）、可选的附加画幅（extra_targets）。
+        中间产物可比成片长（intermediate_duration，批量版本共享的最长时间线），成片按 duration 截断。
+        """
+        import ffmpeg
+
+        extra_targets = list(extra_targets or [])
+        if loop_times > 1:
+            v_in = ffmpeg.input(concat_file, format="concat", safe=0, stream_loop=loop_times - 1)
+        else:
+            v_in = ffmpeg.input(concat_file, format="concat", safe=0)
+        v_stream = v_in.video
+        if speed and abs(speed - 1.0) > 1e-6:
+            v_stream = v_stream.filter("setpts", f"{1/speed}*PTS")
+        branches = _split_streams(v_stream, 1 + len(extra_targets) + (1 if intermediate_path else 0))
+        main = branches.pop(0)
+
+        x264_kwargs = _branch_x264_kwargs(encode_policy, 1 + len(branches))
+        outputs = []
+        if intermediate_path:
+            outputs.append(
+                ffmpeg.output(
+                    branches.pop(),
+                    intermediate_path,
+                    vcodec=NORMALIZE_VCODEC,
+                    pix_fmt=NORMALIZE_PIX_FMT,
+                    t=max(duration, intermediate_duration or 0.0),
+                    **{**x264_kwargs, "crf": intermediate_crf},
+                )
+            )
+
+        if subtitle_path and os.path.exists(subtitle_path):
+            main = main.filter(
+                "subtitles",
+                filename=os.path.abspath(subtitle_path).replace("\\", "/"),
+                charenc="UTF-8",
+                force_style=sub_style,
+            )
+        main, thumb_outputs = _with_thumbnail_outputs(main, output_path, duration, filtered=True)
+        output_kwargs = {"vcodec": "libx264", "t": duration, **x264_kwargs}
+        audio_streams = _split_streams(
+            VideoEditor._mix_voice_and_bgm(voice_path, bgm_path, voice_volume, bgm_volume),
+            1 + len(extra_targets),
+            "asplit",
+        )
+        if audio_streams[0] is not None:
+            output_kwargs["acodec"] = "aac"
+            main_out = ffmpeg.output(main, audio_streams[0], output_path, **output_kwargs)
+        else:
+            main_out = ffmpeg.output(main, output_path, **output_kwargs)
+        outputs += _aspect_target_outputs(
+            branches, audio_streams[1:], output_path, extra_targets, subtitle_path, duration, x264_kwargs
+        )
+        print(f"[VideoEditor] 同一次调用输出 {1 + len(outputs)} 路（成片 + 中间产物/附加画幅）：{output_path}")
+        expected = max(duration, intermediate_duration or 0.0) if intermediate_path else duration
+        _run_ffmpeg_stream(ffmpeg.merge_outputs(main_out, *outputs, *thumb_outputs), expected, progress_cb)
 
     @staticmethod
     def edit(
@@ -294,6 +1345,12 @@ class VideoEditor:
         bgm_volume: float = 0.25,
         voice_volume: float = 1.0,
         output_name: Optional[str] = None,
+        progress_cb=None,
+        encode_policy=None,
+        preview: bool = False,
+        extra_targets: Optional[List[Tuple[str, int, int]]] = None,
+        timeline_duration: Optional[float] = None,
+        render_info: Optional[Dict[str, Any]] = None,
     ):
         """
         最简剪辑逻辑：拼接视频+添加BGM+调速
@@ -306,6 +1363,13 @@ class VideoEditor:
         :param bgm_volume: BGM 音量（0~1）
         :param voice_volume: 配音音量（0~1）
         :param output_name: 自定义输出文件名（不含扩展名），如果为None则自动生成
+        :param progress_cb: 渲染进度回调 progress_cb(0-99)，按 EDIT_PROGRESS_INTERVAL_SECONDS 节流
+        :param encode_policy: 编码策略（encode_policy.EncodePolicy），为 None 时按当前负载自动选择
+        :param preview: 预览模式：输出缩小到短边 PREVIEW_SHORT_SIDE（字幕样式与成片一致）
+        :param extra_targets: 附加画幅 [(标签, 宽, 高)]，与主输出同一次解码输出到 aspect_variant_path(成品, 标签)；预览忽略
+        :param timeline_duration: 批量剪辑：组内最长的配音时长。不为 None 时总是走中间产物（不受 EDIT_INTERMEDIATE_CACHE 限制），
+            中间产物按该时长渲染，组内各版本（配音不同）共享同一份，出片时按各自时长截断；预览生成预览尺寸的中间产物
+        :param render_info: 传入 dict 时回填本次渲染的情况：reused_intermediate=True 表示复用了已有的中间产物
         :return: 成品视频绝对路径（失败返回None）
         """
         try:
@@ -314,17 +1378,8 @@ class VideoEditor:
             raise RuntimeError("未安装 ffmpeg-python，请先 pip install ffmpeg-python")
 
         def _probe_video_dimensions(path: str):
-            try:
-                info = ffmpeg.probe(path)
-                streams = info.get("streams") or []
-                for s in streams:
-                    if (s.get("codec_type") or "").lower() == "video":
-                        w = s.get("width")
-                        h = s.get("height")
-                        return (int(w) if w else None, int(h) if h else None)
-            except Exception:
-                pass
-            return (None, None)
+            # 走共享 probe 缓存，避免对已 probe 过的片段重复启动 ffprobe
+            return probe_video_dimensions(path)
 
         def _subtitle_style_for_min_dim(min_dim):
             # Scale subtitle size by the smaller video dimension.
@@ -464,8 +1519,7 @@ class VideoEditor:
             voice_duration = None
             if voice_path and os.path.exists(voice_path):
                 try:
-                    voice_probe = ffmpeg.probe(voice_path)
-                    voice_duration = float(voice_probe.get("format", {}).get("duration", 0.0))
+                    voice_duration = summary_duration(probe_summary(voice_path))
                     print(f"[VideoEditor] 配音时长: {voice_duration:.2f}秒")
                 except Exception as dur_error:
                     print(f"[VideoEditor] 警告：获取配音时长失败：{dur_error}")
@@ -474,8 +1528,7 @@ class VideoEditor:
             video_duration = 0.0
             try:
                 for vp in video_paths:
-                    vp_probe = ffmpeg.probe(vp)
-                    vp_duration = float(vp_probe.get("format", {}).get("duration", 0.0))
+                    vp_duration = summary_duration(probe_summary(vp))
                     video_duration += vp_duration
                 print(f"[VideoEditor] 视频原始总时长: {video_duration:.2f}秒")
             except Exception as dur_error:
@@ -511,8 +1564,9 @@ class VideoEditor:
                 video_duration = video_duration / speed_f
                 print(f"[VideoEditor] 调速后视频时长: {video_duration:.2f}秒")
 
-            # 如果有配音且视频较短，需要循环视频
-            loop_concat_file = None
+            loop_times = 1
+            # 如果有配音且视频较短，需要循环视频：对拼接输入做有界 stream_loop，
+            # 再裁剪到配音时长（只解码输出所需的长度，不再展开 N 份 concat 列表）
             if voice_duration and voice_duration > 0 and video_duration > 0:
                 duration_diff = abs(video_duration - voice_duration)
                 if duration_diff > 0.5:  # 差异超过0.5秒才调整
@@ -520,34 +1574,174 @@ class VideoEditor:
                         # 视频较短，需要循环
                         print(f"[VideoEditor] 视频较短（{video_duration:.2f}秒 < {voice_duration:.2f}秒），将循环视频")
                         loop_times = int(voice_duration / video_duration) + 1
-                        # 创建循环视频的concat文件
-                        import secrets
-                        loop_concat_file = os.path.join(OUTPUT_VIDEO_DIR, f"loop_concat_{secrets.token_hex(4)}.txt")
-                        with open(loop_concat_file, "w", encoding="utf-8") as f:
-                            for _ in range(loop_times):
-                                for vp in video_paths:
-                                    vp_escaped = vp.replace("'", "'\\''")
-                                    f.write(f"file '{vp_escaped}'\n")
-                        # 使用循环后的视频
-                        v_in = ffmpeg.input(loop_concat_file, format="concat", safe=0)
+                        v_in = ffmpeg.input(concat_file, format="concat", safe=0, stream_loop=loop_times - 1)
                         # 更新视频总时长为循环后的时长
                         video_duration = video_duration * loop_times
-                        print(f"[VideoEditor] 已创建循环视频，循环 {loop_times} 次，循环后总时长：{video_duration:.2f}秒")
+                        print(f"[VideoEditor] 拼接输入循环 {loop_times} 次，循环后总时长：{video_duration:.2f}秒")
+
+            # 预览：先缩小再烧字幕，字幕相对画面的大小与成片一致
+            preview_w, preview_h = _preview_scale_args(first_w, first_h)
+            if preview:
+                vf_parts.append(f"scale={preview_w}:{preview_h}")
 
             # 烧录字幕（可选）
             if subtitle_path and os.path.exists(subtitle_path):
-                # Windows 盘符 ':' 需要写成 '\:'（在 Python 字符串里是 '\\:'）
-                sub_file = subtitle_path.replace("\\", "/").replace(":", "\\:")
-                # filename/force_style 用单引号包裹更稳
-                vf_parts.append(
-                    "subtitles="
-                    + f"filename='{sub_file}'"
-                    + ":charenc=UTF-8"
-                    + f":force_style='{sub_style}'"
-                )
+                vf_parts.append(_subtitles_vf(subtitle_path, sub_style))
 
             vf = ",".join(vf_parts) if vf_parts else None
 
+            target_duration = video_duration
+            if voice_duration and (not video_duration or video_duration > voice_duration):
+                target_duration = voice_duration
+
+            # 附加画幅：各画幅的字号按自身短边计算；时长未知时无法限定输出长度，不导出
+            if preview or not extra_targets:
+                extra_targets = []
+            elif target_duration <= 0:
+                print("[VideoEditor] 警告：成片时长未知，跳过附加画幅")
+                extra_targets = []
+            else:
+                extra_targets = [
+                    (label, int(w), int(h), _subtitle_style_for_min_dim(min(int(w), int(h))))
+                    for label, w, h in extra_targets
+                ]
+
+            # 无调速/字幕/附加画幅时，若片段编码参数一致则视频流复制，只编码音频
+            stream_copy = False
+            if not vf_parts and not extra_targets:
+                stream_copy, copy_reason = plan_stream_copy(video_paths)
+                print(f"[VideoEditor] 流复制判定：{stream_copy}（{copy_reason}）")
+
+            # 需要重编码时走中间产物缓存：拼接/循环/调速/裁剪的结果按输入缓存，
+            # 只改配音、BGM 或字幕的再次剪辑直接复用；有附加画幅时同一次解码 split 出各画幅
+            # 时长未知时无法限定输出长度（BGM 无限循环），不走中间产物
+            shared = timeline_duration is not None
+            use_cache = EDIT_INTERMEDIATE_CACHE or shared
+            use_timeline = use_cache or bool(extra_targets)
+            if not stream_copy and use_timeline and video_paths and target_duration > 0:
+                policy = encode_policy or choose_policy("render")
+                needs_overlay = preview or bool(subtitle_path and os.path.exists(subtitle_path))
+                # 要叠加字幕/缩放时任一 CRF 的中间产物都可复用（都要再编码）；
+                # 无叠加时只复用按成片 CRF 编码、可直接流复制的那份
+                crf_options = [EDIT_INTERMEDIATE_CRF, policy.crf] if needs_overlay else [policy.crf]
+                intermediate_crf = crf_options[0]
+
+                # 批量：按组内最长配音展开循环，各版本的时间线都是它的前缀
+                shared_loop, shared_duration = loop_times, target_duration
+                if shared and timeline_duration > target_duration and video_duration > 0:
+                    single = video_duration / loop_times
+                    if timeline_duration - single > 0.5:
+                        shared_loop = max(loop_times, int(timeline_duration / single) + 1)
+                    shared_duration = max(target_duration, min(timeline_duration, single * shared_loop))
+
+                # 预览优先用预览尺寸的中间产物，其次是全分辨率的
+                preview_scale = (preview_w, preview_h) if preview else None
+                scale_options = [preview_scale, None] if preview else [None]
+
+                def _params(crf: int, scale) -> Dict[str, Any]:
+                    return _intermediate_params(video_paths, shared_loop, speed_f, shared_duration, crf, scale)
+
+                intermediate_path = None
+                intermediate_scale = None
+                for scale in scale_options if use_cache else []:
+                    for crf in crf_options:
+                        intermediate_path = segment_cache.lookup("intermediate", _params(crf, scale))
+                        if intermediate_path:
+                            intermediate_crf, intermediate_scale = crf, scale
+                            break
+                    if intermediate_path:
+                        break
+                finish_cb = progress_cb
+                output_done = []
+
+                def _render_shared(out: Optional[str], cb) -> None:
+                    VideoEditor._render_timeline(
+                        concat_file,
+                        shared_loop,
+                        speed_f,
+                        target_duration,
+                        voice_path,
+                        bgm_path,
+                        voice_volume,
+                        bgm_volume,
+                        subtitle_path,
+                        sub_style,
+                        output_path,
+                        encode_policy,
+                        cb,
+                        intermediate_path=out,
+                        intermediate_crf=intermediate_crf,
+                        extra_targets=extra_targets,
+                        intermediate_duration=shared_duration,
+                    )
+                    output_done.append(output_path)
+
+                rendered = []
+                if intermediate_path:
+                    print(f"[VideoEditor] 命中中间产物缓存：{intermediate_path}")
+                elif preview and not shared:
+                    # 单个预览不生成中间产物（那样比直接出预览更慢），只复用已有的
+                    pass
+                elif not use_cache:
+                    # 仅为附加画幅：成片与各画幅同一次解码输出，不落中间产物
+                    _render_shared(None, progress_cb)
+                else:
+                    # 批量预览：生成预览尺寸的中间产物，组内各版本只做字幕叠加
+                    intermediate_scale = preview_scale
+                    chunked = not preview and _use_chunked_encode(shared_duration, video_paths)
+                    split = 70 if needs_overlay or extra_targets else 95
+                    render_cb = _progress_slice(progress_cb, 0, split)
+
+                    def _render(out: str) -> None:
+                        rendered.append(out)
+                        if chunked:
+                            render_chunked(
+                                video_paths, shared_loop, speed_f, shared_duration, out, encode_policy, render_cb,
+                                crf=intermediate_crf,
+                            )
+                        elif not preview and (needs_overlay or extra_targets):
+                            _render_shared(out, progress_cb)
+                        else:
+                            _render_intermediate(
+                                concat_file, shared_loop, speed_f, shared_duration, out, encode_policy, render_cb,
+                                crf=intermediate_crf, scale=intermediate_scale,
+                            )
+
+                    intermediate_path = segment_cache.get_or_render(
+                        "intermediate", _params(intermediate_crf, intermediate_scale), _render
+                    )
+                    finish_cb = _progress_slice(progress_cb, split, 99)
+
+                # 等锁期间被其它任务生成的也算复用
+                if intermediate_path and not rendered and render_info is not None:
+                    render_info["reused_intermediate"] = True
+
+                if intermediate_path or output_done:
+                    # 成片已与中间产物同一次调用写出时不再出片
+                    if not output_done:
+                        VideoEditor._finish_from_intermediate(
+                            intermediate_path,
+                            target_duration,
+                            voice_path,
+                            bgm_path,
+                            voice_volume,
+                            bgm_volume,
+                            subtitle_path,
+                            sub_style,
+                            (preview_w, preview_h) if preview and not intermediate_scale else None,
+                            output_path,
+                            encode_policy,
+                            finish_cb,
+                            intermediate_crf=intermediate_crf,
+                            extra_targets=extra_targets,
+                        )
+                    safe_remove(concat_file)
+                    if os.path.exists(output_path):
+                        print(f"[VideoEditor] 剪辑成功，输出文件：{output_path}，大小：{os.path.getsize(output_path)} 字节")
+                        return output_path
+                    print(f"[VideoEditor] 警告：输出文件不存在：{output_path}")
+                    return None
+
             # 音频：默认去掉原视频音轨，用配音 + BGM 双轨混音（可选）
             audio_stream = None
             if voice_path:
@@ -587,7 +1781,10 @@ class VideoEditor:
             use_complex_filter = False  # 标记是否使用了复杂滤镜图
             
             # 如果视频较长需要裁剪到配音时长（包括循环后的情况）
-            if voice_duration and video_duration > voice_duration:
+            if stream_copy:
+                # 流复制不能走 trim 滤镜，改用输出时长限制
+                pass
+            elif voice_duration and video_duration > voice_duration:
                 print(f"[VideoEditor] 视频较长（{video_duration:.2f}秒 > {voice_duration:.2f}秒），将裁剪到配音时长，确保视频在配音结束时停止")
                 v_stream = v_stream.trim(end=voice_duration).setpts("PTS-STARTPTS")
                 use_complex_filter = True  # trim 创建了复杂滤镜图
@@ -600,6 +1797,9 @@ class VideoEditor:
                     v_stream = v_stream.filter("setpts", f"{1/speed_f}*PTS")
                     print(f"[VideoEditor] 通过复杂滤镜图应用调速：{speed_f}x")
                 
+                if preview:
+                    v_stream = v_stream.filter("scale", preview_w, preview_h)
+
                 # 添加字幕（如果有）
                 if subtitle_path and os.path.exists(subtitle_path):
                     # 使用绝对路径，确保路径格式正确
@@ -616,12 +1816,31 @@ class VideoEditor:
                 # 如果没有使用复杂滤镜图，字幕通过 vf 参数添加（已在之前添加到 vf_parts）
                 pass
             
+            x264_kwargs = {} if stream_copy else (encode_policy or choose_policy("render")).x264_kwargs()
+
+            # 重编码时封面/动图与成片同一次调用输出（流复制与预览不在此生成）
+            thumb_outputs = []
+            if not stream_copy and not preview:
+                thumb_duration = video_duration
+                if voice_duration and (not video_duration or video_duration > voice_duration):
+                    thumb_duration = voice_duration
+                v_stream, thumb_outputs = _with_thumbnail_outputs(
+                    v_stream,
+                    output_path,
+                    thumb_duration,
+                    filtered=use_complex_filter,
+                    vf=None if use_complex_filter else vf,
+                )
+
             if audio_stream is not None:
                 # 构建输出参数
                 output_kwargs = {
-                    "vcodec": "libx264",
+                    "vcodec": "copy" if stream_copy else "libx264",
                     "acodec": "aac",
+                    **x264_kwargs,
                 }
+                if stream_copy and voice_duration and video_duration > voice_duration:
+                    output_kwargs["t"] = voice_duration
                 # 添加视频滤镜（如果有，且未使用复杂滤镜图）
                 if vf and not use_complex_filter:
                     output_kwargs["vf"] = vf
@@ -634,10 +1853,12 @@ class VideoEditor:
                     **output_kwargs
                 )
             else:
-                output_kwargs = {"vcodec": "libx264"}
+                output_kwargs = {"vcodec": "copy" if stream_copy else "libx264", **x264_kwargs}
                 if vf and not use_complex_filter:
                     output_kwargs["vf"] = vf
                 stream = ffmpeg.output(v_stream, output_path, **output_kwargs)
+            if thumb_outputs:
+                stream = ffmpeg.merge_outputs(stream, *thumb_outputs)
 
             # 执行命令
             print(f"[VideoEditor] 开始执行 FFmpeg 命令，输出文件：{output_path}")
@@ -647,20 +1868,17 @@ class VideoEditor:
             print(f"[VideoEditor] 字幕路径：{subtitle_path}")
             print(f"[VideoEditor] 播放速度：{speed}")
             
+            # 预期输出时长（用于换算进度）：有配音时裁到配音长度
+            expected_duration = video_duration
+            if voice_duration and (not video_duration or video_duration > voice_duration):
+                expected_duration = voice_duration
+
             try:
-                # 执行 FFmpeg 命令
-                ffmpeg.run(stream, overwrite_output=True, quiet=True)
-            except ffmpeg.Error as ffmpeg_error:
-                # 捕获 FFmpeg 错误
-                stderr_msg = ""
-                if hasattr(ffmpeg_error, 'stderr') and ffmpeg_error.stderr:
-                    try:
-                        stderr_msg = ffmpeg_error.stderr.decode('utf-8', errors='ignore')
-                    except:
-                        stderr_msg = str(ffmpeg_error.stderr)
-                error_msg = f"FFmpeg 执行失败：{stderr_msg or str(ffmpeg_error)}"
-                print(f"[VideoEditor] {error_msg}")
-                raise RuntimeError(error_msg)
+                # 执行 FFmpeg 命令（解析 -progress 输出上报进度）
+                _run_ffmpeg_stream(stream, expected_duration, progress_cb)
+            except RuntimeError as ffmpeg_error:
+                print(f"[VideoEditor] {ffmpeg_error}")
+                raise
             except Exception as ffmpeg_ex:
                 # 捕获其他异常
                 error_msg = f"FFmpeg 执行异常：{str(ffmpeg_ex)}"
@@ -669,8 +1887,6 @@ class VideoEditor:
 
             # 4. 清理临时文件
             safe_remove(concat_file)
-            if 'loop_concat_file' in locals() and loop_concat_file:
-                safe_remove(loop_concat_file)
 
             # 验证成品是否存在
             if os.path.exists(output_path):
@@ -691,6 +1907,9 @@ class VideoEditor:
                 safe_remove(concat_file)
             if 'output_path' in locals() and os.path.exists(output_path):
                 safe_remove(output_path)
+            if 'output_path' in locals():
+                for target in extra_targets or []:
+                    safe_remove(aspect_variant_path(output_path, target[0]))
             raise  # 重新抛出异常，让调用者处理
 
 
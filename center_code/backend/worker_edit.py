@@ -0,0 +1,218 @@
+"""
+Video edit (render) worker (standalone process).
+
+Queue table: video_edit_tasks（payload_json 由 blueprints/editor.py 写入）
+
+可在多个节点上运行（共享数据库与 uploads 目录），每个进程用 EDIT_WORKER_CONCURRENCY 控制并发。
+pending 任务按用户公平调度（见 edit_scheduler.py），而不是全局先到先得。
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Set
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from sqlalchemy import text
+
+from db import get_db
+from edit_scheduler import claim_candidates
+from models import VideoEditTask
+
+
+@dataclass(frozen=True)
+class TaskInfo:
+    id: int
+    payload_json: str
+
+
+def utcnow() -> datetime:
+    # video_edit_tasks 的时间字段使用本地时间（与 models 默认值一致）
+    return datetime.now()
+
+
+def worker_id(slot: int = 0) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{slot}"
+
+
+_ACTIVE: Set[int] = set()
+_ACTIVE_LOCK = threading.Lock()
+
+
+def fail_exhausted(stale_before: datetime) -> None:
+    """锁已过期且重试次数用尽的 running 任务直接置为失败（worker 进程已丢失）"""
+    now = utcnow()
+    with get_db() as db:
+        db.execute(
+            text(
+                """
+                UPDATE video_edit_tasks
+                SET status='fail',
+                    progress=100,
+                    error_message='剪辑 worker 异常退出，重试次数已用尽',
+                    locked_by=NULL,
+                    locked_at=NULL,
+                    updated_at=:now
+                WHERE status='running'
+                  AND payload_json IS NOT NULL
+                  AND locked_at IS NOT NULL
+                  AND locked_at < :stale_before
+                  AND attempts >= max_attempts
+                """
+            ),
+            {"now": now, "stale_before": stale_before},
+        )
+        db.commit()
+
+
+def claim_one(wid: str, lock_timeout_seconds: int) -> Optional[TaskInfo]:
+    now = utcnow()
+    stale_before = now - timedelta(seconds=int(lock_timeout_seconds or 0))
+
+    with get_db() as db:
+        # worker 丢失（锁过期）的 running 任务优先恢复；其次按用户公平顺序取 pending 的新任务
+        stale = (
+            db.query(VideoEditTask.id)
+            .filter(
+                VideoEditTask.payload_json.isnot(None),
+                VideoEditTask.attempts < VideoEditTask.max_attempts,
+                VideoEditTask.status == "running",
+                VideoEditTask.locked_at < stale_before,
+            )
+            .order_by(VideoEditTask.locked_at.asc())
+            .first()
+        )
+        candidates = [int(stale[0])] if stale else claim_candidates(db, stale_before)
+
+        for task_id in candidates:
+            claimed = _try_claim(db, task_id, wid, now, stale_before)
+            if claimed:
+                return claimed
+        return None
+
+
+def _try_claim(db, task_id: int, wid: str, now: datetime, stale_before: datetime) -> Optional[TaskInfo]:
+    """条件 UPDATE 抢占任务；被其它 worker 抢先时返回 None"""
+    res = db.execute(
+        text(
+            """
+            UPDATE video_edit_tasks
+            SET status='running',
+                locked_by=:worker_id,
+                locked_at=:now,
+                attempts=attempts+1,
+                updated_at=:now
+            WHERE id=:id
+              AND attempts < max_attempts
+              AND (
+                (status='pending' AND (locked_at IS NULL OR locked_at < :stale_before))
+                OR (status='running' AND locked_at < :stale_before)
+              )
+            """
+        ),
+        {"worker_id": wid, "now": now, "id": task_id, "stale_before": stale_before},
+    )
+    if getattr(res, "rowcount", 0) != 1:
+        return None
+
+    task = db.query(VideoEditTask).filter(VideoEditTask.id == task_id).first()
+    if not task:
+        return None
+
+    # 不返回 ORM 实例：get_db() 退出时 commit 会使属性过期
+    return TaskInfo(id=int(task.id), payload_json=str(task.payload_json or ""))
+
+
+def heartbeat(wid_prefix: str) -> None:
+    """刷新本进程正在执行任务的 locked_at，避免长时间渲染被其它 worker 当作失联任务重领"""
+    with _ACTIVE_LOCK:
+        ids = list(_ACTIVE)
+    if not ids:
+        return
+    now = utcnow()
+    with get_db() as db:
+        for task_id in ids:
+            db.execute(
+                text(
+                    "UPDATE video_edit_tasks SET locked_at=:now "
+                    "WHERE id=:id AND status='running' AND locked_by LIKE :prefix"
+                ),
+                {"now": now, "id": int(task_id), "prefix": f"{wid_prefix}:%"},
+            )
+        db.commit()
+
+
+def process_once(wid: str, lock_timeout_seconds: int) -> bool:
+    task = claim_one(wid, lock_timeout_seconds)
+    if not task:
+        return False
+
+    # 延迟导入：加载编辑蓝图（及其依赖）只在真正执行任务时发生
+    from blueprints.editor import run_edit_task_payload
+
+    with _ACTIVE_LOCK:
+        _ACTIVE.add(task.id)
+    try:
+        print(f"[edit-worker] {wid} task={task.id} start")
+        run_edit_task_payload(task.id, task.payload_json)
+        print(f"[edit-worker] {wid} task={task.id} done")
+    finally:
+        with _ACTIVE_LOCK:
+            _ACTIVE.discard(task.id)
+    return True
+
+
+def _slot_loop(slot: int, sleep_seconds: float, lock_timeout_seconds: int) -> None:
+    wid = worker_id(slot)
+    while True:
+        did = False
+        try:
+            did = process_once(wid, lock_timeout_seconds)
+        except Exception as e:
+            print(f"[edit-worker] {wid} error: {e}")
+
+        if not did:
+            time.sleep(sleep_seconds)
+
+
+def main() -> None:
+    sleep_seconds = float(os.environ.get("EDIT_WORKER_SLEEP", "1.0") or "1.0")
+    lock_timeout_seconds = int(os.environ.get("EDIT_LOCK_TIMEOUT", "600") or "600")
+    concurrency = max(1, int(os.environ.get("EDIT_WORKER_CONCURRENCY", "1") or "1"))
+    wid_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    print(f"[edit-worker] started: {wid_prefix}")
+    print(f"[edit-worker] concurrency={concurrency} sleep={sleep_seconds}s lock_timeout={lock_timeout_seconds}s")
+
+    for slot in range(concurrency):
+        t = threading.Thread(
+            target=_slot_loop,
+            args=(slot, sleep_seconds, lock_timeout_seconds),
+            name=f"edit-slot-{slot}",
+            daemon=True,
+        )
+        t.start()
+
+    # 主线程：心跳续期 + 清理重试用尽的失联任务
+    heartbeat_interval = max(1.0, lock_timeout_seconds / 4.0)
+    while True:
+        try:
+            heartbeat(wid_prefix)
+            fail_exhausted(utcnow() - timedelta(seconds=lock_timeout_seconds))
+        except Exception as e:
+            print(f"[edit-worker] heartbeat error: {e}")
+        time.sleep(heartbeat_interval)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("[edit-worker] stopped")
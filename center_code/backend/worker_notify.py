@@ -0,0 +1,131 @@
+"""
+队列 worker 的推送唤醒：入队方发一个 UDP 数据报，空闲 worker 立即醒来认领，不必反复查库。
+
+- worker 端 Listener 绑定一个 UDP 端口，并把 host:port 登记到 WORKER_NOTIFY_DIR/<channel>/ 下的文件
+- 入队方 notify(channel) 读取登记文件，向每个 worker 发一个数据报（失败静默忽略，worker 仍有兜底超时）
+- 登记目录默认在 backend/logs/run 下（不能放进 uploads：/uploads/<path> 路由会把它公开出去）；
+  多节点部署时把 WORKER_NOTIFY_DIR 指向各节点共享、但不对外提供下载的目录，WORKER_NOTIFY_HOST 设为本节点可达的地址
+
+通知只是"可能有新任务"的提示，丢失时 worker 会在兜底超时后照常查库。
+"""
+
+import json
+import os
+import select
+import socket
+import time
+from typing import List, Tuple
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORKER_NOTIFY_DIR = os.environ.get("WORKER_NOTIFY_DIR") or os.path.join(_BACKEND_DIR, "logs", "run", "worker_notify")
+# worker 监听并登记的地址；多节点时设为本节点内网 IP
+WORKER_NOTIFY_HOST = os.environ.get("WORKER_NOTIFY_HOST", "127.0.0.1")
+# 登记文件超过该时长（秒）未刷新视为 worker 已退出
+WORKER_NOTIFY_STALE_SECONDS = float(os.environ.get("WORKER_NOTIFY_STALE_SECONDS", "300") or "300")
+
+_WAKE = b"wake"
+
+
+def _channel_dir(channel: str) -> str:
+    return os.path.join(WORKER_NOTIFY_DIR, channel)
+
+
+class Listener:
+    """worker 端：阻塞等待唤醒（或超时）"""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((WORKER_NOTIFY_HOST, 0))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.path = os.path.join(_channel_dir(channel), f"{socket.gethostname()}_{os.getpid()}_{self.port}.json")
+        self._registered_at = 0.0
+        self.register()
+
+    def register(self) -> None:
+        try:
+            os.makedirs(_channel_dir(self.channel), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"host": WORKER_NOTIFY_HOST, "port": self.port, "pid": os.getpid()}, f)
+            os.replace(tmp, self.path)
+            self._registered_at = time.monotonic()
+        except OSError as e:
+            print(f"[worker_notify] 登记失败：{e}")
+
+    def wait(self, timeout: float) -> bool:
+        """等待唤醒，最多 timeout 秒；收到通知返回 True（一次取空所有积压的通知）"""
+        if time.monotonic() - self._registered_at > WORKER_NOTIFY_STALE_SECONDS / 3:
+            self.register()
+        try:
+            ready, _, _ = select.select([self.sock], [], [], max(0.0, timeout))
+        except (OSError, ValueError):
+            time.sleep(max(0.0, timeout))
+            return False
+        if not ready:
+            return False
+        while True:
+            try:
+                self.sock.recv(64)
+            except (BlockingIOError, OSError):
+                break
+        return True
+
+    def poke(self) -> None:
+        """本进程内唤醒自己（如某个槽位的任务结束）"""
+        try:
+            self.sock.sendto(_WAKE, (WORKER_NOTIFY_HOST, self.port))
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def _endpoints(channel: str) -> List[Tuple[str, int]]:
+    out = []
+    d = _channel_dir(channel)
+    try:
+        names = os.listdir(d)
+    except OSError:
+        return out
+    now = time.time()
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(d, name)
+        try:
+            if now - os.path.getmtime(path) > WORKER_NOTIFY_STALE_SECONDS:
+                os.remove(path)
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+            out.append((str(info["host"]), int(info["port"])))
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+    return out
+
+
+def notify(channel: str) -> int:
+    """唤醒该通道上所有已登记的 worker，返回发送的数据报数；从不抛异常"""
+    endpoints = _endpoints(channel)
+    if not endpoints:
+        return 0
+    sent = 0
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for addr in endpoints:
+                try:
+                    sock.sendto(_WAKE, addr)
+                    sent += 1
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return sent
@@ -2,16 +2,26 @@
 Material transcode worker (standalone process).
 
 Queue table: material_transcode_tasks
+
+每个进程运行 TRANSCODE_WORKER_CONCURRENCY 个转码槽位；主线程按空闲槽位数批量认领（短素材优先）。
+空闲时阻塞等待上传接口的唤醒通知（见 worker_notify.py），只在兜底超时后才查库。
+视频完整重编码时在同一次 ffmpeg 调用里顺带输出代理版本（见 renditions.py），写入 materials.meta_json；
+remux/audio 方案只做封装，素材先置为 ready，代理版本作为后续的 renditions 任务单独生成。
+running 任务带租约（lease_expires_at），后台线程定期续期；租约过期（worker 崩溃）的任务由 reaper 放回 pending 或置为失败。
 """
 
+import json
 import os
 import socket
 import subprocess
 import sys
+import threading
 import time
-from dataclasses import dataclass
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
@@ -20,11 +30,35 @@ if current_dir not in sys.path:
 from sqlalchemy import text
 
 from db import get_db
-from models import MaterialTranscodeTask
-from media_utils import ffprobe, get_duration_seconds, resolve_ffmpeg_exe
+from encode_policy import EncodePolicy, choose_policy
+import job_control
+import renditions
+import worker_notify
+from media_utils import (
+    build_meta_json,
+    file_sha256,
+    probe_duration_seconds,
+    probe_summary,
+    resolve_ffmpeg_exe,
+    stored_content_hash,
+    summary_duration,
+    summary_video_dimensions,
+)
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# 并发转码槽位数；0 表示按 CPU 核数 / 4 自动计算（x264 线程由 encode_policy 在运行任务间均分）
+TRANSCODE_WORKER_CONCURRENCY = int(os.environ.get("TRANSCODE_WORKER_CONCURRENCY", "0") or "0")
+# 最短任务优先；等待超过该时长（秒）的任务不再让位，避免长素材饿死
+TRANSCODE_SJF_MAX_WAIT_SECONDS = int(os.environ.get("TRANSCODE_SJF_MAX_WAIT_SECONDS", "600") or "600")
+# 进度在内存中缓冲，每隔该时长（秒）合并写库一次
+TRANSCODE_PROGRESS_FLUSH_SECONDS = float(os.environ.get("TRANSCODE_PROGRESS_FLUSH_SECONDS", "2.0") or "2.0")
+# 空闲时等待唤醒的兜底超时（秒）：通知丢失或任务由其它途径入队时，最迟这么久后查库
+TRANSCODE_WORKER_IDLE_TIMEOUT = float(os.environ.get("TRANSCODE_WORKER_IDLE_TIMEOUT", "30") or "30")
+# running 任务的租约时长（秒）；worker 每 1/3 租约续期一次，并顺带回收其它 worker 过期的租约
+TRANSCODE_LEASE_SECONDS = float(os.environ.get("TRANSCODE_LEASE_SECONDS", "90") or "90")
+
+
 @dataclass(frozen=True)
 class TaskInfo:
     id: int
@@ -32,6 +66,8 @@ class TaskInfo:
     input_path: str
     output_path: str
     kind: str
+    plan: str
+    lock_token: str
 
 
 def utcnow() -> datetime:
@@ -42,57 +78,182 @@ def worker_id() -> str:
     return f"{socket.gethostname()}:{os.getpid()}"
 
 
-def claim_one(wid: str, lock_timeout_seconds: int) -> Optional[TaskInfo]:
+def claim_batch(wid: str, limit: int, lock_timeout_seconds: int) -> List[TaskInfo]:
+    """
+    一次 DB 往返认领最多 limit 个任务：单条 UPDATE ... WHERE id IN (子查询 ... LIMIT n) 原子抢占，
+    再按本次认领的令牌（locked_by = worker_id:随机后缀）读回。其它 worker 并发认领时，条件里的 status='pending' 保证同一任务只被一方抢到。
+
+    顺序：等待超过 TRANSCODE_SJF_MAX_WAIT_SECONDS 的任务优先（防止长任务饿死），其次入库转码先于代理版本任务，
+    同类再按素材时长短的优先。
+    """
+    if limit <= 0:
+        return []
     now = utcnow()
     stale_before = now - timedelta(seconds=int(lock_timeout_seconds or 0))
+    # created_at 由 models 默认值写入本地时间
+    aged_before = datetime.now() - timedelta(seconds=TRANSCODE_SJF_MAX_WAIT_SECONDS)
+    token = f"{wid}:{uuid.uuid4().hex[:8]}"
 
     with get_db() as db:
-        candidate = (
-            db.query(MaterialTranscodeTask.id)
-            .filter(
-                MaterialTranscodeTask.status == "pending",
-                MaterialTranscodeTask.attempts < MaterialTranscodeTask.max_attempts,
-                (MaterialTranscodeTask.locked_at.is_(None)) | (MaterialTranscodeTask.locked_at < stale_before),
-            )
-            .order_by(MaterialTranscodeTask.created_at.asc())
-            .first()
-        )
-        if not candidate:
-            return None
-
-        task_id = int(candidate[0])
+        # 子查询再包一层派生表：MySQL 不允许 UPDATE 的子查询直接读同一张表
         res = db.execute(
             text(
                 """
                 UPDATE material_transcode_tasks
                 SET status='running',
-                    locked_by=:worker_id,
+                    locked_by=:token,
                     locked_at=:now,
+                    lease_expires_at=:lease_until,
                     attempts=attempts+1,
                     updated_at=:now
-                WHERE id=:id
+                WHERE id IN (
+                    SELECT id FROM (
+                        SELECT t.id AS id
+                        FROM material_transcode_tasks t
+                        LEFT JOIN materials m ON m.id = t.material_id
+                        WHERE t.status='pending'
+                          AND t.attempts < t.max_attempts
+                          AND (t.locked_at IS NULL OR t.locked_at < :stale_before)
+                        ORDER BY
+                          CASE WHEN t.created_at < :aged_before THEN 0 ELSE 1 END,
+                          CASE WHEN t.transcode_plan = 'renditions' THEN 1 ELSE 0 END,
+                          CASE WHEN m.duration IS NULL THEN 1 ELSE 0 END,
+                          m.duration ASC,
+                          t.created_at ASC
+                        LIMIT :limit
+                    ) AS picked
+                )
                   AND status='pending'
+                  AND attempts < max_attempts
                   AND (locked_at IS NULL OR locked_at < :stale_before)
                 """
             ),
-            {"worker_id": wid, "now": now, "id": task_id, "stale_before": stale_before},
+            {
+                "token": token,
+                "now": now,
+                "lease_until": now + timedelta(seconds=TRANSCODE_LEASE_SECONDS),
+                "stale_before": stale_before,
+                "aged_before": aged_before,
+                "limit": int(limit),
+            },
+        )
+        if not getattr(res, "rowcount", 0):
+            db.commit()
+            return []
+
+        rows = db.execute(
+            text(
+                "SELECT id, material_id, input_path, output_path, kind, transcode_plan "
+                "FROM material_transcode_tasks WHERE locked_by=:token AND status='running'"
+            ),
+            {"token": token},
+        ).fetchall()
+        db.commit()
+
+    return [
+        TaskInfo(
+            id=int(r[0]),
+            material_id=int(r[1]),
+            input_path=str(r[2]),
+            output_path=str(r[3]),
+            kind=str(r[4]),
+            # 旧任务没有记录方案，按完整重编码处理
+            plan=str(r[5] or "full"),
+            lock_token=token,
         )
-        if getattr(res, "rowcount", 0) != 1:
-            return None
-
-        task = db.query(MaterialTranscodeTask).filter(MaterialTranscodeTask.id == task_id).first()
-        if not task:
-            return None
-
-        # Important: do not return ORM instances from this function.
-        # get_db() commits on exit which expires ORM attributes, leading to detached instances.
-        return TaskInfo(
-            id=int(task.id),
-            material_id=int(task.material_id),
-            input_path=str(task.input_path),
-            output_path=str(task.output_path),
-            kind=str(task.kind),
+        for r in rows
+    ]
+
+
+_LEASED: Set[int] = set()
+_LEASED_LOCK = threading.Lock()
+
+
+def renew_leases(wid: str) -> None:
+    """一条 UPDATE 为本进程正在执行的任务续期租约"""
+    with _LEASED_LOCK:
+        ids = sorted(_LEASED)
+    if not ids:
+        return
+    now = utcnow()
+    params = {"now": now, "lease_until": now + timedelta(seconds=TRANSCODE_LEASE_SECONDS), "prefix": f"{wid}:%"}
+    for i, task_id in enumerate(ids):
+        params[f"id{i}"] = int(task_id)
+    with get_db() as db:
+        db.execute(
+            text(
+                "UPDATE material_transcode_tasks SET lease_expires_at=:lease_until "
+                f"WHERE id IN ({', '.join(f':id{i}' for i in range(len(ids)))}) "
+                "AND status='running' AND locked_by LIKE :prefix"
+            ),
+            params,
         )
+        db.commit()
+
+
+def reap_expired_leases(lock_timeout_seconds: int) -> int:
+    """
+    回收租约过期的 running 任务（持有它的 worker 已崩溃或失联）：
+    attempts 未用尽的放回 pending 重新排队，用尽的置为失败并把素材标记为 failed。
+    没有租约的旧任务（升级前认领）按 locked_at 超过 lock_timeout_seconds 判断。
+    """
+    now = utcnow()
+    params = {"now": now, "stale_before": now - timedelta(seconds=int(lock_timeout_seconds or 0))}
+    expired = (
+        "status='running' AND ("
+        "(lease_expires_at IS NOT NULL AND lease_expires_at < :now) "
+        "OR (lease_expires_at IS NULL AND locked_at < :stale_before))"
+    )
+    reaped = 0
+    with get_db() as db:
+        rows = db.execute(
+            text(
+                "SELECT id, material_id, attempts, max_attempts, transcode_plan "
+                f"FROM material_transcode_tasks WHERE {expired}"
+            ),
+            params,
+        ).fetchall()
+        for task_id, material_id, attempts, max_attempts, plan in rows:
+            exhausted = int(attempts or 0) >= int(max_attempts or 0)
+            # 条件里重复过期判断：查询之后租约可能刚被续期
+            if exhausted:
+                sql = (
+                    "UPDATE material_transcode_tasks SET status='fail', "
+                    "error_message='转码 worker 异常退出，重试次数已用尽', "
+                    "locked_by=NULL, locked_at=NULL, lease_expires_at=NULL, updated_at=:now "
+                    f"WHERE id=:id AND {expired}"
+                )
+            else:
+                sql = (
+                    "UPDATE material_transcode_tasks SET status='pending', progress=0, "
+                    "locked_by=NULL, locked_at=NULL, lease_expires_at=NULL, updated_at=:now "
+                    f"WHERE id=:id AND {expired}"
+                )
+            res = db.execute(text(sql), {**params, "id": int(task_id)})
+            if getattr(res, "rowcount", 0) != 1:
+                continue
+            reaped += 1
+            # 代理版本任务失败不影响已就绪的素材
+            if exhausted and plan != "renditions":
+                db.execute(
+                    text("UPDATE materials SET status='failed', updated_at=:now WHERE id=:id"),
+                    {"now": now, "id": int(material_id)},
+                )
+            print(f"[worker] reaped task={task_id} lease expired -> {'fail' if exhausted else 'pending'}")
+        db.commit()
+    return reaped
+
+
+def _lease_loop(wid: str, lock_timeout_seconds: int, on_reaped) -> None:
+    interval = max(1.0, TRANSCODE_LEASE_SECONDS / 3.0)
+    while True:
+        try:
+            renew_leases(wid)
+            if reap_expired_leases(lock_timeout_seconds):
+                on_reaped()
+        except Exception as e:
+            print(f"[worker] lease error: {e}")
+        time.sleep(interval)
 
 
 def update_task(task_id: int, **fields) -> None:
@@ -129,6 +290,108 @@ def update_material(material_id: int, **fields) -> None:
         db.commit()
 
 
+def output_meta_fields(material_id: int, output_abs: str, rendition_meta: Optional[dict] = None) -> dict:
+    """
+    转码产物的 probe 摘要（带文件指纹与内容哈希），转码前的原片摘要保留在 meta_json.source；
+    rendition_meta 为本次生成的代理版本，写入 meta_json.renditions。
+    """
+    try:
+        summary = probe_summary(output_abs)
+        with get_db() as db:
+            row = db.execute(
+                text("SELECT meta_json FROM materials WHERE id=:id"), {"id": int(material_id)}
+            ).first()
+        previous = row[0] if row else None
+        # 只补生成代理版本时产物未变，沿用已记录的内容哈希
+        digest = stored_content_hash(previous, output_abs) or file_sha256(output_abs)
+        meta_json = build_meta_json(summary, output_abs, previous, content_sha256=digest)
+        if rendition_meta:
+            meta = json.loads(meta_json)
+            meta["renditions"] = rendition_meta
+            meta_json = json.dumps(meta, ensure_ascii=False)
+        fields = {"meta_json": meta_json}
+        duration = summary_duration(summary)
+        if duration > 0:
+            fields["duration"] = duration
+        width, height = summary_video_dimensions(summary)
+        if width and height:
+            fields["width"] = width
+            fields["height"] = height
+        try:
+            fields["size"] = os.path.getsize(output_abs)
+        except Exception:
+            pass
+        return fields
+    except Exception as e:
+        print(f"[worker] probe output failed: {e}")
+        return {}
+
+
+class ProgressBuffer:
+    """
+    转码进度的内存缓冲：ffmpeg 每推进 1% 只更新内存，由后台线程按 TRANSCODE_PROGRESS_FLUSH_SECONDS
+    把所有任务的最新进度合并成一条 UPDATE ... CASE 写库。状态变更（success/fail）仍由 update_task 立即写入。
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def set(self, task_id: int, progress: int) -> None:
+        with self._lock:
+            if progress > self._pending.get(task_id, -1):
+                self._pending[task_id] = int(progress)
+
+    def discard(self, task_id: int) -> None:
+        with self._lock:
+            self._pending.pop(task_id, None)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        params = {"now": utcnow()}
+        cases = []
+        ids = []
+        for i, (task_id, progress) in enumerate(batch.items()):
+            params[f"id{i}"] = int(task_id)
+            params[f"p{i}"] = int(progress)
+            cases.append(f"WHEN :id{i} THEN :p{i}")
+            ids.append(f":id{i}")
+        # 只推进 running 任务，且不回退（任务可能已被立即写成 success/fail/cancelled）
+        progress_expr = f"CASE id {' '.join(cases)} ELSE progress END"
+        try:
+            with get_db() as db:
+                db.execute(
+                    text(
+                        f"UPDATE material_transcode_tasks SET progress={progress_expr}, updated_at=:now "
+                        f"WHERE id IN ({', '.join(ids)}) AND status='running' AND progress < {progress_expr}"
+                    ),
+                    params,
+                )
+                db.commit()
+        except Exception as e:
+            print(f"[worker] flush progress failed: {e}")
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval_seconds)
+            self.flush()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="transcode-progress", daemon=True)
+        self._thread.start()
+
+
+_PROGRESS = ProgressBuffer(TRANSCODE_PROGRESS_FLUSH_SECONDS)
+
+
 def run_ffmpeg_transcode(
     *,
     input_abs: str,
@@ -136,7 +399,15 @@ def run_ffmpeg_transcode(
     kind: str,
     duration_seconds: float,
     task_id: int,
+    plan: str = "full",
+    policy: Optional[EncodePolicy] = None,
+    rendition_outputs: Optional[List[Tuple[renditions.Rendition, str]]] = None,
 ) -> None:
+    """
+    plan（见 media_utils.plan_transcode）：remux 全部流复制、audio 复制视频只转 AAC 音频，
+    两者都写 +faststart 的 MP4；full 完整重编码；renditions 只输出代理版本（不写 output_abs）。
+    rendition_outputs 作为同一命令的附加输出，输入只解码一次；各代理编码器与主输出均分 policy 的线程预算。
+    """
     os.makedirs(os.path.dirname(output_abs), exist_ok=True)
     ffmpeg_exe = resolve_ffmpeg_exe()
     kind = (kind or "").lower().strip()
@@ -154,16 +425,35 @@ def run_ffmpeg_transcode(
         "-nostats",
     ]
 
-    if kind == "video":
+    # 主输出与各代理编码器均分线程预算
+    threads = 0
+    if kind == "video" and plan not in ("remux", "audio"):
+        policy = policy or choose_policy("transcode")
+        encoders = len(rendition_outputs or []) + (0 if plan == "renditions" else 1)
+        threads = max(1, int(policy.threads) // max(1, encoders))
+
+    if kind == "video" and plan == "renditions":
+        cmd = list(common)
+    elif kind == "video" and plan in ("remux", "audio"):
+        # 字幕/数据轨（如手机录像的 timecode）不一定能封装进 MP4，直接丢弃
+        audio_args = ["-c:a", "copy"] if plan == "remux" else ["-c:a", "aac", "-b:a", "128k"]
+        cmd = common + [
+            "-sn",
+            "-dn",
+            "-c:v",
+            "copy",
+            *audio_args,
+            "-movflags",
+            "+faststart",
+            output_abs,
+        ]
+    elif kind == "video":
         cmd = common + [
             "-c:v",
             "libx264",
             "-pix_fmt",
             "yuv420p",
-            "-preset",
-            "veryfast",
-            "-crf",
-            "23",
+            *replace(policy, threads=threads).x264_args(),
             "-c:a",
             "aac",
             "-b:a",
@@ -184,8 +474,14 @@ def run_ffmpeg_transcode(
     else:
         raise RuntimeError(f"unknown kind: {kind}")
 
+    if kind == "video" and rendition_outputs:
+        for rendition, path in rendition_outputs:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            cmd += rendition.ffmpeg_args(path, threads)
+
     last_pct = -1
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # 登记到当前任务，取消时整组终止
+    p = job_control.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     try:
         if p.stdout:
             for line in p.stdout:
@@ -199,78 +495,273 @@ def run_ffmpeg_transcode(
                         pct = int(min(99, max(0, (out_ms / (duration_seconds * 1000000.0)) * 100.0)))
                         if pct > last_pct:
                             last_pct = pct
-                            update_task(task_id, progress=pct)
+                            _PROGRESS.set(task_id, pct)
                     except Exception:
                         continue
                 elif k == "progress" and v.strip() == "end":
                     if last_pct < 99:
-                        update_task(task_id, progress=99)
+                        _PROGRESS.set(task_id, 99)
     finally:
         stdout, stderr = p.communicate(timeout=None)
+        job_control.release(p)
+        job_control.check_cancelled()
         if p.returncode != 0:
             err = (stderr or stdout or "").strip()
             raise RuntimeError(err or f"ffmpeg failed, exit={p.returncode}")
 
 
-def process_once(wid: str, lock_timeout_seconds: int) -> bool:
-    task = claim_one(wid, lock_timeout_seconds)
-    if not task:
-        return False
+def task_cancelled(task_id: int, lock_token: Optional[str] = None) -> bool:
+    """
+    任务已被取消或删除（素材被删除时转码任务随之删除）；
+    给定 lock_token 时，租约已被回收（任务不再由本次认领持有）也视为取消。
+    """
+    with get_db() as db:
+        row = db.execute(
+            text("SELECT status, locked_by FROM material_transcode_tasks WHERE id=:id"), {"id": int(task_id)}
+        ).first()
+    if row is None or row[0] == "cancelled":
+        return True
+    return bool(lock_token) and row[1] != lock_token
+
+
+def run_task(task: TaskInfo) -> None:
+    _PROGRESS.start()
+    with _LEASED_LOCK:
+        _LEASED.add(task.id)
+    try:
+        with job_control.job_scope("transcode", task.id, poll=lambda: task_cancelled(task.id, task.lock_token)):
+            try:
+                _process_task(task)
+            except job_control.JobCancelled:
+                _PROGRESS.discard(task.id)
+                if not task_cancelled(task.id):
+                    # 租约已被回收，任务可能正由其它 worker 重新转码，不能删除共享的输出路径
+                    print(f"[worker] task={task.id} lease lost, abandoned")
+                    return
+                print(f"[worker] task={task.id} cancelled")
+                partial = [path for _r, path in _rendition_outputs(task)]
+                if task.plan != "renditions":
+                    # renditions 任务的 output_path 是已就绪的素材本身
+                    partial.append(os.path.join(BASE_DIR, task.output_path.replace("/", os.sep)))
+                _remove_files(partial)
+    finally:
+        with _LEASED_LOCK:
+            _LEASED.discard(task.id)
+
+
+def _rendition_outputs(task: TaskInfo) -> List[Tuple[renditions.Rendition, str]]:
+    """视频素材按阶梯生成的代理版本：[(版本, 绝对路径), ...]"""
+    if (task.kind or "").lower().strip() != "video":
+        return []
+    return [
+        (r, os.path.join(BASE_DIR, renditions.rendition_rel_path(task.output_path, r.name).replace("/", os.sep)))
+        for r in renditions.ladder()
+    ]
+
+
+def _remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            if os.path.isfile(path):
+                os.remove(path)
+        except Exception:
+            pass
+
+
+def enqueue_renditions(task: TaskInfo) -> None:
+    """remux/audio 入库完成后，为已就绪的素材文件补一个只生成代理版本的后续任务"""
+    now = utcnow()
+    with get_db() as db:
+        db.execute(
+            text(
+                "INSERT INTO material_transcode_tasks "
+                "(material_id, input_path, output_path, kind, transcode_plan, status, progress, "
+                "attempts, max_attempts, created_at, updated_at) "
+                "VALUES (:material_id, :path, :path, 'video', 'renditions', 'pending', 0, 0, 3, :now, :now)"
+            ),
+            {"material_id": int(task.material_id), "path": task.output_path, "now": now},
+        )
+        db.commit()
+
+
+def _process_renditions_task(task: TaskInfo, rendition_outputs: List[Tuple[renditions.Rendition, str]]) -> None:
+    """后续任务：从已就绪的素材文件生成代理版本；失败只记在任务上，不改变素材状态"""
+    source_abs = os.path.join(BASE_DIR, task.input_path.replace("/", os.sep))
+    if not rendition_outputs:
+        update_task(task.id, status="success", progress=100, error_message=None)
+        return
+    if not os.path.exists(source_abs):
+        update_task(task.id, status="fail", error_message=f"input missing: {source_abs}")
+        return
+
+    policy = choose_policy("transcode")
+    update_task(task.id, progress=1, encode_policy=policy.to_json())
+    try:
+        run_ffmpeg_transcode(
+            input_abs=source_abs,
+            output_abs=source_abs,
+            kind=task.kind,
+            duration_seconds=probe_duration_seconds(source_abs),
+            task_id=task.id,
+            plan="renditions",
+            policy=policy,
+            rendition_outputs=rendition_outputs,
+        )
+        _PROGRESS.discard(task.id)
+        rendition_meta = {
+            r.name: r.to_meta(renditions.rendition_rel_path(task.output_path, r.name))
+            for r, path in rendition_outputs
+            if os.path.isfile(path)
+        }
+        update_task(task.id, status="success", progress=100, error_message=None)
+        update_material(task.material_id, **output_meta_fields(task.material_id, source_abs, rendition_meta))
+    except job_control.JobCancelled:
+        raise
+    except Exception as e:
+        _PROGRESS.discard(task.id)
+        _remove_files([path for _r, path in rendition_outputs])
+        update_task(task.id, status="fail", error_message=str(e)[-8000:])
+
 
+def _process_task(task: TaskInfo) -> None:
     input_abs = os.path.join(BASE_DIR, task.input_path.replace("/", os.sep))
     output_abs = os.path.join(BASE_DIR, task.output_path.replace("/", os.sep))
+    rendition_outputs = _rendition_outputs(task)
+    if task.plan == "renditions":
+        _process_renditions_task(task, rendition_outputs)
+        return
 
     if not os.path.exists(input_abs):
         update_task(task.id, status="fail", error_message=f"input missing: {input_abs}")
         update_material(task.material_id, status="failed")
-        return True
+        return
 
-    duration_s = 0.0
-    try:
-        duration_s = float(get_duration_seconds(ffprobe(input_abs)) or 0.0)
-    except Exception:
-        pass
+    duration_s = probe_duration_seconds(input_abs)
 
     try:
-        update_task(task.id, progress=1)
-        run_ffmpeg_transcode(
-            input_abs=input_abs,
-            output_abs=output_abs,
-            kind=task.kind,
-            duration_seconds=duration_s,
-            task_id=task.id,
-        )
+        plan = task.plan
+        policy = None
+        if plan in ("remux", "audio"):
+            update_task(task.id, progress=1)
+            try:
+                run_ffmpeg_transcode(
+                    input_abs=input_abs,
+                    output_abs=output_abs,
+                    kind=task.kind,
+                    duration_seconds=duration_s,
+                    task_id=task.id,
+                    plan=plan,
+                )
+            except RuntimeError as e:
+                # 流复制失败（封装不兼容的码流等）时退回完整重编码
+                print(f"[worker] task={task.id} {plan} failed, fallback to full: {e}")
+                _PROGRESS.discard(task.id)
+                plan = "full"
+        if plan not in ("remux", "audio"):
+            if (task.kind or "").lower().strip() == "video":
+                # 按当前核数与队列深度决定线程数/preset，并记录到任务上
+                policy = choose_policy("transcode")
+                update_task(task.id, progress=1, transcode_plan=plan, encode_policy=policy.to_json())
+            else:
+                update_task(task.id, progress=1, transcode_plan=plan)
+            run_ffmpeg_transcode(
+                input_abs=input_abs,
+                output_abs=output_abs,
+                kind=task.kind,
+                duration_seconds=duration_s,
+                task_id=task.id,
+                plan=plan,
+                policy=policy,
+                rendition_outputs=rendition_outputs,
+            )
+        _PROGRESS.discard(task.id)
+        # 完整重编码时代理版本已在同一次调用中生成；流复制的素材先就绪，代理版本交给后续任务
+        full_encoded = plan not in ("remux", "audio")
+        rendition_meta = {
+            r.name: r.to_meta(renditions.rendition_rel_path(task.output_path, r.name))
+            for r, path in rendition_outputs
+            if full_encoded and os.path.isfile(path)
+        }
         update_task(task.id, status="success", progress=100, error_message=None)
-        update_material(task.material_id, status="ready", path=task.output_path)
+        update_material(
+            task.material_id,
+            status="ready",
+            path=task.output_path,
+            **output_meta_fields(task.material_id, output_abs, rendition_meta),
+        )
+        if rendition_outputs and not full_encoded:
+            enqueue_renditions(task)
+    except job_control.JobCancelled:
+        raise
     except Exception as e:
         msg = str(e)
         if len(msg) > 8000:
             msg = msg[-8000:]
+        _PROGRESS.discard(task.id)
+        _remove_files([path for _r, path in rendition_outputs])
         update_task(task.id, status="fail", error_message=msg)
         update_material(task.material_id, status="failed")
 
-    return True
-
 
 def main() -> None:
     wid = worker_id()
     sleep_seconds = float(os.environ.get("TRANSCODE_WORKER_SLEEP", "1.0") or "1.0")
     lock_timeout_seconds = int(os.environ.get("TRANSCODE_LOCK_TIMEOUT", "1800") or "1800")
+    concurrency = TRANSCODE_WORKER_CONCURRENCY or max(1, (os.cpu_count() or 1) // 4)
 
     print(f"[worker] started: {wid}")
-    print(f"[worker] sleep={sleep_seconds}s lock_timeout={lock_timeout_seconds}s")
-
-    while True:
-        did = False
-        try:
-            did = process_once(wid, lock_timeout_seconds)
-        except KeyboardInterrupt:
-            raise
-        except Exception as e:
-            print(f"[worker] error: {e}")
+    print(f"[worker] concurrency={concurrency} sleep={sleep_seconds}s lock_timeout={lock_timeout_seconds}s")
 
-        if not did:
-            time.sleep(sleep_seconds)
+    try:
+        listener: Optional[worker_notify.Listener] = worker_notify.Listener("transcode")
+        print(f"[worker] notify port={listener.port} idle_timeout={TRANSCODE_WORKER_IDLE_TIMEOUT}s")
+    except OSError as e:
+        # 无法监听时退回定时轮询
+        listener = None
+        print(f"[worker] notify disabled: {e}")
+
+    # 租约续期 + 回收过期租约；回收出的任务立即唤醒主线程认领
+    threading.Thread(
+        target=_lease_loop,
+        args=(wid, lock_timeout_seconds, (listener.poke if listener is not None else (lambda: None))),
+        name="transcode-lease",
+        daemon=True,
+    ).start()
+
+    # 主线程负责认领：有空闲槽位时一次认领补满，任务交给槽位线程执行
+    active: Set[Future] = set()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="transcode-slot") as pool:
+        while True:
+            for f in [f for f in active if f.done()]:
+                active.discard(f)
+                exc = f.exception()
+                if exc is not None:
+                    print(f"[worker] error: {exc}")
+
+            claimed: List[TaskInfo] = []
+            free = concurrency - len(active)
+            if free > 0:
+                try:
+                    claimed = claim_batch(wid, free, lock_timeout_seconds)
+                except Exception as e:
+                    print(f"[worker] claim error: {e}")
+            for task in claimed:
+                print(f"[worker] task={task.id} material={task.material_id} start")
+                f = pool.submit(run_task, task)
+                if listener is not None:
+                    # 任务结束即唤醒主线程补位
+                    f.add_done_callback(lambda _f: listener.poke())
+                active.add(f)
+
+            if claimed and len(active) < concurrency:
+                continue
+            if listener is not None:
+                # 槽位已满或队列已空：等新任务通知或任一任务结束，最多 TRANSCODE_WORKER_IDLE_TIMEOUT
+                listener.wait(TRANSCODE_WORKER_IDLE_TIMEOUT)
+            elif active:
+                wait(active, timeout=sleep_seconds, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(sleep_seconds)
 
 
 if __name__ == "__main__":
@@ -19,6 +19,70 @@ export const getTask = (taskId) => {
   return apiClient.get(`/tasks/${taskId}`)
 }
 
+/**
+ * 订阅任务进度（Server-Sent Events）
+ * 用 fetch 读取事件流以便携带 Authorization 头；返回取消函数。
+ * 连接失败或中途断开时回调 onError，调用方可回退到轮询 getTask。
+ */
+export const subscribeTaskEvents = (taskId, { onProgress, onError } = {}) => {
+  const controller = new AbortController()
+  const token = localStorage.getItem('auth_token')
+  const baseURL = import.meta.env.VITE_API_BASE_URL || '/api'
+
+  ;(async () => {
+    try {
+      const resp = await fetch(`${baseURL}/tasks/${taskId}/events`, {
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
+        signal: controller.signal
+      })
+      if (!resp.ok || !resp.body) {
+        throw new Error(`HTTP ${resp.status}`)
+      }
+
+      const reader = resp.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      let finished = false
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        let idx
+        while ((idx = buffer.indexOf('\n\n')) >= 0) {
+          const chunk = buffer.slice(0, idx)
+          buffer = buffer.slice(idx + 2)
+          let event = 'message'
+          let data = ''
+          for (const line of chunk.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim()
+            else if (line.startsWith('data:')) data += line.slice(5).trim()
+          }
+          if (!data) continue
+          const payload = JSON.parse(data)
+          if (event === 'error') {
+            throw new Error(payload.message || '任务不存在')
+          }
+          if (event === 'progress') {
+            onProgress && onProgress(payload)
+            if (['success', 'fail', 'cancelled'].includes(payload.status)) {
+              finished = true
+            }
+          }
+        }
+      }
+      if (!finished) {
+        throw new Error('进度连接已断开')
+      }
+    } catch (error) {
+      if (!controller.signal.aborted) {
+        onError && onError(error)
+      }
+    }
+  })()
+
+  return () => controller.abort()
+}
+
 export const deleteTask = (taskId, deleteOutput = false) => {
   return apiClient.post(`/tasks/${taskId}/delete`, { delete_output: deleteOutput })
 }